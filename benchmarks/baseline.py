@@ -0,0 +1,204 @@
+"""
+Description:
+    Shared helpers of the offline benchmarks: timing, machine-readable baselines and their comparison. Every
+    benchmark writes its results with `save_baseline`, as a JSON file that records the benchmark parameters and the
+    environment (host, Python and NumPy versions, git commit) next to the timings, so that the baselines of two runs,
+    e.g. before and after a change, can be compared with the `compare` command.
+
+    Timings are the best of `--repeats` runs, which is less sensitive to other load on the machine than the mean.
+
+Usage:
+    python baseline.py compare <before.json> <after.json> [--threshold 0.10]
+
+Arguments:
+    before, after : Baselines written by the same benchmark.
+    --threshold   : (Optional) Relative slowdown of a timing reported as a regression. Defaults to 0.10 (10%).
+                    The command exits with status 1 if there is at least one regression.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+
+BASELINE_VERSION = 1
+
+# Keys of the results that are timings, compared by `compare`
+TIMING_SUFFIX = "_seconds"
+
+def timed(func, *args, **kwargs):
+    """
+    Run a function and measure its wall-clock time.
+
+    Returns:
+        tuple: (result, seconds).
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def best_of(repeats, func, *args, setup=None, quiet=True, **kwargs):
+    """
+    Run a function several times and keep the fastest run.
+
+    Args:
+        repeats (int): Number of runs.
+        func (callable): Function to time.
+        *args: Positional arguments of the function.
+        setup (callable, optional): Called before every run and not timed (e.g. to remove a previous output).
+        quiet (bool): Discard what the function prints, so that log messages are neither shown nor timed on a
+            terminal.
+        **kwargs: Keyword arguments of the function.
+
+    Returns:
+        tuple: (result of the last run, seconds of the fastest run).
+    """
+    best = None
+    result = None
+    for _ in range(repeats):
+        if setup:
+            setup()
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull if quiet else sys.stdout):
+            result, seconds = timed(func, *args, **kwargs)
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+def environment():
+    """
+    Describe the machine and the code a benchmark ran on.
+
+    Returns:
+        dict: Host, platform, Python and NumPy versions, CPU count and git commit (None outside a git checkout).
+    """
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": numpy_version,
+        "cpus": os.cpu_count(),
+        "git_commit": commit,
+    }
+
+def save_baseline(output_file, benchmark, params, results):
+    """
+    Write the results of a benchmark as a JSON baseline.
+
+    Args:
+        output_file (str): Path to the JSON file.
+        benchmark (str): Name of the benchmark.
+        params (dict): Parameters the benchmark ran with; baselines are only comparable for equal parameters.
+        results (dict): Results; timings end in `_seconds`, other values (e.g. imbalance ratios) are reported as is.
+    """
+    baseline = {
+        "version": BASELINE_VERSION,
+        "benchmark": benchmark,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    with open(output_file, "w") as f:
+        json.dump(baseline, f, indent=4)
+    print(f"[INFO] Saved baseline to '{output_file}'")
+
+def load_baseline(baseline_file):
+    """
+    Load a baseline written by `save_baseline`.
+
+    Args:
+        baseline_file (str): Path to the JSON file.
+
+    Returns:
+        dict: Baseline.
+
+    Raises:
+        SystemExit: If the file is missing or is not a baseline.
+    """
+    if not os.path.isfile(baseline_file):
+        print(f"[ERROR] Baseline '{baseline_file}' does not exist.")
+        sys.exit(1)
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION or "results" not in baseline:
+        print(f"[ERROR] '{baseline_file}' is not a benchmark baseline.")
+        sys.exit(1)
+    return baseline
+
+def compare_baselines(before, after, threshold=0.10):
+    """
+    Compare the results of two baselines.
+
+    Args:
+        before (dict): Baseline of the reference run.
+        after (dict): Baseline of the new run.
+        threshold (float): Relative slowdown of a timing reported as a regression.
+
+    Returns:
+        tuple: (list of (key, before value, after value, ratio or None, status) rows, number of regressions).
+    """
+    rows = []
+    regressions = 0
+    for key in sorted(set(before["results"]) | set(after["results"])):
+        old, new = before["results"].get(key), after["results"].get(key)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            rows.append((key, old, new, None, "missing" if old is None or new is None else ""))
+            continue
+        ratio = new / old if old else None
+        status = ""
+        if key.endswith(TIMING_SUFFIX) and ratio is not None:
+            if ratio > 1 + threshold:
+                status = "REGRESSION"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                status = "faster"
+        elif old != new:
+            status = "changed"
+        rows.append((key, old, new, ratio, status))
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark baselines.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subparsers.add_parser("compare", help="Compare the results of two baselines.")
+    compare_parser.add_argument("before", type=str, help="Baseline of the reference run.")
+    compare_parser.add_argument("after", type=str, help="Baseline of the new run.")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression.")
+    args = parser.parse_args()
+
+    before, after = load_baseline(args.before), load_baseline(args.after)
+    if before["benchmark"] != after["benchmark"]:
+        print(f"[ERROR] The baselines are of different benchmarks: '{before['benchmark']}' and '{after['benchmark']}'.")
+        sys.exit(1)
+    if before["params"] != after["params"]:
+        print("[WARNING] The baselines were run with different parameters; the timings are not directly comparable.")
+    if before["environment"].get("host") != after["environment"].get("host"):
+        print("[WARNING] The baselines were run on different hosts.")
+
+    rows, regressions = compare_baselines(before, after, args.threshold)
+    print("=============================================")
+    print(f"{before['benchmark']}: {before['environment'].get('git_commit')} -> {after['environment'].get('git_commit')}")
+    print("=============================================")
+    for key, old, new, ratio, status in rows:
+        ratio_text = f"{ratio:6.2f}x" if ratio is not None else "      -"
+        print(f"{key:40s} {str(old):>12s} {str(new):>12s} {ratio_text} {status}")
+    print("=============================================")
+    print(f"[INFO] {regressions} timing(s) more than {args.threshold:.0%} slower.")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Description:
+    Benchmark for the Bonito ctc-data tooling (`ctc_data.py`, which `prepare_training_dataset.py` wraps). Writes
+    synthetic datasets (`chunks.npy`, `references.npy`, `reference_lengths.npy`) in the layout of
+    `bonito basecaller --save-ctc` and times truncation to the smallest dataset, merging, merging with shuffling
+    (random reads from every input) and a shuffled train/validation split.
+
+    The datasets get different numbers of chunks (the first `--num_chunks`, the others 10% and 20% more) so that
+    truncation has work to do, and different reference widths so that merging pads. They are written in blocks and
+    never held in memory. When the datasets fit in memory the inputs are read from the page cache after the first
+    run; use a total size larger than the RAM of the machine (or `--root` on the target filesystem) to include
+    disk reads.
+
+Usage:
+    python bench_ctc_data.py [--num_chunks 50000] [--chunk_length 4000] [--num_datasets 3] [--block_mb 256]
+                             [--repeats 3] [--root <dir>] [--json <file>]
+
+Arguments:
+    --num_chunks   : Number of chunks of the smallest dataset.
+    --chunk_length : Number of signal samples per chunk.
+    --num_datasets : Number of datasets to create.
+    --block_mb     : Block size passed to `ctc_data.py`, in MB.
+    --repeats      : Number of runs of each timed step; the fastest is reported.
+    --root         : Directory in which the datasets are created. Defaults to a temporary directory.
+    --json         : (Optional) Write the results as a baseline to this JSON file (see `baseline.py`).
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "nanopore_caller", "scripts", "bonito"))
+
+from baseline import best_of, timed, save_baseline
+from ctc_data import CHUNKS_FILE, REFERENCES_FILE, LENGTHS_FILE, truncate_datasets, merge_datasets, split_dataset
+
+# Rows generated at a time when writing a synthetic dataset
+WRITE_BLOCK_ROWS = 10000
+
+def write_synthetic_dataset(dataset_dir, num_chunks, chunk_length, reference_width, seed=0):
+    """
+    Write a synthetic ctc-data dataset with the dtypes of `bonito basecaller --save-ctc`.
+
+    Args:
+        dataset_dir (str): Directory to create.
+        num_chunks (int): Number of chunks.
+        chunk_length (int): Number of signal samples per chunk.
+        reference_width (int): Width of the zero-padded reference array.
+        seed (int): Random seed.
+
+    Returns:
+        int: Size of the dataset in bytes.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(dataset_dir, exist_ok=True)
+    chunks = np.lib.format.open_memmap(os.path.join(dataset_dir, CHUNKS_FILE), mode="w+", dtype=np.float16,
+                                       shape=(num_chunks, chunk_length))
+    references = np.lib.format.open_memmap(os.path.join(dataset_dir, REFERENCES_FILE), mode="w+", dtype=np.uint8,
+                                           shape=(num_chunks, reference_width))
+    lengths = np.lib.format.open_memmap(os.path.join(dataset_dir, LENGTHS_FILE), mode="w+", dtype=np.uint16,
+                                        shape=(num_chunks,))
+
+    for start in range(0, num_chunks, WRITE_BLOCK_ROWS):
+        stop = min(start + WRITE_BLOCK_ROWS, num_chunks)
+        block_lengths = rng.integers(reference_width // 3, reference_width + 1, size=stop - start)
+        chunks[start:stop] = rng.standard_normal((stop - start, chunk_length), dtype=np.float32)
+        bases = rng.integers(1, 5, size=(stop - start, reference_width), dtype=np.uint8)
+        bases[np.arange(reference_width) >= block_lengths[:, None]] = 0
+        references[start:stop] = bases
+        lengths[start:stop] = block_lengths
+
+    for array in (chunks, references, lengths):
+        array.flush()
+    return chunks.nbytes + references.nbytes + lengths.nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ctc-data truncation, merging and splitting.")
+    parser.add_argument("--num_chunks", type=int, default=50000, help="Number of chunks of the smallest dataset.")
+    parser.add_argument("--chunk_length", type=int, default=4000, help="Number of signal samples per chunk.")
+    parser.add_argument("--num_datasets", type=int, default=3, help="Number of datasets to create.")
+    parser.add_argument("--block_mb", type=int, default=256, help="Block size passed to ctc_data.py, in MB.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of runs of each timed step.")
+    parser.add_argument("--root", type=str, default=None, help="Directory in which the datasets are created.")
+    parser.add_argument("--json", type=str, default=None, help="Write the results as a baseline to this JSON file.")
+    args = parser.parse_args()
+
+    if args.num_datasets < 2:
+        parser.error("--num_datasets must be at least 2.")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_ctc_data_", dir=args.root)
+    merged = os.path.join(work_dir, "merged")
+    split = os.path.join(work_dir, "split")
+
+    try:
+        dataset_dirs = [os.path.join(work_dir, f"dataset_{i}") for i in range(args.num_datasets)]
+        sizes = [int(args.num_chunks * (1 + 0.1 * i)) for i in range(args.num_datasets)]
+        widths = [args.chunk_length // 8 + 16 * i for i in range(args.num_datasets)]
+        print(f"[INFO] Creating {args.num_datasets} synthetic datasets of {sizes[0]} to {sizes[-1]} chunks under '{work_dir}'...")
+        total_bytes = 0
+        build_seconds = 0.0
+        for i, dataset_dir in enumerate(dataset_dirs):
+            size, seconds = timed(write_synthetic_dataset, dataset_dir, sizes[i], args.chunk_length, widths[i], seed=i)
+            total_bytes += size
+            build_seconds += seconds
+        print(f"[INFO] {total_bytes / 1024 ** 3:.2f} GB of datasets created in {build_seconds:.2f} seconds.")
+
+        def remove(*paths):
+            return lambda: [shutil.rmtree(path, ignore_errors=True) for path in paths]
+
+        processed = [os.path.join(d, "processed") for d in dataset_dirs]
+        _, truncate_seconds = best_of(args.repeats, truncate_datasets, dataset_dirs, block_mb=args.block_mb,
+                                      setup=remove(*processed))
+        _, merge_seconds = best_of(args.repeats, merge_datasets, dataset_dirs, merged, block_mb=args.block_mb,
+                                   setup=remove(merged))
+        _, shuffle_seconds = best_of(args.repeats, merge_datasets, dataset_dirs, merged, shuffle=True,
+                                     block_mb=args.block_mb, setup=remove(merged))
+        _, split_seconds = best_of(args.repeats, split_dataset, merged, split, sum(sizes) // 20, shuffle=True,
+                                   block_mb=args.block_mb, setup=remove(split))
+
+        gb = total_bytes / 1024 ** 3
+        results = {
+            "truncate_seconds": round(truncate_seconds, 4),
+            "merge_seconds": round(merge_seconds, 4),
+            "merge_shuffle_seconds": round(shuffle_seconds, 4),
+            "split_shuffle_seconds": round(split_seconds, 4),
+            "merge_gb_per_second": round(gb / merge_seconds, 4),
+            "merge_shuffle_gb_per_second": round(gb / shuffle_seconds, 4),
+        }
+        params = {
+            "num_chunks": args.num_chunks,
+            "chunk_length": args.chunk_length,
+            "num_datasets": args.num_datasets,
+            "block_mb": args.block_mb,
+            "repeats": args.repeats,
+            "total_size_gb": round(gb, 3),
+        }
+
+        print("=============================================")
+        print(f"Truncate to smallest        : {truncate_seconds:.3f} s")
+        print(f"Merge                       : {merge_seconds:.3f} s ({results['merge_gb_per_second']:.2f} GB/s)")
+        print(f"Merge with shuffle          : {shuffle_seconds:.3f} s ({results['merge_shuffle_gb_per_second']:.2f} GB/s)")
+        print(f"Split with shuffle          : {split_seconds:.3f} s")
+        print("=============================================")
+
+        if args.json:
+            save_baseline(args.json, "ctc_data", params, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
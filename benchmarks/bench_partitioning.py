@@ -0,0 +1,184 @@
+"""
+Description:
+    Benchmark for pod5 partitioning and redistribution. Builds a synthetic tree of sparse `.pod5` files with a
+    realistic size distribution and times the scan, both packing strategies of `partition_pod5_files.py` and both
+    modes of `distribute_files_by_size.py`. The imbalance ratio (largest / mean partition) of each strategy is
+    recorded with the timings, so that a change to the packing can be judged on both.
+
+    MinKNOW closes a pod5 file after a fixed number of reads, so the files of one acquisition have similar sizes and
+    only its last file is smaller. The synthetic tree has `--num_runs` acquisitions with a mean file size drawn
+    between 200 MB and 1.2 GB, file sizes within 15% of their acquisition's mean, and a truncated last file per
+    acquisition. The files are sparse, so the tree takes almost no disk space.
+
+Usage:
+    python bench_partitioning.py [--num_files 20000] [--num_runs 40] [--size_limit_gb 50] [--num_workers 4]
+                                 [--threads 16] [--repeats 3] [--root <dir>] [--json <file>]
+
+Arguments:
+    --num_files     : Number of synthetic .pod5 files to create.
+    --num_runs      : Number of acquisitions the files are spread over (one directory each).
+    --size_limit_gb : Partition size limit in GB.
+    --num_workers   : Number of GPU workers for the balanced strategy.
+    --threads       : Number of scanner and linking threads.
+    --repeats       : Number of runs of each timed step; the fastest is reported.
+    --root          : Directory in which the synthetic tree is created. Defaults to a temporary directory.
+    --json          : (Optional) Write the results as a baseline to this JSON file (see `baseline.py`).
+"""
+
+import os
+import sys
+import random
+import shutil
+import argparse
+import tempfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "rna_pipeline", "scripts"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "nanopore_caller", "scripts", "dorado"))
+
+from baseline import best_of, timed, save_baseline
+from pod5_scanner import scan_files
+from partition_pod5_files import partition_files, balance_partitions, compute_imbalance_ratio
+from distribute_files_by_size import scan_directory, redistribute_links, distribute_files
+
+def pod5_sizes(num_files, num_runs, seed=0):
+    """
+    Draw file sizes that follow the layout of MinKNOW acquisitions.
+
+    Args:
+        num_files (int): Number of files.
+        num_runs (int): Number of acquisitions.
+        seed (int): Random seed.
+
+    Returns:
+        list of list of int: File sizes in bytes of each acquisition.
+    """
+    rng = random.Random(seed)
+    runs = []
+    for run in range(num_runs):
+        count = num_files // num_runs + (1 if run < num_files % num_runs else 0)
+        mean_mb = rng.uniform(200, 1200)
+        sizes = [int(max(1.0, rng.gauss(mean_mb, 0.15 * mean_mb)) * 1024 * 1024) for _ in range(count)]
+        if sizes:
+            # The last file of an acquisition is closed early
+            sizes[-1] = int(sizes[-1] * rng.uniform(0.01, 1.0))
+        runs.append(sizes)
+    return runs
+
+def build_tree(root, runs):
+    """
+    Create one directory of sparse .pod5 files per acquisition.
+
+    Args:
+        root (str): Directory in which the tree is created.
+        runs (list of list of int): File sizes of each acquisition.
+
+    Returns:
+        list of str: Paths of the created files.
+    """
+    paths = []
+    for run, sizes in enumerate(runs):
+        run_dir = os.path.join(root, f"run_{run}", "pod5")
+        os.makedirs(run_dir, exist_ok=True)
+        for i, size in enumerate(sizes):
+            path = os.path.join(run_dir, f"run_{run}_chunk_{i}.pod5")
+            with open(path, "wb") as f:
+                f.truncate(size)
+            paths.append(path)
+    return paths
+
+def link_flat(paths, flat_dir):
+    """
+    Hard-link the files of the tree into one flat directory, the input layout of distribute_files_by_size.py.
+
+    Args:
+        paths (list of str): Files of the synthetic tree.
+        flat_dir (str): Directory to create.
+    """
+    shutil.rmtree(flat_dir, ignore_errors=True)
+    os.makedirs(flat_dir)
+    for path in paths:
+        os.link(path, os.path.join(flat_dir, os.path.basename(path)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pod5 scanning, partitioning and redistribution.")
+    parser.add_argument("--num_files", type=int, default=20000, help="Number of synthetic .pod5 files.")
+    parser.add_argument("--num_runs", type=int, default=40, help="Number of acquisitions the files are spread over.")
+    parser.add_argument("--size_limit_gb", type=float, default=50, help="Partition size limit in GB.")
+    parser.add_argument("--num_workers", type=int, default=4, help="Number of GPU workers for the balanced strategy.")
+    parser.add_argument("--threads", type=int, default=16, help="Number of scanner and linking threads.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of runs of each timed step.")
+    parser.add_argument("--root", type=str, default=None, help="Directory in which the synthetic tree is created.")
+    parser.add_argument("--json", type=str, default=None, help="Write the results as a baseline to this JSON file.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_partitioning_", dir=args.root)
+    tree = os.path.join(work_dir, "pod5")
+    flat = os.path.join(work_dir, "flat")
+    target = os.path.join(work_dir, "target")
+    size_limit_bytes = args.size_limit_gb * (1024 ** 3)
+
+    try:
+        runs = pod5_sizes(args.num_files, args.num_runs)
+        print(f"[INFO] Creating {args.num_files} sparse .pod5 files in {args.num_runs} acquisitions under '{tree}'...")
+        paths, build_seconds = timed(build_tree, tree, runs)
+        link_flat(paths, flat)
+        print(f"[INFO] Tree created in {build_seconds:.2f} seconds.")
+
+        # Scan
+        scanned, scan_seconds = best_of(args.repeats, scan_files, tree, ".pod5", args.threads)
+        sizes = {path: info.size for path, info in scanned.items()}
+        assert len(sizes) == len(paths), "The scan did not find every synthetic file"
+
+        # Partitioning with both strategies
+        sequential, sequential_seconds = best_of(args.repeats, partition_files, sizes, size_limit_bytes)
+        balanced, balanced_seconds = best_of(args.repeats, balance_partitions, sizes, size_limit_bytes, args.num_workers)
+
+        # Redistribution: subfolders of links (source untouched), then moving the files of a fresh flat copy
+        flat_scan = scan_directory(flat)
+        _, link_seconds = best_of(args.repeats, redistribute_links, flat, target, size_limit_bytes, flat_scan,
+                                  "size", "symlink", args.threads, setup=lambda: shutil.rmtree(target, ignore_errors=True))
+
+        def reset_move():
+            shutil.rmtree(target, ignore_errors=True)
+            link_flat(paths, flat)
+        _, move_seconds = best_of(args.repeats, distribute_files, flat, target, size_limit_bytes, setup=reset_move)
+
+        results = {
+            "scan_seconds": round(scan_seconds, 4),
+            "partition_sequential_seconds": round(sequential_seconds, 4),
+            "partition_sequential_count": len(sequential),
+            "partition_sequential_imbalance": round(compute_imbalance_ratio(sequential), 4),
+            "partition_balanced_seconds": round(balanced_seconds, 4),
+            "partition_balanced_count": len(balanced),
+            "partition_balanced_imbalance": round(compute_imbalance_ratio(balanced), 4),
+            "redistribute_link_seconds": round(link_seconds, 4),
+            "redistribute_move_seconds": round(move_seconds, 4),
+        }
+        params = {
+            "num_files": args.num_files,
+            "num_runs": args.num_runs,
+            "size_limit_gb": args.size_limit_gb,
+            "num_workers": args.num_workers,
+            "threads": args.threads,
+            "repeats": args.repeats,
+            "total_size_gb": round(sum(sizes.values()) / (1024 ** 3), 2),
+        }
+
+        print("=============================================")
+        print(f"Scan                        : {scan_seconds:.3f} s")
+        print(f"Partition (sequential)      : {sequential_seconds:.3f} s, {len(sequential)} partitions, "
+              f"imbalance {results['partition_sequential_imbalance']:.3f}")
+        print(f"Partition (balanced)        : {balanced_seconds:.3f} s, {len(balanced)} partitions, "
+              f"imbalance {results['partition_balanced_imbalance']:.3f}")
+        print(f"Redistribute (link)         : {link_seconds:.3f} s")
+        print(f"Redistribute (move)         : {move_seconds:.3f} s")
+        print("=============================================")
+
+        if args.json:
+            save_baseline(args.json, "partitioning", params, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
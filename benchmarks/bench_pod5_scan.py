@@ -0,0 +1,129 @@
+"""
+Description:
+    Benchmark for pod5 discovery. Builds a synthetic tree of sparse `.pod5` files (100,000 by default) and times the
+    original serial `os.walk` + `os.path.getsize` scan against `pod5_scanner.scan_files` without a cache, with an empty
+    cache that is populated during the scan (cold), and with a populated cache (warm).
+
+    The synthetic files are sparse, so the tree takes almost no disk space. On a local disk, metadata calls are cheap
+    and the gains are smaller than on the networked project filesystem, where each call pays a round trip. Run the
+    benchmark with `--root` on the target filesystem to measure that case.
+
+Usage:
+    python bench_pod5_scan.py [--num_files 100000] [--num_dirs 200] [--threads 16] [--root <dir>] [--json <file>]
+
+Arguments:
+    --num_files : Number of synthetic .pod5 files to create.
+    --num_dirs  : Number of directories the files are spread over.
+    --threads   : Number of scanner threads.
+    --root      : Directory in which the synthetic tree is created. Defaults to a temporary directory.
+    --json      : (Optional) Write the timings as a baseline to this JSON file (see `baseline.py`).
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rna_pipeline", "scripts"))
+
+from baseline import timed, save_baseline
+from pod5_scanner import scan_files
+
+def build_tree(root, num_files, num_dirs, seed=0):
+    """
+    Create a tree of sparse .pod5 files with sizes between 10 MB and 2 GB.
+
+    Args:
+        root (str): Directory in which the tree is created.
+        num_files (int): Number of files to create.
+        num_dirs (int): Number of directories the files are spread over.
+        seed (int): Random seed for the file sizes.
+    """
+    rng = random.Random(seed)
+    dirs = [os.path.join(root, f"run_{i // 20}", f"pod5_{i}") for i in range(num_dirs)]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    for i in range(num_files):
+        path = os.path.join(dirs[i % num_dirs], f"read_chunk_{i}.pod5")
+        with open(path, "wb") as f:
+            f.truncate(int(rng.uniform(10, 2048) * 1024 * 1024))
+
+def serial_scan(root):
+    """
+    Original discovery loop: serial os.walk followed by one os.path.getsize per file.
+
+    Args:
+        root (str): Directory to scan.
+
+    Returns:
+        dict: Dictionary mapping file paths to sizes in bytes.
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=False):
+        for f in filenames:
+            if f.endswith(".pod5"):
+                path = os.path.abspath(os.path.join(dirpath, f))
+                files[path] = os.path.getsize(path)
+    return files
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serial vs parallel cached pod5 discovery.")
+    parser.add_argument("--num_files", type=int, default=100000, help="Number of synthetic .pod5 files.")
+    parser.add_argument("--num_dirs", type=int, default=200, help="Number of directories the files are spread over.")
+    parser.add_argument("--threads", type=int, default=16, help="Number of scanner threads.")
+    parser.add_argument("--root", type=str, default=None, help="Directory in which the synthetic tree is created.")
+    parser.add_argument("--json", type=str, default=None, help="Write the timings as a baseline to this JSON file.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pod5_scan_", dir=args.root)
+    tree = os.path.join(work_dir, "pod5")
+    cache_file = os.path.join(work_dir, "scan_cache.json")
+
+    try:
+        print(f"[INFO] Creating {args.num_files} sparse .pod5 files in {args.num_dirs} directories under '{tree}'...")
+        _, build_seconds = timed(build_tree, tree, args.num_files, args.num_dirs)
+        print(f"[INFO] Tree created in {build_seconds:.2f} seconds.")
+
+        # Age the files past the scanner's recent-write grace period so the warm run can use the cache
+        old = time.time() - 3600
+        for dirpath, dirnames, filenames in os.walk(tree):
+            for f in filenames:
+                os.utime(os.path.join(dirpath, f), (old, old))
+
+        serial, serial_seconds = timed(serial_scan, tree)
+        uncached, uncached_seconds = timed(scan_files, tree, ".pod5", args.threads)
+        cold, cold_seconds = timed(scan_files, tree, ".pod5", args.threads, cache_file)
+        warm, warm_seconds = timed(scan_files, tree, ".pod5", args.threads, cache_file)
+
+        sizes = [{p: i.size for p, i in scan.items()} for scan in (uncached, cold, warm)]
+        assert all(s == serial for s in sizes), "Scanner results differ from the serial scan"
+
+        params = {
+            "num_files": len(serial),
+            "num_dirs": args.num_dirs,
+            "threads": args.threads,
+        }
+        results = {
+            "serial_walk_seconds": round(serial_seconds, 4),
+            "parallel_uncached_seconds": round(uncached_seconds, 4),
+            "parallel_cold_seconds": round(cold_seconds, 4),
+            "parallel_warm_seconds": round(warm_seconds, 4),
+        }
+
+        print("=============================================")
+        print(f"Serial os.walk + getsize : {serial_seconds:.3f} s")
+        print(f"Parallel scan (no cache) : {uncached_seconds:.3f} s")
+        print(f"Parallel scan (cold)     : {cold_seconds:.3f} s")
+        print(f"Parallel scan (warm)     : {warm_seconds:.3f} s")
+        print("=============================================")
+
+        if args.json:
+            save_baseline(args.json, "pod5_scan", params, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
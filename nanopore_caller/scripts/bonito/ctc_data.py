@@ -0,0 +1,754 @@
+"""
+Description:
+    Library and command-line tool for Bonito ctc-data datasets, i.e. directories holding `chunks.npy`,
+    `references.npy` and `reference_lengths.npy` as written by `bonito basecaller --save-ctc`. It replaces the
+    hard-coded `prepare_training_dataset.py` scripts with merge, subsample, truncate, shuffle and train/validation
+    split operations over any number of datasets, and derives stricter qscore / accuracy variants of a dataset
+    basecalled once at the loosest thresholds.
+
+Key Features:
+    - **Bounded Memory:** Inputs are opened with `mmap_mode='r'` and copied a block of rows at a time straight into
+      output arrays preallocated with `numpy.lib.format.open_memmap`, so datasets of several hundred GB never pass
+      through RAM. The block size is set in MB with `--block_mb`.
+    - **Row Selections:** Every operation builds a selection (source dataset and row of every output row) and hands
+      it to one copy routine. Rows of a block are read in ascending order within each source, so shuffled outputs
+      still read the inputs mostly sequentially.
+    - **Mixed Inputs:** Datasets with different reference widths are merged by zero-padding `references.npy` to the
+      widest input; differing chunk lengths are rejected.
+    - **Bonito Layout:** `split` writes the validation rows to `<output_dir>/validation`, the directory that
+      `bonito train` loads validation data from.
+    - **Per-Chunk Sidecar:** `summarize` pairs every row with its record in the `basecalls.bam` of the same run and
+      writes `chunk_summary.npy` (read ID, mean read qscore, alignment accuracy). Bonito saves the rows in random
+      order and drops chunks of atypical reference length, so rows are paired by content: the target of a row is
+      matched with the reference span of a record. Rows whose target matches several records stay unpaired (NaN
+      qscore and accuracy) and are never selected by `filter`. The sidecar follows the rows through every other
+      operation.
+    - **Threshold Variants without Basecalling:** `filter` keeps the rows whose qscore and accuracy pass stricter
+      thresholds, either as a compacted copy or as a view: a directory holding only the selected row numbers
+      (`rows.npy`) and its source (`view.json`). Views are accepted by every operation, e.g.
+      `merge <output_dir> <view_dir>` turns a view into a dataset for `bonito train`.
+    - **Atomic Outputs:** Arrays are written under a temporary name and renamed once complete.
+
+Usage:
+    python ctc_data.py info <dataset_dir> [<dataset_dir> ...]
+    python ctc_data.py merge <output_dir> <dataset_dir> [<dataset_dir> ...] [--equal] [--shuffle] [--seed <N>]
+    python ctc_data.py subsample <dataset_dir> <output_dir> --num_chunks <N> [--shuffle] [--seed <N>]
+    python ctc_data.py truncate <dataset_dir> [<dataset_dir> ...] [--num_chunks <N>] [--output_name processed]
+    python ctc_data.py shuffle <dataset_dir> <output_dir> [--seed <N>]
+    python ctc_data.py split <dataset_dir> <output_dir> (--valid_chunks <N> | --valid_fraction <F>) [--shuffle] [--seed <N>]
+    python ctc_data.py summarize <dataset_dir> --reference <reference.fasta> [--bam <basecalls.bam>]
+    python ctc_data.py filter <dataset_dir> <output_dir> [--min_qscore <Q>] [--min_accuracy <A>] [--view]
+
+Arguments:
+    info           : Print the number of chunks, chunk length, reference width and dtypes of each dataset.
+    merge          : Concatenate datasets. `--equal` first truncates every input to the smallest one.
+    subsample      : Draw `--num_chunks` random rows (kept in input order unless `--shuffle` is given).
+    truncate       : Keep the first rows of every dataset, either `--num_chunks` or the size of the smallest
+                     dataset, and write them to `<dataset_dir>/<output_name>` (the behaviour of the former
+                     `prepare_training_dataset.py`).
+    shuffle        : Write the rows of a dataset in random order.
+    split          : Write training rows to `output_dir` and validation rows to `output_dir/validation`.
+    summarize      : Write the per-chunk sidecar from `--bam` (default `<dataset_dir>/basecalls.bam`) and the
+                     `--reference` FASTA the dataset was basecalled with (indexed with `samtools faidx`, or
+                     writable so that `pysam` can index it).
+    filter         : Keep the rows with qscore >= `--min_qscore` and accuracy >= `--min_accuracy`; `--view` writes
+                     a view instead of a copy.
+    --seed         : (Optional) Random seed. Defaults to 0.
+    --block_mb     : (Optional) Size of the blocks copied at a time, in MB. Defaults to 256.
+
+Requirements:
+    - The `numpy` Python package.
+    - The `pysam` Python package for `summarize`.
+"""
+
+import os
+import sys
+import json
+import math
+import hashlib
+import argparse
+import numpy as np
+
+# Arrays of a ctc-data dataset
+CHUNKS_FILE = "chunks.npy"
+REFERENCES_FILE = "references.npy"
+LENGTHS_FILE = "reference_lengths.npy"
+DATASET_FILES = (CHUNKS_FILE, REFERENCES_FILE, LENGTHS_FILE)
+
+# Per-chunk sidecar with the read ID, mean read qscore and alignment accuracy of every row
+SUMMARY_FILE = "chunk_summary.npy"
+
+# A view is a directory holding the rows of another dataset that it selects, instead of copies of the arrays
+VIEW_FILE = "view.json"
+VIEW_ROWS_FILE = "rows.npy"
+
+# Subdirectory from which `bonito train` loads validation data
+VALIDATION_DIR = "validation"
+
+DEFAULT_BLOCK_MB = 256
+
+def load_dataset(dataset_dir):
+    """
+    Open the arrays of a ctc-data dataset as read-only memory maps.
+
+    For a view, the arrays of the source dataset are opened and the selected rows are returned as `rows`.
+
+    Args:
+        dataset_dir (str): Dataset directory.
+
+    Returns:
+        dict: Dictionary with the `chunks`, `references` and `lengths` arrays, the `path` of the dataset, the
+        `summary` sidecar if present, and the selected `rows` if the dataset is a view.
+
+    Raises:
+        SystemExit: If a file is missing or the arrays do not have the same number of rows.
+    """
+    view_file = os.path.join(dataset_dir, VIEW_FILE)
+    if os.path.isfile(view_file):
+        with open(view_file) as f:
+            view = json.load(f)
+        source = load_dataset(view["source"])
+        rows = np.load(os.path.join(dataset_dir, VIEW_ROWS_FILE), mmap_mode="r")
+        if "rows" in source:
+            rows = source["rows"][rows]
+        return dict(source, path=dataset_dir, rows=rows)
+
+    for name in DATASET_FILES:
+        if not os.path.isfile(os.path.join(dataset_dir, name)):
+            print(f"[ERROR] '{name}' not found in '{dataset_dir}'.")
+            sys.exit(1)
+
+    dataset = {
+        "path": dataset_dir,
+        "chunks": np.load(os.path.join(dataset_dir, CHUNKS_FILE), mmap_mode="r"),
+        "references": np.load(os.path.join(dataset_dir, REFERENCES_FILE), mmap_mode="r"),
+        "lengths": np.load(os.path.join(dataset_dir, LENGTHS_FILE), mmap_mode="r"),
+    }
+    rows = {len(dataset[key]) for key in ("chunks", "references", "lengths")}
+    if len(rows) != 1:
+        print(f"[ERROR] The arrays in '{dataset_dir}' have different numbers of rows: "
+              f"{len(dataset['chunks'])}, {len(dataset['references'])}, {len(dataset['lengths'])}.")
+        sys.exit(1)
+
+    summary_path = os.path.join(dataset_dir, SUMMARY_FILE)
+    if os.path.isfile(summary_path):
+        dataset["summary"] = np.load(summary_path, mmap_mode="r")
+        if len(dataset["summary"]) != len(dataset["chunks"]):
+            print(f"[WARNING] Ignoring '{summary_path}': {len(dataset['summary'])} rows for {len(dataset['chunks'])} chunks.")
+            del dataset["summary"]
+    return dataset
+
+def num_chunks(dataset):
+    """
+    Return the number of rows of a dataset.
+
+    Args:
+        dataset (dict): Dataset returned by `load_dataset`.
+
+    Returns:
+        int: Number of chunks.
+    """
+    return len(dataset["rows"]) if "rows" in dataset else len(dataset["chunks"])
+
+def print_dataset_info(dataset):
+    """
+    Print the shapes and dtypes of a dataset.
+
+    Args:
+        dataset (dict): Dataset returned by `load_dataset`.
+    """
+    chunks, references, lengths = dataset["chunks"], dataset["references"], dataset["lengths"]
+    print(f"[INFO] {dataset['path']}: {num_chunks(dataset)} chunks")
+    print(f"       chunks {chunks.shape} {chunks.dtype}, references {references.shape} {references.dtype}, "
+          f"reference_lengths {lengths.shape} {lengths.dtype}")
+    if "rows" in dataset:
+        print(f"       view of {len(chunks)} source chunks")
+    if "summary" in dataset:
+        summary = dataset["summary"] if "rows" not in dataset else dataset["summary"][np.asarray(dataset["rows"])]
+        paired = summary[~np.isnan(summary["qscore"])]
+        if len(paired):
+            print(f"       read qscore {paired['qscore'].min():.1f}-{paired['qscore'].max():.1f}, "
+                  f"accuracy {paired['accuracy'].min():.4f}-{paired['accuracy'].max():.4f}")
+        if len(paired) < len(summary):
+            print(f"       {len(summary) - len(paired)} chunks without a paired record")
+
+def summary_dtype(read_id_width):
+    """
+    Return the record layout of the per-chunk sidecar.
+
+    Args:
+        read_id_width (int): Maximum length of a read ID in bytes.
+
+    Returns:
+        numpy.dtype: Structured dtype with `read_id`, `qscore` and `accuracy` fields.
+    """
+    return np.dtype([("read_id", f"S{max(1, read_id_width)}"), ("qscore", "<f4"), ("accuracy", "<f4")])
+
+def select_all(datasets):
+    """
+    Select every row of every dataset, in order.
+
+    Args:
+        datasets (list of dict): Datasets.
+
+    Returns:
+        tuple: (source dataset of every output row, source row of every output row), as integer arrays.
+    """
+    sources = np.concatenate([np.full(num_chunks(d), idx, dtype=np.int32) for idx, d in enumerate(datasets)])
+    rows = np.concatenate([np.arange(num_chunks(d), dtype=np.int64) for d in datasets])
+    return sources, rows
+
+def select_first(datasets, count):
+    """
+    Select the first `count` rows of every dataset.
+
+    Args:
+        datasets (list of dict): Datasets.
+        count (int): Number of rows per dataset.
+
+    Returns:
+        tuple: (source dataset of every output row, source row of every output row).
+    """
+    sources = np.repeat(np.arange(len(datasets), dtype=np.int32), count)
+    rows = np.tile(np.arange(count, dtype=np.int64), len(datasets))
+    return sources, rows
+
+def block_rows(datasets, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Compute the number of rows copied at a time.
+
+    Args:
+        datasets (list of dict): Datasets.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        int: Number of rows per block.
+    """
+    row_bytes = max(d["chunks"][0:1].nbytes + d["references"][0:1].nbytes + d["lengths"][0:1].nbytes
+                    for d in datasets) or 1
+    return max(1, block_mb * 1024 * 1024 // row_bytes)
+
+def write_dataset(datasets, sources, rows, output_dir, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Write the selected rows of one or more datasets to a new dataset.
+
+    Args:
+        datasets (list of dict): Input datasets.
+        sources (numpy.ndarray): Input dataset of every output row.
+        rows (numpy.ndarray): Input row of every output row.
+        output_dir (str): Output directory.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        int: Number of rows written.
+
+    Raises:
+        SystemExit: If the inputs have different chunk lengths or the output directory is one of the inputs.
+    """
+    chunk_lengths = {d["chunks"].shape[1:] for d in datasets}
+    if len(chunk_lengths) != 1:
+        print(f"[ERROR] Datasets have different chunk shapes: {sorted(chunk_lengths)}")
+        sys.exit(1)
+    if any(os.path.abspath(d["path"]) == os.path.abspath(output_dir) for d in datasets):
+        print(f"[ERROR] Output directory '{output_dir}' is also an input.")
+        sys.exit(1)
+
+    for key in ("chunks", "references", "lengths"):
+        dtypes = {d[key].dtype for d in datasets}
+        if len(dtypes) > 1:
+            print(f"[WARNING] Inputs have different {key} dtypes {sorted(str(t) for t in dtypes)}; using {np.result_type(*dtypes)}.")
+
+    total = len(rows)
+    reference_width = max(d["references"].shape[1] for d in datasets)
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = {key: os.path.join(output_dir, name) for key, name in zip(("chunks", "references", "lengths"), DATASET_FILES)}
+    shapes = {
+        "chunks": (total,) + datasets[0]["chunks"].shape[1:],
+        "references": (total, reference_width),
+        "lengths": (total,),
+    }
+    dtypes = {key: np.result_type(*[d[key].dtype for d in datasets]) for key in paths}
+
+    # The sidecar is carried over when every input has one
+    if all("summary" in d for d in datasets):
+        paths["summary"] = os.path.join(output_dir, SUMMARY_FILE)
+        shapes["summary"] = (total,)
+        dtypes["summary"] = summary_dtype(max(d["summary"].dtype["read_id"].itemsize for d in datasets))
+
+    outputs = {
+        key: np.lib.format.open_memmap(f"{paths[key]}.partial", mode="w+", dtype=dtypes[key], shape=shapes[key])
+        for key in paths
+    }
+
+    step = block_rows(datasets, block_mb)
+    for block_start in range(0, total, step):
+        block_sources = sources[block_start:block_start + step]
+        block_source_rows = rows[block_start:block_start + step]
+        for idx in np.unique(block_sources):
+            positions = np.flatnonzero(block_sources == idx)
+            # Read each input in ascending row order, then scatter to the output positions
+            dataset = datasets[idx]
+            selected = block_source_rows[positions]
+            if "rows" in dataset:
+                selected = np.asarray(dataset["rows"][selected])
+            order = np.argsort(selected, kind="stable")
+            source_rows = selected[order]
+            targets = block_start + positions[order]
+
+            outputs["chunks"][targets] = dataset["chunks"][source_rows]
+            outputs["references"][targets, :dataset["references"].shape[1]] = dataset["references"][source_rows]
+            outputs["lengths"][targets] = dataset["lengths"][source_rows]
+            if "summary" in outputs:
+                outputs["summary"][targets] = dataset["summary"][source_rows].astype(dtypes["summary"])
+        print(f"[INFO] Copied {min(block_start + step, total)} / {total} chunks to '{output_dir}'")
+
+    for key, output in outputs.items():
+        output.flush()
+        os.replace(f"{paths[key]}.partial", paths[key])
+
+    return total
+
+def merge_datasets(dataset_dirs, output_dir, equal=False, shuffle=False, seed=0, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Concatenate datasets, optionally truncating each to the smallest one and shuffling the result.
+
+    Args:
+        dataset_dirs (list of str): Input dataset directories.
+        output_dir (str): Output directory.
+        equal (bool): Take the same number of rows (the size of the smallest dataset) from every input.
+        shuffle (bool): Write the rows in random order.
+        seed (int): Random seed.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        int: Number of rows written.
+    """
+    datasets = [load_dataset(path) for path in dataset_dirs]
+    if equal:
+        sources, rows = select_first(datasets, min(num_chunks(d) for d in datasets))
+    else:
+        sources, rows = select_all(datasets)
+    if shuffle:
+        permutation = np.random.default_rng(seed).permutation(len(rows))
+        sources, rows = sources[permutation], rows[permutation]
+    return write_dataset(datasets, sources, rows, output_dir, block_mb)
+
+def subsample_dataset(dataset_dir, output_dir, count, shuffle=False, seed=0, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Write a random subset of the rows of a dataset.
+
+    Args:
+        dataset_dir (str): Input dataset directory.
+        output_dir (str): Output directory.
+        count (int): Number of rows to keep.
+        shuffle (bool): Write the rows in random order instead of input order.
+        seed (int): Random seed.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        int: Number of rows written.
+
+    Raises:
+        SystemExit: If `count` is larger than the dataset.
+    """
+    dataset = load_dataset(dataset_dir)
+    if count > num_chunks(dataset):
+        print(f"[ERROR] Cannot draw {count} chunks from '{dataset_dir}', which has {num_chunks(dataset)}.")
+        sys.exit(1)
+
+    rows = np.random.default_rng(seed).choice(num_chunks(dataset), size=count, replace=False)
+    if not shuffle:
+        rows.sort()
+    return write_dataset([dataset], np.zeros(count, dtype=np.int32), rows.astype(np.int64), output_dir, block_mb)
+
+def truncate_datasets(dataset_dirs, count=None, output_name="processed", block_mb=DEFAULT_BLOCK_MB):
+    """
+    Keep the first rows of every dataset and write them to a subdirectory of the dataset.
+
+    Args:
+        dataset_dirs (list of str): Input dataset directories.
+        count (int, optional): Number of rows to keep. Defaults to the size of the smallest dataset.
+        output_name (str): Name of the output subdirectory.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        int: Number of rows kept per dataset.
+
+    Raises:
+        SystemExit: If `count` is larger than one of the datasets.
+    """
+    datasets = [load_dataset(path) for path in dataset_dirs]
+    smallest = min(num_chunks(d) for d in datasets)
+    if count is None:
+        count = smallest
+    elif count > smallest:
+        print(f"[ERROR] Cannot keep {count} chunks; the smallest dataset has {smallest}.")
+        sys.exit(1)
+
+    for dataset in datasets:
+        rows = np.arange(count, dtype=np.int64)
+        write_dataset([dataset], np.zeros(count, dtype=np.int32), rows,
+                      os.path.join(dataset["path"], output_name), block_mb)
+    return count
+
+def shuffle_dataset(dataset_dir, output_dir, seed=0, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Write the rows of a dataset in random order.
+
+    Args:
+        dataset_dir (str): Input dataset directory.
+        output_dir (str): Output directory.
+        seed (int): Random seed.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        int: Number of rows written.
+    """
+    return merge_datasets([dataset_dir], output_dir, shuffle=True, seed=seed, block_mb=block_mb)
+
+def split_dataset(dataset_dir, output_dir, valid_chunks, shuffle=False, seed=0, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Split a dataset into training rows (`output_dir`) and validation rows (`output_dir/validation`).
+
+    Validation rows are drawn at random; the remaining rows are written as training rows.
+
+    Args:
+        dataset_dir (str): Input dataset directory.
+        output_dir (str): Output directory.
+        valid_chunks (int): Number of validation rows.
+        shuffle (bool): Write the training rows in random order instead of input order.
+        seed (int): Random seed.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        tuple: (number of training rows, number of validation rows).
+
+    Raises:
+        SystemExit: If `valid_chunks` is not smaller than the dataset.
+    """
+    dataset = load_dataset(dataset_dir)
+    total = num_chunks(dataset)
+    if not 0 < valid_chunks < total:
+        print(f"[ERROR] The number of validation chunks must be between 1 and {total - 1} (got {valid_chunks}).")
+        sys.exit(1)
+
+    rng = np.random.default_rng(seed)
+    is_valid = np.zeros(total, dtype=bool)
+    is_valid[rng.choice(total, size=valid_chunks, replace=False)] = True
+    train_rows = np.flatnonzero(~is_valid)
+    valid_rows = np.flatnonzero(is_valid)
+    if shuffle:
+        train_rows = rng.permutation(train_rows)
+
+    write_dataset([dataset], np.zeros(len(train_rows), dtype=np.int32), train_rows, output_dir, block_mb)
+    write_dataset([dataset], np.zeros(len(valid_rows), dtype=np.int32), valid_rows,
+                  os.path.join(output_dir, VALIDATION_DIR), block_mb)
+    return len(train_rows), len(valid_rows)
+
+def read_qscore(record):
+    """
+    Return the mean qscore of a basecalled read, as computed by Bonito.
+
+    Args:
+        record (pysam.AlignedSegment): BAM record written by `bonito basecaller`.
+
+    Returns:
+        float: The `qs` tag if present, otherwise the mean qscore of the base qualities.
+    """
+    if record.has_tag("qs"):
+        return float(record.get_tag("qs"))
+    qualities = np.asarray(record.query_qualities if record.query_qualities is not None else [], dtype=np.float64)
+    if len(qualities) == 0:
+        return 0.0
+    mean_error = np.exp(qualities * (-math.log(10) / 10)).mean()
+    return float(-10 * math.log10(max(mean_error, 1e-4)))
+
+def alignment_accuracy(record):
+    """
+    Return the alignment accuracy of a read, matching bases / alignment block length, as used by
+    `--min-accuracy-save-ctc`.
+
+    Args:
+        record (pysam.AlignedSegment): Mapped BAM record with an `NM` tag.
+
+    Returns:
+        float: Alignment accuracy between 0 and 1.
+    """
+    # Alignment block length: matches, mismatches, insertions and deletions (CIGAR M, I, D, =, X)
+    block_length = sum(length for op, length in record.cigartuples if op in (0, 1, 2, 7, 8))
+    if block_length == 0:
+        return 0.0
+    return (block_length - record.get_tag("NM")) / block_length
+
+def encode_target(sequence):
+    """
+    Encode a reference sequence as a ctc-data target row, as `bonito basecaller --save-ctc` does.
+
+    Args:
+        sequence (str): Reference bases on the strand of the read.
+
+    Returns:
+        numpy.ndarray: uint8 codes (A=1, C=2, G=3, T=4; any other base is 0).
+    """
+    codes = np.zeros(256, dtype=np.uint8)
+    for base, code in zip("ACGTU", (1, 2, 3, 4, 4)):
+        codes[ord(base)] = code
+    return codes[np.frombuffer(sequence.upper().encode(), dtype=np.uint8)]
+
+def target_hashes(dataset, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Hash the reference target of every row of a dataset.
+
+    Args:
+        dataset (dict): Dataset returned by `load_dataset`.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        numpy.ndarray: uint64 hash of `references[row, :lengths[row]]` for every row.
+    """
+    references, lengths = dataset["references"], dataset["lengths"]
+    hashes = np.zeros(len(references), dtype=np.uint64)
+    block = max(1, (block_mb * 1024 ** 2) // max(1, references.shape[1] * references.dtype.itemsize))
+    for start in range(0, len(references), block):
+        rows = np.asarray(references[start:start + block])
+        for offset, length in enumerate(np.asarray(lengths[start:start + block])):
+            digest = hashlib.blake2b(rows[offset, :length].astype(np.uint8).tobytes(), digest_size=8).digest()
+            hashes[start + offset] = int.from_bytes(digest, "little")
+    return hashes
+
+def summarize_dataset(dataset_dir, bam_path, reference_path, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Write the per-chunk sidecar of a dataset from the BAM file of the same `bonito basecaller --save-ctc` run.
+
+    Bonito writes one BAM record per saved chunk, but then drops the chunks with atypical reference lengths and
+    saves the others in random order, so rows cannot be paired with records by position. Every row is paired
+    instead with the record whose reference span (read from `reference_path`, reverse-complemented for reverse
+    strand records) is its target. Rows whose target matches several records are left unpaired: their qscore and
+    accuracy are NaN, so `filter` never selects them.
+
+    Args:
+        dataset_dir (str): Dataset directory.
+        bam_path (str): BAM file written by the basecalling run.
+        reference_path (str): Reference FASTA the run aligned to.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        numpy.ndarray: The sidecar records.
+
+    Raises:
+        SystemExit: If `pysam` is not installed, the dataset is a view, or a row matches no record.
+    """
+    try:
+        import pysam
+    except ImportError:
+        print("[ERROR] The 'pysam' package is required to read the basecalled BAM file. Install it with 'pip install pysam'.")
+        sys.exit(1)
+
+    dataset = load_dataset(dataset_dir)
+    if "rows" in dataset:
+        print(f"[ERROR] '{dataset_dir}' is a view; summarize its source dataset instead.")
+        sys.exit(1)
+
+    references, lengths = dataset["references"], dataset["lengths"]
+    total = num_chunks(dataset)
+    hashes = target_hashes(dataset, block_mb)
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+
+    # Record paired with every row: -1 for none yet, -2 for several
+    paired = np.full(total, -1, dtype=np.int64)
+    read_ids, qscores, accuracies = [], [], []
+    with pysam.AlignmentFile(bam_path, check_sq=False) as bam, pysam.FastaFile(reference_path) as fasta:
+        for record in bam.fetch(until_eof=True):
+            if record.is_unmapped or record.is_secondary or record.is_supplementary:
+                continue
+            sequence = fasta.fetch(record.reference_name, record.reference_start, record.reference_end)
+            target = encode_target(sequence)
+            if record.is_reverse:
+                target = np.where(target > 0, 5 - target, 0).astype(np.uint8)[::-1]
+            digest = hashlib.blake2b(target.tobytes(), digest_size=8).digest()
+            key = np.uint64(int.from_bytes(digest, "little"))
+            first, last = np.searchsorted(sorted_hashes, key, "left"), np.searchsorted(sorted_hashes, key, "right")
+            # Atypical chunks that Bonito dropped have no row
+            rows = [row for row in order[first:last]
+                    if lengths[row] == len(target) and np.array_equal(references[row, :len(target)], target)]
+            if not rows:
+                continue
+            read_ids.append(record.query_name.encode())
+            qscores.append(read_qscore(record))
+            accuracies.append(alignment_accuracy(record))
+            for row in rows:
+                paired[row] = len(read_ids) - 1 if paired[row] == -1 and len(rows) == 1 else -2
+
+    missing = int(np.count_nonzero(paired == -1))
+    if missing:
+        print(f"[ERROR] {missing} of {total} chunks in '{dataset_dir}' match no record of '{bam_path}'. "
+              f"Are the BAM file and '{reference_path}' those of the basecalling run?")
+        sys.exit(1)
+    ambiguous = int(np.count_nonzero(paired == -2))
+    if ambiguous:
+        print(f"[WARNING] {ambiguous} chunk(s) share their reference target with other records and were left "
+              "unpaired; no filtered variant includes them.")
+
+    summary = np.zeros(total, dtype=summary_dtype(max((len(r) for r in read_ids), default=1)))
+    summary["qscore"], summary["accuracy"] = np.nan, np.nan
+    rows = np.flatnonzero(paired >= 0)
+    if len(rows):
+        records = paired[rows]
+        summary["read_id"][rows] = np.array(read_ids)[records]
+        summary["qscore"][rows] = np.array(qscores, dtype=np.float32)[records]
+        summary["accuracy"][rows] = np.array(accuracies, dtype=np.float32)[records]
+
+    summary_path = os.path.join(dataset_dir, SUMMARY_FILE)
+    with open(f"{summary_path}.partial", "wb") as f:
+        np.save(f, summary)
+    os.replace(f"{summary_path}.partial", summary_path)
+    return summary
+
+def filter_dataset(dataset_dir, output_dir, min_qscore=0.0, min_accuracy=0.0, view=False, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Derive a stricter qscore / accuracy variant of a dataset from its per-chunk sidecar.
+
+    Args:
+        dataset_dir (str): Dataset directory with a sidecar (see `summarize_dataset`).
+        output_dir (str): Output directory.
+        min_qscore (float): Minimum mean read qscore.
+        min_accuracy (float): Minimum alignment accuracy.
+        view (bool): Write a view (the selected row numbers) instead of copies of the arrays.
+        block_mb (int): Block size in MB.
+
+    Returns:
+        tuple: (number of rows kept, number of rows in the input).
+
+    Raises:
+        SystemExit: If the dataset has no sidecar.
+    """
+    dataset = load_dataset(dataset_dir)
+    if "summary" not in dataset:
+        print(f"[ERROR] '{dataset_dir}' has no '{SUMMARY_FILE}'. Run 'ctc_data.py summarize' on it first.")
+        sys.exit(1)
+
+    summary = dataset["summary"] if "rows" not in dataset else dataset["summary"][np.asarray(dataset["rows"])]
+    rows = np.flatnonzero((summary["qscore"] >= min_qscore) & (summary["accuracy"] >= min_accuracy))
+
+    if view:
+        os.makedirs(output_dir, exist_ok=True)
+        rows_path = os.path.join(output_dir, VIEW_ROWS_FILE)
+        with open(f"{rows_path}.partial", "wb") as f:
+            np.save(f, rows.astype(np.int64))
+        os.replace(f"{rows_path}.partial", rows_path)
+        with open(os.path.join(output_dir, VIEW_FILE), "w") as f:
+            json.dump({"source": os.path.abspath(dataset_dir), "min_qscore": min_qscore, "min_accuracy": min_accuracy}, f, indent=4)
+    else:
+        write_dataset([dataset], np.zeros(len(rows), dtype=np.int32), rows, output_dir, block_mb)
+
+    return len(rows), num_chunks(dataset)
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Merge, subsample, truncate, shuffle and split Bonito ctc-data datasets.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(sub, seed=True):
+        sub.add_argument("--block_mb", type=int, default=DEFAULT_BLOCK_MB, help="Size of the blocks copied at a time, in MB.")
+        if seed:
+            sub.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    info_parser = subparsers.add_parser("info", help="Print the shapes and dtypes of datasets.")
+    info_parser.add_argument("dataset_dirs", type=str, nargs="+", help="Dataset directories.")
+
+    merge_parser = subparsers.add_parser("merge", help="Concatenate datasets.")
+    merge_parser.add_argument("output_dir", type=str, help="Output directory.")
+    merge_parser.add_argument("dataset_dirs", type=str, nargs="+", help="Dataset directories.")
+    merge_parser.add_argument("--equal", action="store_true", help="Take the size of the smallest dataset from every input.")
+    merge_parser.add_argument("--shuffle", action="store_true", help="Write the rows in random order.")
+    add_common(merge_parser)
+
+    subsample_parser = subparsers.add_parser("subsample", help="Draw random rows of a dataset.")
+    subsample_parser.add_argument("dataset_dir", type=str, help="Dataset directory.")
+    subsample_parser.add_argument("output_dir", type=str, help="Output directory.")
+    subsample_parser.add_argument("--num_chunks", type=int, required=True, help="Number of chunks to draw.")
+    subsample_parser.add_argument("--shuffle", action="store_true", help="Write the rows in random order.")
+    add_common(subsample_parser)
+
+    truncate_parser = subparsers.add_parser("truncate", help="Keep the first rows of every dataset.")
+    truncate_parser.add_argument("dataset_dirs", type=str, nargs="+", help="Dataset directories.")
+    truncate_parser.add_argument("--num_chunks", type=int, default=None, help="Number of chunks to keep. Defaults to the smallest dataset.")
+    truncate_parser.add_argument("--output_name", type=str, default="processed", help="Name of the output subdirectory.")
+    add_common(truncate_parser, seed=False)
+
+    shuffle_parser = subparsers.add_parser("shuffle", help="Write the rows of a dataset in random order.")
+    shuffle_parser.add_argument("dataset_dir", type=str, help="Dataset directory.")
+    shuffle_parser.add_argument("output_dir", type=str, help="Output directory.")
+    add_common(shuffle_parser)
+
+    split_parser = subparsers.add_parser("split", help="Split a dataset into training and validation rows.")
+    split_parser.add_argument("dataset_dir", type=str, help="Dataset directory.")
+    split_parser.add_argument("output_dir", type=str, help="Output directory; validation rows go to output_dir/validation.")
+    group = split_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--valid_chunks", type=int, help="Number of validation chunks.")
+    group.add_argument("--valid_fraction", type=float, help="Fraction of chunks used for validation.")
+    split_parser.add_argument("--shuffle", action="store_true", help="Write the training rows in random order.")
+    add_common(split_parser)
+
+    summarize_parser = subparsers.add_parser("summarize", help="Write the per-chunk read ID, qscore and accuracy sidecar.")
+    summarize_parser.add_argument("dataset_dir", type=str, help="Dataset directory.")
+    summarize_parser.add_argument("--bam", type=str, default=None, help="BAM file of the basecalling run. Defaults to <dataset_dir>/basecalls.bam.")
+    summarize_parser.add_argument("--reference", type=str, required=True, help="Reference FASTA of the basecalling run.")
+    add_common(summarize_parser, seed=False)
+
+    filter_parser = subparsers.add_parser("filter", help="Derive a stricter qscore / accuracy variant from the sidecar.")
+    filter_parser.add_argument("dataset_dir", type=str, help="Dataset directory with a sidecar.")
+    filter_parser.add_argument("output_dir", type=str, help="Output directory.")
+    filter_parser.add_argument("--min_qscore", type=float, default=0.0, help="Minimum mean read qscore.")
+    filter_parser.add_argument("--min_accuracy", type=float, default=0.0, help="Minimum alignment accuracy.")
+    filter_parser.add_argument("--view", action="store_true", help="Write the selected row numbers instead of copying the arrays.")
+    add_common(filter_parser, seed=False)
+
+    args = parser.parse_args()
+
+    if getattr(args, "block_mb", 1) < 1:
+        print(f"[ERROR] The block size must be at least 1 MB (got {args.block_mb}).")
+        sys.exit(1)
+
+    if args.command == "info":
+        for path in args.dataset_dirs:
+            print_dataset_info(load_dataset(path))
+    elif args.command == "merge":
+        written = merge_datasets(args.dataset_dirs, args.output_dir, args.equal, args.shuffle, args.seed, args.block_mb)
+        print(f"[INFO] Merged {len(args.dataset_dirs)} dataset(s) into '{args.output_dir}' ({written} chunks).")
+    elif args.command == "subsample":
+        written = subsample_dataset(args.dataset_dir, args.output_dir, args.num_chunks, args.shuffle, args.seed, args.block_mb)
+        print(f"[INFO] Wrote {written} chunks to '{args.output_dir}'.")
+    elif args.command == "truncate":
+        kept = truncate_datasets(args.dataset_dirs, args.num_chunks, args.output_name, args.block_mb)
+        print(f"[INFO] Kept the first {kept} chunks of {len(args.dataset_dirs)} dataset(s) in '<dataset>/{args.output_name}'.")
+    elif args.command == "shuffle":
+        written = shuffle_dataset(args.dataset_dir, args.output_dir, args.seed, args.block_mb)
+        print(f"[INFO] Wrote {written} shuffled chunks to '{args.output_dir}'.")
+    elif args.command == "summarize":
+        bam_path = args.bam or os.path.join(args.dataset_dir, "basecalls.bam")
+        if not os.path.isfile(bam_path):
+            print(f"[ERROR] BAM file '{bam_path}' does not exist.")
+            sys.exit(1)
+        if not os.path.isfile(args.reference):
+            print(f"[ERROR] Reference file '{args.reference}' does not exist.")
+            sys.exit(1)
+        summary = summarize_dataset(args.dataset_dir, bam_path, args.reference, args.block_mb)
+        print(f"[INFO] Wrote the sidecar of {len(summary)} chunks to '{os.path.join(args.dataset_dir, SUMMARY_FILE)}'.")
+    elif args.command == "filter":
+        kept, total = filter_dataset(args.dataset_dir, args.output_dir, args.min_qscore, args.min_accuracy, args.view, args.block_mb)
+        kind = "view" if args.view else "dataset"
+        print(f"[INFO] Kept {kept} of {total} chunks (qscore >= {args.min_qscore}, accuracy >= {args.min_accuracy}) "
+              f"in {kind} '{args.output_dir}'.")
+    else:
+        valid_chunks = args.valid_chunks
+        if valid_chunks is None:
+            valid_chunks = int(round(num_chunks(load_dataset(args.dataset_dir)) * args.valid_fraction))
+        train, valid = split_dataset(args.dataset_dir, args.output_dir, valid_chunks, args.shuffle, args.seed, args.block_mb)
+        print(f"[INFO] Wrote {train} training chunks to '{args.output_dir}' and {valid} validation chunks to "
+              f"'{os.path.join(args.output_dir, VALIDATION_DIR)}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Description:
+    Quality-control report for Bonito ctc-data datasets (`chunks.npy`, `references.npy`, `reference_lengths.npy`).
+    One or more datasets, e.g. `sup_qscore_0_acc_0.99` and `sup_qscore_30_acc_0.995`, are scanned in blocks of rows
+    across a process pool, and the statistics are written side by side to a JSON file and an HTML page.
+
+Key Features:
+    - **Bounded Memory:** Every worker opens the arrays with `mmap_mode='r'` and reads one block of rows at a time
+      (`--block_mb`), so memory use is about `--workers` x `--block_mb` whatever the size of `chunks.npy`. Only one
+      8-byte hash per chunk is kept for the whole run.
+    - **Additive Statistics:** Workers return histograms over fixed bins and counters, which are summed per dataset;
+      the result does not depend on the number of workers or the block size.
+    - **Reference Statistics:** Histogram and summary of `reference_lengths`, and base composition of `references`
+      over the real length of each reference (Bonito's encoding 1-4 = A, C, G, T).
+    - **Signal Statistics:** Histograms of the per-chunk signal mean and standard deviation, the number of samples
+      and chunks at or beyond `--clip_value` in absolute value, and chunks holding NaN or infinite values.
+    - **Duplicate Chunks:** Every chunk is hashed (BLAKE2b, 8 bytes); the report counts chunks repeated within a
+      dataset and chunks shared with each of the other datasets.
+    - **Runtime:** The wall time of the scan is printed and stored in the report.
+    - **Views:** `ctc_data.py` views are accepted and report on their selected rows.
+
+Usage:
+    python ctc_qc.py <dataset_dir> [<dataset_dir> ...] --output <prefix> [--workers <N>] [--block_mb <MB>]
+                     [--clip_value <V>]
+
+Arguments:
+    dataset_dir  : Directories holding `chunks.npy`, `references.npy` and `reference_lengths.npy`, or views.
+    --output     : Output prefix; the report is written to `<prefix>.json` and `<prefix>.html`.
+    --workers    : (Optional) Number of worker processes. Defaults to the number of CPUs.
+    --block_mb   : (Optional) Size of the block read by a worker at a time, in MB. Defaults to 64.
+    --clip_value : (Optional) Absolute signal value counted as clipped. Defaults to 5.0.
+
+Requirements:
+    - The `numpy` Python package.
+"""
+
+import os
+import sys
+import html
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from ctc_data import load_dataset, num_chunks, block_rows
+
+DEFAULT_QC_BLOCK_MB = 64
+DEFAULT_CLIP_VALUE = 5.0
+
+# Fixed histogram bins, so that the partial results of the workers can be summed
+MEAN_BINS = np.linspace(-5.0, 5.0, 101)
+STD_BINS = np.linspace(0.0, 5.0, 101)
+
+# Bonito's base encoding in references.npy
+BASES = {1: "A", 2: "C", 3: "G", 4: "T"}
+
+def chunk_hashes(chunks):
+    """
+    Hash every chunk of a block.
+
+    Args:
+        chunks (numpy.ndarray): Block of chunks.
+
+    Returns:
+        numpy.ndarray: One uint64 hash per chunk.
+    """
+    chunks = np.ascontiguousarray(chunks)
+    digests = b"".join(hashlib.blake2b(row.tobytes(), digest_size=8).digest() for row in chunks)
+    return np.frombuffer(digests, dtype=np.uint64)
+
+def scan_block(task):
+    """
+    Compute the statistics of one block of rows. Runs in a worker process.
+
+    Args:
+        task (tuple): (dataset directory, first row, end row, clip value). Rows are rows of the view for views.
+
+    Returns:
+        dict: Partial statistics of the block and the hashes of its chunks.
+    """
+    dataset_dir, start, end, clip_value = task
+    dataset = load_dataset(dataset_dir)
+    rows = np.arange(start, end)
+    if "rows" in dataset:
+        # Sorted so that the block is read in file order
+        rows = np.sort(np.asarray(dataset["rows"][start:end]))
+
+    chunks = np.asarray(dataset["chunks"][rows], dtype=np.float32)
+    references = np.asarray(dataset["references"][rows])
+    lengths = np.asarray(dataset["lengths"][rows]).astype(np.int64)
+
+    finite = np.isfinite(chunks).all(axis=1)
+    means = chunks[finite].mean(axis=1)
+    stds = chunks[finite].std(axis=1)
+    clipped = (np.abs(chunks[finite]) >= clip_value).sum(axis=1)
+
+    in_reference = np.arange(references.shape[1])[None, :] < lengths[:, None]
+    return {
+        "length_counts": np.bincount(lengths, minlength=references.shape[1] + 1),
+        "base_counts": np.bincount(references[in_reference].astype(np.int64), minlength=256),
+        "mean_counts": np.histogram(np.clip(means, MEAN_BINS[0], MEAN_BINS[-1]), bins=MEAN_BINS)[0],
+        "std_counts": np.histogram(np.clip(stds, STD_BINS[0], STD_BINS[-1]), bins=STD_BINS)[0],
+        "mean_sum": float(means.sum(dtype=np.float64)),
+        "std_sum": float(stds.sum(dtype=np.float64)),
+        "clipped_samples": int(clipped.sum()),
+        "clipped_chunks": int((clipped > 0).sum()),
+        "nonfinite_chunks": int((~finite).sum()),
+        "hashes": chunk_hashes(dataset["chunks"][rows]),
+    }
+
+def merge_partials(total, partial):
+    """
+    Add the partial statistics of one block to the running totals of its dataset.
+
+    Args:
+        total (dict or None): Running totals, or None for the first block.
+        partial (dict): Statistics returned by `scan_block`.
+
+    Returns:
+        dict: Updated totals; `hashes` becomes a list of hash arrays.
+    """
+    if total is None:
+        return dict(partial, hashes=[partial["hashes"]])
+    for key, value in partial.items():
+        if key == "hashes":
+            total["hashes"].append(value)
+        elif key == "length_counts" and len(value) != len(total[key]):
+            width = max(len(value), len(total[key]))
+            total[key] = np.pad(total[key], (0, width - len(total[key]))) + np.pad(value, (0, width - len(value)))
+        else:
+            total[key] = total[key] + value
+    return total
+
+def histogram_median(counts):
+    """
+    Return the median of integer values given as a histogram.
+
+    Args:
+        counts (numpy.ndarray): Count of every value starting at 0.
+
+    Returns:
+        int or None: Median value, or None for an empty histogram.
+    """
+    total = counts.sum()
+    if total == 0:
+        return None
+    return int(np.searchsorted(np.cumsum(counts), (total + 1) / 2))
+
+def summarize_totals(dataset, totals, clip_value):
+    """
+    Turn the summed statistics of a dataset into its section of the report.
+
+    Args:
+        dataset (dict): Dataset returned by `load_dataset`.
+        totals (dict): Summed statistics returned by `merge_partials`.
+        clip_value (float): Absolute signal value counted as clipped.
+
+    Returns:
+        dict: Report section of the dataset.
+    """
+    count = num_chunks(dataset)
+    lengths = totals["length_counts"]
+    values = np.arange(len(lengths))
+    present = np.nonzero(lengths)[0]
+    finite = count - totals["nonfinite_chunks"]
+    bases = totals["base_counts"]
+    num_bases = int(bases.sum())
+
+    return {
+        "path": dataset["path"],
+        "num_chunks": count,
+        "chunk_length": int(dataset["chunks"].shape[1]),
+        "chunk_dtype": str(dataset["chunks"].dtype),
+        "reference_width": int(dataset["references"].shape[1]),
+        "reference_lengths": {
+            "min": int(present[0]) if len(present) else None,
+            "max": int(present[-1]) if len(present) else None,
+            "mean": float((values * lengths).sum() / count) if count else None,
+            "median": histogram_median(lengths),
+            "histogram": lengths.tolist(),
+        },
+        "bases": {
+            "counts": {name: int(bases[code]) for code, name in BASES.items()},
+            "fractions": {name: float(bases[code] / num_bases) if num_bases else 0.0 for code, name in BASES.items()},
+            "other": num_bases - int(sum(bases[code] for code in BASES)),
+        },
+        "signal": {
+            "mean_of_means": totals["mean_sum"] / finite if finite else None,
+            "mean_of_stds": totals["std_sum"] / finite if finite else None,
+            "mean_histogram": {"edges": MEAN_BINS.tolist(), "counts": totals["mean_counts"].tolist()},
+            "std_histogram": {"edges": STD_BINS.tolist(), "counts": totals["std_counts"].tolist()},
+            "clip_value": clip_value,
+            "clipped_samples": totals["clipped_samples"],
+            "clipped_chunks": totals["clipped_chunks"],
+            "nonfinite_chunks": totals["nonfinite_chunks"],
+        },
+    }
+
+def find_duplicates(sections, hashes):
+    """
+    Add duplicate-chunk counts to the report sections.
+
+    Args:
+        sections (list of dict): Report sections, one per dataset.
+        hashes (list of numpy.ndarray): Chunk hashes of every dataset.
+    """
+    unique = [np.unique(h) for h in hashes]
+    for idx, section in enumerate(sections):
+        section["duplicates"] = {
+            "repeated_chunks": int(len(hashes[idx]) - len(unique[idx])),
+            "shared_with": {
+                sections[other]["path"]: int(np.isin(hashes[idx], unique[other], assume_unique=False).sum())
+                for other in range(len(sections)) if other != idx
+            },
+        }
+
+def run_qc(dataset_dirs, workers=None, block_mb=DEFAULT_QC_BLOCK_MB, clip_value=DEFAULT_CLIP_VALUE):
+    """
+    Scan datasets across a process pool and build the report.
+
+    Args:
+        dataset_dirs (list of str): Dataset directories or views.
+        workers (int or None): Number of worker processes; None for the number of CPUs.
+        block_mb (int): Size of the block read by a worker at a time, in MB.
+        clip_value (float): Absolute signal value counted as clipped.
+
+    Returns:
+        dict: The report.
+    """
+    start_time = time.perf_counter()
+    datasets = [load_dataset(d) for d in dataset_dirs]
+
+    tasks = []
+    for idx, dataset in enumerate(datasets):
+        step = block_rows([dataset], block_mb)
+        count = num_chunks(dataset)
+        # An empty dataset still gets one (empty) block, so that every dataset has totals
+        tasks.extend((idx, (dataset_dirs[idx], start, min(start + step, count), clip_value))
+                     for start in range(0, max(count, 1), step))
+    print(f"[INFO] Scanning {len(datasets)} dataset(s) in {len(tasks)} block(s).")
+
+    totals = [None] * len(datasets)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for (idx, _), partial in zip(tasks, executor.map(scan_block, [task for _, task in tasks])):
+            totals[idx] = merge_partials(totals[idx], partial)
+
+    sections, hashes = [], []
+    for dataset, total in zip(datasets, totals):
+        sections.append(summarize_totals(dataset, total, clip_value))
+        hashes.append(np.concatenate(total["hashes"]))
+    find_duplicates(sections, hashes)
+
+    return {
+        "generated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "runtime_seconds": round(time.perf_counter() - start_time, 3),
+        "workers": workers or os.cpu_count(),
+        "block_mb": block_mb,
+        "datasets": sections,
+    }
+
+def svg_histogram(counts, labels, width=480, height=120):
+    """
+    Render a histogram as an inline SVG bar chart.
+
+    Args:
+        counts (list of int): Bar heights.
+        labels (tuple): (label of the first bar, label of the last bar).
+        width (int): Chart width in pixels.
+        height (int): Chart height in pixels.
+
+    Returns:
+        str: SVG markup.
+    """
+    peak = max(counts) if counts and max(counts) > 0 else 1
+    bar = width / max(1, len(counts))
+    bars = "".join(
+        f'<rect x="{i * bar:.2f}" y="{height - c / peak * height:.2f}" width="{max(bar - 0.5, 0.5):.2f}" '
+        f'height="{c / peak * height:.2f}" fill="#4878a8"/>'
+        for i, c in enumerate(counts) if c
+    )
+    return (f'<svg width="{width}" height="{height + 16}" xmlns="http://www.w3.org/2000/svg">{bars}'
+            f'<text x="0" y="{height + 14}" font-size="11">{html.escape(str(labels[0]))}</text>'
+            f'<text x="{width}" y="{height + 14}" font-size="11" text-anchor="end">{html.escape(str(labels[1]))}</text></svg>')
+
+def write_html(report, path):
+    """
+    Write the report as a self-contained HTML page with the datasets side by side.
+
+    Args:
+        report (dict): Report returned by `run_qc`.
+        path (str): Output path.
+    """
+    def fmt(value):
+        if value is None:
+            return "-"
+        return f"{value:.4f}" if isinstance(value, float) else str(value)
+
+    sections = report["datasets"]
+    rows = [
+        ("Chunks", [s["num_chunks"] for s in sections]),
+        ("Chunk length / dtype", [f"{s['chunk_length']} / {s['chunk_dtype']}" for s in sections]),
+        ("Reference width", [s["reference_width"] for s in sections]),
+        ("Reference length min / median / max",
+         [f"{fmt(s['reference_lengths']['min'])} / {fmt(s['reference_lengths']['median'])} / "
+          f"{fmt(s['reference_lengths']['max'])}" for s in sections]),
+        ("Reference length mean", [s["reference_lengths"]["mean"] for s in sections]),
+    ]
+    rows += [(f"Base {name}", [s["bases"]["fractions"][name] for s in sections]) for name in BASES.values()]
+    rows += [
+        ("Other symbols", [s["bases"]["other"] for s in sections]),
+        ("Signal mean (mean over chunks)", [s["signal"]["mean_of_means"] for s in sections]),
+        ("Signal std (mean over chunks)", [s["signal"]["mean_of_stds"] for s in sections]),
+        (f"Clipped samples (|x| >= {report['datasets'][0]['signal']['clip_value'] if sections else ''})",
+         [s["signal"]["clipped_samples"] for s in sections]),
+        ("Chunks with clipped samples", [s["signal"]["clipped_chunks"] for s in sections]),
+        ("Chunks with NaN / inf", [s["signal"]["nonfinite_chunks"] for s in sections]),
+        ("Repeated chunks", [s["duplicates"]["repeated_chunks"] for s in sections]),
+        ("Chunks shared with other datasets", [sum(s["duplicates"]["shared_with"].values()) for s in sections]),
+    ]
+
+    header = "".join(f"<th>{html.escape(s['path'])}</th>" for s in sections)
+    body = "".join(f"<tr><td>{html.escape(name)}</td>{''.join(f'<td>{html.escape(fmt(v))}</td>' for v in values)}</tr>"
+                   for name, values in rows)
+    charts = []
+    for title, key, labels in (
+        ("Reference lengths", None, None),
+        ("Per-chunk signal mean", "mean_histogram", (MEAN_BINS[0], MEAN_BINS[-1])),
+        ("Per-chunk signal std", "std_histogram", (STD_BINS[0], STD_BINS[-1])),
+    ):
+        cells = []
+        for s in sections:
+            if key is None:
+                counts = s["reference_lengths"]["histogram"]
+                cells.append(svg_histogram(counts, (0, len(counts) - 1)))
+            else:
+                cells.append(svg_histogram(s["signal"][key]["counts"], labels))
+        charts.append(f"<tr><td>{title}</td>{''.join(f'<td>{c}</td>' for c in cells)}</tr>")
+
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>ctc-data QC</title>
+<style>body {{ font-family: sans-serif; }} table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; vertical-align: top; }}</style></head>
+<body><h1>ctc-data QC</h1>
+<p>Generated {html.escape(report['generated'])} in {report['runtime_seconds']:.1f} s with {report['workers']} worker(s).</p>
+<table><tr><th></th>{header}</tr>{body}{''.join(charts)}</table>
+</body></html>
+"""
+    with open(path, "w") as f:
+        f.write(page)
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Write a QC report for one or more Bonito ctc-data datasets.")
+    parser.add_argument("dataset_dirs", type=str, nargs="+", help="Dataset directories or views.")
+    parser.add_argument("--output", type=str, required=True, help="Output prefix for <prefix>.json and <prefix>.html.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--block_mb", type=int, default=DEFAULT_QC_BLOCK_MB, help="Size of the block read at a time, in MB.")
+    parser.add_argument("--clip_value", type=float, default=DEFAULT_CLIP_VALUE, help="Absolute signal value counted as clipped.")
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        print(f"[ERROR] The number of workers must be at least 1 (got {args.workers}).")
+        sys.exit(1)
+    if args.block_mb < 1:
+        print(f"[ERROR] The block size must be at least 1 MB (got {args.block_mb}).")
+        sys.exit(1)
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    report = run_qc(args.dataset_dirs, args.workers, args.block_mb, args.clip_value)
+
+    with open(f"{args.output}.json", "w") as f:
+        json.dump(report, f, indent=4)
+    write_html(report, f"{args.output}.html")
+
+    for section in report["datasets"]:
+        print(f"[INFO] {section['path']}: {section['num_chunks']} chunks, median reference length "
+              f"{section['reference_lengths']['median']}, {section['duplicates']['repeated_chunks']} repeated chunks, "
+              f"{section['signal']['clipped_chunks']} chunks with clipped samples")
+    print(f"[INFO] Report written to '{args.output}.json' and '{args.output}.html'.")
+    print(f"[INFO] QC runtime: {report['runtime_seconds']:.1f} seconds")
+
+if __name__ == "__main__":
+    main()
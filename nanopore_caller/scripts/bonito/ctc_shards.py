@@ -0,0 +1,432 @@
+"""
+Description:
+    Sharded storage format and training loader for Bonito ctc-data. A ctc-data dataset (`chunks.npy`,
+    `references.npy`, `reference_lengths.npy`) is packed into fixed-size shards that are each read in one sequential
+    pass, instead of being sampled row by row through a memory map, which causes random page faults on network
+    storage.
+
+Key Features:
+    - **Fixed-Size Shards:** `shard_<i>.npz` (uncompressed) holds `--shard_size` consecutive chunks; `index.json`
+      lists the shards and the layout needed to convert back.
+    - **Compact Signal:** Chunks are optionally quantized to int16 with a per-chunk scale and offset (the rounding
+      error is at most half a quantization step, i.e. 1/131068 of the chunk's signal range). With `--no_quantize`
+      the original dtype is kept.
+    - **Packed References:** References are stored as uint8 and concatenated at their real length, with an offsets
+      array, instead of padded to the longest reference.
+    - **Block-Shuffling Loader:** `iter_batches` visits the shards in random order, reads `buffer_shards` of them at a
+      time, shuffles the rows within that buffer and yields batches in the `(data, targets, lengths)` layout of
+      Bonito's `ChunkDataSet`. The next shard is read in a background thread while the current one is consumed.
+      `torch_loader` wraps it in a `torch.utils.data.DataLoader`.
+    - **Round Trip:** `pack` reads the current layout (or a `ctc_data.py` view) in bounded blocks, and `unpack`
+      writes it back with preallocated memory maps. The per-chunk sidecar (`chunk_summary.npy`) is carried along.
+
+Usage:
+    python ctc_shards.py pack <dataset_dir> <shard_dir> [--shard_size <N>] [--no_quantize]
+    python ctc_shards.py unpack <shard_dir> <dataset_dir>
+    python ctc_shards.py info <shard_dir>
+    python ctc_shards.py iterate <shard_dir> [--batch_size <N>] [--buffer_shards <N>] [--max_batches <N>] [--seed <N>]
+
+Arguments:
+    pack            : Convert a ctc-data dataset into shards.
+    unpack          : Convert shards back into `chunks.npy`, `references.npy` and `reference_lengths.npy`.
+    info            : Print the layout of a shard directory.
+    iterate         : Read batches with the training loader and report the throughput.
+    --shard_size    : (Optional) Chunks per shard. Defaults to 16384.
+    --no_quantize   : (Optional) Store the signal in its original dtype instead of int16.
+    --batch_size    : (Optional) Chunks per batch. Defaults to 64.
+    --buffer_shards : (Optional) Number of shards shuffled together. Defaults to 4.
+
+Requirements:
+    - The `numpy` Python package; `torch` for `torch_loader`.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from ctc_data import load_dataset, num_chunks, SUMMARY_FILE, DATASET_FILES
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+DEFAULT_SHARD_SIZE = 16384
+
+# int16 values used for quantized signal; -32768 is left unused so the range is symmetric
+QUANT_LEVELS = 32767
+
+def shard_name(idx):
+    """
+    Return the file name of a shard.
+
+    Args:
+        idx (int): Shard index.
+
+    Returns:
+        str: File name.
+    """
+    return f"shard_{idx:05d}.npz"
+
+def quantize(chunks):
+    """
+    Quantize chunks to int16 with a per-chunk scale and offset.
+
+    Args:
+        chunks (numpy.ndarray): Signal of shape (N, chunk_length).
+
+    Returns:
+        tuple: (int16 signal, float32 scale, float32 offset); the signal is recovered as `q * scale + offset`.
+    """
+    chunks = np.asarray(chunks, dtype=np.float32)
+    low, high = chunks.min(axis=1), chunks.max(axis=1)
+    offset = (high + low) / 2
+    scale = (high - low) / (2 * QUANT_LEVELS)
+    scale[scale == 0] = 1.0
+    signal = np.rint((chunks - offset[:, None]) / scale[:, None])
+    return np.clip(signal, -QUANT_LEVELS, QUANT_LEVELS).astype(np.int16), scale.astype(np.float32), offset.astype(np.float32)
+
+def dequantize(signal, scale, offset):
+    """
+    Recover float32 signal from quantized chunks.
+
+    Args:
+        signal (numpy.ndarray): int16 signal of shape (N, chunk_length).
+        scale (numpy.ndarray): Per-chunk scale.
+        offset (numpy.ndarray): Per-chunk offset.
+
+    Returns:
+        numpy.ndarray: float32 signal.
+    """
+    return signal.astype(np.float32) * scale[:, None] + offset[:, None]
+
+def load_index(shard_dir):
+    """
+    Load the index of a shard directory.
+
+    Args:
+        shard_dir (str): Shard directory.
+
+    Returns:
+        dict: Index with the layout and the list of shards.
+
+    Raises:
+        SystemExit: If the index is missing or has another version.
+    """
+    index_path = os.path.join(shard_dir, INDEX_FILE)
+    if not os.path.isfile(index_path):
+        print(f"[ERROR] '{INDEX_FILE}' not found in '{shard_dir}'.")
+        sys.exit(1)
+    with open(index_path) as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        print(f"[ERROR] '{index_path}' has version {index.get('version')}; expected {INDEX_VERSION}.")
+        sys.exit(1)
+    return index
+
+def read_shard(shard_dir, index, idx):
+    """
+    Read one shard in a single sequential pass.
+
+    Args:
+        shard_dir (str): Shard directory.
+        index (dict): Index returned by `load_index`.
+        idx (int): Shard index.
+
+    Returns:
+        dict: Dictionary with `chunks` (float32 if quantized, otherwise the stored dtype), `references` (packed
+        uint8), `reference_offsets` and, if present, `summary`.
+    """
+    with np.load(os.path.join(shard_dir, index["shards"][idx]["name"])) as shard:
+        arrays = {key: shard[key] for key in shard.files}
+    if index["quantized"]:
+        arrays["chunks"] = dequantize(arrays.pop("signal"), arrays.pop("scale"), arrays.pop("offset"))
+    else:
+        arrays["chunks"] = arrays.pop("signal")
+    return arrays
+
+def pack_dataset(dataset_dir, shard_dir, shard_size=DEFAULT_SHARD_SIZE, quantize_signal=True):
+    """
+    Convert a ctc-data dataset into shards.
+
+    Args:
+        dataset_dir (str): Dataset directory (or `ctc_data.py` view).
+        shard_dir (str): Output directory.
+        shard_size (int): Chunks per shard.
+        quantize_signal (bool): Store the signal as int16 with a per-chunk scale and offset.
+
+    Returns:
+        dict: The index written to `index.json`.
+    """
+    dataset = load_dataset(dataset_dir)
+    total = num_chunks(dataset)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    shards = []
+    for shard_idx, start in enumerate(range(0, total, shard_size)):
+        rows = np.arange(start, min(start + shard_size, total))
+        if "rows" in dataset:
+            rows = np.asarray(dataset["rows"][rows])
+
+        chunks = np.asarray(dataset["chunks"][rows])
+        lengths = np.asarray(dataset["lengths"][rows]).astype(np.int64)
+        references = np.asarray(dataset["references"][rows])
+        packed = references[np.arange(references.shape[1])[None, :] < lengths[:, None]].astype(np.uint8)
+
+        arrays = {"reference_offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64), "references": packed}
+        if quantize_signal:
+            arrays["signal"], arrays["scale"], arrays["offset"] = quantize(chunks)
+        else:
+            arrays["signal"] = chunks
+        if "summary" in dataset:
+            arrays["summary"] = np.asarray(dataset["summary"][rows])
+
+        path = os.path.join(shard_dir, shard_name(shard_idx))
+        with open(f"{path}.partial", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(f"{path}.partial", path)
+        shards.append({"name": shard_name(shard_idx), "num_chunks": len(rows)})
+        print(f"[INFO] Wrote {shard_name(shard_idx)} ({len(rows)} chunks)")
+
+    index = {
+        "version": INDEX_VERSION,
+        "num_chunks": total,
+        "chunk_length": int(dataset["chunks"].shape[1]),
+        "chunk_dtype": str(dataset["chunks"].dtype),
+        "reference_width": int(dataset["references"].shape[1]),
+        "reference_lengths_dtype": str(dataset["lengths"].dtype),
+        "quantized": quantize_signal,
+        "has_summary": "summary" in dataset,
+        "shards": shards,
+    }
+    with open(os.path.join(shard_dir, f"{INDEX_FILE}.partial"), "w") as f:
+        json.dump(index, f, indent=4)
+    os.replace(os.path.join(shard_dir, f"{INDEX_FILE}.partial"), os.path.join(shard_dir, INDEX_FILE))
+    return index
+
+def unpack_shards(shard_dir, dataset_dir):
+    """
+    Convert shards back into the `chunks.npy` / `references.npy` / `reference_lengths.npy` layout.
+
+    Args:
+        shard_dir (str): Shard directory.
+        dataset_dir (str): Output dataset directory.
+
+    Returns:
+        int: Number of chunks written.
+    """
+    index = load_index(shard_dir)
+    total = index["num_chunks"]
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    paths = dict(zip(("chunks", "references", "lengths"), (os.path.join(dataset_dir, name) for name in DATASET_FILES)))
+    outputs = {
+        "chunks": np.lib.format.open_memmap(f"{paths['chunks']}.partial", mode="w+", dtype=index["chunk_dtype"],
+                                            shape=(total, index["chunk_length"])),
+        "references": np.lib.format.open_memmap(f"{paths['references']}.partial", mode="w+", dtype=np.uint8,
+                                                shape=(total, index["reference_width"])),
+        "lengths": np.lib.format.open_memmap(f"{paths['lengths']}.partial", mode="w+",
+                                             dtype=index["reference_lengths_dtype"], shape=(total,)),
+    }
+    summaries = []
+
+    start = 0
+    for idx in range(len(index["shards"])):
+        shard = read_shard(shard_dir, index, idx)
+        count = len(shard["chunks"])
+        lengths = np.diff(shard["reference_offsets"])
+        references = np.zeros((count, index["reference_width"]), dtype=np.uint8)
+        references[np.arange(index["reference_width"])[None, :] < lengths[:, None]] = shard["references"]
+
+        outputs["chunks"][start:start + count] = shard["chunks"]
+        outputs["references"][start:start + count] = references
+        outputs["lengths"][start:start + count] = lengths
+        if "summary" in shard:
+            summaries.append(shard["summary"])
+        start += count
+
+    for key, output in outputs.items():
+        output.flush()
+        os.replace(f"{paths[key]}.partial", paths[key])
+    if index.get("has_summary") and summaries:
+        with open(os.path.join(dataset_dir, f"{SUMMARY_FILE}.partial"), "wb") as f:
+            np.save(f, np.concatenate(summaries))
+        os.replace(os.path.join(dataset_dir, f"{SUMMARY_FILE}.partial"), os.path.join(dataset_dir, SUMMARY_FILE))
+    return total
+
+def make_batch(chunks, references, offsets, rows):
+    """
+    Assemble one batch in the layout of Bonito's `ChunkDataSet`.
+
+    Args:
+        chunks (numpy.ndarray): Signal of the buffered chunks.
+        references (numpy.ndarray): Packed references of the buffered chunks.
+        offsets (numpy.ndarray): Reference offsets of the buffered chunks.
+        rows (numpy.ndarray): Buffer rows in the batch.
+
+    Returns:
+        tuple: (data float32 (B, 1, chunk_length), targets int64 (B, longest reference), lengths int64 (B,)).
+    """
+    lengths = (offsets[rows + 1] - offsets[rows]).astype(np.int64)
+    targets = np.zeros((len(rows), int(lengths.max()) if len(rows) else 0), dtype=np.int64)
+    for i, (row, length) in enumerate(zip(rows, lengths)):
+        targets[i, :length] = references[offsets[row]:offsets[row] + length]
+    return chunks[rows][:, None, :].astype(np.float32, copy=False), targets, lengths
+
+def iter_batches(shard_dir, batch_size=64, shuffle=True, buffer_shards=4, seed=0, drop_last=True):
+    """
+    Yield training batches, shuffling at shard level and within a buffer of shards.
+
+    Shards are read whole and in sequence, so storage only sees large sequential reads. The next shard is read in a
+    background thread while the buffered ones are consumed.
+
+    Args:
+        shard_dir (str): Shard directory.
+        batch_size (int): Chunks per batch.
+        shuffle (bool): Visit shards in random order and shuffle rows within the buffer.
+        buffer_shards (int): Number of shards shuffled together.
+        seed (int): Random seed, e.g. the epoch number.
+        drop_last (bool): Drop the final incomplete batch.
+
+    Yields:
+        tuple: (data, targets, lengths) as returned by `make_batch`.
+    """
+    index = load_index(shard_dir)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(index["shards"])) if shuffle else np.arange(len(index["shards"]))
+
+    def concat(shards):
+        offsets, base = [np.zeros(1, dtype=np.int64)], 0
+        for shard in shards:
+            offsets.append(shard["reference_offsets"][1:] + base)
+            base += shard["reference_offsets"][-1]
+        return (np.concatenate([s["chunks"] for s in shards]), np.concatenate([s["references"] for s in shards]),
+                np.concatenate(offsets))
+
+    carry = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(read_shard, shard_dir, index, order[0]) if len(order) else None
+        for group_start in range(0, len(order), buffer_shards):
+            group = []
+            for position in range(group_start, min(group_start + buffer_shards, len(order))):
+                group.append(pending.result())
+                following = position + 1
+                pending = executor.submit(read_shard, shard_dir, index, order[following]) if following < len(order) else None
+
+            # Rows left over from the previous buffer are shuffled into this one
+            if carry is not None:
+                group.append(carry)
+            chunks, references, offsets = concat(group)
+            rows = rng.permutation(len(chunks)) if shuffle else np.arange(len(chunks))
+
+            usable = len(rows) - len(rows) % batch_size
+            for batch_start in range(0, usable, batch_size):
+                yield make_batch(chunks, references, offsets, rows[batch_start:batch_start + batch_size])
+
+            leftover = np.sort(rows[usable:])
+            carry = None
+            if len(leftover):
+                ends = offsets[leftover + 1]
+                starts = offsets[leftover]
+                carry = {
+                    "chunks": chunks[leftover],
+                    "references": np.concatenate([references[s:e] for s, e in zip(starts, ends)]),
+                    "reference_offsets": np.concatenate([[0], np.cumsum(ends - starts)]).astype(np.int64),
+                }
+
+    if carry is not None and not drop_last:
+        rows = np.arange(len(carry["chunks"]))
+        yield make_batch(carry["chunks"], carry["references"], carry["reference_offsets"], rows)
+
+def torch_loader(shard_dir, batch_size=64, shuffle=True, buffer_shards=4, seed=0):
+    """
+    Wrap `iter_batches` in a `torch.utils.data.DataLoader` that yields tensors.
+
+    Args:
+        shard_dir (str): Shard directory.
+        batch_size (int): Chunks per batch.
+        shuffle (bool): Shuffle shards and rows.
+        buffer_shards (int): Number of shards shuffled together.
+        seed (int): Random seed; pass the epoch number to reshuffle every epoch.
+
+    Returns:
+        torch.utils.data.DataLoader: Loader yielding (data, targets, lengths) tensors.
+    """
+    import torch
+    from torch.utils.data import DataLoader, IterableDataset
+
+    class ShardedChunks(IterableDataset):
+        def __iter__(self):
+            for data, targets, lengths in iter_batches(shard_dir, batch_size, shuffle, buffer_shards, seed):
+                yield torch.from_numpy(data), torch.from_numpy(targets), torch.from_numpy(lengths)
+
+    return DataLoader(ShardedChunks(), batch_size=None, pin_memory=True)
+
+def print_index(shard_dir, index):
+    """
+    Print the layout of a shard directory.
+
+    Args:
+        shard_dir (str): Shard directory.
+        index (dict): Index returned by `load_index`.
+    """
+    size = sum(os.path.getsize(os.path.join(shard_dir, shard["name"])) for shard in index["shards"])
+    print(f"[INFO] {shard_dir}: {index['num_chunks']} chunks in {len(index['shards'])} shard(s), {size / 1024 ** 2:.1f} MB")
+    print(f"       chunk length {index['chunk_length']} ({'int16 quantized' if index['quantized'] else index['chunk_dtype']}), "
+          f"reference width {index['reference_width']}, sidecar {'yes' if index.get('has_summary') else 'no'}")
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Pack, unpack and read sharded Bonito ctc-data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Convert a ctc-data dataset into shards.")
+    pack_parser.add_argument("dataset_dir", type=str, help="Dataset directory.")
+    pack_parser.add_argument("shard_dir", type=str, help="Output shard directory.")
+    pack_parser.add_argument("--shard_size", type=int, default=DEFAULT_SHARD_SIZE, help="Chunks per shard.")
+    pack_parser.add_argument("--no_quantize", action="store_true", help="Keep the signal in its original dtype.")
+
+    unpack_parser = subparsers.add_parser("unpack", help="Convert shards back into a ctc-data dataset.")
+    unpack_parser.add_argument("shard_dir", type=str, help="Shard directory.")
+    unpack_parser.add_argument("dataset_dir", type=str, help="Output dataset directory.")
+
+    info_parser = subparsers.add_parser("info", help="Print the layout of a shard directory.")
+    info_parser.add_argument("shard_dir", type=str, help="Shard directory.")
+
+    iterate_parser = subparsers.add_parser("iterate", help="Read batches with the training loader and report the throughput.")
+    iterate_parser.add_argument("shard_dir", type=str, help="Shard directory.")
+    iterate_parser.add_argument("--batch_size", type=int, default=64, help="Chunks per batch.")
+    iterate_parser.add_argument("--buffer_shards", type=int, default=4, help="Number of shards shuffled together.")
+    iterate_parser.add_argument("--max_batches", type=int, default=None, help="Stop after this many batches.")
+    iterate_parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        if args.shard_size < 1:
+            print(f"[ERROR] The shard size must be at least 1 (got {args.shard_size}).")
+            sys.exit(1)
+        index = pack_dataset(args.dataset_dir, args.shard_dir, args.shard_size, not args.no_quantize)
+        print_index(args.shard_dir, index)
+    elif args.command == "unpack":
+        total = unpack_shards(args.shard_dir, args.dataset_dir)
+        print(f"[INFO] Wrote {total} chunks to '{args.dataset_dir}'.")
+    elif args.command == "info":
+        print_index(args.shard_dir, load_index(args.shard_dir))
+    else:
+        if args.batch_size < 1 or args.buffer_shards < 1:
+            print("[ERROR] --batch_size and --buffer_shards must be at least 1.")
+            sys.exit(1)
+        start, batches, chunks = time.perf_counter(), 0, 0
+        for data, _, _ in iter_batches(args.shard_dir, args.batch_size, True, args.buffer_shards, args.seed):
+            batches += 1
+            chunks += len(data)
+            if args.max_batches and batches >= args.max_batches:
+                break
+        elapsed = time.perf_counter() - start
+        print(f"[INFO] Read {batches} batches ({chunks} chunks) in {elapsed:.2f} s "
+              f"({chunks / elapsed if elapsed else 0:.0f} chunks/s).")
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,130 @@
+"""
+Description:
+    Distributes the files of a directory into subfolders whose total size stays within a limit, so that each subfolder
+    can be basecalled by one Dorado job. Subfolders that are already within the limit are kept; otherwise the files are
+    flattened and packed again, largest first. With `--mode link` the source directory is left untouched and the
+    subfolders are written as links into a separate target directory, together with a layout manifest.
+
+Usage:
+    python distribute_files_by_size.py <source_dir> <target_dir> <size_limit_gb> [--mode {move,link}]
+                                       [--link_type {symlink,hardlink}] [--link_threads <N>]
+                                       [--cost_model {size,samples}] [--scan_cache <cache_file>]
+
+Arguments:
+    source_dir     : Directory containing the files to distribute.
+    target_dir     : Directory to create the subfolders in.
+    size_limit_gb  : Maximum size per subfolder in gigabytes.
+    --mode         : (Optional) `move` moves the files into subfolders (default); `link` writes subfolders of links
+                     plus a manifest into target_dir.
+    --link_type    : (Optional) Type of the links created with `--mode link`. Defaults to `symlink`.
+    --link_threads : (Optional) Number of threads creating links concurrently. Defaults to 16.
+    --cost_model   : (Optional) `size` weighs files by bytes (default); `samples` weighs them by signal samples.
+    --scan_cache   : (Optional) Persistent JSON scan cache shared with `partition_pod5_files.py`.
+
+Requirements:
+    - The shared pod5 helpers of the RNA pipeline, `pod5_scanner.py` and `pod5_cost.py`, are imported from
+      `rna_pipeline/scripts` of this repository (resolved relative to this file), or from the directory of this
+      script if they are copied next to it.
+    - Without `pod5_scanner.py`, the directory is scanned serially with `os.walk` and `--scan_cache` is ignored.
+    - `--cost_model samples` requires `pod5_cost.py` and the `pod5` package.
+"""
+
 import os
+import json
 import shutil
 import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from collections import namedtuple
+
+# Shared pod5 helpers (scanner, cost model) live next to the RNA pipeline partitioner (see Requirements)
+RNA_PIPELINE_SCRIPTS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "rna_pipeline", "scripts"))
+sys.path.append(RNA_PIPELINE_SCRIPTS_DIR)
 
-def calculate_dir_size_bytes(dir_path):
+try:
+    from pod5_scanner import scan_files, FileInfo
+except ImportError:
+    # Fall back to a serial os.walk when the script is used outside this repository
+    scan_files = None
+    FileInfo = namedtuple("FileInfo", ["size", "mtime_ns"])
+
+# Manifest written into the target directory by the link mode
+LAYOUT_MANIFEST = "layout_manifest.json"
+
+def load_sample_weights(file_paths):
     """
-    Calculate the total size of the directory in bytes.
+    Weigh files by their signal sample count read from pod5 metadata.
+
+    Args:
+        file_paths (list of str): Paths to the files to weigh.
+
+    Returns:
+        dict: Dictionary mapping file paths to their number of signal samples.
+
+    Raises:
+        SystemExit: If the shared `pod5_cost` module cannot be found.
+    """
+    try:
+        from pod5_cost import collect_pod5_stats
+    except ImportError:
+        print(f"[ERROR] --cost_model samples requires 'pod5_cost.py' from '{RNA_PIPELINE_SCRIPTS_DIR}'.")
+        sys.exit(1)
+
+    file_dict = {}
+    for file_path in file_paths:
+        try:
+            file_dict[file_path] = os.path.getsize(file_path)
+        except OSError as e:
+            print(f"[WARNING] Unable to access {file_path}: {e}")
+    stats = collect_pod5_stats(file_dict)
+    return {file_path: file_stats["num_samples"] for file_path, file_stats in stats.items()}
+
+def scan_directory(dir_path, cache_file=None):
+    """
+    Scan a directory tree once, with the shared parallel scanner when it is available.
 
     Args:
         dir_path (str): Path to the directory.
+        cache_file (str, optional): Persistent scan cache shared with partition_pod5_files.py.
 
     Returns:
-        int: Size of the directory in bytes.
+        dict: Dictionary mapping file paths to FileInfo(size, mtime_ns), excluding symbolic links.
     """
-    total_size = 0
+    if scan_files is not None:
+        return scan_files(dir_path, cache_file=cache_file, skip_symlinks=True)
+
+    if cache_file:
+        print(f"[WARNING] 'pod5_scanner.py' not found in '{RNA_PIPELINE_SCRIPTS_DIR}'. Ignoring the scan cache.")
+    scanned = {}
     for dirpath, dirnames, filenames in os.walk(dir_path):
         for f in filenames:
             fp = os.path.join(dirpath, f)
             # Skip if it's a symbolic link
             if not os.path.islink(fp):
                 try:
-                    total_size += os.path.getsize(fp)
+                    stat = os.stat(fp)
+                    scanned[fp] = FileInfo(stat.st_size, stat.st_mtime_ns)
                 except OSError as e:
                     print(f"[WARNING] Unable to access {fp}: {e}")
-    return total_size
+    return scanned
+
+def calculate_dir_size_bytes(dir_path, scanned=None):
+    """
+    Calculate the total size of the directory in bytes.
+
+    Args:
+        dir_path (str): Path to the directory.
+        scanned (dict, optional): Result of `scan_directory` for a tree containing dir_path. When given,
+            the size is computed from it without touching the filesystem again.
+
+    Returns:
+        int: Size of the directory in bytes.
+    """
+    if scanned is None:
+        scanned = scan_directory(dir_path)
+    prefix = os.path.abspath(dir_path).rstrip(os.sep) + os.sep
+    return sum(info.size for path, info in scanned.items() if path.startswith(prefix))
 
 def convert_bytes_to_gb(size_bytes):
     """
@@ -37,13 +138,14 @@ def convert_bytes_to_gb(size_bytes):
     """
     return size_bytes / (1024 ** 3)
 
-def check_all_subfolders_within_limit(source_dir, size_limit_bytes):
+def check_all_subfolders_within_limit(source_dir, size_limit_bytes, scanned=None):
     """
     Check if all immediate subdirectories within source_dir are within the size limit.
 
     Args:
         source_dir (str): Path to the main directory.
         size_limit_bytes (int): Maximum allowed size per subfolder in bytes.
+        scanned (dict, optional): Result of `scan_directory` for source_dir.
 
     Returns:
         bool: True if all subfolders are within the limit, False otherwise.
@@ -53,7 +155,7 @@ def check_all_subfolders_within_limit(source_dir, size_limit_bytes):
                   if os.path.isdir(os.path.join(source_dir, d))]
 
     for subfolder in subfolders:
-        sub_size = calculate_dir_size_bytes(subfolder)
+        sub_size = calculate_dir_size_bytes(subfolder, scanned)
         sub_size_gb = convert_bytes_to_gb(sub_size)
         print(f"[INFO] Size of {os.path.basename(subfolder)}: {sub_size_gb:.2f} GB")
         if sub_size > size_limit_bytes:
@@ -110,7 +212,7 @@ def flatten_directory(source_dir):
             print(f"[WARNING] Directory {dirpath} is not empty or cannot be removed.")
     print("[INFO] Flattening of subdirectories completed.")
 
-def distribute_files(source_dir, target_dir, size_limit_bytes):
+def distribute_files(source_dir, target_dir, size_limit_bytes, cost_model="size"):
     """
     Distribute files from the source directory into subfolders in the target directory 
     based on a size limit for each subfolder.
@@ -119,6 +221,8 @@ def distribute_files(source_dir, target_dir, size_limit_bytes):
         source_dir (str): Path to the source directory containing files to distribute.
         target_dir (str): Path to the target directory where subfolders will be created.
         size_limit_bytes (int): Size limit for each subfolder in bytes.
+        cost_model (str): 'size' to weigh files by bytes, or 'samples' to weigh them by signal samples.
+            With 'samples', the size limit is converted to the equivalent number of samples for this directory.
     """
     print("[INFO] Starting file distribution...")
 
@@ -126,9 +230,21 @@ def distribute_files(source_dir, target_dir, size_limit_bytes):
     all_files = [os.path.join(source_dir, f) for f in os.listdir(source_dir)
                  if os.path.isfile(os.path.join(source_dir, f))]
 
+    if cost_model == "samples":
+        pod5_paths = [f for f in all_files if f.endswith(".pod5")]
+        weights = load_sample_weights(pod5_paths)
+        total_bytes = sum(os.path.getsize(f) for f in weights)
+        total_samples = sum(weights.values())
+        if total_bytes:
+            size_limit_bytes = size_limit_bytes * total_samples / total_bytes
+        all_files = list(weights)
+        print(f"[INFO] Weighing files by signal samples (limit per subfolder: {size_limit_bytes / 1e9:.2f} G samples).")
+    else:
+        weights = None
+
     # Sort files by size in descending order
     try:
-        all_files.sort(key=lambda x: os.path.getsize(x), reverse=True)
+        all_files.sort(key=lambda x: weights[x] if weights else os.path.getsize(x), reverse=True)
     except OSError as e:
         print(f"[ERROR] Failed to sort files by size: {e}")
         return
@@ -145,7 +261,7 @@ def distribute_files(source_dir, target_dir, size_limit_bytes):
 
     for file_path in all_files:
         try:
-            file_size = os.path.getsize(file_path)
+            file_size = weights[file_path] if weights else os.path.getsize(file_path)
         except OSError as e:
             print(f"[WARNING] Unable to access {file_path}: {e}")
             continue
@@ -194,11 +310,197 @@ def remove_empty_subfolders(source_dir):
     else:
         print("[INFO] Removal of empty subfolders completed.")
 
+def plan_bins(weights, size_limit):
+    """
+    Pack files into bins of at most size_limit, largest file first, opening a new bin when the current one is full.
+
+    Args:
+        weights (dict): Dictionary mapping file paths to their weights (bytes or signal samples).
+        size_limit (float): Maximum total weight per bin.
+
+    Returns:
+        list of tuple: (list of file paths, total weight) per bin. Files heavier than the limit get a bin of their own.
+    """
+    bins = []
+    current, current_weight = [], 0
+    for file_path in sorted(weights, key=lambda f: (-weights[f], f)):
+        if current and current_weight + weights[file_path] > size_limit:
+            bins.append((current, current_weight))
+            current, current_weight = [], 0
+        current.append(file_path)
+        current_weight += weights[file_path]
+    if current:
+        bins.append((current, current_weight))
+    return bins
+
+def plan_layout(source_dir, scanned, size_limit, weights):
+    """
+    Plan a layout in which every subfolder is within the size limit, keeping the existing subfolders that already are.
+
+    Subfolders within the limit keep their name and files. Only the files of oversized subfolders are redistributed,
+    into `<subfolder>_<i>`; files directly in source_dir are packed into `subfolder_<i>`.
+
+    Args:
+        source_dir (str): Path to the source directory.
+        scanned (dict): Result of `scan_directory` for source_dir.
+        size_limit (float): Maximum total weight per subfolder.
+        weights (dict): Dictionary mapping file paths to their weights.
+
+    Returns:
+        dict: Dictionary mapping subfolder names to {"size": total weight, "files": sorted file paths}.
+    """
+    groups = {}
+    for file_path in scanned:
+        if file_path not in weights:
+            continue
+        relative_dir = os.path.dirname(os.path.relpath(file_path, source_dir))
+        groups.setdefault(relative_dir, {})[file_path] = weights[file_path]
+
+    # Keep the subfolders within the limit first so that new subfolder names never collide with them
+    layout = {}
+    oversized = []
+    for name in sorted(groups):
+        group_weight = sum(groups[name].values())
+        if name and group_weight <= size_limit:
+            layout[name] = {"size": group_weight, "files": sorted(groups[name])}
+        else:
+            oversized.append(name)
+
+    for name in oversized:
+        prefix = name if name else "subfolder"
+        if name:
+            print(f"[INFO] Rebalancing {name} ({len(groups[name])} files).")
+        idx = 0
+        for bin_files, bin_weight in plan_bins(groups[name], size_limit):
+            while f"{prefix}_{idx}" in layout:
+                idx += 1
+            layout[f"{prefix}_{idx}"] = {"size": bin_weight, "files": sorted(bin_files)}
+    return layout
+
+def _link_file(task):
+    """
+    Create one link of the layout.
+
+    Args:
+        task (tuple): (source file path, link path, link type).
+
+    Returns:
+        str: Link type that was created, or None on failure.
+    """
+    file_path, link_path, link_type = task
+    if link_type == "hardlink":
+        try:
+            os.link(file_path, link_path)
+            return "hardlink"
+        except OSError:
+            # Hardlinks cannot cross filesystems; fall back to a symlink rather than copying the data
+            pass
+    try:
+        os.symlink(file_path, link_path)
+        return "symlink"
+    except OSError as e:
+        print(f"[ERROR] Failed to link {file_path} to {link_path}: {e}")
+        return None
+
+def write_link_layout(layout, source_dir, target_dir, link_type="symlink", max_workers=16, metadata=None):
+    """
+    Materialize a layout as subfolders of symlinks or hardlinks plus a manifest, leaving the source files untouched.
+
+    The layout is built in `<target_dir>.partial` and renamed to target_dir once every link exists, so an
+    interrupted run never leaves a half-built layout behind. A target_dir written by a previous run (holding a
+    layout manifest) is replaced.
+
+    Args:
+        layout (dict): Result of `plan_layout`.
+        source_dir (str): Path to the source directory.
+        target_dir (str): Directory to create the subfolders in.
+        link_type (str): 'symlink' or 'hardlink'. Hardlinks that cannot be created fall back to symlinks.
+        max_workers (int): Number of threads creating links concurrently.
+        metadata (dict, optional): Extra fields stored in the manifest.
+
+    Returns:
+        bool: True if every link was created, False otherwise.
+    """
+    if os.path.isdir(target_dir) and os.listdir(target_dir) and not os.path.isfile(os.path.join(target_dir, LAYOUT_MANIFEST)):
+        print(f"[ERROR] Target directory {target_dir} is not empty and does not hold a previous layout.")
+        return False
+
+    partial_dir = f"{target_dir}.partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+
+    tasks = []
+    for name, entry in layout.items():
+        os.makedirs(os.path.join(partial_dir, name))
+        for file_path in entry["files"]:
+            tasks.append((file_path, os.path.join(partial_dir, name, os.path.basename(file_path)), link_type))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_link_file, tasks))
+
+    failed = results.count(None)
+    if failed:
+        print(f"[ERROR] {failed} link(s) could not be created. The previous layout, if any, is left in place.")
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        return False
+    if link_type == "hardlink" and results.count("symlink"):
+        print(f"[WARNING] {results.count('symlink')} file(s) are on another filesystem and were symlinked instead.")
+
+    manifest = {"version": 1, "source_dir": source_dir, "link_type": link_type}
+    manifest.update(metadata or {})
+    manifest["subfolders"] = layout
+    with open(os.path.join(partial_dir, LAYOUT_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir)
+    os.replace(partial_dir, target_dir)
+    print(f"[INFO] Linked {len(tasks)} files into {len(layout)} subfolders of {target_dir}.")
+    print(f"[INFO] Layout manifest: {os.path.join(target_dir, LAYOUT_MANIFEST)}")
+    return True
+
+def redistribute_links(source_dir, target_dir, size_limit_bytes, scanned, cost_model="size", link_type="symlink", max_workers=16):
+    """
+    Redistribute files into subfolders of links in the target directory without moving any source file.
+
+    Args:
+        source_dir (str): Path to the source directory.
+        target_dir (str): Directory to create the linked subfolders in.
+        size_limit_bytes (int): Size limit for each subfolder in bytes.
+        scanned (dict): Result of `scan_directory` for source_dir.
+        cost_model (str): 'size' to weigh files by bytes, or 'samples' to weigh them by signal samples.
+        link_type (str): 'symlink' or 'hardlink'.
+        max_workers (int): Number of threads creating links concurrently.
+
+    Returns:
+        bool: True if the layout was written, False otherwise.
+    """
+    if cost_model == "samples":
+        weights = load_sample_weights(sorted(f for f in scanned if f.endswith(".pod5")))
+        total_bytes = sum(scanned[f].size for f in weights)
+        total_samples = sum(weights.values())
+        size_limit = size_limit_bytes * total_samples / total_bytes if total_bytes else size_limit_bytes
+        print(f"[INFO] Weighing files by signal samples (limit per subfolder: {size_limit / 1e9:.2f} G samples).")
+    else:
+        weights = {file_path: info.size for file_path, info in scanned.items()}
+        size_limit = size_limit_bytes
+
+    layout = plan_layout(source_dir, scanned, size_limit, weights)
+    for name, entry in layout.items():
+        print(f"[INFO] {name}: {len(entry['files'])} files")
+
+    metadata = {"cost_model": cost_model, "size_limit_gb": convert_bytes_to_gb(size_limit_bytes)}
+    return write_link_layout(layout, source_dir, target_dir, link_type, max_workers, metadata)
+
 def main():
     parser = argparse.ArgumentParser(description="Distribute files into subfolders based on size limit.")
     parser.add_argument("source_dir", type=str, help="Source directory containing files to distribute.")
     parser.add_argument("target_dir", type=str, help="Target directory to create subfolders in.")
     parser.add_argument("size_limit", type=float, help="Size limit for each subfolder in GB.")
+    parser.add_argument("--scan_cache", type=str, default=None, help="Persistent JSON scan cache shared with partition_pod5_files.py.")
+    parser.add_argument("--cost_model", type=str, choices=["size", "samples"], default="size", help="Weigh files by on-disk size or by signal samples read from pod5 metadata.")
+    parser.add_argument("--mode", type=str, choices=["move", "link"], default="move", help="'move' moves the files into subfolders; 'link' leaves source_dir untouched and writes subfolders of links plus a manifest into target_dir.")
+    parser.add_argument("--link_type", type=str, choices=["symlink", "hardlink"], default="symlink", help="Type of the links created with --mode link.")
+    parser.add_argument("--link_threads", type=int, default=16, help="Number of threads creating links concurrently with --mode link.")
 
     args = parser.parse_args()
 
@@ -213,11 +515,34 @@ def main():
     print(f"Directory: {source_dir}")
     print("=============================================")
 
+    # Scan source_dir once; subfolder sizes are derived from the same scan
+    scanned = scan_directory(source_dir, os.path.abspath(args.scan_cache) if args.scan_cache else None)
+
     # Calculate the size of source_dir
-    dir_size_bytes = calculate_dir_size_bytes(source_dir)
+    dir_size_bytes = calculate_dir_size_bytes(source_dir, scanned)
     dir_size_gb = convert_bytes_to_gb(dir_size_bytes)
     print(f"[INFO] Total size of source directory: {dir_size_gb:.2f} GB")
 
+    if args.mode == "link":
+        if target_dir == source_dir or target_dir.startswith(source_dir + os.sep):
+            print("[ERROR] With --mode link the target directory must be outside the source directory.")
+            sys.exit(1)
+
+        if dir_size_bytes <= size_limit_bytes:
+            print(f"[INFO] Directory size is within the size limit of {size_limit_gb} GB. Skipping file distribution.")
+            return
+
+        print("[INFO] Checking for nested subfolders...")
+        check_no_nested_subfolders(source_dir)
+
+        print("=============================================")
+        print(f"Linking {source_dir} into subfolders of {target_dir}")
+        print(f"Size Limit per Subfolder: {size_limit_gb} GB")
+        print("=============================================")
+        if not redistribute_links(source_dir, target_dir, size_limit_bytes, scanned, args.cost_model, args.link_type, args.link_threads):
+            sys.exit(1)
+        return
+
     # Initialize a flag to determine whether to run distribution
     run_distribution = False
 
@@ -235,7 +560,7 @@ def main():
             print("[INFO] Existing subdirectories detected. Verifying their sizes...")
 
             # Check if all subdirectories are within the size limit
-            if check_all_subfolders_within_limit(source_dir, size_limit_bytes):
+            if check_all_subfolders_within_limit(source_dir, size_limit_bytes, scanned):
                 print(f"[INFO] All existing subdirectories are within the size limit of {size_limit_gb} GB.")
 
                 # Remove any empty subfolders
@@ -257,7 +582,7 @@ def main():
             print("=============================================")
 
             # Execute the distribution
-            distribute_files(source_dir, target_dir, size_limit_bytes)
+            distribute_files(source_dir, target_dir, size_limit_bytes, args.cost_model)
 
             # Remove any empty subfolders that might exist after distribution
             remove_empty_subfolders(source_dir)
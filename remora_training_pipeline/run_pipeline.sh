@@ -57,6 +57,8 @@
 #            ├── main_job.sh
 #            ├── run_basecaller.sh
 #            ├── prepare_training_dataset.sh
+#            ├── prepare_shard_job.sh
+#            ├── remora_shards.py
 #            └── run_training.sh
 #
 # Author: Tayeb Jamali
@@ -129,6 +131,10 @@ DORADO_MIN_QSCORE=9                                             # Minimum qualit
 PREPARE_JOB_RUNTIME="1:00:00"
 PREPARE_JOB_MEMORY="64G"
 TOTAL_CPUS_PREPARE=8
+PREPARE_SHARDS=1                                                # Read-ID shards per dataset (1 runs one prepare per dataset)
+PREPARE_SHARD_MODE="local"                                      # local (worker processes of the prepare job) or array (array job)
+PREPARE_SHARD_CPUS=2                                            # CPU cores per array task (array mode)
+PREPARE_GROUP_BALANCE="equal"                                   # Weight canonical/modified data equally or proportional to their chunks
 
 # Run Training
 TRAINING_JOB_RUNTIME="12:00:00"
@@ -152,6 +158,7 @@ export DORADO_JOB_RUNTIME DORADO_JOB_MEMORY TOTAL_CPUS_DORADO TOTAL_GPUS_DORADO
 export DORADO_GPU_TYPE DORADO_MODEL_NAME DORADO_MIN_QSCORE 
 
 export PREPARE_JOB_RUNTIME PREPARE_JOB_MEMORY TOTAL_CPUS_PREPARE
+export PREPARE_SHARDS PREPARE_SHARD_MODE PREPARE_SHARD_CPUS PREPARE_GROUP_BALANCE
 
 export TRAINING_JOB_RUNTIME TRAINING_JOB_MEMORY TOTAL_CPUS_TRAINING
 export TOTAL_GPUS_TRAINING TRAINING_GPU_TYPE
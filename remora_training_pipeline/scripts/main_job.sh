@@ -14,6 +14,11 @@
 # - **Job Submission with Dependencies**: Submits each job script with
 #   dependencies using the `-hold_jid` flag, ensuring sequential execution.
 #
+# - **Sharded Dataset Preparation**: With PREPARE_SHARDS > 1 and
+#   PREPARE_SHARD_MODE=array, dataset preparation is submitted as a split job,
+#   an array job running `prepare_shard_job.sh` per shard, and a config job;
+#   the training job holds on the config job.
+#
 # - **Error Handling**: Exits the pipeline if any of the job submissions fail.
 #
 # - **Logging**: Outputs informative messages to track the pipeline's progress.
@@ -96,19 +101,62 @@ echo "Step 2: Submitting Prepare Training Dataset Job"
 # Define Prepare Training Dataset job name
 PREPARE_JOB_NAME="PREPARE_JOB"
 
-# Submit the prepare_training_dataset.sh script with dependency on DORADO_JOB_ID
-PREPARE_JOB_ID=$(qsub -terse \
-    -V \
-    -P "${QSUB_PROJECT}" \
-    -N "${PREPARE_JOB_NAME}" \
-    -hold_jid "${DORADO_JOB_ID}" \
-    -l h_rt="${PREPARE_JOB_RUNTIME}" \
-    -l mem_free="${PREPARE_JOB_MEMORY}" \
-    -pe omp "${TOTAL_CPUS_PREPARE}" \
-    -m "${QSUB_EMAIL}" \
-    -j "${QSUB_JOINT_STDERR}" \
-    "${SCRIPTS_DIR}/prepare_training_dataset.sh"
-)
+if [ "${PREPARE_SHARDS:-1}" -gt 1 ] && [ "${PREPARE_SHARD_MODE:-local}" = "array" ]; then
+    # Split the BAM files into shards, run one remora dataset prepare per array task,
+    # then write the config; the training job holds on the config job
+    PREPARE_SPLIT_JOB_ID=$(qsub -terse \
+        -V \
+        -P "${QSUB_PROJECT}" \
+        -N "${PREPARE_JOB_NAME}_SPLIT" \
+        -hold_jid "${DORADO_JOB_ID}" \
+        -l h_rt="${PREPARE_JOB_RUNTIME}" \
+        -l mem_free="${PREPARE_JOB_MEMORY}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        "${SCRIPTS_DIR}/prepare_training_dataset.sh" split
+    )
+
+    # One task per shard of each dataset; tasks without a shard (few reads) exit at once
+    PREPARE_ARRAY_JOB_FULL_ID=$(qsub -terse \
+        -V \
+        -t 1-$((2 * PREPARE_SHARDS)) \
+        -P "${QSUB_PROJECT}" \
+        -N "${PREPARE_JOB_NAME}_SHARD" \
+        -hold_jid "${PREPARE_SPLIT_JOB_ID}" \
+        -l h_rt="${PREPARE_JOB_RUNTIME}" \
+        -l mem_free="${PREPARE_JOB_MEMORY}" \
+        -pe omp "${PREPARE_SHARD_CPUS:-2}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        "${SCRIPTS_DIR}/prepare_shard_job.sh" "$(dirname "${TRAIN_DATASET}")/prepare_shards/manifest.tsv"
+    )
+    PREPARE_ARRAY_JOB_ID=$(echo "${PREPARE_ARRAY_JOB_FULL_ID}" | cut -d '.' -f1)
+
+    PREPARE_JOB_ID=$(qsub -terse \
+        -V \
+        -P "${QSUB_PROJECT}" \
+        -N "${PREPARE_JOB_NAME}" \
+        -hold_jid "${PREPARE_ARRAY_JOB_ID}" \
+        -l h_rt="${PREPARE_JOB_RUNTIME}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        "${SCRIPTS_DIR}/prepare_training_dataset.sh" config
+    )
+else
+    # Submit the prepare_training_dataset.sh script with dependency on DORADO_JOB_ID
+    PREPARE_JOB_ID=$(qsub -terse \
+        -V \
+        -P "${QSUB_PROJECT}" \
+        -N "${PREPARE_JOB_NAME}" \
+        -hold_jid "${DORADO_JOB_ID}" \
+        -l h_rt="${PREPARE_JOB_RUNTIME}" \
+        -l mem_free="${PREPARE_JOB_MEMORY}" \
+        -pe omp "${TOTAL_CPUS_PREPARE}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        "${SCRIPTS_DIR}/prepare_training_dataset.sh"
+    )
+fi
 
 check_exit_status $? "Prepare Training Dataset"
 
@@ -0,0 +1,95 @@
+#!/bin/bash -l
+
+# =============================================================================
+#                             prepare_shard_job.sh
+# =============================================================================
+# Description:
+#   This script runs `remora dataset prepare` on one read-ID shard of a pod5/BAM
+#   pair. It is run as a task of an array job (`PREPARE_SHARD_MODE=array`) or as
+#   a worker process of `prepare_training_dataset.sh` (`PREPARE_SHARD_MODE=local`).
+#
+#     1. **Shard Selection:**
+#        - Reads line `TASK_INDEX` of the shard manifest written by
+#          `prepare_training_dataset.sh split`: pod5 file, shard BAM file, output
+#          directory and prepare flags, separated by tabs.
+#        - Array tasks beyond the end of the manifest (datasets with fewer reads
+#          than shards) exit without doing anything.
+#
+#     2. **remora dataset prepare Execution:**
+#        - Runs `remora dataset prepare` on the shard and records its runtime.
+#        - Writes the output under a temporary name and renames it on success, so that
+#          the config step only sees complete outputs.
+#
+# Arguments:
+#   1. MANIFEST    - Shard manifest written by `prepare_training_dataset.sh split`.
+#   2. TASK_INDEX  - (Optional) Line of the manifest to run. Defaults to SGE_TASK_ID.
+#
+# Usage:
+#   qsub -t 1-<NUM_TASKS> prepare_shard_job.sh MANIFEST
+#
+# =============================================================================
+
+# Enable strict error handling
+set -euo pipefail
+
+# ----------------------- Step 0: Parse Input Arguments -----------------------
+if [ "$#" -lt 1 ] || [ "$#" -gt 2 ]; then
+    echo "Usage: $0 MANIFEST [TASK_INDEX]"
+    exit 1
+fi
+
+MANIFEST="${1}"
+TASK_INDEX="${2:-${SGE_TASK_ID-}}"
+
+if [ -z "${TASK_INDEX}" ]; then
+    echo "Error: No TASK_INDEX given and SGE_TASK_ID is not set. Exiting."
+    exit 1
+fi
+
+# ----------------------- Step 1: Job Information -----------------------
+echo "=========================================================="
+echo "Start date : $(date)"
+echo "Job name : ${JOB_NAME-local}"
+echo "Job ID : ${JOB_ID-local}"
+echo "Task ID : ${TASK_INDEX}"
+echo "=========================================================="
+
+# Load the miniconda module and activate the conda environment named nanopore (array tasks only)
+if [ -n "${SGE_TASK_ID-}" ] && [ -z "${2-}" ]; then
+    module load miniconda || { echo "Failed to load miniconda module"; exit 2; }
+    conda activate nanopore || { echo "Failed to activate conda environment nanopore"; exit 3; }
+fi
+
+# ----------------------- Step 2: Select the Shard -----------------------
+if [ ! -f "${MANIFEST}" ]; then
+    echo "Error: Shard manifest '${MANIFEST}' does not exist. Exiting."
+    exit 1
+fi
+
+SHARD_LINE=$(sed -n "${TASK_INDEX}p" "${MANIFEST}")
+if [ -z "${SHARD_LINE}" ]; then
+    echo "No shard for task ${TASK_INDEX} in ${MANIFEST}; nothing to do."
+    exit 0
+fi
+
+IFS=$'\t' read -r SHARD_POD5 SHARD_BAM SHARD_OUTPUT SHARD_FLAGS <<< "${SHARD_LINE}"
+
+# ----------------------- Step 3: Run remora dataset prepare on the Shard -----------------------
+START_TIME=$(date +%s)
+
+rm -rf "${SHARD_OUTPUT}" "${SHARD_OUTPUT}.partial"
+remora dataset prepare "${SHARD_POD5}" "${SHARD_BAM}" \
+  --output-path "${SHARD_OUTPUT}.partial" \
+  ${SHARD_FLAGS}
+
+mv "${SHARD_OUTPUT}.partial" "${SHARD_OUTPUT}"
+
+END_TIME=$(date +%s)
+RUNTIME=$((END_TIME - START_TIME))
+
+printf "remora dataset prepare runtime for %s: %d seconds\n" "${SHARD_BAM}" "${RUNTIME}" >> "$(dirname "${MANIFEST}")/prepare_runtimes.log"
+
+echo "remora dataset prepare completed for shard ${TASK_INDEX}: ${SHARD_OUTPUT}"
+echo "=========================================================="
+echo "End date : $(date)"
+echo "=========================================================="
@@ -7,19 +7,49 @@
 #   BAM and POD5 files. It loads necessary modules, activates the conda environment,
 #   and executes Remora dataset preparation commands.
 #
+#   With PREPARE_SHARDS > 1, each BAM file is split into PREPARE_SHARDS shards with
+#   equal numbers of read IDs (`remora_shards.py split`), and `remora dataset prepare`
+#   runs on every shard at the same time:
+#     - PREPARE_SHARD_MODE=local: as worker processes of this job, at most
+#       TOTAL_CPUS_PREPARE at a time.
+#     - PREPARE_SHARD_MODE=array: as tasks of an array job (`prepare_shard_job.sh`).
+#       `main_job.sh` then runs this script three times: `split`, the array job, and
+#       `config` once the array job has finished.
+#
+#   The training config is written over all outputs with `remora dataset make_config`
+#   (`remora_shards.py config`). The dataset weights are computed from the number of
+#   chunks of every output: canonical and modified data get equal total weight
+#   (PREPARE_GROUP_BALANCE=equal, the former `--dataset-weights 1 1`) or weight
+#   proportional to their chunk counts (PREPARE_GROUP_BALANCE=proportional).
+#
 # Usage:
-#   ./prepare_training_dataset.sh
+#   ./prepare_training_dataset.sh [all|split|config]
 #
 # Requirements:
 #   - Miniconda module
 #   - Conda environment named 'nanopore'
 #   - CUDA module
 #   - Remora installed in the conda environment
+#   - pysam installed in the conda environment (for PREPARE_SHARDS > 1)
 #
 # Outputs:
 #   - Prepared training dataset files in the specified output directories
+#     (`<CAN_CHUNKS>/shard_<i>` and `<MOD_CHUNKS>/shard_<i>` when sharded)
 #
 
+STAGE="${1:-all}"
+PREPARE_SHARDS="${PREPARE_SHARDS:-1}"
+PREPARE_GROUP_BALANCE="${PREPARE_GROUP_BALANCE:-equal}"
+
+if [[ "${STAGE}" != "all" && "${STAGE}" != "split" && "${STAGE}" != "config" ]]; then
+    echo "Error: Unknown stage '${STAGE}'. Use all, split or config."
+    exit 1
+fi
+if [[ "${PREPARE_GROUP_BALANCE}" != "equal" && "${PREPARE_GROUP_BALANCE}" != "proportional" ]]; then
+    echo "Error: Unknown PREPARE_GROUP_BALANCE '${PREPARE_GROUP_BALANCE}'. Use equal or proportional."
+    exit 1
+fi
+
 # Load the miniconda module to access conda
 module load miniconda || { echo "Failed to load miniconda module"; exit 2; }
 
@@ -29,30 +59,131 @@ conda activate nanopore || { echo "Failed to activate conda environment nanopore
 # Load the CUDA module to enable GPU support
 module load cuda || { echo "Failed to load CUDA module"; exit 4; }
 
+# Enable strict error handling (after conda activation, whose scripts use unset variables)
+set -euo pipefail
+
+# remora dataset prepare flags shared by both datasets, and specific to each
+PREPARE_FLAGS="--refine-kmer-level-table ${KMER_LEVEL_TABLE} --refine-rough-rescale --motif CG 0"
+CAN_PREPARE_FLAGS="${PREPARE_FLAGS} --mod-base-control"
+MOD_PREPARE_FLAGS="${PREPARE_FLAGS} --mod-base m 5mC"
+
+# Shard BAM files, manifest and runtimes of a sharded run
+SHARD_DIR="$(dirname "${TRAIN_DATASET}")/prepare_shards"
+MANIFEST="${SHARD_DIR}/manifest.tsv"
+
+# Function to split both BAM files into read-ID shards and write the shard manifest
+split_shards() {
+    rm -rf "${SHARD_DIR}"
+    mkdir -p "${SHARD_DIR}" "${CAN_CHUNKS}" "${MOD_CHUNKS}"
+    : > "${MANIFEST}"
+
+    local KIND POD5 BAM CHUNKS FLAGS SHARD_BAM SHARD_IDX
+    for KIND in can mod; do
+        if [ "${KIND}" = "can" ]; then
+            POD5="${CAN_POD5}"; BAM="${CAN_BAM}"; CHUNKS="${CAN_CHUNKS}"; FLAGS="${CAN_PREPARE_FLAGS}"
+        else
+            POD5="${MOD_POD5}"; BAM="${MOD_BAM}"; CHUNKS="${MOD_CHUNKS}"; FLAGS="${MOD_PREPARE_FLAGS}"
+        fi
+
+        python3 "${SCRIPTS_DIR}/remora_shards.py" split "${BAM}" "${SHARD_DIR}/${KIND}" --num_shards "${PREPARE_SHARDS}"
+
+        for SHARD_IDX in $(seq 1 "${PREPARE_SHARDS}"); do
+            SHARD_BAM="${SHARD_DIR}/${KIND}_${SHARD_IDX}.bam"
+            if [ -f "${SHARD_BAM}" ]; then
+                printf "%s\t%s\t%s\t%s\n" "${POD5}" "${SHARD_BAM}" "${CHUNKS}/shard_${SHARD_IDX}" "${FLAGS}" >> "${MANIFEST}"
+            fi
+        done
+    done
+
+    echo "Wrote $(wc -l < "${MANIFEST}") shards to ${MANIFEST}"
+}
+
+# Function to write the training config over the outputs listed in the manifest
+write_config() {
+    local CAN_OUTPUTS=() MOD_OUTPUTS=() SHARD_POD5 SHARD_BAM SHARD_OUTPUT SHARD_FLAGS
+
+    while IFS=$'\t' read -r SHARD_POD5 SHARD_BAM SHARD_OUTPUT SHARD_FLAGS; do
+        if [ ! -d "${SHARD_OUTPUT}" ]; then
+            echo "Error: Shard output '${SHARD_OUTPUT}' is missing. A prepare task did not finish. Exiting."
+            exit 1
+        fi
+        case "${SHARD_OUTPUT}" in
+            "${CAN_CHUNKS}"/*) CAN_OUTPUTS+=("${SHARD_OUTPUT}") ;;
+            *) MOD_OUTPUTS+=("${SHARD_OUTPUT}") ;;
+        esac
+    done < "${MANIFEST}"
+
+    python3 "${SCRIPTS_DIR}/remora_shards.py" config "${TRAIN_DATASET}" \
+      --group canonical "${CAN_OUTPUTS[@]}" \
+      --group modified "${MOD_OUTPUTS[@]}" \
+      --group_balance "${PREPARE_GROUP_BALANCE}" \
+      --log_filename "${TRAIN_LOG}"
+
+    cat "${SHARD_DIR}/prepare_runtimes.log" 2>/dev/null || true
+    rm -f "${SHARD_DIR}"/*.bam
+}
+
+if [ "${STAGE}" = "split" ]; then
+    split_shards
+    exit 0
+elif [ "${STAGE}" = "config" ]; then
+    echo "Running Remora dataset make_config"
+    write_config
+    echo "Training dataset preparation completed successfully."
+    exit 0
+fi
+
 # Step 1: Data Preparation
 
-echo "Running Remora dataset prepare for Control Samples"
-remora dataset prepare "$CAN_POD5" "$CAN_BAM" \
-  --output-path "$CAN_CHUNKS" \
-  --refine-kmer-level-table "$KMER_LEVEL_TABLE" \
-  --refine-rough-rescale \
-  --motif CG 0 \
-  --mod-base-control
-
-echo "Running Remora dataset prepare for Modified Samples"
-remora dataset prepare "$MOD_POD5" "$MOD_BAM" \
-  --output-path "$MOD_CHUNKS" \
-  --refine-kmer-level-table "$KMER_LEVEL_TABLE" \
-  --refine-rough-rescale \
-  --motif CG 0 \
-  --mod-base m 5mC
+if [ "${PREPARE_SHARDS}" -le 1 ]; then
+    echo "Running Remora dataset prepare for Control Samples"
+    remora dataset prepare "$CAN_POD5" "$CAN_BAM" \
+      --output-path "$CAN_CHUNKS" \
+      ${CAN_PREPARE_FLAGS}
+
+    echo "Running Remora dataset prepare for Modified Samples"
+    remora dataset prepare "$MOD_POD5" "$MOD_BAM" \
+      --output-path "$MOD_CHUNKS" \
+      ${MOD_PREPARE_FLAGS}
+else
+    echo "Running Remora dataset prepare on ${PREPARE_SHARDS} shards per dataset"
+    split_shards
+
+    # Run at most TOTAL_CPUS_PREPARE shards at a time
+    MAX_WORKERS="${TOTAL_CPUS_PREPARE:-1}"
+    NUM_TASKS=$(wc -l < "${MANIFEST}")
+    FAILED_SHARDS=0
+    RUNNING_SHARDS=0
+    for TASK_INDEX in $(seq 1 "${NUM_TASKS}"); do
+        if [ "${RUNNING_SHARDS}" -ge "${MAX_WORKERS}" ]; then
+            wait -n || FAILED_SHARDS=$((FAILED_SHARDS + 1))
+            RUNNING_SHARDS=$((RUNNING_SHARDS - 1))
+        fi
+        bash "${SCRIPTS_DIR}/prepare_shard_job.sh" "${MANIFEST}" "${TASK_INDEX}" > "${SHARD_DIR}/task_${TASK_INDEX}.log" 2>&1 &
+        RUNNING_SHARDS=$((RUNNING_SHARDS + 1))
+    done
+    while [ "${RUNNING_SHARDS}" -gt 0 ]; do
+        wait -n || FAILED_SHARDS=$((FAILED_SHARDS + 1))
+        RUNNING_SHARDS=$((RUNNING_SHARDS - 1))
+    done
+
+    if [ "${FAILED_SHARDS}" -gt 0 ]; then
+        echo "Error: ${FAILED_SHARDS} remora dataset prepare shard(s) failed. See the logs in ${SHARD_DIR}. Exiting."
+        exit 1
+    fi
+fi
 
 # Step 2: Composing Training Datasets
 
 echo "Running Remora dataset make_config"
-remora dataset make_config "$TRAIN_DATASET" "$CAN_CHUNKS" "$MOD_CHUNKS" \
-  --dataset-weights 1 1 \
-  --log-filename "$TRAIN_LOG"
+if [ "${PREPARE_SHARDS}" -le 1 ]; then
+    python3 "${SCRIPTS_DIR}/remora_shards.py" config "${TRAIN_DATASET}" \
+      --group canonical "${CAN_CHUNKS}" \
+      --group modified "${MOD_CHUNKS}" \
+      --group_balance "${PREPARE_GROUP_BALANCE}" \
+      --log_filename "${TRAIN_LOG}"
+else
+    write_config
+fi
 
 echo "Training dataset preparation completed successfully."
-
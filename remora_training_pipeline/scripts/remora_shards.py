@@ -0,0 +1,229 @@
+"""
+Description:
+    Helpers for running `remora dataset prepare` on read-ID shards of a pod5/BAM pair and combining the results. The
+    `split` command distributes the reads of a BAM file over shard BAM files with equal numbers of read IDs, so that
+    `remora dataset prepare` can run on every shard at the same time, and the `config` command writes the training
+    dataset config over all shard outputs with `remora dataset make_config`, taking the dataset weights from the
+    number of chunks each shard produced.
+
+Key Features:
+    - **Read-ID-Balanced Shards:** Read IDs are assigned to shards round-robin in order of first appearance, and every
+      record of a read (primary, secondary, supplementary) goes to the shard of its read ID. The pod5 file is not
+      split: `remora dataset prepare` looks up the signal of the reads in the shard BAM file.
+    - **Weights from Chunk Counts:** Within a group (e.g. canonical or modified), every shard is weighted by its
+      share of the group's chunks, so the shards together are sampled like one unsharded dataset. Groups are given
+      equal total weight (`--group_balance equal`, the former fixed `--dataset-weights 1 1`) or weight proportional
+      to their chunk counts (`--group_balance proportional`).
+    - **Empty Shards:** Shards without chunks are left out of the config with a warning.
+
+Usage:
+    python remora_shards.py split <input_bam> <shard_prefix> --num_shards <N>
+    python remora_shards.py config <train_dataset.jsn> --group <name> <dataset_dir> [...] [--group ...]
+                                   [--group_balance equal|proportional] [--log_filename <log>]
+
+Arguments:
+    split:
+        input_bam       : BAM file written by the basecaller.
+        shard_prefix    : Prefix of the shard BAM files; shards are written as `<shard_prefix>_<i>.bam` (from 1).
+                          Shards that would hold no reads are not written.
+        --num_shards    : Number of shards.
+    config:
+        train_dataset   : Training dataset config written by `remora dataset make_config`.
+        --group         : Name of a group followed by its `remora dataset prepare` output directories. Repeat once
+                          per group.
+        --group_balance : (Optional) `equal` (default) or `proportional`.
+        --log_filename  : (Optional) Log file passed to `remora dataset make_config`.
+
+Requirements:
+    - The `pysam` Python package for `split`.
+    - Remora (`remora` on the PATH and the `remora` Python package) for `config`.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Remora core dataset metadata file
+METADATA_FILE = "metadata.jsn"
+
+def split_bam(input_bam, shard_prefix, num_shards):
+    """
+    Split a BAM file into shards with equal numbers of read IDs.
+
+    Args:
+        input_bam (str): Path to the BAM file.
+        shard_prefix (str): Prefix of the shard BAM files.
+        num_shards (int): Number of shards.
+
+    Returns:
+        list of int: Number of read IDs per shard.
+
+    Raises:
+        SystemExit: If `pysam` is not installed.
+    """
+    try:
+        import pysam
+    except ImportError:
+        print("[ERROR] The 'pysam' package is required to split BAM files. Install it with 'pip install pysam'.")
+        sys.exit(1)
+
+    shard_of_read = {}
+    reads = [0] * num_shards
+    paths = [f"{shard_prefix}_{idx + 1}.bam" for idx in range(num_shards)]
+
+    with pysam.AlignmentFile(input_bam, "rb", check_sq=False) as bam:
+        writers = [pysam.AlignmentFile(f"{path}.partial", "wb", template=bam) for path in paths]
+        try:
+            for record in bam.fetch(until_eof=True):
+                shard = shard_of_read.get(record.query_name)
+                if shard is None:
+                    shard = len(shard_of_read) % num_shards
+                    shard_of_read[record.query_name] = shard
+                    reads[shard] += 1
+                writers[shard].write(record)
+        finally:
+            for writer in writers:
+                writer.close()
+
+    # Shards without reads (fewer reads than shards) are not written
+    for path, count in zip(paths, reads):
+        if count:
+            os.replace(f"{path}.partial", path)
+        else:
+            os.remove(f"{path}.partial")
+    return reads
+
+def count_chunks(dataset_dir):
+    """
+    Return the number of chunks of a `remora dataset prepare` output.
+
+    Args:
+        dataset_dir (str): Remora core dataset directory.
+
+    Returns:
+        int: Number of chunks.
+
+    Raises:
+        SystemExit: If the directory is not a Remora dataset.
+    """
+    try:
+        from remora.data_chunks import CoreRemoraDataset
+        return int(CoreRemoraDataset(dataset_dir).size)
+    except ImportError:
+        pass
+
+    # Without the Remora package, read the extent of the dataset from its metadata
+    metadata_path = os.path.join(dataset_dir, METADATA_FILE)
+    if not os.path.isfile(metadata_path):
+        print(f"[ERROR] '{dataset_dir}' is not a Remora dataset ('{METADATA_FILE}' not found).")
+        sys.exit(1)
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    return int(metadata["dataset_end"]) - int(metadata.get("dataset_start", 0))
+
+def compute_weights(groups, group_balance="equal"):
+    """
+    Compute the dataset weight of every shard from the chunk counts.
+
+    Args:
+        groups (list of tuple): (group name, list of (dataset directory, chunk count)).
+        group_balance (str): `equal` gives every group the same total weight; `proportional` weights groups by
+            their chunk counts.
+
+    Returns:
+        list of tuple: (dataset directory, weight) for every shard with chunks.
+    """
+    totals = [sum(count for _, count in datasets) for _, datasets in groups]
+    grand_total = sum(totals)
+    weights = []
+    for (name, datasets), total in zip(groups, totals):
+        if total == 0:
+            print(f"[WARNING] Group '{name}' has no chunks and is left out of the config.")
+            continue
+        group_weight = 1.0 if group_balance == "equal" else total / grand_total
+        for path, count in datasets:
+            if count == 0:
+                print(f"[WARNING] '{path}' has no chunks and is left out of the config.")
+                continue
+            weights.append((path, group_weight * count / total))
+    return weights
+
+def write_config(train_dataset, groups, group_balance="equal", log_filename=None):
+    """
+    Write the training dataset config over the shard outputs with `remora dataset make_config`.
+
+    Args:
+        train_dataset (str): Output config path.
+        groups (list of tuple): (group name, list of dataset directories).
+        group_balance (str): `equal` or `proportional`.
+        log_filename (str or None): Log file passed to `remora dataset make_config`.
+
+    Raises:
+        SystemExit: If no shard has chunks or `remora dataset make_config` fails.
+    """
+    counted = []
+    for name, dataset_dirs in groups:
+        datasets = [(path, count_chunks(path)) for path in dataset_dirs]
+        counted.append((name, datasets))
+        print(f"[INFO] Group '{name}': {sum(count for _, count in datasets)} chunks in {len(datasets)} dataset(s)")
+        for path, count in datasets:
+            print(f"       {path}: {count}")
+
+    weights = compute_weights(counted, group_balance)
+    if not weights:
+        print("[ERROR] No dataset has chunks.")
+        sys.exit(1)
+
+    command = ["remora", "dataset", "make_config", train_dataset] + [path for path, _ in weights]
+    command += ["--dataset-weights"] + [f"{weight:.6g}" for _, weight in weights]
+    if log_filename:
+        command += ["--log-filename", log_filename]
+    print(f"[INFO] Running: {' '.join(command)}")
+    try:
+        subprocess.run(command, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"[ERROR] remora dataset make_config failed: {e}")
+        sys.exit(1)
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Shard remora dataset prepare by read ID and combine the outputs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = subparsers.add_parser("split", help="Split a BAM file into read-ID-balanced shards.")
+    split_parser.add_argument("input_bam", type=str, help="BAM file written by the basecaller.")
+    split_parser.add_argument("shard_prefix", type=str, help="Prefix of the shard BAM files.")
+    split_parser.add_argument("--num_shards", type=int, required=True, help="Number of shards.")
+
+    config_parser = subparsers.add_parser("config", help="Write the training dataset config over shard outputs.")
+    config_parser.add_argument("train_dataset", type=str, help="Output training dataset config.")
+    config_parser.add_argument("--group", nargs="+", action="append", required=True, metavar=("NAME", "DATASET_DIR"),
+                               help="Group name followed by its dataset directories.")
+    config_parser.add_argument("--group_balance", choices=["equal", "proportional"], default="equal",
+                               help="Weight groups equally or by their chunk counts.")
+    config_parser.add_argument("--log_filename", type=str, default=None, help="Log file for remora dataset make_config.")
+
+    args = parser.parse_args()
+
+    if args.command == "split":
+        if not os.path.isfile(args.input_bam):
+            print(f"[ERROR] Input BAM file '{args.input_bam}' does not exist.")
+            sys.exit(1)
+        if args.num_shards < 1:
+            print(f"[ERROR] The number of shards must be at least 1 (got {args.num_shards}).")
+            sys.exit(1)
+        reads = split_bam(args.input_bam, args.shard_prefix, args.num_shards)
+        print(f"[INFO] Split {sum(reads)} reads of '{args.input_bam}' into {args.num_shards} shards "
+              f"({min(reads)}-{max(reads)} reads per shard).")
+    else:
+        for group in args.group:
+            if len(group) < 2:
+                print(f"[ERROR] --group {group[0]} needs at least one dataset directory.")
+                sys.exit(1)
+        groups = [(group[0], group[1:]) for group in args.group]
+        write_config(args.train_dataset, groups, args.group_balance, args.log_filename)
+
+if __name__ == "__main__":
+    main()
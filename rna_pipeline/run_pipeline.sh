@@ -84,7 +84,15 @@ MODKIT_OUTPUT_DIR="${ALIGNED_BAM_DIR}"                          # Define the out
 
 # -------------------- Python Partitioning Parameters ----------------------
 
-SIZE_LIMIT=25       # GB - Size limit per partition
+SIZE_LIMIT=25                   # GB - Size limit per partition
+PARTITION_STRATEGY="sequential" # Packing strategy: "sequential" (fill one partition at a time) or "balanced" (minimize the largest partition)
+PARTITION_WORKERS=""            # Optional number of GPU workers for the "balanced" strategy (partition count becomes a multiple of it)
+PARTITION_COST_MODEL="size"     # Weigh files by "size" (bytes on disk) or "samples" (signal samples from pod5 metadata; requires the pod5 package)
+SCAN_CACHE=""                   # Optional persistent pod5 scan cache (e.g., "${OUTPUT_DIR}/pod5_scan_cache.json"); re-runs only list changed directories
+DUPLICATE_MODE="content"        # "content" skips byte-identical pod5 copies; "name" aborts on repeated filenames (former behaviour)
+HASH_CACHE=""                   # Optional persistent pod5 hash cache for duplicate detection (e.g., "${OUTPUT_DIR}/pod5_hash_cache.json")
+CALIBRATION_LOGS=""             # Optional space-separated dorado_runtimes.log files from past runs to calibrate samples/second ("samples" cost model only)
+INCREMENTAL_MODE="false"        # "true" keeps the existing partitions.json and only partitions pod5 files that arrived since the last run
 
 # Path to the Python partitioning script
 PARTITION_SCRIPT="${SCRIPTS_DIR}/partition_pod5_files.py"       # Updated script name
@@ -99,6 +107,10 @@ TOTAL_GPUS_DORADO=1                                             # Total GPUs req
 DORADO_JOB_RUNTIME="12:00:00"                                   # Defines the runtime limit for dorado job
 DORADO_JOB_MEMORY="128G"                                        # Defines the memory requirement for dorado job
 DORADO_GPU_TYPE="L40S"                                          # Defines the GPU type for dorado job
+DORADO_STAGING_MODE="hardlink"                                  # Stage pod5 files by "hardlink" (copy across filesystems), "symlink" or "copy"
+DORADO_PREFETCH="false"                                         # "true" copies the next partition to node-local $TMPDIR while the current one is basecalling
+DORADO_EXECUTION_MODE="sequential"                              # "sequential" (one job, one partition at a time), "array" (one task per partition) or "multigpu" (one worker per GPU of one node)
+DORADO_MAX_CONCURRENT_GPUS=4                                    # "array" mode: maximum number of array tasks (GPUs) running at once
 
 # -------------------- Alignment Job Parameters ----------------------
 
@@ -107,6 +119,15 @@ ALIGN_THREADS=$((TOTAL_CPUS_ALIGN - 2))                         # Number of thre
 
 ALIGN_JOB_RUNTIME="2:00:00"                                     # Defines the runtime limit for alignment job
 ALIGN_JOB_MEMORY="64G"                                          # Defines the memory requirement for alignment job
+ALIGN_MODE="classic"                                            # "classic" (FASTQ and SAM written to disk) or "streaming" (one pipe into a sorted, primary-only BAM)
+RESHARD_UNALIGNED="false"                                       # "true" streams the unaligned reads into shards of equal size instead of one alignment task per partition
+ALIGN_CPU_BUDGET=128                                            # Resharding: total CPUs the alignment array may use at once (shards = ALIGN_CPU_BUDGET / TOTAL_CPUS_ALIGN)
+RESHARD_BALANCE_BY="reads"                                      # Resharding: balance shards by "reads" or "bases"
+TOTAL_CPUS_RESHARD=8                                            # Resharding: CPUs of the reshard job (BGZF threads of the reader and shard writers)
+RESHARD_JOB_RUNTIME="12:00:00"                                  # Resharding: runtime limit of the reshard job, which rewrites every read of the sample
+RESHARD_JOB_MEMORY="16G"                                        # Resharding: memory requirement of the reshard job
+KEEP_FULL_BAM="false"                                           # "streaming" mode: "true" keeps all alignments so the merge job also writes ${GROUP}_${SAMPLE}.bam
+PIPELINED_ALIGN="false"                                         # "true" ("array" Dorado mode) aligns each partition as soon as its Dorado task finishes
 
 # -------------------- Merge Job Parameters ----------------------
 
@@ -123,6 +144,11 @@ MODKIT_THREADS=$((TOTAL_CPUS_MODKIT - 2))                       # Number of thre
 
 MODKIT_JOB_RUNTIME="3:00:00"                                    # Defines the runtime limit for modkit job
 MODKIT_JOB_MEMORY="64G"                                         # Defines the memory requirement for modkit job
+MODKIT_SHARDS=1                                                 # Number of region shards for modkit pileup, balanced by mapped reads (1 runs a single pileup)
+MODKIT_SHARD_MODE="local"                                       # "local" (one worker process per shard in the modkit job) or "array" (one array task per shard)
+MODKIT_FILTER_MODE="plain"                                      # "plain" (one flat filtered BED) or "indexed" (bgzip + tabix, one filtered BED per modification)
+PILEUP_CACHE_DIR=""                                             # Optional cache of raw pileups reused when only coverage/percent thresholds change (e.g., "${ROOT_DIR}/RNA/pileup_cache")
+PILEUP_CACHE_GB=200                                             # Size limit of the pileup cache in GB (least recently used pileups are evicted)
 
 # Define filter thresholds for modkit extractor
 FILTER_THRESHOLD_ALL=0.8
@@ -144,6 +170,18 @@ QSUB_PROJECT="leshlab"                                          # SCC project na
 QSUB_EMAIL="ea"                                                 # Email notifications on end/abort
 QSUB_JOINT_STDERR="y"                                           # Combine stderr and stdout
 
+# --------------------------- Pipeline Executor ----------------------------
+
+PIPELINE_EXECUTOR="chain"                                       # "chain" (qsub main_job.sh), "sge" (resumable DAG of qsub jobs) or "local" (resumable DAG on this machine)
+PIPELINE_STATE_DIR="${OUTPUT_DIR}/pipeline_state"               # DAG executors: plan, completion markers and stage logs
+LOCAL_CPUS=""                                                   # "local" executor: CPU budget (empty uses all CPUs of the machine)
+LOCAL_MEMORY_GB=""                                              # "local" executor: memory budget in GB (empty uses the physical memory)
+LOCAL_GPUS=""                                                   # "local" executor: GPU budget (empty uses CUDA_VISIBLE_DEVICES or nvidia-smi)
+
+# --------------------------- Telemetry ----------------------------
+
+TELEMETRY_LOG="${OUTPUT_DIR}/telemetry.jsonl"                   # Per-stage wall/CPU time, peak memory, I/O and throughput (empty disables); summarize with telemetry.py report
+
 # =============================================================================
 # File Partitioning
 # =============================================================================
@@ -152,8 +190,32 @@ QSUB_JOINT_STDERR="y"                                           # Combine stderr
 # This ensures that partitions.json is saved in the same directory as run_pipeline.sh
 BASH_SOURCE_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 
+# Build the optional partitioning arguments
+PARTITION_ARGS=(--strategy "${PARTITION_STRATEGY}")
+if [ -n "${PARTITION_WORKERS}" ]; then
+    PARTITION_ARGS+=(--num_workers "${PARTITION_WORKERS}")
+fi
+PARTITION_ARGS+=(--cost_model "${PARTITION_COST_MODEL}")
+if [ -n "${SCAN_CACHE}" ]; then
+    PARTITION_ARGS+=(--scan_cache "${SCAN_CACHE}")
+fi
+PARTITION_ARGS+=(--duplicates "${DUPLICATE_MODE}")
+if [ -n "${HASH_CACHE}" ]; then
+    PARTITION_ARGS+=(--hash_cache "${HASH_CACHE}")
+fi
+if [ -n "${TELEMETRY_LOG}" ]; then
+    PARTITION_ARGS+=(--telemetry_log "${TELEMETRY_LOG}")
+fi
+if [ -n "${CALIBRATION_LOGS}" ]; then
+    read -r -a CALIBRATION_LOG_FILES <<< "${CALIBRATION_LOGS}"
+    PARTITION_ARGS+=(--calibrate "${CALIBRATION_LOG_FILES[@]}")
+fi
+if [ "${INCREMENTAL_MODE}" = "true" ]; then
+    PARTITION_ARGS+=(--incremental --basecalled_dir "${UNALIGNED_BAM_DIR}")
+fi
+
 # Execute the Python partitioning script to generate partitioned file lists
-python3 "${PARTITION_SCRIPT}" "${INPUT_DIR}" "${SIZE_LIMIT}" --output_dir "${BASH_SOURCE_DIR}"
+python3 "${PARTITION_SCRIPT}" "${INPUT_DIR}" "${SIZE_LIMIT}" --output_dir "${BASH_SOURCE_DIR}" "${PARTITION_ARGS[@]}"
 
 # =============================================================================
 # Main Job Submission
@@ -169,13 +231,35 @@ export GROUP SAMPLE MODIFIED_BASES ALL_MODS ROOT_DIR SCRIPTS_DIR BASH_SOURCE_DIR
 export ANNOTATION_FILE REFERENCE_FILE
 export INPUT_DIR UNALIGNED_BAM_DIR ALIGNED_BAM_DIR TEMP_DIR MODKIT_OUTPUT_DIR
 export TOTAL_CPUS_DORADO MODEL_NAME MIN_QSCORE TOTAL_GPUS_DORADO DORADO_JOB_RUNTIME DORADO_JOB_MEMORY DORADO_GPU_TYPE
-export TOTAL_CPUS_ALIGN ALIGN_THREADS ALIGN_JOB_RUNTIME ALIGN_JOB_MEMORY
+export DORADO_STAGING_MODE DORADO_PREFETCH DORADO_EXECUTION_MODE DORADO_MAX_CONCURRENT_GPUS
+export TOTAL_CPUS_ALIGN ALIGN_THREADS ALIGN_JOB_RUNTIME ALIGN_JOB_MEMORY ALIGN_MODE KEEP_FULL_BAM
+export RESHARD_UNALIGNED ALIGN_CPU_BUDGET RESHARD_BALANCE_BY TOTAL_CPUS_RESHARD RESHARD_JOB_RUNTIME RESHARD_JOB_MEMORY PIPELINED_ALIGN
 export TOTAL_CPUS_MERGE MERGE_THREADS MERGE_JOB_RUNTIME MERGE_JOB_MEMORY
-export TOTAL_CPUS_MODKIT MODKIT_THREADS MODKIT_JOB_RUNTIME MODKIT_JOB_MEMORY
+export TOTAL_CPUS_MODKIT MODKIT_THREADS MODKIT_JOB_RUNTIME MODKIT_JOB_MEMORY MODKIT_SHARDS MODKIT_SHARD_MODE MODKIT_FILTER_MODE PILEUP_CACHE_DIR PILEUP_CACHE_GB
 export FILTER_THRESHOLD_ALL FILTER_THRESHOLD_A FILTER_THRESHOLD_C FILTER_THRESHOLD_T
 export MOD_THRESHOLD_M6A MOD_THRESHOLD_PSEU MOD_THRESHOLD_INOSINE MOD_THRESHOLD_M5C
 export VALID_COVERAGE_THRESHOLD PERCENT_MODIFIED_THRESHOLD
 export QSUB_PROJECT QSUB_EMAIL QSUB_JOINT_STDERR
+export TELEMETRY_LOG
+
+# The DAG executors run the same job scripts as stages with completion markers, so a re-run resumes where it stopped
+if [ "${PIPELINE_EXECUTOR}" = "sge" ] || [ "${PIPELINE_EXECUTOR}" = "local" ]; then
+    DAG_ARGS=(--backend "${PIPELINE_EXECUTOR}")
+    if [ -n "${LOCAL_CPUS}" ]; then
+        DAG_ARGS+=(--cpus "${LOCAL_CPUS}")
+    fi
+    if [ -n "${LOCAL_MEMORY_GB}" ]; then
+        DAG_ARGS+=(--memory_gb "${LOCAL_MEMORY_GB}")
+    fi
+    if [ -n "${LOCAL_GPUS}" ]; then
+        DAG_ARGS+=(--gpus "${LOCAL_GPUS}")
+    fi
+    python3 "${SCRIPTS_DIR}/pipeline_dag.py" run "${PIPELINE_STATE_DIR}" "${DAG_ARGS[@]}"
+    exit $?
+elif [ "${PIPELINE_EXECUTOR}" != "chain" ]; then
+    echo "[ERROR] Unknown PIPELINE_EXECUTOR '${PIPELINE_EXECUTOR}'. Use chain, sge or local."
+    exit 1
+fi
 
 # Define job names based on the enhanced naming convention
 MAIN_JOB_NAME="main_job_${GROUP}_${SAMPLE}"
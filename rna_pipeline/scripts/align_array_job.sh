@@ -20,6 +20,22 @@
 #     3. **Convert SAM to BAM Format:**
 #        - Converts the alignment output from SAM to BAM format for efficient storage and downstream processing.
 #
+#   **Streaming Mode:**
+#     - With `ALIGN_MODE=streaming`, the three steps run as a single pipeline without intermediate files:
+#         samtools fastq -T <tags> | minimap2 ... - | samtools view -u -F 0x900 | samtools sort
+#     - The FASTQ and SAM files are never written, the modification tags (MM/ML) are carried through as in the
+#       classic mode, and the output is a coordinate-sorted BAM holding primary alignments only (all alignments with
+#       `KEEP_FULL_BAM=true`). These sorted outputs let `merge_job.sh` run in its `sorted` mode.
+#     - The exit status of every stage is checked, and the elapsed time at which each stage finished is appended to
+#       `alignment_runtimes.log`.
+#
+#   **Pipelined Mode:**
+#     - INPUT_DIR may instead be a task list written by `main_job.sh` with `PIPELINED_ALIGN=true`: one line per task
+#       holding the unaligned BAM of a partition and the name of its aligned output, separated by a tab. The task is
+#       submitted with `-hold_jid_ad`, so it starts as soon as the Dorado array task of the same index has finished,
+#       and it aligns `${UNALIGNED_BAM_DIR}/${PARTITION}/${MODEL_TYPE}_calls.bam` in place once the partition's
+#       `basecalling.done` marker exists. The unaligned BAMs are never removed in this mode.
+#
 #   **Job Dependencies:**
 #     - **Dorado Basecalling Job Dependency:**
 #       - This alignment job (`array_job.sh`) is dependent on the successful completion
@@ -32,11 +48,15 @@
 #       (e.g., PBS, SGE, SLURM). Each array task processes a single BAM file independently.
 #
 # Arguments:
-#   1. INPUT_DIR        - Directory containing input unaligned BAM files generated by Dorado.
+#   1. INPUT_DIR        - Directory containing input unaligned BAM files generated by Dorado, or a task list (see
+#                         Pipelined Mode).
 #   2. OUTPUT_DIR       - Directory to store the final aligned BAM files.
 #   3. ANNOTATION_FILE  - Path to the annotation BED file used by `minimap2` for splice-aware alignment.
 #   4. REFERENCE_FILE   - Path to the reference genome file for alignment.
 #   5. ALIGN_THREADS    - Number of threads to allocate for the alignment process.
+#   6. ALIGN_MODE       - (Optional) `classic` (default; FASTQ and SAM written to disk) or `streaming`.
+#   7. KEEP_FULL_BAM    - (Optional) `streaming` mode only: `true` keeps secondary and supplementary alignments in
+#                         the sorted output so that `merge_job.sh` can also produce the full BAM. Defaults to `false`.
 #
 # Usage:
 #   This script is submitted as an array job via `qsub` or an equivalent job scheduler.
@@ -49,6 +69,7 @@
 # Notes:
 #   - Ensure that all input directories and files exist and have appropriate read/write permissions.
 #   - INPUT_DIR is a temporary folder generated in previous job to gather all unaligned BAM file for all partitions in one folder.
+#     The last task of the array to finish removes it; a task that fails leaves it in place for a re-run.
 #   - Adjust resource requests (e.g., memory, CPU threads) based on the computational requirements of your environment.
 #   - Monitor job submissions and statuses using scheduler-specific commands (e.g., `qstat`, `squeue`).
 #
@@ -57,6 +78,11 @@
 # Enable strict error handling
 set -euo pipefail
 
+# Re-run this script under the telemetry wrapper when a telemetry log is configured (see telemetry.py)
+if [ -n "${TELEMETRY_LOG-}" ] && [ ! -f "${TELEMETRY_METRICS-}" ] && [ -f "${SCRIPTS_DIR-}/telemetry.py" ]; then
+    exec python3 "${SCRIPTS_DIR}/telemetry.py" run --log "${TELEMETRY_LOG}" --stage align -- bash -l "$0" "$@"
+fi
+
 # ----------------------- Step 0: Load Necessary Modules -----------------------
 module load samtools
 
@@ -66,6 +92,13 @@ OUTPUT_DIR="${2}"
 ANNOTATION_FILE="${3}"
 REFERENCE_FILE="${4}"
 ALIGN_THREADS="${5}"
+ALIGN_MODE="${6:-classic}"
+KEEP_FULL_BAM="${7:-false}"
+
+if [[ "${ALIGN_MODE}" != "classic" && "${ALIGN_MODE}" != "streaming" ]]; then
+    echo "Error: Unknown ALIGN_MODE '${ALIGN_MODE}'. Use classic or streaming. Exiting."
+    exit 1
+fi
 
 # ----------------------- Step 2: Job Information -----------------------
 echo "=========================================================="
@@ -79,7 +112,7 @@ fi
 echo "=========================================================="
 
 # ----------------------- Step 3: Validate Input Directories and Files -----------------------
-if [ ! -d "${INPUT_DIR}" ]; then
+if [ ! -d "${INPUT_DIR}" ] && [ ! -f "${INPUT_DIR}" ]; then
     echo "Error: Input directory '${INPUT_DIR}' does not exist. Exiting."
     exit 1
 fi
@@ -94,7 +127,65 @@ if [ ! -f "${REFERENCE_FILE}" ]; then
     exit 1
 fi
 
-# ----------------------- Step 4: Create Temporary Output Directory -----------------------
+# Function to count this task as finished; the input directory is shared by every task of the array, and the last
+# task to finish removes it
+finish_task() {
+    if [ -d "${INPUT_DIR}" ]; then
+        FINISHED_TASKS=$(
+            (
+                flock -x 9
+                echo "${SGE_TASK_ID}" >> "${INPUT_DIR}/.finished_tasks"
+                sort -u "${INPUT_DIR}/.finished_tasks" | wc -l
+            ) 9>"${INPUT_DIR}/.finished_tasks.lock"
+        )
+        if [ "${FINISHED_TASKS}" -ge "${NUM_INPUT_BAMS}" ]; then
+            rm -rf "${INPUT_DIR}"
+            echo "All ${NUM_INPUT_BAMS} task(s) finished. Removed input directory: ${INPUT_DIR}"
+        fi
+    fi
+}
+
+# ----------------------- Step 4: Get BAM File to Process -----------------------
+if [ -f "${INPUT_DIR}" ]; then
+    # Pipelined mode: line SGE_TASK_ID of the task list names a partition's unaligned BAM and the output name
+    TASK_LINE=$(sed -n "${SGE_TASK_ID}p" "${INPUT_DIR}")
+    if [ -z "${TASK_LINE}" ]; then
+        echo "No BAM file for task ${SGE_TASK_ID} in ${INPUT_DIR}. Nothing to do."
+        exit 0
+    fi
+    IFS=$'\t' read -r BAM_FILE BAM_BASENAME <<< "${TASK_LINE}"
+
+    # The Dorado task writes the marker only after the BAM is complete
+    if [ ! -f "$(dirname "${BAM_FILE}")/basecalling.done" ]; then
+        echo "Error: ${BAM_FILE} has no basecalling.done marker; the Dorado task for it did not finish. Exiting."
+        exit 1
+    fi
+else
+    # Each array job processes one file
+    NUM_INPUT_BAMS=$(ls "${INPUT_DIR}"/*.bam | wc -l)
+    BAM_FILE=$(ls "${INPUT_DIR}"/*.bam | sed -n "${SGE_TASK_ID}p")
+
+    # The array of a Reshard Job is sized to its shard count, which reshard.done records; shards that received no
+    # reads are not written, and their tasks only count themselves as finished
+    if [ -f "${INPUT_DIR}/reshard.done" ]; then
+        NUM_INPUT_BAMS=$(head -n 1 "${INPUT_DIR}/reshard.done")
+        if [ -z "${BAM_FILE}" ]; then
+            echo "No shard for task ${SGE_TASK_ID} in ${INPUT_DIR} (fewer reads than shards). Nothing to do."
+            finish_task
+            exit 0
+        fi
+    fi
+
+    # Extract the base name of the file (without path and extension)
+    BAM_BASENAME=$(basename "${BAM_FILE}" .bam)
+fi
+
+# Report the partition to the telemetry wrapper
+if [ -n "${TELEMETRY_METRICS-}" ]; then
+    printf "partition=%s\ninput_bytes=%d\n" "${BAM_BASENAME}" "$(stat -c %s "${BAM_FILE}")" >> "${TELEMETRY_METRICS}"
+fi
+
+# ----------------------- Step 5: Create Temporary Output Directory -----------------------
 TEMP_DIR=$(mktemp -d "${OUTPUT_DIR}/run_${SGE_TASK_ID}_XXXXXX")
 
 # Ensure the temporary output directory was created
@@ -105,36 +196,97 @@ fi
 
 echo "Using temporary output directory: ${TEMP_DIR}"
 
-# ----------------------- Step 5: Get BAM File to Process -----------------------
-# Each array job processes one file
-BAM_FILE=$(ls "${INPUT_DIR}"/*.bam | sed -n "${SGE_TASK_ID}p")
+# Tags copied from the unaligned BAM into the FASTQ headers and from there into the aligned reads
+FASTQ_TAGS="ML,MM,MN,sd,ch,fn,rn,ns,qs,st,du,sv,dx,mx"
+ALIGNED_BAM="${OUTPUT_DIR}/${BAM_BASENAME}_aligned.bam"
+
+if [ "${ALIGN_MODE}" = "streaming" ]; then
+    # ----------------------- Step 6: Stream FASTQ Conversion, Alignment, Filtering and Sorting -----------------------
+    SORT_THREADS=$(( ALIGN_THREADS / 4 > 0 ? ALIGN_THREADS / 4 : 1 ))
 
-# Extract the base name of the file (without path and extension)
-BAM_BASENAME=$(basename "${BAM_FILE}" .bam)
+    # Drop secondary and supplementary alignments unless the full BAM is requested
+    if [ "${KEEP_FULL_BAM}" = "true" ]; then
+        EXCLUDE_FLAGS=0
+    else
+        EXCLUDE_FLAGS=0x900
+    fi
 
-# ----------------------- Step 6: Convert BAM to FASTQ -----------------------
-FASTQ_FILE="${TEMP_DIR}/${BAM_BASENAME}.fastq"
-samtools fastq -T ML,MM,MN,sd,ch,fn,rn,ns,qs,st,du,sv,dx,mx "${BAM_FILE}" > "${FASTQ_FILE}"
+    # Run a pipeline stage and record the time at which it finished
+    timed_stage() {
+        local NAME="$1"
+        shift
+        local RC=0
+        "$@" || RC=$?
+        date +%s > "${TEMP_DIR}/${NAME}.end"
+        return ${RC}
+    }
 
-# ----------------------- Step 7: Align FASTQ Using Minimap2 and Log Runtime -----------------------
-SAM_FILE="${TEMP_DIR}/${BAM_BASENAME}.sam"
-START_TIME=$(date +%s)
+    START_TIME=$(date +%s)
 
-minimap2 -ax splice --junc-bed "${ANNOTATION_FILE}" -uf -y "${REFERENCE_FILE}" "${FASTQ_FILE}" -t "${ALIGN_THREADS}" -2 --MD > "${SAM_FILE}"
+    set +e
+    timed_stage fastq samtools fastq -T "${FASTQ_TAGS}" "${BAM_FILE}" \
+        | timed_stage minimap2 minimap2 -ax splice --junc-bed "${ANNOTATION_FILE}" -uf -y "${REFERENCE_FILE}" - -t "${ALIGN_THREADS}" -2 --MD \
+        | timed_stage primary_filter samtools view -u -F "${EXCLUDE_FLAGS}" - \
+        | timed_stage sort samtools sort -@ "${SORT_THREADS}" -T "${TEMP_DIR}/${BAM_BASENAME}.sort" -O bam -o "${ALIGNED_BAM}.partial" -
+    PIPE_STATUS=("${PIPESTATUS[@]}")
+    set -e
 
-END_TIME=$(date +%s)
-RUNTIME=$((END_TIME - START_TIME))
+    STAGE_NAMES=(fastq minimap2 primary_filter sort)
+    for IDX in "${!STAGE_NAMES[@]}"; do
+        if [ "${PIPE_STATUS[$IDX]}" -ne 0 ]; then
+            echo "Error: Stage '${STAGE_NAMES[$IDX]}' failed with exit code ${PIPE_STATUS[$IDX]} for ${BAM_BASENAME}. Exiting."
+            rm -f "${ALIGNED_BAM}.partial"
+            exit 1
+        fi
+    done
+    mv "${ALIGNED_BAM}.partial" "${ALIGNED_BAM}"
 
-# Store the runtime in a log file
-echo "Alignment runtime for ${BAM_BASENAME}: ${RUNTIME} seconds" >> "${OUTPUT_DIR}/alignment_runtimes.log"
+    END_TIME=$(date +%s)
+    RUNTIME=$((END_TIME - START_TIME))
 
-# ----------------------- Step 8: Convert SAM to BAM and Move to Output Directory -----------------------
-ALIGNED_BAM="${OUTPUT_DIR}/${BAM_BASENAME}_aligned.bam"
-samtools view -bS "${SAM_FILE}" > "${ALIGNED_BAM}"
+    # Store the runtime and the elapsed time at which each stage finished in a log file
+    STAGE_TIMES=""
+    for NAME in "${STAGE_NAMES[@]}"; do
+        STAGE_TIMES+=" ${NAME}=$(( $(cat "${TEMP_DIR}/${NAME}.end") - START_TIME ))s"
+    done
+    echo "Alignment runtime for ${BAM_BASENAME}: ${RUNTIME} seconds" >> "${OUTPUT_DIR}/alignment_runtimes.log"
+    echo "Streaming stages for ${BAM_BASENAME} (finished after):${STAGE_TIMES}" >> "${OUTPUT_DIR}/alignment_runtimes.log"
+    echo "Streaming alignment of ${BAM_BASENAME} completed in ${RUNTIME} seconds; stages finished after:${STAGE_TIMES}"
+
+    # The reads only pass through pipes, so the wrapper counts them in the input BAM
+    if [ -n "${TELEMETRY_METRICS-}" ]; then
+        echo "count_bam=${BAM_FILE}" >> "${TELEMETRY_METRICS}"
+    fi
+else
+    # ----------------------- Step 6: Convert BAM to FASTQ -----------------------
+    FASTQ_FILE="${TEMP_DIR}/${BAM_BASENAME}.fastq"
+    samtools fastq -T "${FASTQ_TAGS}" "${BAM_FILE}" > "${FASTQ_FILE}"
+
+    # ----------------------- Step 7: Align FASTQ Using Minimap2 and Log Runtime -----------------------
+    SAM_FILE="${TEMP_DIR}/${BAM_BASENAME}.sam"
+    START_TIME=$(date +%s)
+
+    minimap2 -ax splice --junc-bed "${ANNOTATION_FILE}" -uf -y "${REFERENCE_FILE}" "${FASTQ_FILE}" -t "${ALIGN_THREADS}" -2 --MD > "${SAM_FILE}"
+
+    END_TIME=$(date +%s)
+    RUNTIME=$((END_TIME - START_TIME))
+
+    # Store the runtime in a log file
+    echo "Alignment runtime for ${BAM_BASENAME}: ${RUNTIME} seconds" >> "${OUTPUT_DIR}/alignment_runtimes.log"
+
+    # Count the reads and bases of the FASTQ file, which was just written and is still cached
+    if [ -n "${TELEMETRY_METRICS-}" ]; then
+        awk 'NR % 4 == 2 { reads++; bases += length($0) } END { printf "reads=%d\nbases=%d\n", reads, bases }' "${FASTQ_FILE}" >> "${TELEMETRY_METRICS}"
+    fi
+
+    # ----------------------- Step 8: Convert SAM to BAM and Move to Output Directory -----------------------
+    samtools view -bS "${SAM_FILE}" > "${ALIGNED_BAM}"
+fi
 
 # ----------------------- Step 9: Inform User of Completion -----------------------
 echo "Processing completed for ${BAM_BASENAME}.bam"
 
 # ----------------------- Step 10: Clean Up Temporary Directories -----------------------
 rm -rf "${TEMP_DIR}"
-rm -rf "${INPUT_DIR}"
+
+finish_task
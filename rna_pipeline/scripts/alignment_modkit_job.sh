@@ -15,6 +15,12 @@
 #      - Creates a temporary directory (`TEMP_DIR`) to store BAM files ready for alignment.
 #      - Copies and renames BAM files from the unaligned BAM directory (`UNALIGNED_BAM_DIR`)
 #        to the temporary directory, ensuring consistent naming conventions.
+#      - With `RESHARD_UNALIGNED=true`, a Reshard Job (`reshard_job.sh`) is submitted instead. It
+#        streams the reads of all partitions into `ALIGN_CPU_BUDGET / TOTAL_CPUS_ALIGN` shards of
+#        equal read or base count (`RESHARD_BALANCE_BY`), so that alignment tasks finish at the same
+#        time. Rewriting every read takes far longer than this job may run, so the Reshard Job has its
+#        own runtime, memory and slots (`RESHARD_JOB_RUNTIME`, `RESHARD_JOB_MEMORY`,
+#        `TOTAL_CPUS_RESHARD`), and the Alignment Array Job, sized to the shard count, is held on it.
 #
 #   2. **Submission of Alignment Array Job:**
 #      - Submits an array job (`ALIGN_ARRAY_JOB`) where each task aligns a single BAM file.
@@ -31,7 +37,13 @@
 #      - This job is dependent on the successful completion of the Merge Job.
 #      - Ensures proper sequencing by holding until the Merge Job completes.
 #
+#   **Pipelined Alignment:**
+#     - When `main_job.sh` runs with `PIPELINED_ALIGN=true`, it submits the alignment array jobs itself, each task
+#       held on the Dorado task of its partition, and exports their job IDs in `ALIGN_ARRAY_JOB_IDS`
+#       (comma-separated). Steps 1 and 2 are then skipped and the Merge Job is held on those jobs instead.
+#
 #   **Job Dependencies:**
+#     - **Alignment Array Job** depends on the **Reshard Job** when resharding.
 #     - **Merge Job** depends on the **Alignment Array Job**: The Merge Job will only start after all tasks in the Alignment Array Job have successfully completed.
 #     - **Modkit Extraction Job** depends on the **Merge Job**: The Modkit Extraction Job will only start after the Merge Job has successfully completed.
 #
@@ -56,36 +68,72 @@ echo "Starting Alignment Processing for Group: ${GROUP}, Sample: ${SAMPLE}"
 # ----------------------- Step 1: Prepare Temporary Alignment Directory -----------------------
 echo "Creating temporary alignment directory if it doesn't exist..."
 mkdir -p "${TEMP_DIR}"
+RESHARD_JOB_ID=""
 
-# Initialize a counter for naming BAM files
-COUNTER=0
+if [ -n "${ALIGN_ARRAY_JOB_IDS-}" ]; then
+    # Pipelined alignment: the alignment array jobs submitted by main_job.sh align every partition's BAM in
+    # place, so nothing is staged
+    rmdir "${TEMP_DIR}" 2>/dev/null || true
+    COUNTER=0
+elif [ "${RESHARD_UNALIGNED:-false}" = "true" ]; then
+    # Stream the reads of all partitions into shards of equal read or base count in a job of its own; the number
+    # of shards, and therefore the size of the alignment array, follows from the CPU budget
+    if [ -z "$(find "${UNALIGNED_BAM_DIR}" -mindepth 1 -maxdepth 2 -name "*.bam" -print -quit)" ]; then
+        echo "No BAM file found in ${UNALIGNED_BAM_DIR}."
+        exit 1
+    fi
 
-# Check if there are any subdirectories within the UNALIGNED_BAM_DIR
-SUBFOLDERS=("${UNALIGNED_BAM_DIR}"/*/)
-if [ -d "${SUBFOLDERS[0]}" ]; then
-    # Loop through each subdirectory in the unaligned BAM directory
-    for SUBFOLDER in "${UNALIGNED_BAM_DIR}"/*/; do
-        # Find the BAM file within the subdirectory
-        BAM_FILE=$(find "${SUBFOLDER}" -maxdepth 1 -name "*.bam")
+    COUNTER=$((ALIGN_CPU_BUDGET / TOTAL_CPUS_ALIGN))
+    if [ "${COUNTER}" -lt 1 ]; then
+        echo "Error: ALIGN_CPU_BUDGET (${ALIGN_CPU_BUDGET}) is smaller than TOTAL_CPUS_ALIGN (${TOTAL_CPUS_ALIGN}). Exiting."
+        exit 1
+    fi
 
-        # If a BAM file is found, copy it to the TEMP_DIR with a numbered name
-        if [ -n "${BAM_FILE}" ]; then
-            cp "${BAM_FILE}" "${TEMP_DIR}/calls_${COUNTER}.bam"
-            COUNTER=$((COUNTER + 1))  # Increment the counter
-        else
-            echo "No BAM file found in ${SUBFOLDER}."
-        fi
-    done
+    echo "Submitting Reshard Job for ${COUNTER} shard(s) (budget of ${ALIGN_CPU_BUDGET} CPUs, ${TOTAL_CPUS_ALIGN} per task)..."
+    RESHARD_JOB_ID=$(qsub -terse \
+        -P "${QSUB_PROJECT}" \
+        -N "reshard_job_${GROUP}_${SAMPLE}" \
+        -l h_rt="${RESHARD_JOB_RUNTIME}" \
+        -l mem_free="${RESHARD_JOB_MEMORY}" \
+        -pe omp "${TOTAL_CPUS_RESHARD}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        -v TELEMETRY_LOG="${TELEMETRY_LOG-}",SCRIPTS_DIR="${SCRIPTS_DIR}",GROUP="${GROUP}",SAMPLE="${SAMPLE}" \
+        "${SCRIPTS_DIR}/reshard_job.sh" \
+        "${TEMP_DIR}" "${UNALIGNED_BAM_DIR}" "${COUNTER}" "${RESHARD_BALANCE_BY:-reads}"
+    )
+    echo "Reshard Job submitted with Job ID: ${RESHARD_JOB_ID}"
 else
-    # If no subdirectories, check for BAM files directly in the UNALIGNED_BAM_DIR
-    BAM_FILE=$(find "${UNALIGNED_BAM_DIR}" -maxdepth 1 -name "*.bam")
+    # Initialize a counter for naming BAM files
+    COUNTER=0
 
-    if [ -n "${BAM_FILE}" ]; then
-        cp "${BAM_FILE}" "${TEMP_DIR}/calls.bam"
-        COUNTER=1
+    # Check if there are any subdirectories within the UNALIGNED_BAM_DIR
+    SUBFOLDERS=("${UNALIGNED_BAM_DIR}"/*/)
+    if [ -d "${SUBFOLDERS[0]}" ]; then
+        # Loop through each subdirectory in the unaligned BAM directory
+        for SUBFOLDER in "${UNALIGNED_BAM_DIR}"/*/; do
+            # Find the BAM file within the subdirectory
+            BAM_FILE=$(find "${SUBFOLDER}" -maxdepth 1 -name "*.bam")
+
+            # If a BAM file is found, copy it to the TEMP_DIR with a numbered name
+            if [ -n "${BAM_FILE}" ]; then
+                cp "${BAM_FILE}" "${TEMP_DIR}/calls_${COUNTER}.bam"
+                COUNTER=$((COUNTER + 1))  # Increment the counter
+            else
+                echo "No BAM file found in ${SUBFOLDER}."
+            fi
+        done
     else
-        echo "No BAM file found in ${UNALIGNED_BAM_DIR}."
-        exit 1  # Exit if no BAM files are found
+        # If no subdirectories, check for BAM files directly in the UNALIGNED_BAM_DIR
+        BAM_FILE=$(find "${UNALIGNED_BAM_DIR}" -maxdepth 1 -name "*.bam")
+
+        if [ -n "${BAM_FILE}" ]; then
+            cp "${BAM_FILE}" "${TEMP_DIR}/calls.bam"
+            COUNTER=1
+        else
+            echo "No BAM file found in ${UNALIGNED_BAM_DIR}."
+            exit 1  # Exit if no BAM files are found
+        fi
     fi
 fi
 
@@ -97,9 +145,16 @@ echo "Submitting Alignment Job as an array job..."
 # Ensure the ALIGNED_BAM_DIR exists
 mkdir -p "${ALIGNED_BAM_DIR}"
 
-# Determine the number of BAM files in TEMP_DIR for alignment job submission
-BAM_COUNT=$(ls "${TEMP_DIR}"/*.bam 2>/dev/null | wc -l)
-if [ "${BAM_COUNT}" -eq 0 ]; then
+# Determine the number of BAM files in TEMP_DIR for alignment job submission; the shards of a Reshard Job do not
+# exist yet, so the array is sized to the shard count and held on that job
+ALIGN_HOLD_ARGS=()
+if [ -n "${RESHARD_JOB_ID}" ]; then
+    BAM_COUNT="${COUNTER}"
+    ALIGN_HOLD_ARGS=(-hold_jid "${RESHARD_JOB_ID}")
+else
+    BAM_COUNT=$(ls "${TEMP_DIR}"/*.bam 2>/dev/null | wc -l)
+fi
+if [ "${BAM_COUNT}" -eq 0 ] && [ -z "${ALIGN_ARRAY_JOB_IDS-}" ]; then
     echo "No BAM files found in ${TEMP_DIR}. Exiting."
     exit 1
 fi
@@ -107,19 +162,26 @@ fi
 # Define job name
 ALIGN_ARRAY_JOB_NAME="align_array_job_${GROUP}_${SAMPLE}"
 
-# Submit the alignment job as an array job and capture the array job ID
-ALIGN_ARRAY_JOB_FULL_ID=$(qsub -terse \
-    -t 1-"${BAM_COUNT}" \
-    -P "${QSUB_PROJECT}" \
-    -N "${ALIGN_ARRAY_JOB_NAME}" \
-    -l h_rt="${ALIGN_JOB_RUNTIME}" \
-    -l mem_free="${ALIGN_JOB_MEMORY}" \
-    -pe omp "${TOTAL_CPUS_ALIGN}" \
-    -m "${QSUB_EMAIL}" \
-    -j "${QSUB_JOINT_STDERR}" \
-    "${SCRIPTS_DIR}/align_array_job.sh" \
-    "${TEMP_DIR}" "${ALIGNED_BAM_DIR}" "${ANNOTATION_FILE}" "${REFERENCE_FILE}" "${ALIGN_THREADS}"
-)
+if [ -n "${ALIGN_ARRAY_JOB_IDS-}" ]; then
+    # Pipelined alignment: hold the Merge Job on the alignment array jobs submitted by main_job.sh
+    ALIGN_ARRAY_JOB_FULL_ID="${ALIGN_ARRAY_JOB_IDS}"
+else
+    # Submit the alignment job as an array job and capture the array job ID
+    ALIGN_ARRAY_JOB_FULL_ID=$(qsub -terse \
+        ${ALIGN_HOLD_ARGS[@]+"${ALIGN_HOLD_ARGS[@]}"} \
+        -t 1-"${BAM_COUNT}" \
+        -P "${QSUB_PROJECT}" \
+        -N "${ALIGN_ARRAY_JOB_NAME}" \
+        -l h_rt="${ALIGN_JOB_RUNTIME}" \
+        -l mem_free="${ALIGN_JOB_MEMORY}" \
+        -pe omp "${TOTAL_CPUS_ALIGN}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        -v TELEMETRY_LOG="${TELEMETRY_LOG-}",SCRIPTS_DIR="${SCRIPTS_DIR}",GROUP="${GROUP}",SAMPLE="${SAMPLE}" \
+        "${SCRIPTS_DIR}/align_array_job.sh" \
+        "${TEMP_DIR}" "${ALIGNED_BAM_DIR}" "${ANNOTATION_FILE}" "${REFERENCE_FILE}" "${ALIGN_THREADS}" "${ALIGN_MODE:-classic}" "${KEEP_FULL_BAM:-false}"
+    )
+fi
 
 # Print the full job ID for debugging
 echo "Full Array Job Output: ${ALIGN_ARRAY_JOB_FULL_ID}"
@@ -139,6 +201,13 @@ echo "Submitting Merge Job with dependency on Alignment Array Job..."
 # Define Merge Job Name
 MERGE_JOB_NAME="merge_job_${GROUP}_${SAMPLE}"
 
+# Streaming alignment writes coordinate-sorted BAMs, which the merge job combines with a single k-way merge
+if [ "${ALIGN_MODE:-classic}" = "streaming" ]; then
+    MERGE_MODE="sorted"
+else
+    MERGE_MODE="classic"
+fi
+
 MERGE_JOB_ID=$(qsub -terse \
     -hold_jid "${ALIGN_ARRAY_JOB_ID}" \
     -P "${QSUB_PROJECT}" \
@@ -148,8 +217,9 @@ MERGE_JOB_ID=$(qsub -terse \
     -pe omp "${TOTAL_CPUS_MERGE}" \
     -m "${QSUB_EMAIL}" \
     -j "${QSUB_JOINT_STDERR}" \
+    -v TELEMETRY_LOG="${TELEMETRY_LOG-}",SCRIPTS_DIR="${SCRIPTS_DIR}",GROUP="${GROUP}",SAMPLE="${SAMPLE}" \
     "${SCRIPTS_DIR}/merge_job.sh" \
-    "${ALIGNED_BAM_DIR}" "${SAMPLE}" "${GROUP}" "${MERGE_THREADS}"
+    "${ALIGNED_BAM_DIR}" "${SAMPLE}" "${GROUP}" "${MERGE_THREADS}" "${MERGE_MODE}" "${KEEP_FULL_BAM:-false}"
 )
 
 echo "Merge Job submitted with Job ID: ${MERGE_JOB_ID}"
@@ -161,7 +231,7 @@ echo "Submitting Modkit Extractor Job with dependency on Merge Job..."
 # Define Modkit Job Name
 MODKIT_JOB_NAME="modkit_job_${GROUP}_${SAMPLE}"
 
-MODKIT_JOB_ID=$(qsub -terse \
+MODKIT_JOB_ID=$(qsub -terse -V \
     -hold_jid "${MERGE_JOB_ID}" \
     -P "${QSUB_PROJECT}" \
     -N "${MODKIT_JOB_NAME}" \
@@ -174,7 +244,8 @@ MODKIT_JOB_ID=$(qsub -terse \
     "${GROUP}" "${SAMPLE}" "${MODIFIED_BASES}" "${ALL_MODS}" "${ALIGNED_BAM_DIR}" "${MODKIT_OUTPUT_DIR}" \
     "${FILTER_THRESHOLD_ALL}" "${FILTER_THRESHOLD_A}" "${FILTER_THRESHOLD_C}" "${FILTER_THRESHOLD_T}" \
     "${MOD_THRESHOLD_M6A}" "${MOD_THRESHOLD_PSEU}" "${MOD_THRESHOLD_INOSINE}" "${MOD_THRESHOLD_M5C}" \
-    "${VALID_COVERAGE_THRESHOLD}" "${PERCENT_MODIFIED_THRESHOLD}" "${MODKIT_THREADS}"
+    "${VALID_COVERAGE_THRESHOLD}" "${PERCENT_MODIFIED_THRESHOLD}" "${MODKIT_THREADS}" \
+    "${MODKIT_SHARDS:-1}" "${MODKIT_SHARD_MODE:-local}"
 )
 
 echo "Modkit Extractor Job submitted with Job ID: ${MODKIT_JOB_ID}"
@@ -183,6 +254,9 @@ echo
 # ----------------------------- Completion Message ----------------------------
 echo "Alignment processing and subsequent jobs have been submitted successfully."
 echo "============================================="
+if [ -n "${RESHARD_JOB_ID}" ]; then
+    echo "Reshard Job ID: ${RESHARD_JOB_ID}"
+fi
 echo "Alignment Array Job ID: ${ALIGN_ARRAY_JOB_ID}"
 echo "Merge Job ID: ${MERGE_JOB_ID}"
 echo "Modkit Extractor Job ID: ${MODKIT_JOB_ID}"
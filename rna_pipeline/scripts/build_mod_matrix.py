@@ -0,0 +1,550 @@
+"""
+Description:
+    This script collects the filtered bedMethyl files of many `${GROUP}_${SAMPLE}` runs into a site x sample store of
+    percent modified and valid coverage, and exports dense matrices from it for group comparisons (e.g. AD vs Control).
+    The sorted per-sample files are combined with a streaming k-way merge, so memory use does not grow with the number
+    of samples, and new samples are added to an existing store without rewriting the samples already in it.
+
+Key Features:
+    - **Streaming k-way Merge:** All input files are read line by line and merged by genome position. A site is
+      identified by (contig, start, strand, modification code).
+    - **Sparse Columnar Store:** Sites and per-sample columns are flat binary files that are memory-mapped when read:
+        - `sites.bin`: One record per site (contig index, start, strand, modification index). Sites are only ever
+          appended, so site IDs are stable.
+        - `site_order.bin`: Site IDs in genome order, rewritten after every addition.
+        - `columns/column_<i>.bin`: One record (site ID, percent modified, valid coverage) per site called in sample
+          `i`, sorted by site ID. Sites not called in a sample take no space.
+        - `store.json`: Contigs, modification codes, number of sites, and the name, group and source files of every
+          sample.
+    - **Appending Samples:** The existing sites are merged, in genome order, with the new samples' files. Sites seen
+      for the first time are appended to `sites.bin`; existing columns are left untouched.
+    - **Matrix Export:** Writes percent modified and valid coverage matrices (sites x samples, TSV) for the whole
+      store, one contig or one region, a block of sites at a time, together with the sample groups.
+    - **Error Handling:** Alerts and exits on missing input files, duplicate sample names, and input files that are
+      not sorted by position. The store is only updated once an addition has completed.
+
+Usage:
+    python build_mod_matrix.py add <store_dir> <sample_sheet> [--contig_order <file>]
+    python build_mod_matrix.py export <store_dir> <output_prefix> [--region <contig[:start-end]>] [--mod <code>]
+                                      [--min_samples <N>]
+
+Arguments:
+    add:
+        store_dir       : Store directory. Created if it does not exist.
+        sample_sheet    : Tab-separated file with the columns `sample`, `group` and `bed` (an optional header line is
+                          skipped). A sample may be listed on several lines, e.g. once per modification file written
+                          with `MODKIT_FILTER_MODE=indexed`. Plain and gzip/bgzip-compressed files are accepted.
+        --contig_order  : (Optional) File with one contig per line in the order the input files are sorted in, e.g.
+                          the first column of the reference `.fai`. Without it, contigs are ranked in the order they
+                          are first seen, which only works when every input contains the first contigs.
+    export:
+        store_dir       : Store directory.
+        output_prefix   : Writes `<prefix>.percent.tsv`, `<prefix>.coverage.tsv` and `<prefix>.samples.tsv`.
+        --region        : (Optional) Contig or region (`contig:start-end`, 0-based, half-open) to export.
+        --mod           : (Optional) Only export sites of this modification code (e.g. `a`, `m`, `17596`, `17802`).
+        --min_samples   : (Optional) Only export sites called in at least this many samples. Defaults to 1.
+
+Requirements:
+    - The `numpy` and `pandas` Python packages.
+"""
+
+import os
+import sys
+import gzip
+import json
+import heapq
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+
+STORE_FILE = "store.json"
+SITES_FILE = "sites.bin"
+ORDER_FILE = "site_order.bin"
+COLUMNS_DIR = "columns"
+STORE_VERSION = 1
+
+# Record layouts of the binary files
+SITE_DTYPE = np.dtype([("contig", "<i4"), ("start", "<i8"), ("strand", "S1"), ("mod", "<i2")])
+ENTRY_DTYPE = np.dtype([("site", "<i8"), ("percent", "<f4"), ("coverage", "<i4")])
+ORDER_DTYPE = np.dtype("<i8")
+
+# Number of records buffered before they are written
+WRITE_BUFFER = 100000
+
+# Number of sites exported at a time
+EXPORT_CHUNK = 1000000
+
+class SiteOrderError(Exception):
+    """Raised when an input file is not sorted by position."""
+
+def load_store(store_dir):
+    """
+    Load the metadata of a store, or return the metadata of an empty store.
+
+    Args:
+        store_dir (str): Store directory.
+
+    Returns:
+        dict: Store metadata with `contigs`, `mods`, `num_sites` and `samples`.
+    """
+    store_file = os.path.join(store_dir, STORE_FILE)
+    if not os.path.isfile(store_file):
+        return {"version": STORE_VERSION, "contigs": [], "mods": [], "num_sites": 0, "samples": []}
+    with open(store_file) as f:
+        store = json.load(f)
+    if store.get("version") != STORE_VERSION:
+        print(f"[ERROR] Store '{store_dir}' has version {store.get('version')}; expected {STORE_VERSION}.")
+        sys.exit(1)
+    return store
+
+def save_store(store_dir, store):
+    """
+    Atomically write the metadata of a store.
+
+    Args:
+        store_dir (str): Store directory.
+        store (dict): Store metadata.
+    """
+    tmp_file = os.path.join(store_dir, f"{STORE_FILE}.partial")
+    with open(tmp_file, "w") as f:
+        json.dump(store, f, indent=4)
+    os.replace(tmp_file, os.path.join(store_dir, STORE_FILE))
+
+def read_binary(path, dtype, count):
+    """
+    Memory-map the first records of a binary store file.
+
+    Args:
+        path (str): Path to the file.
+        dtype (numpy.dtype): Record layout.
+        count (int): Number of records.
+
+    Returns:
+        numpy.ndarray: Read-only array of records (an empty array if `count` is 0).
+    """
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+def read_sample_sheet(sample_sheet):
+    """
+    Read the sample sheet.
+
+    Args:
+        sample_sheet (str): Path to the tab-separated sample sheet.
+
+    Returns:
+        dict: Dictionary mapping sample names to dictionaries with `group` and `beds`, in sheet order.
+
+    Raises:
+        SystemExit: If a line is malformed, a sample is listed with two groups, or a BED file does not exist.
+    """
+    samples = {}
+    with open(sample_sheet) as f:
+        for line_number, line in enumerate(f, start=1):
+            fields = line.rstrip("\n").split("\t")
+            if not line.strip() or line.startswith("#"):
+                continue
+            if line_number == 1 and [field.lower() for field in fields] == ["sample", "group", "bed"]:
+                continue
+            if len(fields) != 3:
+                print(f"[ERROR] Line {line_number} of '{sample_sheet}' does not have 3 tab-separated columns.")
+                sys.exit(1)
+
+            name, group, bed = fields
+            if not os.path.isfile(bed):
+                print(f"[ERROR] BED file '{bed}' of sample '{name}' does not exist.")
+                sys.exit(1)
+            entry = samples.setdefault(name, {"group": group, "beds": []})
+            if entry["group"] != group:
+                print(f"[ERROR] Sample '{name}' is listed with groups '{entry['group']}' and '{group}'.")
+                sys.exit(1)
+            entry["beds"].append(os.path.abspath(bed))
+    return samples
+
+def iter_bed_positions(path, contig_rank):
+    """
+    Yield the records of a bedMethyl file grouped by position.
+
+    Contigs missing from `contig_rank` are added to it with the next rank.
+
+    Args:
+        path (str): Path to a plain or gzip-compressed bedMethyl file.
+        contig_rank (dict): Dictionary mapping contigs to their rank in genome order.
+
+    Yields:
+        tuple: ((contig rank, start), list of (strand, mod code, percent modified, valid coverage)).
+
+    Raises:
+        SiteOrderError: If a position sorts before the previous one.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    key, records = None, []
+    with opener(path, "rt") as f:
+        for line in f:
+            fields = line.split()
+            if line.startswith("#") or len(fields) < 11 or not fields[1].isdigit():
+                continue
+            rank = contig_rank.setdefault(fields[0], len(contig_rank))
+            record_key = (rank, int(fields[1]))
+            if record_key != key:
+                if key is not None:
+                    if record_key < key:
+                        raise SiteOrderError(f"'{path}' is not sorted by position at {fields[0]}:{fields[1]}")
+                    yield key, records
+                key, records = record_key, []
+            records.append((fields[5].encode(), fields[3], float(fields[10]), int(fields[9])))
+    if key is not None:
+        yield key, records
+
+def iter_sample_positions(beds, contig_rank, tag):
+    """
+    Yield the records of all files of one sample grouped by position.
+
+    Args:
+        beds (list of str): bedMethyl files of the sample, each sorted by position.
+        contig_rank (dict): Dictionary mapping contigs to their rank in genome order.
+        tag (int): Sample index attached to every item.
+
+    Yields:
+        tuple: ((contig rank, start), tag, list of (strand, mod code, percent modified, valid coverage)).
+    """
+    streams = [iter_bed_positions(path, contig_rank) for path in beds]
+    merged = heapq.merge(*streams, key=lambda item: item[0]) if len(streams) > 1 else streams[0]
+    for key, group in itertools.groupby(merged, key=lambda item: item[0]):
+        yield key, tag, [record for _, records in group for record in records]
+
+def iter_store_positions(sites, order, chunk_size=WRITE_BUFFER):
+    """
+    Yield the existing sites of a store grouped by position, in genome order.
+
+    Args:
+        sites (numpy.ndarray): Site records.
+        order (numpy.ndarray): Site IDs in genome order.
+        chunk_size (int): Number of sites read at a time.
+
+    Yields:
+        tuple: ((contig rank, start), -1, list of (strand, mod index, site ID)).
+    """
+    key, records = None, []
+    for chunk_start in range(0, len(order), chunk_size):
+        ids = np.asarray(order[chunk_start:chunk_start + chunk_size])
+        chunk = sites[ids]
+        for site_id, contig, start, strand, mod in zip(ids.tolist(), chunk["contig"].tolist(), chunk["start"].tolist(),
+                                                       chunk["strand"].tolist(), chunk["mod"].tolist()):
+            if (contig, start) != key:
+                if key is not None:
+                    yield key, -1, records
+                key, records = (contig, start), []
+            records.append((strand, mod, site_id))
+    if key is not None:
+        yield key, -1, records
+
+def genome_order(sites):
+    """
+    Sort site IDs by contig, start, strand and modification.
+
+    Args:
+        sites (numpy.ndarray): Site records.
+
+    Returns:
+        numpy.ndarray: Site IDs in genome order.
+    """
+    return np.lexsort((sites["mod"], sites["strand"], sites["start"], sites["contig"])).astype(ORDER_DTYPE)
+
+def add_samples(store_dir, samples, contig_order=None):
+    """
+    Merge the bedMethyl files of new samples into a store.
+
+    Args:
+        store_dir (str): Store directory. Created if it does not exist.
+        samples (dict): Dictionary mapping sample names to dictionaries with `group` and `beds`.
+        contig_order (list of str, optional): Contigs in the order the input files are sorted in.
+
+    Returns:
+        dict: Updated store metadata.
+
+    Raises:
+        SiteOrderError: If an input file is not sorted by position.
+    """
+    store = load_store(store_dir)
+    os.makedirs(os.path.join(store_dir, COLUMNS_DIR), exist_ok=True)
+
+    contig_rank = {contig: rank for rank, contig in enumerate(store["contigs"])}
+    for contig in contig_order or []:
+        contig_rank.setdefault(contig, len(contig_rank))
+    mod_index = {mod: idx for idx, mod in enumerate(store["mods"])}
+
+    num_sites = store["num_sites"]
+    sites_path = os.path.join(store_dir, SITES_FILE)
+    sites = read_binary(sites_path, SITE_DTYPE, num_sites)
+    order = read_binary(os.path.join(store_dir, ORDER_FILE), ORDER_DTYPE, num_sites)
+
+    first_column = len(store["samples"])
+    names = list(samples)
+    column_paths = [os.path.join(store_dir, COLUMNS_DIR, f"column_{first_column + idx}.bin") for idx in range(len(names))]
+    counts = [0] * len(names)
+
+    streams = [iter_store_positions(sites, order)]
+    streams += [iter_sample_positions(samples[name]["beds"], contig_rank, idx) for idx, name in enumerate(names)]
+
+    # Sites written by an earlier addition that did not complete are discarded
+    with open(sites_path, "ab") as sites_file:
+        sites_file.truncate(num_sites * SITE_DTYPE.itemsize)
+
+    site_buffer = []
+    column_buffers = [[] for _ in names]
+    column_files = [open(f"{path}.partial", "wb") for path in column_paths]
+    try:
+        with open(sites_path, "ab") as sites_file:
+            for key, group in itertools.groupby(heapq.merge(*streams, key=lambda item: item[0]), key=lambda item: item[0]):
+                site_ids = {}
+                sample_records = []
+                for _, tag, records in group:
+                    if tag < 0:
+                        site_ids.update({(strand, mod): site_id for strand, mod, site_id in records})
+                    else:
+                        sample_records.append((tag, records))
+
+                for tag, records in sample_records:
+                    for strand, mod, percent, coverage in records:
+                        mod_idx = mod_index.setdefault(mod, len(mod_index))
+                        site_id = site_ids.get((strand, mod_idx))
+                        if site_id is None:
+                            site_id = num_sites
+                            site_ids[(strand, mod_idx)] = site_id
+                            site_buffer.append((key[0], key[1], strand, mod_idx))
+                            num_sites += 1
+                        column_buffers[tag].append((site_id, percent, coverage))
+
+                if len(site_buffer) >= WRITE_BUFFER:
+                    np.array(site_buffer, dtype=SITE_DTYPE).tofile(sites_file)
+                    site_buffer = []
+                for tag, buffer in enumerate(column_buffers):
+                    if len(buffer) >= WRITE_BUFFER:
+                        np.array(buffer, dtype=ENTRY_DTYPE).tofile(column_files[tag])
+                        counts[tag] += len(buffer)
+                        column_buffers[tag] = []
+
+            np.array(site_buffer, dtype=SITE_DTYPE).tofile(sites_file)
+            for tag, buffer in enumerate(column_buffers):
+                np.array(buffer, dtype=ENTRY_DTYPE).tofile(column_files[tag])
+                counts[tag] += len(buffer)
+    except SiteOrderError:
+        for column_file in column_files:
+            column_file.close()
+        for path in column_paths:
+            os.remove(f"{path}.partial")
+        raise
+    finally:
+        for column_file in column_files:
+            column_file.close()
+
+    # Sort each new column by site ID for lookups
+    for path, count in zip(column_paths, counts):
+        column = np.fromfile(f"{path}.partial", dtype=ENTRY_DTYPE, count=count)
+        column[np.argsort(column["site"], kind="stable")].tofile(path)
+        os.remove(f"{path}.partial")
+
+    sites = read_binary(sites_path, SITE_DTYPE, num_sites)
+    order_path = os.path.join(store_dir, ORDER_FILE)
+    genome_order(sites).tofile(f"{order_path}.partial")
+    os.replace(f"{order_path}.partial", order_path)
+
+    store["contigs"] = sorted(contig_rank, key=contig_rank.get)
+    store["mods"] = sorted(mod_index, key=mod_index.get)
+    store["num_sites"] = num_sites
+    for idx, name in enumerate(names):
+        store["samples"].append({
+            "name": name,
+            "group": samples[name]["group"],
+            "sources": samples[name]["beds"],
+            "num_sites": counts[idx],
+            "column": os.path.relpath(column_paths[idx], store_dir),
+        })
+    save_store(store_dir, store)
+    return store
+
+def parse_region(region):
+    """
+    Parse a region string.
+
+    Args:
+        region (str): `contig` or `contig:start-end` (0-based, half-open).
+
+    Returns:
+        tuple: (contig, start or None, end or None).
+    """
+    contig, _, interval = region.partition(":")
+    if not interval:
+        return contig, None, None
+    start, _, end = interval.replace(",", "").partition("-")
+    return contig, int(start), int(end)
+
+def build_matrix(store_dir, store, sites, ids, start=None, end=None, mod=None, min_samples=1):
+    """
+    Build the percent modified and valid coverage matrices of a set of sites.
+
+    Args:
+        store_dir (str): Store directory.
+        store (dict): Store metadata.
+        sites (numpy.ndarray): Site records of the store.
+        ids (numpy.ndarray): Site IDs, in the order of the output rows.
+        start (int, optional): Only include sites starting at or after this position.
+        end (int, optional): Only include sites starting before this position.
+        mod (str, optional): Only include sites of this modification code.
+        min_samples (int): Only include sites called in at least this many samples.
+
+    Returns:
+        tuple: (sites DataFrame, percent modified DataFrame, valid coverage DataFrame), aligned by row.
+    """
+    selected = sites[ids]
+    mask = np.ones(len(ids), dtype=bool)
+    if start is not None:
+        mask &= (selected["start"] >= start) & (selected["start"] < end)
+    if mod is not None:
+        mask &= selected["mod"] == (store["mods"].index(mod) if mod in store["mods"] else -1)
+    ids, selected = ids[mask], selected[mask]
+
+    names = [sample["name"] for sample in store["samples"]]
+    percent = np.full((len(ids), len(names)), np.nan, dtype=np.float32)
+    coverage = np.zeros((len(ids), len(names)), dtype=np.int32)
+    for column_idx, sample in enumerate(store["samples"]):
+        column = read_binary(os.path.join(store_dir, sample["column"]), ENTRY_DTYPE, sample["num_sites"])
+        if len(column) == 0:
+            continue
+        positions = np.minimum(np.searchsorted(column["site"], ids), len(column) - 1)
+        hit = column["site"][positions] == ids
+        percent[hit, column_idx] = column["percent"][positions[hit]]
+        coverage[hit, column_idx] = column["coverage"][positions[hit]]
+
+    keep = (coverage > 0).sum(axis=1) >= min_samples
+    selected = selected[keep]
+    site_frame = pd.DataFrame({
+        "contig": np.array(store["contigs"], dtype=object)[selected["contig"]],
+        "start": selected["start"],
+        "end": selected["start"] + 1,
+        "strand": np.char.decode(selected["strand"]),
+        "mod": np.array(store["mods"], dtype=object)[selected["mod"]],
+    })
+    return (site_frame,
+            pd.DataFrame(percent[keep], columns=names),
+            pd.DataFrame(coverage[keep], columns=names))
+
+def export_matrix(store_dir, output_prefix, region=None, mod=None, min_samples=1, chunk_size=EXPORT_CHUNK):
+    """
+    Write the percent modified and valid coverage matrices and the sample groups.
+
+    Sites are exported in genome order, a fixed number of sites at a time, so memory use does not depend on the
+    size of the store.
+
+    Args:
+        store_dir (str): Store directory.
+        output_prefix (str): Output path prefix.
+        region (str, optional): Contig or region to export; all contigs if omitted.
+        mod (str, optional): Only export sites of this modification code.
+        min_samples (int): Only export sites called in at least this many samples.
+        chunk_size (int): Number of sites processed at a time.
+
+    Returns:
+        int: Number of sites written.
+    """
+    store = load_store(store_dir)
+    sites = read_binary(os.path.join(store_dir, SITES_FILE), SITE_DTYPE, store["num_sites"])
+    order = read_binary(os.path.join(store_dir, ORDER_FILE), ORDER_DTYPE, store["num_sites"])
+
+    lo, hi, start, end = 0, len(order), None, None
+    if region:
+        contig, start, end = parse_region(region)
+        if contig not in store["contigs"]:
+            print(f"[ERROR] Contig '{contig}' is not in the store.")
+            sys.exit(1)
+        # Sites of a contig are contiguous in genome order
+        contig_idx = store["contigs"].index(contig)
+        lo, hi = np.searchsorted(sites["contig"][np.asarray(order)], [contig_idx, contig_idx + 1])
+
+    pd.DataFrame([{"sample": s["name"], "group": s["group"]} for s in store["samples"]]).to_csv(
+        f"{output_prefix}.samples.tsv", sep="\t", index=False)
+
+    written = 0
+    for chunk_start in range(lo, max(hi, lo + 1), chunk_size):
+        ids = np.asarray(order[chunk_start:min(chunk_start + chunk_size, hi)])
+        site_frame, percent, coverage = build_matrix(store_dir, store, sites, ids, start, end, mod, min_samples)
+        mode, header = ("w", True) if chunk_start == lo else ("a", False)
+        pd.concat([site_frame, percent], axis=1).to_csv(f"{output_prefix}.percent.tsv", sep="\t", index=False,
+                                                        mode=mode, header=header, na_rep="NA", float_format="%.2f")
+        pd.concat([site_frame, coverage], axis=1).to_csv(f"{output_prefix}.coverage.tsv", sep="\t", index=False,
+                                                         mode=mode, header=header)
+        written += len(site_frame)
+
+    print(f"[INFO] Exported {written} sites x {len(store['samples'])} samples to '{output_prefix}.percent.tsv' "
+          f"and '{output_prefix}.coverage.tsv'.")
+    return written
+
+def print_store_summary(store):
+    """
+    Print the number of sites and the samples of a store.
+
+    Args:
+        store (dict): Store metadata.
+    """
+    print(f"[INFO] Store holds {store['num_sites']} sites on {len(store['contigs'])} contig(s) "
+          f"and {len(store['samples'])} sample(s).")
+    for sample in store["samples"]:
+        print(f"[INFO] {sample['name']} ({sample['group']}): {sample['num_sites']} sites")
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Build and export a site x sample modification matrix from bedMethyl files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Add samples to a store, creating it if needed.")
+    add_parser.add_argument("store_dir", type=str, help="Store directory.")
+    add_parser.add_argument("sample_sheet", type=str, help="Tab-separated file with the columns sample, group and bed.")
+    add_parser.add_argument("--contig_order", type=str, default=None, help="File with one contig per line in genome order.")
+
+    export_parser = subparsers.add_parser("export", help="Export percent modified and valid coverage matrices.")
+    export_parser.add_argument("store_dir", type=str, help="Store directory.")
+    export_parser.add_argument("output_prefix", type=str, help="Prefix of the output TSV files.")
+    export_parser.add_argument("--region", type=str, default=None, help="Contig or region (contig:start-end) to export.")
+    export_parser.add_argument("--mod", type=str, default=None, help="Only export sites of this modification code.")
+    export_parser.add_argument("--min_samples", type=int, default=1, help="Only export sites called in at least this many samples.")
+
+    args = parser.parse_args()
+
+    if args.command == "add":
+        if not os.path.isfile(args.sample_sheet):
+            print(f"[ERROR] Sample sheet '{args.sample_sheet}' does not exist.")
+            sys.exit(1)
+        samples = read_sample_sheet(args.sample_sheet)
+        if not samples:
+            print(f"[ERROR] No samples found in '{args.sample_sheet}'.")
+            sys.exit(1)
+
+        existing = {sample["name"] for sample in load_store(args.store_dir)["samples"]}
+        duplicates = sorted(existing.intersection(samples))
+        if duplicates:
+            print(f"[ERROR] Sample(s) already in the store: {', '.join(duplicates)}")
+            sys.exit(1)
+
+        contig_order = None
+        if args.contig_order:
+            with open(args.contig_order) as f:
+                contig_order = [line.split("\t")[0].strip() for line in f if line.strip()]
+
+        try:
+            store = add_samples(args.store_dir, samples, contig_order)
+        except SiteOrderError as e:
+            print(f"[ERROR] {e}. Sort the input files, or pass --contig_order if they are sorted in a contig order "
+                  "that is not the order in which contigs are first seen.")
+            sys.exit(1)
+        print_store_summary(store)
+    else:
+        if not os.path.isfile(os.path.join(args.store_dir, STORE_FILE)):
+            print(f"[ERROR] Store '{args.store_dir}' does not exist.")
+            sys.exit(1)
+        export_matrix(args.store_dir, args.output_prefix, args.region, args.mod, args.min_samples)
+
+if __name__ == "__main__":
+    main()
@@ -42,9 +42,19 @@
 #        - Constructs output file paths and ensures that output directories are ready.
 #
 #     3. **Execution Phase:**
-#        - Iterates through each partition, copies the associated POD5 files to a temporary directory, and executes Dorado basecalling.
+#        - Iterates through each partition, stages the associated POD5 files in a temporary directory, and executes Dorado basecalling.
 #        - Directs the basecalling output to a single unaligned BAM file per partition.
 #
+#   **Staging:**
+#     - Dorado reads a directory, so each partition's POD5 files are staged in `${UNALIGNED_BAM_DIR}/${PARTITION}_pod5`.
+#       The staging mode is set with the `DORADO_STAGING_MODE` environment variable:
+#         - `hardlink` (default): Hard-links each file, falling back to a copy only when the link fails (e.g., when the
+#           POD5 files and `UNALIGNED_BAM_DIR` are on different filesystems). No data is read or written.
+#         - `symlink`: Symbolically links each file. Works across filesystems; Dorado reads directly from the source.
+#         - `copy`: Copies each file, as in earlier versions of this script.
+#     - With `DORADO_PREFETCH=true`, partitions are instead copied to the node-local `$TMPDIR`, and the next partition
+#       is copied in the background while the current one is basecalling. `$TMPDIR` must hold two partitions.
+#
 #   **Job Dependencies:**
 #     - **No Direct Dependencies:**
 #       - This basecaller job is typically the first step in the pipeline and does not depend on any previous jobs.
@@ -68,6 +78,9 @@
 #       }
 #       ```
 #       - Each partition (e.g., `partition_1`) contains key-value pairs where keys are the full paths to POD5 files and values represent file sizes.
+#       - When `partition_pod5_files.py` is run with `--cost_model samples`, each partition is instead an object whose
+#         `files` key holds the per-file entries, alongside per-partition `size_bytes`, `num_reads`, `num_samples` and
+#         `estimated_seconds` fields. Both formats are accepted.
 #
 #   **Output:**
 #     - **Unaligned BAM Files (`${UNALIGNED_BAM_DIR}`):**
@@ -75,6 +88,19 @@
 #       - Naming convention:
 #         - For each partition: `${UNALIGNED_BAM_DIR}/${PARTITION}/${MODEL_TYPE}_calls.bam`
 #
+#     - **Completion Marker (`${UNALIGNED_BAM_DIR}/${PARTITION}/basecalling.done`):**
+#       - Written once a partition has been basecalled, with the SHA-256 of the partition's sorted file list
+#         (`files_sha256=`). `partition_pod5_files.py --incremental` uses it to decide which partitions still need
+#         work. A partition is skipped here only if its marker records the file list it has in `partitions.json` now;
+#         after `partitions.json` is rebuilt with other files in a partition, the stale output stops the run at the
+#         directory check (or, for a partition in the pending list, is removed and basecalled again).
+#
+#     - **Runtime Log (`${UNALIGNED_BAM_DIR}/dorado_runtimes.log`):**
+#       - Tab-separated record per partition with the runtime in seconds and, when available from `partitions.json`,
+#         the number of signal samples, reads and bytes. Used by `pod5_cost.py` to calibrate samples/second.
+#       - The last two columns hold the staging mode and the seconds spent waiting for staging, so that the staging
+#         modes can be compared. The basecalling throughput (MB/s and samples/s) is also printed for each partition.
+#
 #
 #   **Arguments:**
 #     1. `MODIFIED_BASES`    - Space-separated string of RNA modifications (e.g., `"m5C m6A_DRACH inosine_m6A pseU"`)
@@ -82,6 +108,9 @@
 #     3. `MODEL_NAME`        - Dorado model name (e.g., `hac@v5.1.0`)
 #     4. `MIN_QSCORE`        - Minimum quality score for filtering low-quality reads (e.g., `9`)
 #     5. `PARTITIONS_JSON`   - Path to the `partitions.json` file specifying POD5 file paths
+#     6. `PENDING_PARTITIONS` - (Optional) Path to `pending_partitions.txt`, one partition name per line. When given,
+#                               only these partitions are basecalled, and a partition whose earlier run was interrupted
+#                               (output present but no completion marker) is basecalled again from scratch.
 #
 #   **Notes:**
 #     - **CUDA Module:**
@@ -100,7 +129,12 @@
 #       - Implement additional logging if needed to capture more detailed information about the basecalling process, especially for large-scale pipelines.
 #
 #     - **Parallel Processing:**
-#       - The script is designed to process partitions sequentially within a single job. If you need to parallelize basecalling across multiple partitions, consider modifying the script or integrating it within a larger workflow managed by a job scheduler that can handle multiple job submissions and dependencies.
+#       - The `DORADO_EXECUTION_MODE` environment variable selects how partitions are processed:
+#         - `sequential` (default): All partitions are basecalled one after another on the job's GPUs.
+#         - `array`: The job is an SGE array job (`qsub -t 1-N`), and each task basecalls the partition on line
+#           `SGE_TASK_ID` of the pending list (or of the sorted keys of `partitions.json`).
+#         - `multigpu`: One worker per GPU in `CUDA_VISIBLE_DEVICES` takes partitions from a work queue guarded by
+#           `flock`, running Dorado with `CUDA_VISIBLE_DEVICES` restricted to its own GPU.
 #
 # =============================================================================
 
@@ -108,8 +142,8 @@
 set -euo pipefail
 
 # ----------------------- Step 0: Parse Input Arguments -----------------------
-if [ "$#" -ne 5 ]; then
-    echo "Usage: $0 MODIFIED_BASES UNALIGNED_BAM_DIR MODEL_NAME MIN_QSCORE PARTITIONS_JSON"
+if [ "$#" -ne 5 ] && [ "$#" -ne 6 ]; then
+    echo "Usage: $0 MODIFIED_BASES UNALIGNED_BAM_DIR MODEL_NAME MIN_QSCORE PARTITIONS_JSON [PENDING_PARTITIONS]"
     exit 1
 fi
 
@@ -118,6 +152,7 @@ UNALIGNED_BAM_DIR="${2}"      # Directory where unaligned BAM files will be stor
 MODEL_NAME="${3}"             # Dorado model name (e.g., hac@v5.1.0)
 MIN_QSCORE="${4}"             # Minimum quality score for filtering reads
 PARTITIONS_JSON="${5}"        # Path to the partitions.json file
+PENDING_PARTITIONS="${6-}"    # Optional list of partitions that still need basecalling
 
 # ----------------------- Step 1: Job Information -----------------------
 echo "=========================================================="
@@ -149,6 +184,11 @@ if [ ! -f "${PARTITIONS_JSON}" ]; then
     exit 4
 fi
 
+if [ -n "${PENDING_PARTITIONS}" ] && [ ! -f "${PENDING_PARTITIONS}" ]; then
+    echo "[ERROR] Pending partitions list not found at '${PENDING_PARTITIONS}'."
+    exit 4
+fi
+
 # ----------------------- Step 5: Define Directory Validation Function -----------------------
 # Function to check if directory exists and is empty
 check_directory() {
@@ -166,13 +206,81 @@ check_directory() {
     fi
 }
 
-# ----------------------- Step 6: Define Cleanup Function -----------------------
-# Function to clean up temporary directories upon exit
+# ----------------------- Step 6: Define Staging and Cleanup Functions -----------------------
+DORADO_STAGING_MODE="${DORADO_STAGING_MODE:-hardlink}"   # hardlink, symlink or copy
+DORADO_PREFETCH="${DORADO_PREFETCH:-false}"              # Copy the next partition to $TMPDIR while basecalling
+DORADO_EXECUTION_MODE="${DORADO_EXECUTION_MODE:-sequential}"   # sequential, array or multigpu
+
+if [[ "$DORADO_EXECUTION_MODE" != "sequential" && "$DORADO_EXECUTION_MODE" != "array" && "$DORADO_EXECUTION_MODE" != "multigpu" ]]; then
+    echo "[ERROR] Unknown DORADO_EXECUTION_MODE '${DORADO_EXECUTION_MODE}'. Use sequential, array or multigpu."
+    exit 1
+fi
+
+if [[ "$DORADO_STAGING_MODE" != "hardlink" && "$DORADO_STAGING_MODE" != "symlink" && "$DORADO_STAGING_MODE" != "copy" ]]; then
+    echo "[ERROR] Unknown DORADO_STAGING_MODE '${DORADO_STAGING_MODE}'. Use hardlink, symlink or copy."
+    exit 1
+fi
+
+if [ "$DORADO_PREFETCH" = "true" ] && [ -z "${TMPDIR-}" ]; then
+    echo "[WARNING] DORADO_PREFETCH is set but TMPDIR is not defined. Staging with '${DORADO_STAGING_MODE}' instead."
+    DORADO_PREFETCH="false"
+fi
+
+# Function to stage the POD5 files of a partition in a directory using hardlinks, symlinks or copies
+stage_partition() {
+    local PARTITION="$1"
+    local DEST_DIR="$2"
+    local MODE="$3"
+    local LINKED=0
+    local COPIED=0
+    local POD5_FILE TARGET
+
+    mkdir -p "$DEST_DIR"
+    while IFS= read -r POD5_FILE; do
+        if [ ! -f "${POD5_FILE}" ]; then
+            echo "Warning: POD5 file '${POD5_FILE}' does not exist. Skipping."
+            continue
+        fi
+        TARGET="${DEST_DIR}/$(basename "${POD5_FILE}")"
+        # Files with the same name but different content may share a partition; stage them under distinct names
+        if [ -e "${TARGET}" ] || [ -L "${TARGET}" ]; then
+            TARGET="${DEST_DIR}/$((LINKED + COPIED))_$(basename "${POD5_FILE}")"
+        fi
+        case "$MODE" in
+            hardlink)
+                if ln -f "${POD5_FILE}" "${TARGET}" 2>/dev/null; then
+                    LINKED=$((LINKED + 1))
+                else
+                    cp "${POD5_FILE}" "${TARGET}" || { echo "Failed to copy ${POD5_FILE}"; return 1; }
+                    COPIED=$((COPIED + 1))
+                fi
+                ;;
+            symlink)
+                ln -sf "${POD5_FILE}" "${TARGET}" || { echo "Failed to link ${POD5_FILE}"; return 1; }
+                LINKED=$((LINKED + 1))
+                ;;
+            copy)
+                cp "${POD5_FILE}" "${TARGET}" || { echo "Failed to copy ${POD5_FILE}"; return 1; }
+                COPIED=$((COPIED + 1))
+                ;;
+        esac
+    done < <(jq -r --arg partition "$PARTITION" "${PARTITION_FILES_FILTER} | keys[]" "$PARTITIONS_JSON")
+
+    echo "Staged ${PARTITION} in ${DEST_DIR} (${MODE}): ${LINKED} linked, ${COPIED} copied."
+}
+
+# Function to clean up temporary directories and background prefetches upon exit
 cleanup() {
-    if [[ -d "$TEMP_DIR" ]]; then
-        rm -rf "$TEMP_DIR"
-        echo "Cleaned up temporary directory: $TEMP_DIR"
+    if [[ -n "${PREFETCH_PID-}" ]]; then
+        kill "$PREFETCH_PID" 2>/dev/null || true
+        wait "$PREFETCH_PID" 2>/dev/null || true
     fi
+    for DIR in "${TEMP_DIR-}" "${PREFETCH_DIR-}"; do
+        if [[ -n "$DIR" && -d "$DIR" ]]; then
+            rm -rf "$DIR"
+            echo "Cleaned up temporary directory: $DIR"
+        fi
+    done
 }
 trap cleanup EXIT
 
@@ -183,49 +291,273 @@ if ! command -v jq &> /dev/null; then
     exit 5
 fi
 
-# Read all partition names
-PARTITIONS=$(jq -r 'keys[]' "$PARTITIONS_JSON")
+# Read the partition names, restricted to the pending ones when a list is given
+if [ -n "${PENDING_PARTITIONS}" ]; then
+    PARTITIONS=$(grep -v '^[[:space:]]*$' "${PENDING_PARTITIONS}" || true)
+    echo "Basecalling $(echo "${PARTITIONS}" | grep -c . || true) pending partition(s) listed in ${PENDING_PARTITIONS}."
+else
+    PARTITIONS=$(jq -r 'keys[]' "$PARTITIONS_JSON")
+fi
+
+# Marker written into a partition's output directory once it has been basecalled
+DONE_MARKER="basecalling.done"
+
+# jq filter selecting the file mapping of a partition in either partitions.json format
+PARTITION_FILES_FILTER='.[$partition] | if has("files") then .files else . end'
+
+# Initialize the runtime log used to calibrate the samples cost model
+RUNTIME_LOG="${UNALIGNED_BAM_DIR}/dorado_runtimes.log"
+mkdir -p "${UNALIGNED_BAM_DIR}"
+# noclobber creates the file exclusively, so a concurrent array task or GPU worker never truncates rows already logged
+(
+    set -o noclobber
+    printf "partition\truntime_seconds\tnum_samples\tnum_reads\tsize_bytes\tstaging_mode\tstaging_seconds\n" > "${RUNTIME_LOG}"
+) 2>/dev/null || true
+
+# Select the partitions to basecall, skipping those that were already basecalled by an earlier run
+if [ "$DORADO_EXECUTION_MODE" = "array" ]; then
+    # Each array task basecalls the partition on line SGE_TASK_ID of the partition list
+    if [[ -z "${SGE_TASK_ID-}" || "${SGE_TASK_ID}" = "undefined" ]]; then
+        echo "[ERROR] DORADO_EXECUTION_MODE=array requires the job to be submitted as an array job (qsub -t)."
+        exit 1
+    fi
+    PARTITIONS=$(echo "${PARTITIONS}" | sed -n "${SGE_TASK_ID}p")
+    if [ -z "${PARTITIONS}" ]; then
+        echo "No partition for task ${SGE_TASK_ID}. Nothing to do."
+        exit 0
+    fi
+fi
+
+# Function to print the SHA-256 of a partition's sorted file list, recorded in its completion marker
+partition_files_hash() {
+    jq -r --arg partition "$1" "${PARTITION_FILES_FILTER} | keys[]" "$PARTITIONS_JSON" | sha256sum | cut -d' ' -f1
+}
+
+# Function to check that a partition was basecalled from the files it holds in partitions.json now
+is_basecalled() {
+    local MARKER="${UNALIGNED_BAM_DIR}/${1}/${DONE_MARKER}"
+    [ -f "${MARKER}" ] && grep -qx "files_sha256=$(partition_files_hash "$1")" "${MARKER}"
+}
 
-# Iterate through each partition
+TODO_PARTITIONS=()
 for PARTITION in $PARTITIONS; do
-    echo "Processing ${PARTITION}..."
+    if is_basecalled "${PARTITION}"; then
+        echo "${PARTITION} was already basecalled. Skipping."
+        continue
+    fi
+    if [ -f "${UNALIGNED_BAM_DIR}/${PARTITION}/${DONE_MARKER}" ]; then
+        echo "Warning: ${PARTITION} was basecalled from other files than it holds in ${PARTITIONS_JSON} now."
+    fi
+    TODO_PARTITIONS+=("${PARTITION}")
+done
 
-    # Extract all POD5 file paths for the current partition
-    POD5_FILES=$(jq -r --arg partition "$PARTITION" '.[$partition] | keys[]' "$PARTITIONS_JSON")
+# Directory in which a partition is staged
+staging_dir() {
+    if [ "$DORADO_PREFETCH" = "true" ]; then
+        echo "${TMPDIR}/${1}_pod5"
+    else
+        echo "${UNALIGNED_BAM_DIR}/${1}_pod5"
+    fi
+}
 
-    # Define the output BAM directory and BAM file path for this partition
-    OUTPUT_BAM_DIR="${UNALIGNED_BAM_DIR}/${PARTITION}"
-    OUTPUT_BAM_FILE="${OUTPUT_BAM_DIR}/${MODEL_TYPE}_calls.bam"
+# Function to prepare the output directory of a partition
+prepare_output_dir() {
+    local PARTITION="$1"
+    local OUTPUT_BAM_DIR="${UNALIGNED_BAM_DIR}/${PARTITION}"
+    local OUTPUT_BAM_FILE="${OUTPUT_BAM_DIR}/${MODEL_TYPE}_calls.bam"
+
+    # An output without a current completion marker is left over from an interrupted run or from other files; redo
+    # it when running pending partitions
+    if [ -n "${PENDING_PARTITIONS}" ] && [ -f "${OUTPUT_BAM_FILE}" ]; then
+        echo "Removing incomplete or stale output of an earlier run: ${OUTPUT_BAM_FILE}"
+        rm -f "${OUTPUT_BAM_FILE}"
+    fi
+    if [ -n "${PENDING_PARTITIONS}" ]; then
+        rm -f "${OUTPUT_BAM_DIR}/${DONE_MARKER}"
+    fi
 
     # Validate the output directory
     check_directory "${OUTPUT_BAM_DIR}"
+}
 
-    # Define the temporary directory within UNALIGNED_BAM_DIR with naming pattern "${PARTITION}_pod5"
-    TEMP_DIR="${UNALIGNED_BAM_DIR}/${PARTITION}_pod5"
-    mkdir -p "${TEMP_DIR}"
-    echo "Temporary directory created: ${TEMP_DIR}"
+# Function to run Dorado on a staged partition and record its runtime and throughput
+basecall_partition() {
+    local PARTITION="$1"
+    local STAGED_DIR="$2"
+    local STAGING_LABEL="$3"
+    local STAGING_SECONDS="$4"
+    local OUTPUT_BAM_DIR="${UNALIGNED_BAM_DIR}/${PARTITION}"
+    local OUTPUT_BAM_FILE="${OUTPUT_BAM_DIR}/${MODEL_TYPE}_calls.bam"
+    local START_TIME END_TIME RUNTIME PARTITION_STATS NUM_SAMPLES NUM_READS SIZE_BYTES
+    local TELEMETRY=()
 
-    # Copy POD5 files into the temporary directory
-    for POD5_FILE in $POD5_FILES; do
-        if [ -f "${POD5_FILE}" ]; then
-            cp "${POD5_FILE}" "${TEMP_DIR}/" || { echo "Failed to copy ${POD5_FILE}"; exit 6; }
-        else
-            echo "Warning: POD5 file '${POD5_FILE}' does not exist. Skipping."
+    # The partition's cost fields (empty for the size-only format)
+    PARTITION_STATS=$(jq -r --arg partition "$PARTITION" \
+        '.[$partition] | [.num_samples // "", .num_reads // "", .size_bytes // ([.[] | numbers] | add) // ""] | @tsv' "$PARTITIONS_JSON")
+
+    # Measure the basecaller with the telemetry wrapper when a telemetry log is configured (see telemetry.py)
+    if [ -n "${TELEMETRY_LOG-}" ] && [ -f "${SCRIPTS_DIR-}/telemetry.py" ]; then
+        # cut keeps empty fields, which read would collapse
+        NUM_SAMPLES=$(cut -f1 <<< "${PARTITION_STATS}")
+        NUM_READS=$(cut -f2 <<< "${PARTITION_STATS}")
+        SIZE_BYTES=$(cut -f3 <<< "${PARTITION_STATS}")
+        TELEMETRY=(python3 "${SCRIPTS_DIR}/telemetry.py" run --log "${TELEMETRY_LOG}" --stage dorado --partition "${PARTITION}"
+                   ${NUM_SAMPLES:+--samples "${NUM_SAMPLES}"} ${NUM_READS:+--reads "${NUM_READS}"}
+                   ${SIZE_BYTES:+--input_bytes "${SIZE_BYTES}"} --)
+    fi
+
+    # Run Dorado basecaller on the staging directory
+    echo "Running Dorado basecaller for ${PARTITION}${CUDA_VISIBLE_DEVICES:+ on GPU(s) ${CUDA_VISIBLE_DEVICES}}..."
+    START_TIME=$(date +%s)
+    ${TELEMETRY[@]+"${TELEMETRY[@]}"} dorado basecaller --modified-bases $MODIFIED_BASES --min-qscore $MIN_QSCORE "$MODEL_NAME" "$STAGED_DIR" > "$OUTPUT_BAM_FILE" || return 1
+    END_TIME=$(date +%s)
+    RUNTIME=$((END_TIME - START_TIME))
+
+    echo "Dorado basecalling for ${PARTITION} completed successfully in ${RUNTIME} seconds. Output: ${OUTPUT_BAM_FILE}"
+
+    # Record the runtime together with the partition's cost fields
+    printf "%s\t%d\t%s\t%s\t%d\n" "${PARTITION}" "${RUNTIME}" "${PARTITION_STATS}" "${STAGING_LABEL}" "${STAGING_SECONDS}" >> "${RUNTIME_LOG}"
+
+    # Report the basecalling throughput
+    echo "${PARTITION_STATS}" | awk -F'\t' -v runtime="${RUNTIME}" -v staging="${STAGING_SECONDS}" -v partition="${PARTITION}" '{
+        secs = (runtime > 0) ? runtime : 1
+        line = sprintf("Throughput for %s: %.1f MB/s", partition, $3 / 1048576 / secs)
+        if ($1 != "") line = line sprintf(", %.0f samples/s", $1 / secs)
+        print line sprintf(" (staging wait: %d seconds)", staging)
+    }'
+
+    # Mark the partition as basecalled from its current file list, so later runs over the same partition leave it alone
+    printf "files_sha256=%s\nfinished=%s\n" "$(partition_files_hash "${PARTITION}")" "$(date)" > "${OUTPUT_BAM_DIR}/${DONE_MARKER}"
+}
+
+# Function to take the next partition from a shared queue file; prints nothing when the queue is empty
+claim_next_partition() {
+    local QUEUE_FILE="$1"
+    (
+        flock -x 9
+        local NEXT
+        NEXT=$(head -n 1 "${QUEUE_FILE}")
+        if [ -n "${NEXT}" ]; then
+            sed -i '1d' "${QUEUE_FILE}"
         fi
+        echo "${NEXT}"
+    ) 9>"${QUEUE_FILE}.lock"
+}
+
+# Function run by each GPU worker in multigpu mode: basecall partitions from the queue until it is empty
+gpu_worker() {
+    local GPU="$1"
+    local QUEUE_FILE="$2"
+    local PARTITION WORKER_DIR STAGE_START STAGING_SECONDS
+
+    export CUDA_VISIBLE_DEVICES="${GPU}"
+    trap 'if [[ -n "${WORKER_DIR-}" && -d "${WORKER_DIR}" ]]; then rm -rf "${WORKER_DIR}"; fi' EXIT
+
+    while true; do
+        PARTITION=$(claim_next_partition "${QUEUE_FILE}")
+        if [ -z "${PARTITION}" ]; then
+            break
+        fi
+        echo "[GPU ${GPU}] Processing ${PARTITION}..."
+
+        prepare_output_dir "${PARTITION}"
+
+        WORKER_DIR="${UNALIGNED_BAM_DIR}/${PARTITION}_pod5"
+        STAGE_START=$(date +%s)
+        stage_partition "${PARTITION}" "${WORKER_DIR}" "${DORADO_STAGING_MODE}" || return 6
+        STAGING_SECONDS=$(( $(date +%s) - STAGE_START ))
+
+        basecall_partition "${PARTITION}" "${WORKER_DIR}" "${DORADO_STAGING_MODE}" "${STAGING_SECONDS}" || { echo "[GPU ${GPU}] Dorado failed for ${PARTITION}"; return 7; }
+
+        rm -rf "${WORKER_DIR}"
+        WORKER_DIR=""
+        echo "[GPU ${GPU}] Finished ${PARTITION}."
     done
+}
 
-    # Run Dorado basecaller on the temporary directory
-    echo "Running Dorado basecaller for ${PARTITION}..."
-    dorado basecaller --modified-bases $MODIFIED_BASES --min-qscore $MIN_QSCORE "$MODEL_NAME" "$TEMP_DIR" > "$OUTPUT_BAM_FILE"
+PREFETCH_PID=""
+PREFETCH_DIR=""
 
-    echo "Dorado basecalling for ${PARTITION} completed successfully. Output: ${OUTPUT_BAM_FILE}"
+if [ "$DORADO_EXECUTION_MODE" = "multigpu" ]; then
+    # ----------------------- Multi-GPU Mode: One Worker per Visible GPU -----------------------
+    if [ -n "${CUDA_VISIBLE_DEVICES-}" ]; then
+        IFS=',' read -r -a GPU_DEVICES <<< "${CUDA_VISIBLE_DEVICES}"
+    else
+        mapfile -t GPU_DEVICES < <(nvidia-smi --query-gpu=index --format=csv,noheader 2>/dev/null || true)
+    fi
+    if [ "${#GPU_DEVICES[@]}" -eq 0 ]; then
+        echo "[ERROR] No GPUs found for DORADO_EXECUTION_MODE=multigpu (CUDA_VISIBLE_DEVICES is empty)."
+        exit 1
+    fi
+    if [ "$DORADO_PREFETCH" = "true" ]; then
+        echo "[WARNING] DORADO_PREFETCH is not used in multigpu mode. Staging with '${DORADO_STAGING_MODE}'."
+    fi
 
-    # Clean up the temporary directory
-    rm -rf "${TEMP_DIR}"
+    QUEUE_FILE="${UNALIGNED_BAM_DIR}/.dorado_queue_${JOB_ID}"
+    printf "%s\n" ${TODO_PARTITIONS[@]+"${TODO_PARTITIONS[@]}"} | grep -v '^$' > "${QUEUE_FILE}" || true
+    echo "Basecalling ${#TODO_PARTITIONS[@]} partition(s) on ${#GPU_DEVICES[@]} GPU(s): ${GPU_DEVICES[*]}"
 
-    echo "Removed temporary directory: ${TEMP_DIR}"
-    echo "----------------------------------------------------------"
-done
+    WORKER_PIDS=()
+    for GPU in "${GPU_DEVICES[@]}"; do
+        gpu_worker "${GPU}" "${QUEUE_FILE}" &
+        WORKER_PIDS+=($!)
+    done
+
+    FAILED_WORKERS=0
+    for PID in "${WORKER_PIDS[@]}"; do
+        wait "${PID}" || FAILED_WORKERS=$((FAILED_WORKERS + 1))
+    done
+    rm -f "${QUEUE_FILE}" "${QUEUE_FILE}.lock"
+
+    if [ "${FAILED_WORKERS}" -gt 0 ]; then
+        echo "[ERROR] ${FAILED_WORKERS} GPU worker(s) failed. Partitions without a ${DONE_MARKER} marker were not completed."
+        exit 7
+    fi
+else
+    # ----------------------- Sequential and Array Modes -----------------------
+    for IDX in ${TODO_PARTITIONS[@]+"${!TODO_PARTITIONS[@]}"}; do
+        PARTITION="${TODO_PARTITIONS[$IDX]}"
+        echo "Processing ${PARTITION}..."
+
+        prepare_output_dir "${PARTITION}"
+
+        # Stage the POD5 files of this partition; with prefetching, wait for the background copy started earlier
+        TEMP_DIR=$(staging_dir "${PARTITION}")
+        STAGE_START=$(date +%s)
+        if [ "$DORADO_PREFETCH" = "true" ]; then
+            if [ -n "${PREFETCH_PID}" ]; then
+                wait "${PREFETCH_PID}" || { echo "Failed to prefetch ${PARTITION}"; exit 6; }
+                PREFETCH_PID=""
+                PREFETCH_DIR=""
+            else
+                stage_partition "${PARTITION}" "${TEMP_DIR}" copy || exit 6
+            fi
+            STAGING_LABEL="prefetch"
+        else
+            stage_partition "${PARTITION}" "${TEMP_DIR}" "${DORADO_STAGING_MODE}" || exit 6
+            STAGING_LABEL="${DORADO_STAGING_MODE}"
+        fi
+        STAGING_SECONDS=$(( $(date +%s) - STAGE_START ))
+        echo "Staging directory ready: ${TEMP_DIR} (waited ${STAGING_SECONDS} seconds)"
+
+        # Start copying the next partition to node-local storage while this one is basecalling
+        if [ "$DORADO_PREFETCH" = "true" ] && [ $((IDX + 1)) -lt "${#TODO_PARTITIONS[@]}" ]; then
+            NEXT_PARTITION="${TODO_PARTITIONS[$((IDX + 1))]}"
+            PREFETCH_DIR=$(staging_dir "${NEXT_PARTITION}")
+            stage_partition "${NEXT_PARTITION}" "${PREFETCH_DIR}" copy &
+            PREFETCH_PID=$!
+            echo "Prefetching ${NEXT_PARTITION} into ${PREFETCH_DIR} in the background."
+        fi
+
+        basecall_partition "${PARTITION}" "${TEMP_DIR}" "${STAGING_LABEL}" "${STAGING_SECONDS}" || { echo "Dorado failed for ${PARTITION}"; exit 7; }
+
+        # Clean up the temporary directory
+        rm -rf "${TEMP_DIR}"
+
+        echo "Removed temporary directory: ${TEMP_DIR}"
+        echo "----------------------------------------------------------"
+    done
+fi
 
 echo "All partitions have been processed successfully."
 echo "=========================================================="
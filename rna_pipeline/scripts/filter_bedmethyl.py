@@ -0,0 +1,171 @@
+"""
+Description:
+    This script filters a `modkit pileup` bedMethyl file by valid coverage and percent modified, and writes one
+    bgzip-compressed, tabix-indexed BED file per modification code. It replaces the `awk` filter of `modkit_job.sh`
+    when `MODKIT_FILTER_MODE=indexed`: the filtered calls of one modification can then be queried by region without
+    reading the whole file, and the outputs are several times smaller than the plain filtered BED.
+
+Key Features:
+    - **Block Processing:** The pileup is read with pandas in blocks of a fixed number of records, and the thresholds
+      are applied to whole columns at once, so memory use is bounded by the block size and not by the pileup size.
+    - **Same Filter as `awk`:** Records are kept when valid coverage (column 10) is at least the coverage threshold
+      and percent modified (column 11) is at least the percent modified threshold. Columns separated by tabs or spaces
+      are both accepted; the outputs are tab-separated.
+    - **Split by Modification Code:** Records are written to one output per modification code (column 4), named after
+      the modification (`m` -> m5C, `a` -> m6A, `17596` -> inosine, `17802` -> pseU; other codes keep their code).
+    - **Indexed Outputs:** Each output is written through a BGZF stream while the pileup is read, and indexed with
+      tabix once it is closed.
+    - **Error Handling:** Alerts and exits if the input file is missing or if an output cannot be indexed, e.g.
+      because the pileup is not sorted by position.
+
+Usage:
+    python filter_bedmethyl.py <input_bed> <output_pattern> --min_coverage <N> --min_percent_modified <P>
+                               [--chunk_size <N>]
+
+Arguments:
+    input_bed              : bedMethyl file written by `modkit pileup`.
+    output_pattern         : Output path containing `{mod}`, which is replaced by the modification name. Must end
+                             with `.gz`.
+    --min_coverage         : Minimum valid coverage (column 10).
+    --min_percent_modified : Minimum percent modified (column 11).
+    --chunk_size           : (Optional) Number of records per block. Defaults to 250000.
+
+Requirements:
+    - The `pandas` and `pysam` Python packages.
+"""
+
+import io
+import os
+import sys
+import argparse
+import pandas as pd
+
+# Output names of the modification codes used by the pipeline
+MOD_CODE_NAMES = {
+    "m": "m5C",
+    "a": "m6A",
+    "17596": "inosine",
+    "17802": "pseU",
+}
+
+# Zero-based bedMethyl columns used by the filter
+MOD_CODE_COLUMN = 3
+VALID_COVERAGE_COLUMN = 9
+PERCENT_MODIFIED_COLUMN = 10
+
+def read_header(input_bed):
+    """
+    Read the column header of a bedMethyl file written with `--with-header`.
+
+    Args:
+        input_bed (str): Path to the bedMethyl file.
+
+    Returns:
+        tuple: (header line without a trailing newline or None, number of leading lines to skip).
+    """
+    with open(input_bed) as f:
+        first_line = f.readline().rstrip("\n")
+
+    fields = first_line.split()
+    if first_line.startswith("#"):
+        return first_line, 0
+    if fields and (len(fields) < 2 or not fields[1].isdigit()):
+        return first_line, 1
+    return None, 0
+
+def filter_bedmethyl(input_bed, output_pattern, min_coverage, min_percent_modified, chunk_size=250000):
+    """
+    Filter a bedMethyl file and write one bgzip-compressed, tabix-indexed file per modification code.
+
+    Args:
+        input_bed (str): Path to the bedMethyl file.
+        output_pattern (str): Output path containing `{mod}`.
+        min_coverage (float): Minimum valid coverage.
+        min_percent_modified (float): Minimum percent modified.
+        chunk_size (int): Number of records per block.
+
+    Returns:
+        dict: Dictionary mapping output paths to the number of records written.
+
+    Raises:
+        SystemExit: If `pysam` is not installed or an output cannot be indexed.
+    """
+    try:
+        import pysam
+    except ImportError:
+        print("[ERROR] The 'pysam' package is required for bgzip and tabix output. Install it with 'pip install pysam'.")
+        sys.exit(1)
+
+    header, skip_rows = read_header(input_bed)
+    if header is not None and not header.startswith("#"):
+        header = "#" + "\t".join(header.split())
+
+    writers = {}
+    counts = {}
+    total = 0
+
+    reader = pd.read_csv(input_bed, sep=r"\s+", header=None, dtype=str, comment="#", skiprows=skip_rows,
+                         chunksize=chunk_size)
+    try:
+        for chunk in reader:
+            total += len(chunk)
+            coverage = pd.to_numeric(chunk[VALID_COVERAGE_COLUMN], errors="coerce").to_numpy()
+            percent = pd.to_numeric(chunk[PERCENT_MODIFIED_COLUMN], errors="coerce").to_numpy()
+            kept = chunk[(coverage >= min_coverage) & (percent >= min_percent_modified)]
+
+            for code, records in kept.groupby(MOD_CODE_COLUMN, sort=False):
+                path = output_pattern.format(mod=MOD_CODE_NAMES.get(code, code))
+                if path not in writers:
+                    writers[path] = pysam.BGZFile(f"{path}.partial", "wb")
+                    counts[path] = 0
+                    if header is not None:
+                        writers[path].write(f"{header}\n".encode())
+
+                buffer = io.StringIO()
+                records.to_csv(buffer, sep="\t", header=False, index=False)
+                writers[path].write(buffer.getvalue().encode())
+                counts[path] += len(records)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    for path in writers:
+        os.replace(f"{path}.partial", path)
+        try:
+            pysam.tabix_index(path, preset="bed", force=True)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Unable to index '{path}': {e}. Is the pileup sorted by position?")
+            sys.exit(1)
+
+    print(f"[INFO] Read {total} records from '{input_bed}'.")
+    for path, count in counts.items():
+        print(f"[INFO] {os.path.basename(path)}: {count} records")
+    if not counts:
+        print("[WARNING] No records passed the thresholds.")
+
+    return counts
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Filter a bedMethyl file into bgzip-compressed, tabix-indexed files per modification.")
+    parser.add_argument("input_bed", type=str, help="bedMethyl file written by modkit pileup.")
+    parser.add_argument("output_pattern", type=str, help="Output path containing '{mod}', ending with '.gz'.")
+    parser.add_argument("--min_coverage", type=float, required=True, help="Minimum valid coverage (column 10).")
+    parser.add_argument("--min_percent_modified", type=float, required=True, help="Minimum percent modified (column 11).")
+    parser.add_argument("--chunk_size", type=int, default=250000, help="Number of records per block.")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_bed):
+        print(f"[ERROR] Input BED file '{args.input_bed}' does not exist.")
+        sys.exit(1)
+    if "{mod}" not in args.output_pattern or not args.output_pattern.endswith(".gz"):
+        print(f"[ERROR] Output pattern '{args.output_pattern}' must contain '{{mod}}' and end with '.gz'.")
+        sys.exit(1)
+    if args.chunk_size < 1:
+        print(f"[ERROR] The chunk size must be at least 1 (got {args.chunk_size}).")
+        sys.exit(1)
+
+    filter_bedmethyl(args.input_bed, args.output_pattern, args.min_coverage, args.min_percent_modified, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,12 @@
 #          into unaligned BAM files.
 #        - Utilizes GPU acceleration for efficient processing by requesting appropriate
 #          GPU resources.
+#        - `DORADO_EXECUTION_MODE` selects how partitions are spread over GPUs:
+#            - `sequential`: one job basecalls all partitions one after another.
+#            - `array`: an array job with one task per partition (`TOTAL_GPUS_DORADO` GPUs per task),
+#              running at most `DORADO_MAX_CONCURRENT_GPUS` tasks at once.
+#            - `multigpu`: one job on a node with `TOTAL_GPUS_DORADO` GPUs; each GPU takes partitions
+#              from a shared work queue.
 #
 #     2. **Alignment & Modkit Extraction Submission:**
 #        - Submits an Alignment & Modkit Extraction job (`alignment_modkit_job.sh`) that
@@ -26,13 +32,27 @@
 #        - Internally, `alignment_modkit_job.sh` handles further job submissions for merging
 #          and modification extraction.
 #
+#     3. **Pipelined Alignment (`PIPELINED_ALIGN=true`, `array` mode only):**
+#        - Instead of waiting for the whole Dorado job, an alignment array job (`align_array_job.sh`) with one
+#          task per partition is submitted with `-hold_jid_ad`, so alignment task i starts as soon as Dorado task i
+#          has written `${PARTITION}/${MODEL_TYPE}_calls.bam` and its `basecalling.done` marker.
+#        - Partitions basecalled by earlier runs (incremental mode) are aligned by a second array job that does
+#          not wait for Dorado.
+#        - `alignment_modkit_job.sh` is then submitted right away with `ALIGN_ARRAY_JOB_IDS` set; it only submits
+#          the Merge job, held on the last alignment task, and the Modkit job.
+#        - Ignored with a warning in the `sequential` and `multigpu` modes (one job basecalls every partition, so
+#          there is no per-partition job to wait for) and with `RESHARD_UNALIGNED=true` (resharding needs all
+#          partitions).
+#
 #   **Job Dependencies:**
 #     - **Dorado Basecalling Job (`dorado_job.sh`):**
 #       - **Dependency:** None (it is the initial step in the pipeline).
 #       - **Function:** Converts raw POD5 files into unaligned BAM files using Dorado.
 #
 #     - **Alignment & Modkit Extraction Job (`alignment_modkit_job.sh`):**
-#       - **Dependency:** Must complete successfully after the Dorado Basecalling Job.
+#       - **Dependency:** Must complete successfully after the Dorado Basecalling Job. In `array`
+#         mode it waits for every task of the array. With `PIPELINED_ALIGN=true` it has no dependency;
+#         the alignment tasks wait for their own Dorado tasks instead.
 #       - **Function:** Aligns the basecalled reads to a reference genome and extracts RNA modifications.
 #       - **Internal Dependencies:** Manages the submission of Merge and Modkit Extraction sub-jobs.
 #
@@ -81,14 +101,51 @@ if [ ! -f "${PARTITIONS_JSON}" ]; then
     exit 1
 fi
 
+# Restrict basecalling to the partitions listed by partition_pod5_files.py as still needing work
+PENDING_PARTITIONS="${BASH_SOURCE_DIR}/pending_partitions.txt"
+DORADO_ARGS=("${MODIFIED_BASES}" "${UNALIGNED_BAM_DIR}" "${MODEL_NAME}" "${MIN_QSCORE}" "${PARTITIONS_JSON}")
+if [ -f "${PENDING_PARTITIONS}" ]; then
+    DORADO_ARGS+=("${PENDING_PARTITIONS}")
+fi
+
 # ----------------------- Step 1: Submit Dorado Basecalling Job -----------------------
-echo "Submitting Dorado Basecalling Job to process all partitions..."
+DORADO_EXECUTION_MODE="${DORADO_EXECUTION_MODE:-sequential}"
+PIPELINED_ALIGN="${PIPELINED_ALIGN:-false}"
+
+# Alignment can only follow basecalling partition by partition when every partition is its own array task
+if [ "${PIPELINED_ALIGN}" = "true" ]; then
+    if [ "${DORADO_EXECUTION_MODE}" != "array" ]; then
+        echo "[WARNING] PIPELINED_ALIGN requires DORADO_EXECUTION_MODE=array. Aligning after basecalling has finished."
+        PIPELINED_ALIGN="false"
+    elif [ "${RESHARD_UNALIGNED:-false}" = "true" ]; then
+        echo "[WARNING] PIPELINED_ALIGN cannot be combined with RESHARD_UNALIGNED. Aligning after basecalling has finished."
+        PIPELINED_ALIGN="false"
+    fi
+fi
+echo "Submitting Dorado Basecalling Job to process all partitions (mode: ${DORADO_EXECUTION_MODE})..."
 
 # Define Dorado job name
 DORADO_JOB_NAME="dorado_job_${GROUP}_${SAMPLE}"
 
+# In array mode, every task basecalls one partition and at most DORADO_MAX_CONCURRENT_GPUS tasks run at once
+DORADO_ARRAY_ARGS=()
+if [ "${DORADO_EXECUTION_MODE}" = "array" ]; then
+    if [ -f "${PENDING_PARTITIONS}" ]; then
+        NUM_PARTITIONS=$(grep -c . "${PENDING_PARTITIONS}" || true)
+    else
+        NUM_PARTITIONS=$(jq 'length' "${PARTITIONS_JSON}")
+    fi
+    if [ "${NUM_PARTITIONS}" -eq 0 ]; then
+        echo "[WARNING] No partitions need basecalling. Submitting a single no-op task."
+        NUM_PARTITIONS=1
+    fi
+    DORADO_ARRAY_ARGS=(-t 1-"${NUM_PARTITIONS}" -tc "${DORADO_MAX_CONCURRENT_GPUS:-${NUM_PARTITIONS}}")
+    echo "Dorado array job: ${NUM_PARTITIONS} task(s), up to ${DORADO_MAX_CONCURRENT_GPUS:-${NUM_PARTITIONS}} running concurrently."
+fi
+
 # Submit the Dorado basecalling script with necessary arguments and qsub options
-DORADO_JOB_ID=$(qsub -terse -V \
+DORADO_JOB_FULL_ID=$(qsub -terse -V \
+    ${DORADO_ARRAY_ARGS[@]+"${DORADO_ARRAY_ARGS[@]}"} \
     -P "${QSUB_PROJECT}" \
     -N "${DORADO_JOB_NAME}" \
     -l h_rt="${DORADO_JOB_RUNTIME}" \
@@ -99,21 +156,96 @@ DORADO_JOB_ID=$(qsub -terse -V \
     -m "${QSUB_EMAIL}" \
     -j "${QSUB_JOINT_STDERR}" \
     "${SCRIPTS_DIR}/dorado_job.sh" \
-    "${MODIFIED_BASES}" "${UNALIGNED_BAM_DIR}" "${MODEL_NAME}" "${MIN_QSCORE}" "${PARTITIONS_JSON}"
+    "${DORADO_ARGS[@]}"
 )
 
+# An array job ID is reported as <job_id>.<range>; holding on <job_id> waits for every task
+DORADO_JOB_ID=$(echo "${DORADO_JOB_FULL_ID}" | cut -d '.' -f1)
+
 echo "Dorado Basecalling Job submitted with Job ID: ${DORADO_JOB_ID}"
 echo
 
-# ----------------------- Step 2: Submit Alignment & Modkit Extraction Job -----------------------
+# ----------------------- Step 2: Submit Pipelined Alignment Array Jobs -----------------------
+ALIGN_MODKIT_HOLD_ARGS=(-hold_jid "${DORADO_JOB_ID}")
+if [ "${PIPELINED_ALIGN}" = "true" ]; then
+    echo "Submitting pipelined Alignment Array Jobs (each partition is aligned as soon as it is basecalled)..."
+    MODEL_TYPE=$(echo "${MODEL_NAME}" | awk -F'@' '{print $1}')
+    mkdir -p "${ALIGNED_BAM_DIR}"
+
+    # Task lists: line i of the first list belongs to Dorado task i; the second holds partitions basecalled earlier
+    PIPELINED_TASKS="${BASH_SOURCE_DIR}/align_tasks_pipelined.tsv"
+    BASECALLED_TASKS="${BASH_SOURCE_DIR}/align_tasks_basecalled.tsv"
+    if [ -f "${PENDING_PARTITIONS}" ]; then
+        DORADO_PARTITIONS=$(grep -v '^[[:space:]]*$' "${PENDING_PARTITIONS}" || true)
+    else
+        DORADO_PARTITIONS=$(jq -r 'keys[]' "${PARTITIONS_JSON}")
+    fi
+    : > "${PIPELINED_TASKS}"
+    for PARTITION in ${DORADO_PARTITIONS}; do
+        printf "%s\t%s\n" "${UNALIGNED_BAM_DIR}/${PARTITION}/${MODEL_TYPE}_calls.bam" "${PARTITION}_calls" >> "${PIPELINED_TASKS}"
+    done
+    : > "${BASECALLED_TASKS}"
+    for PARTITION in $(jq -r 'keys[]' "${PARTITIONS_JSON}"); do
+        if ! echo "${DORADO_PARTITIONS}" | grep -qx "${PARTITION}" && [ -f "${UNALIGNED_BAM_DIR}/${PARTITION}/basecalling.done" ]; then
+            printf "%s\t%s\n" "${UNALIGNED_BAM_DIR}/${PARTITION}/${MODEL_TYPE}_calls.bam" "${PARTITION}_calls" >> "${BASECALLED_TASKS}"
+        fi
+    done
+
+    ALIGN_ARGS=("${ALIGNED_BAM_DIR}" "${ANNOTATION_FILE}" "${REFERENCE_FILE}" "${ALIGN_THREADS}" "${ALIGN_MODE:-classic}" "${KEEP_FULL_BAM:-false}")
+    ALIGN_ARRAY_JOB_IDS=""
+
+    # -hold_jid_ad needs the same number of tasks as the Dorado array, including its single no-op task
+    ALIGN_ARRAY_JOB_FULL_ID=$(qsub -terse \
+        -t 1-"${NUM_PARTITIONS}" \
+        -hold_jid_ad "${DORADO_JOB_ID}" \
+        -P "${QSUB_PROJECT}" \
+        -N "align_array_job_${GROUP}_${SAMPLE}" \
+        -l h_rt="${ALIGN_JOB_RUNTIME}" \
+        -l mem_free="${ALIGN_JOB_MEMORY}" \
+        -pe omp "${TOTAL_CPUS_ALIGN}" \
+        -m "${QSUB_EMAIL}" \
+        -j "${QSUB_JOINT_STDERR}" \
+        -v TELEMETRY_LOG="${TELEMETRY_LOG-}",SCRIPTS_DIR="${SCRIPTS_DIR}",GROUP="${GROUP}",SAMPLE="${SAMPLE}" \
+        "${SCRIPTS_DIR}/align_array_job.sh" \
+        "${PIPELINED_TASKS}" "${ALIGN_ARGS[@]}"
+    )
+    ALIGN_ARRAY_JOB_IDS=$(echo "${ALIGN_ARRAY_JOB_FULL_ID}" | cut -d '.' -f1)
+    echo "Pipelined Alignment Array Job submitted with Job ID: ${ALIGN_ARRAY_JOB_IDS}"
+
+    NUM_BASECALLED=$(grep -c . "${BASECALLED_TASKS}" || true)
+    if [ "${NUM_BASECALLED}" -gt 0 ]; then
+        ALIGN_ARRAY_JOB_FULL_ID=$(qsub -terse \
+            -t 1-"${NUM_BASECALLED}" \
+            -P "${QSUB_PROJECT}" \
+            -N "align_basecalled_job_${GROUP}_${SAMPLE}" \
+            -l h_rt="${ALIGN_JOB_RUNTIME}" \
+            -l mem_free="${ALIGN_JOB_MEMORY}" \
+            -pe omp "${TOTAL_CPUS_ALIGN}" \
+            -m "${QSUB_EMAIL}" \
+            -j "${QSUB_JOINT_STDERR}" \
+            -v TELEMETRY_LOG="${TELEMETRY_LOG-}",SCRIPTS_DIR="${SCRIPTS_DIR}",GROUP="${GROUP}",SAMPLE="${SAMPLE}" \
+            "${SCRIPTS_DIR}/align_array_job.sh" \
+            "${BASECALLED_TASKS}" "${ALIGN_ARGS[@]}"
+        )
+        ALIGN_ARRAY_JOB_IDS="${ALIGN_ARRAY_JOB_IDS},$(echo "${ALIGN_ARRAY_JOB_FULL_ID}" | cut -d '.' -f1)"
+        echo "Alignment Array Job for ${NUM_BASECALLED} partition(s) basecalled earlier submitted."
+    fi
+
+    # alignment_modkit_job.sh only submits the Merge and Modkit jobs and need not wait for Dorado
+    export ALIGN_ARRAY_JOB_IDS
+    ALIGN_MODKIT_HOLD_ARGS=()
+    echo
+fi
+
+# ----------------------- Step 3: Submit Alignment & Modkit Extraction Job -----------------------
 echo "Submitting Alignment & Modkit Job for Alignment Processing and Extracting Modifications..."
 
 # Define Alignment & Modkit Extraction job name
 ALIGN_MODKIT_JOB_NAME="align_modkit_job_${GROUP}_${SAMPLE}"
 
-# Submit alignment_modkit_job.sh with dependency on Dorado job
+# Submit alignment_modkit_job.sh with dependency on Dorado job (none when alignment is pipelined)
 ALIGN_MODKIT_JOB_ID=$(qsub -terse -V \
-    -hold_jid "${DORADO_JOB_ID}" \
+    ${ALIGN_MODKIT_HOLD_ARGS[@]+"${ALIGN_MODKIT_HOLD_ARGS[@]}"} \
     -P "${QSUB_PROJECT}" \
     -N "${ALIGN_MODKIT_JOB_NAME}" \
     -l h_rt=1:00:00 \
@@ -129,6 +261,9 @@ echo
 echo "Pipeline submission complete."
 echo "============================================="
 echo "Dorado Job ID: ${DORADO_JOB_ID}"
+if [ "${PIPELINED_ALIGN}" = "true" ]; then
+    echo "Pipelined Alignment Array Job ID(s): ${ALIGN_ARRAY_JOB_IDS}"
+fi
 echo "Alignment & Modkit Extraction Job ID: ${ALIGN_MODKIT_JOB_ID}"
 echo "============================================="
 
@@ -36,6 +36,15 @@
 #        - Removes temporary and intermediate files to conserve storage space and
 #          maintain a clean working directory.
 #
+#   **Sorted Merge Mode:**
+#     - With `MERGE_MODE=sorted`, the inputs are expected to be coordinate-sorted already (`ALIGN_MODE=streaming`
+#       in `align_array_job.sh`). They are combined with a single k-way `samtools merge --write-index`, which builds
+#       the index while writing, so steps 2 to 6 above are skipped.
+#     - If the inputs hold all alignments (`KEEP_FULL_BAM=true`), the full BAM is merged first and the primary-only
+#       BAM is filtered from it in one indexed pass; filtering preserves the coordinate order. If the inputs are
+#       already primary-only (`KEEP_FULL_BAM=false`), the merge writes the primary-only BAM directly.
+#     - Requires samtools 1.10 or later.
+#
 #   **Final Output:**
 #     - A single, sorted, indexed, and filtered BAM file containing only primary
 #       alignments, ready for subsequent analyses such as variant calling or visualization.
@@ -52,6 +61,9 @@
 #   2. SAMPLE_NAME     - Identifier for the sample being processed (e.g., C0, A9).
 #   3. GROUP_NAME      - Identifier for the experimental or biological group (e.g., Control, AD).
 #   4. MERGE_THREADS   - Number of threads to allocate for merging and sorting operations.
+#   5. MERGE_MODE      - (Optional) `classic` (default) or `sorted`.
+#   6. KEEP_FULL_BAM   - (Optional) `sorted` mode only: `true` means the inputs hold all alignments and the full
+#                        sorted BAM is written as well; `false` (default) writes only the primary-only BAM.
 #
 # Usage:
 #   This script is intended to be submitted as a dependent job via `qsub` or an equivalent
@@ -70,6 +82,11 @@
 # Enable strict error handling
 set -euo pipefail
 
+# Re-run this script under the telemetry wrapper when a telemetry log is configured (see telemetry.py)
+if [ -n "${TELEMETRY_LOG-}" ] && [ ! -f "${TELEMETRY_METRICS-}" ] && [ -f "${SCRIPTS_DIR-}/telemetry.py" ]; then
+    exec python3 "${SCRIPTS_DIR}/telemetry.py" run --log "${TELEMETRY_LOG}" --stage merge -- bash -l "$0" "$@"
+fi
+
 # ----------------------- Step 0: Load Necessary Modules -----------------------
 module load samtools || { echo "Failed to load samtools module"; exit 1; }
 
@@ -78,6 +95,13 @@ OUTPUT_DIR="${1}"
 SAMPLE_NAME="${2}"
 GROUP_NAME="${3}"
 MERGE_THREADS="${4}"
+MERGE_MODE="${5:-classic}"      # classic or sorted
+KEEP_FULL_BAM="${6:-false}"     # sorted mode: also write the full (all alignments) sorted BAM
+
+if [[ "${MERGE_MODE}" != "classic" && "${MERGE_MODE}" != "sorted" ]]; then
+    echo "Error: Unknown MERGE_MODE '${MERGE_MODE}'. Use classic or sorted. Exiting."
+    exit 1
+fi
 
 # ----------------------- Step 2: Job Information -----------------------
 echo "=========================================================="
@@ -90,47 +114,80 @@ if [[ -n "${SGE_TASK_ID-}" ]]; then
 fi
 echo "=========================================================="
 
-# ----------------------- Step 3: Merge All BAM Files -----------------------
-FINAL_BAM="${OUTPUT_DIR}/final_merged.bam"
-
-echo "Merging BAM files into '${FINAL_BAM}' using ${MERGE_THREADS} threads..."
-samtools merge -@ "${MERGE_THREADS}" "${FINAL_BAM}" "${OUTPUT_DIR}"/*_aligned.bam
-
-# Remove individual aligned BAM files after successful merge
-echo "Removing individual aligned BAM files..."
-rm "${OUTPUT_DIR}"/*_aligned.bam
-
-# ----------------------- Step 4: Sort the Final BAM File -----------------------
 SORTED_BAM="${OUTPUT_DIR}/${GROUP_NAME}_${SAMPLE_NAME}.bam"
-
-echo "Sorting the merged BAM file into '${SORTED_BAM}'..."
-samtools sort -@ "${MERGE_THREADS}" -o "${SORTED_BAM}" "${FINAL_BAM}"
-
-# ----------------------- Step 5: Index the Sorted BAM File -----------------------
-echo "Indexing the sorted BAM file '${SORTED_BAM}'..."
-samtools index "${SORTED_BAM}"
-
-# ----------------------- Step 6: Filter for Primary Alignments -----------------------
 PRIMARY_BAM="${SORTED_BAM%.bam}_primary.bam"
 
-echo "Filtering primary alignments into '${PRIMARY_BAM}'..."
-samtools view -@ "${MERGE_THREADS}" -b -F 0x100 -F 0x800 "${SORTED_BAM}" > "${PRIMARY_BAM}"
-
-# ----------------------- Step 7: Sort Filtered BAM File -----------------------
-SORTED_BAM="${PRIMARY_BAM%.bam}_sorted.bam"
-
-echo "Sorting the primary BAM file into '${SORTED_BAM}'..."
-samtools sort -@ "${MERGE_THREADS}" -o $SORTED_BAM $PRIMARY_BAM
-
-mv $SORTED_BAM $PRIMARY_BAM
-
-# ----------------------- Step 8: Index the Filtered BAM File -----------------------
-echo "Indexing the filtered BAM file '${PRIMARY_BAM}'..."
-samtools index "${PRIMARY_BAM}"
+if [ "${MERGE_MODE}" = "sorted" ]; then
+    # ----------------------- Step 3: Check That All Inputs Are Coordinate-Sorted -----------------------
+    for BAM_FILE in "${OUTPUT_DIR}"/*_aligned.bam; do
+        if ! samtools view -H "${BAM_FILE}" | grep -q "^@HD.*SO:coordinate"; then
+            echo "Error: '${BAM_FILE}' is not coordinate-sorted. Use MERGE_MODE=classic for unsorted alignments. Exiting."
+            exit 1
+        fi
+    done
+
+    if [ "${KEEP_FULL_BAM}" = "true" ]; then
+        # ----------------------- Step 4: Merge Sorted BAM Files and Index in the Same Pass -----------------------
+        echo "Merging sorted BAM files into '${SORTED_BAM}' using ${MERGE_THREADS} threads..."
+        samtools merge -@ "${MERGE_THREADS}" --write-index "${SORTED_BAM}##idx##${SORTED_BAM}.bai" "${OUTPUT_DIR}"/*_aligned.bam
+
+        # ----------------------- Step 5: Filter for Primary Alignments and Index in the Same Pass -----------------------
+        # Filtering keeps the coordinate order, so no second sort is needed
+        echo "Filtering primary alignments into '${PRIMARY_BAM}'..."
+        samtools view -@ "${MERGE_THREADS}" -b -F 0x900 --write-index -o "${PRIMARY_BAM}##idx##${PRIMARY_BAM}.bai" "${SORTED_BAM}"
+    else
+        # ----------------------- Step 4: Merge Sorted Primary-Only BAM Files and Index in the Same Pass -----------------------
+        echo "Merging sorted primary-only BAM files into '${PRIMARY_BAM}' using ${MERGE_THREADS} threads..."
+        samtools merge -@ "${MERGE_THREADS}" --write-index "${PRIMARY_BAM}##idx##${PRIMARY_BAM}.bai" "${OUTPUT_DIR}"/*_aligned.bam
+    fi
+
+    # ----------------------- Step 6: Clean Up Intermediate Files -----------------------
+    echo "Removing individual aligned BAM files..."
+    rm "${OUTPUT_DIR}"/*_aligned.bam
+else
+    # ----------------------- Step 3: Merge All BAM Files -----------------------
+    FINAL_BAM="${OUTPUT_DIR}/final_merged.bam"
+
+    echo "Merging BAM files into '${FINAL_BAM}' using ${MERGE_THREADS} threads..."
+    samtools merge -@ "${MERGE_THREADS}" "${FINAL_BAM}" "${OUTPUT_DIR}"/*_aligned.bam
+
+    # Remove individual aligned BAM files after successful merge
+    echo "Removing individual aligned BAM files..."
+    rm "${OUTPUT_DIR}"/*_aligned.bam
+
+    # ----------------------- Step 4: Sort the Final BAM File -----------------------
+    echo "Sorting the merged BAM file into '${SORTED_BAM}'..."
+    samtools sort -@ "${MERGE_THREADS}" -o "${SORTED_BAM}" "${FINAL_BAM}"
+
+    # ----------------------- Step 5: Index the Sorted BAM File -----------------------
+    echo "Indexing the sorted BAM file '${SORTED_BAM}'..."
+    samtools index "${SORTED_BAM}"
+
+    # ----------------------- Step 6: Filter for Primary Alignments -----------------------
+    echo "Filtering primary alignments into '${PRIMARY_BAM}'..."
+    samtools view -@ "${MERGE_THREADS}" -b -F 0x100 -F 0x800 "${SORTED_BAM}" > "${PRIMARY_BAM}"
+
+    # ----------------------- Step 7: Sort Filtered BAM File -----------------------
+    PRIMARY_SORTED_BAM="${PRIMARY_BAM%.bam}_sorted.bam"
+
+    echo "Sorting the primary BAM file into '${PRIMARY_SORTED_BAM}'..."
+    samtools sort -@ "${MERGE_THREADS}" -o $PRIMARY_SORTED_BAM $PRIMARY_BAM
+
+    mv $PRIMARY_SORTED_BAM $PRIMARY_BAM
+
+    # ----------------------- Step 8: Index the Filtered BAM File -----------------------
+    echo "Indexing the filtered BAM file '${PRIMARY_BAM}'..."
+    samtools index "${PRIMARY_BAM}"
+
+    # ----------------------- Step 9: Clean Up Intermediate Files -----------------------
+    echo "Cleaning up intermediate file '${FINAL_BAM}'..."
+    rm "${FINAL_BAM}"
+fi
 
-# ----------------------- Step 9: Clean Up Intermediate Files -----------------------
-echo "Cleaning up intermediate file '${FINAL_BAM}'..."
-rm "${FINAL_BAM}"
+# Report the merged reads to the telemetry wrapper (counted from the index)
+if [ -n "${TELEMETRY_METRICS-}" ]; then
+    printf "mode=%s\ncount_bam=%s\n" "${MERGE_MODE}" "${PRIMARY_BAM}" >> "${TELEMETRY_METRICS}"
+fi
 
 # Inform the user of completion
 echo "Merging, sorting, indexing, and extracting primary reads completed successfully."
@@ -9,7 +9,7 @@
 #   It performs the following sequential operations:
 #
 #     1. **Argument Parsing and Validation:**
-#        - Ensures that exactly 18 input arguments are provided.
+#        - Ensures that 17 input arguments are provided, plus the optional MODKIT_SHARDS and MODKIT_SHARD_MODE.
 #        - Assigns each argument to a descriptive variable for clarity.
 #        - Validates the existence of the input BAM file.
 #
@@ -24,9 +24,28 @@
 #        - Executes Modkit's pileup function on the input BAM file.
 #        - Logs the runtime of the pileup process for performance monitoring.
 #
+#        - With `MODKIT_SHARDS` > 1, the reference is split by `pileup_shards.py` into region
+#          shards of roughly equal mapped read count (from the BAM index). Each shard is piled up
+#          with `--include-bed`, either as a worker process of this job (`MODKIT_SHARD_MODE=local`)
+#          or as a task of an array job (`MODKIT_SHARD_MODE=array`, see `modkit_shard_job.sh`).
+#          The shard outputs are concatenated in genome order into the same BED file as an
+#          unsharded run. In array mode, this script resubmits itself in `merge` mode, holding on
+#          the array job, to merge and filter the outputs.
+#
+#        - With `PILEUP_CACHE_DIR` set (environment variable), the raw pileup is looked up in
+#          a content-addressed cache (`pileup_cache.py`) keyed by the input BAM, its index,
+#          the pileup flags and the modkit version. On a hit, the pileup is skipped and only
+#          the filter step runs, so sweeps over `VALID_COVERAGE_THRESHOLD` and
+#          `PERCENT_MODIFIED_THRESHOLD` reuse one pileup. New pileups are copied into the cache,
+#          which evicts its least recently used entries beyond `PILEUP_CACHE_GB` (default 200).
+#          A reused `${OUTPUT_BED}` is a read-only hard link into the cache: do not modify it.
+#
 #     5. **Filtering the Output BED File:**
 #        - Applies specified coverage and modification thresholds to filter the Modkit
 #          output, retaining only high-confidence modifications.
+#        - With `MODKIT_FILTER_MODE=indexed` (environment variable), `filter_bedmethyl.py`
+#          applies the same thresholds in blocks and writes one bgzip-compressed,
+#          tabix-indexed BED file per modification code instead of one plain BED file.
 #
 #   **Job Dependencies:**
 #     - **Merge Job Dependency:**
@@ -53,6 +72,10 @@
 #     - **Filtered BED File (`${FILTERED_BED}`):**
 #       - Contains modification pileup data filtered based on specified coverage and modification thresholds.
 #
+#     - **Indexed Filtered BED Files (`${FILTERED_BED_PATTERN}`, `MODKIT_FILTER_MODE=indexed`):**
+#       - The same records split by modification (`{mod}` is m5C, m6A, inosine or pseU),
+#         compressed with bgzip and indexed with tabix (`.tbi`) for region queries.
+#
 #   **Error Handling:**
 #     - Validates the number of input arguments; exits with usage instructions if incorrect.
 #     - Checks for the existence of the input BAM file; exits with an error message if not found.
@@ -70,12 +93,17 @@
 # Enable strict error handling to ensure the script exits on any error
 set -euo pipefail
 
+# Re-run this script under the telemetry wrapper when a telemetry log is configured (see telemetry.py)
+if [ -n "${TELEMETRY_LOG-}" ] && [ ! -f "${TELEMETRY_METRICS-}" ] && [ -f "${SCRIPTS_DIR-}/telemetry.py" ]; then
+    exec python3 "${SCRIPTS_DIR}/telemetry.py" run --log "${TELEMETRY_LOG}" --stage modkit -- bash -l "$0" "$@"
+fi
+
 # ----------------------- Step 0: Parse Input Arguments -----------------------
-if [ "$#" -ne 17 ]; then
+if [ "$#" -lt 17 ] || [ "$#" -gt 19 ]; then
     echo "Usage: $0 GROUP SAMPLE MODIFIED_BASES ALL_MODS ALIGNED_BAM_DIR OUTPUT_DIR \
 FILTER_THRESHOLD_ALL FILTER_THRESHOLD_A FILTER_THRESHOLD_C FILTER_THRESHOLD_T \
 MOD_THRESHOLD_M6A MOD_THRESHOLD_PSEU MOD_THRESHOLD_INOSINE MOD_THRESHOLD_M5C \
-VALID_COVERAGE_THRESHOLD PERCENT_MODIFIED_THRESHOLD MODKIT_THREADS"
+VALID_COVERAGE_THRESHOLD PERCENT_MODIFIED_THRESHOLD MODKIT_THREADS [MODKIT_SHARDS [MODKIT_SHARD_MODE]]"
     exit 1
 fi
 
@@ -99,6 +127,21 @@ MOD_THRESHOLD_M5C="${14}"     # Threshold for m5C modifications
 VALID_COVERAGE_THRESHOLD="${15}"    # Threshold for valid coverage
 PERCENT_MODIFIED_THRESHOLD="${16}"  # Threshold for percent modified
 MODKIT_THREADS="${17}"              # Number of threads for modkit
+MODKIT_SHARDS="${18:-1}"            # Number of region shards for modkit pileup (1 runs a single pileup)
+MODKIT_SHARD_MODE="${19:-local}"    # local (worker processes), array (array job) or merge (internal: merge array outputs)
+
+if [[ "${MODKIT_SHARD_MODE}" != "local" && "${MODKIT_SHARD_MODE}" != "array" && "${MODKIT_SHARD_MODE}" != "merge" ]]; then
+    echo "Error: Unknown MODKIT_SHARD_MODE '${MODKIT_SHARD_MODE}'. Use local or array (merge is internal: the array mode resubmits this script in it)."
+    exit 1
+fi
+
+# Filter output: "plain" (awk, one flat BED) or "indexed" (bgzip + tabix, one BED per modification code)
+MODKIT_FILTER_MODE="${MODKIT_FILTER_MODE:-plain}"
+
+if [[ "${MODKIT_FILTER_MODE}" != "plain" && "${MODKIT_FILTER_MODE}" != "indexed" ]]; then
+    echo "Error: Unknown MODKIT_FILTER_MODE '${MODKIT_FILTER_MODE}'. Use plain or indexed."
+    exit 1
+fi
 
 # ----------------------- Step 2: Job Information -----------------------
 echo "=========================================================="
@@ -121,6 +164,16 @@ if [ ! -f "${INPUT_BAM}" ]; then
     exit 1
 fi
 
+# Report the pileup input to the telemetry wrapper (counted from the index). The submitting and merging jobs of
+# the array mode are recorded as separate stages, so they do not skew the runtime suggested for the pileup.
+if [ -n "${TELEMETRY_METRICS-}" ]; then
+    case "${MODKIT_SHARD_MODE}" in
+        array) echo "stage=modkit_submit" >> "${TELEMETRY_METRICS}" ;;
+        merge) echo "stage=modkit_merge" >> "${TELEMETRY_METRICS}" ;;
+        *) printf "mode=%s_shards\ncount_bam=%s\n" "${MODKIT_SHARDS}" "${INPUT_BAM}" >> "${TELEMETRY_METRICS}" ;;
+    esac
+fi
+
 # ----------------------- Step 4: Define Output Files -----------------------
 # Extract the base name of the BAM file (without path and extension)
 BAM_BASENAME="$(basename "${INPUT_BAM}" .bam)"
@@ -131,6 +184,9 @@ OUTPUT_BED="${OUTPUT_DIR}/${BAM_BASENAME}.bed"
 # Define the output filtered BED file
 FILTERED_BED="${OUTPUT_DIR}/${BAM_BASENAME}_${ALL_MODS}_filtered_cov_th_${VALID_COVERAGE_THRESHOLD}_per_th_${PERCENT_MODIFIED_THRESHOLD}.bed"
 
+# With MODKIT_FILTER_MODE=indexed, {mod} is replaced by each modification name (m5C, m6A, inosine, pseU)
+FILTERED_BED_PATTERN="${OUTPUT_DIR}/${BAM_BASENAME}_{mod}_filtered_cov_th_${VALID_COVERAGE_THRESHOLD}_per_th_${PERCENT_MODIFIED_THRESHOLD}.bed.gz"
+
 # ----------------------- Step 5: Define Flags for modkit pileup -----------------------
 # Convert MODIFIED_BASES string to an array for the loop
 IFS=' ' read -r -a MODS_ARRAY <<< "${MODIFIED_BASES}"
@@ -181,32 +237,174 @@ done
 PILEUP_LOG="${OUTPUT_DIR}/pileup.log"
 RUNTIME_LOG="${OUTPUT_DIR}/pileup_runtimes.log"
 
-# Record the start time
-START_TIME=$(date +%s)
+# Directory holding the shard regions and the per-shard pileup outputs
+SHARD_DIR="${OUTPUT_DIR}/${BAM_BASENAME}_pileup_shards"
 
-# Log the start of the pileup
-printf "Starting modkit pileup for %s at %s\n" "${BAM_BASENAME}" "$(date)" >> "${PILEUP_LOG}"
+# Look up the raw pileup in the pileup cache (PILEUP_CACHE_DIR, see pileup_cache.py). The key covers the BAM, its
+# index, the pileup flags and the modkit version, but not the coverage and percent modified thresholds, which are
+# only applied by the filter step below.
+PILEUP_CACHE_KEY=""
+PILEUP_CACHE_HIT=false
+if [ -n "${PILEUP_CACHE_DIR-}" ]; then
+    MODKIT_VERSION=$(modkit --version 2>/dev/null || echo "unknown")
+    if PILEUP_CACHE_KEY=$(python3 "${SCRIPTS_DIR}/pileup_cache.py" key "${INPUT_BAM}" --flags "${FLAGS} --with-header" --tool_version "${MODKIT_VERSION}"); then
+        if [ "${MODKIT_SHARD_MODE}" != "merge" ] && python3 "${SCRIPTS_DIR}/pileup_cache.py" fetch "${PILEUP_CACHE_DIR}" "${PILEUP_CACHE_KEY}" "${OUTPUT_BED}"; then
+            PILEUP_CACHE_HIT=true
+        fi
+    else
+        echo "Warning: Unable to compute the pileup cache key; running modkit pileup without the cache."
+        PILEUP_CACHE_KEY=""
+    fi
+fi
 
-# Run modkit pileup with the specified flags
-modkit pileup "${INPUT_BAM}" "${OUTPUT_BED}" --threads "${MODKIT_THREADS}" \
-  --log-filepath "${PILEUP_LOG}" ${FLAGS} --with-header
+# Cached pileups are hard links to read-only files, so never write a new pileup through an existing output
+if [ "${PILEUP_CACHE_HIT}" != "true" ] && [ "${MODKIT_SHARD_MODE}" != "merge" ]; then
+    rm -f "${OUTPUT_BED}"
+fi
 
-# Record the end time and calculate runtime
-END_TIME=$(date +%s)
-RUNTIME=$((END_TIME - START_TIME))
+if [ "${PILEUP_CACHE_HIT}" = "true" ]; then
+    printf "Reused cached modkit pileup %s for %s at %s\n" "${PILEUP_CACHE_KEY:0:12}" "${BAM_BASENAME}" "$(date)" >> "${PILEUP_LOG}"
+    if [ -n "${TELEMETRY_METRICS-}" ]; then
+        echo "stage=modkit_cached" >> "${TELEMETRY_METRICS}"
+    fi
+elif [ "${MODKIT_SHARDS}" -le 1 ]; then
+    # Record the start time
+    START_TIME=$(date +%s)
 
-# Log the runtime
-printf "modkit pileup runtime for %s: %d seconds\n" "${BAM_BASENAME}" "${RUNTIME}" >> "${RUNTIME_LOG}"
+    # Log the start of the pileup
+    printf "Starting modkit pileup for %s at %s\n" "${BAM_BASENAME}" "$(date)" >> "${PILEUP_LOG}"
+
+    # Run modkit pileup with the specified flags
+    modkit pileup "${INPUT_BAM}" "${OUTPUT_BED}" --threads "${MODKIT_THREADS}" \
+      --log-filepath "${PILEUP_LOG}" ${FLAGS} --with-header
+
+    # Record the end time and calculate runtime
+    END_TIME=$(date +%s)
+    RUNTIME=$((END_TIME - START_TIME))
+
+    # Log the runtime
+    printf "modkit pileup runtime for %s: %d seconds\n" "${BAM_BASENAME}" "${RUNTIME}" >> "${RUNTIME_LOG}"
+elif [ "${MODKIT_SHARD_MODE}" = "merge" ]; then
+    # ----------------------- Step 6b: Merge the Outputs of the Pileup Array Job -----------------------
+    SHARD_OUTPUTS=()
+    for SHARD_BED in "${SHARD_DIR}"/shard_*.bed; do
+        case "${SHARD_BED}" in *.pileup.bed) continue ;; esac
+        SHARD_OUTPUT="${SHARD_BED%.bed}.pileup.bed"
+        if [ ! -f "${SHARD_OUTPUT}" ]; then
+            echo "Error: Pileup output '${SHARD_OUTPUT}' is missing. A pileup array task did not finish. Exiting."
+            exit 1
+        fi
+        SHARD_OUTPUTS+=("${SHARD_OUTPUT}")
+    done
+
+    rm -f "${OUTPUT_BED}"
+    python3 "${SCRIPTS_DIR}/pileup_shards.py" merge "${SHARD_DIR}/contig_order.txt" "${OUTPUT_BED}" "${SHARD_OUTPUTS[@]}"
+    cat "${SHARD_DIR}"/shard_*.log >> "${PILEUP_LOG}"
+    cat "${SHARD_DIR}/pileup_runtimes.log" >> "${RUNTIME_LOG}"
+    rm -rf "${SHARD_DIR}"
+else
+    # ----------------------- Step 6a: Plan Region Shards Balanced by Mapped Reads -----------------------
+    rm -rf "${SHARD_DIR}"
+    python3 "${SCRIPTS_DIR}/pileup_shards.py" plan "${INPUT_BAM}" "${SHARD_DIR}" --num_shards "${MODKIT_SHARDS}"
+    NUM_SHARDS=$(ls "${SHARD_DIR}"/shard_*.bed | wc -l)
+
+    if [ "${MODKIT_SHARD_MODE}" = "array" ]; then
+        # Run one pileup per array task, then resubmit this script to merge the outputs and filter them
+        PILEUP_ARRAY_JOB_FULL_ID=$(qsub -terse \
+            -t 1-"${NUM_SHARDS}" \
+            -P "${QSUB_PROJECT}" \
+            -N "modkit_shard_job_${GROUP}_${SAMPLE}" \
+            -l h_rt="${MODKIT_JOB_RUNTIME}" \
+            -l mem_free="${MODKIT_JOB_MEMORY}" \
+            -pe omp "${TOTAL_CPUS_MODKIT}" \
+            -m "${QSUB_EMAIL}" \
+            -j "${QSUB_JOINT_STDERR}" \
+            "${SCRIPTS_DIR}/modkit_shard_job.sh" \
+            "${INPUT_BAM}" "${SHARD_DIR}" "${MODKIT_THREADS}" "${FLAGS}"
+        )
+        PILEUP_ARRAY_JOB_ID=$(echo "${PILEUP_ARRAY_JOB_FULL_ID}" | cut -d '.' -f1)
+        echo "modkit pileup array job submitted with Job ID: ${PILEUP_ARRAY_JOB_ID} (${NUM_SHARDS} shards)"
+
+        MODKIT_MERGE_JOB_ID=$(qsub -terse -V \
+            -hold_jid "${PILEUP_ARRAY_JOB_ID}" \
+            -P "${QSUB_PROJECT}" \
+            -N "modkit_merge_job_${GROUP}_${SAMPLE}" \
+            -l h_rt="${MODKIT_JOB_RUNTIME}" \
+            -m "${QSUB_EMAIL}" \
+            -j "${QSUB_JOINT_STDERR}" \
+            "${SCRIPTS_DIR}/modkit_job.sh" \
+            "${@:1:17}" "${MODKIT_SHARDS}" merge
+        )
+        echo "modkit merge and filter job submitted with Job ID: ${MODKIT_MERGE_JOB_ID}"
+        exit 0
+    fi
+
+    # ----------------------- Step 6b: Run One modkit pileup Worker per Shard -----------------------
+    THREADS_PER_SHARD=$(( MODKIT_THREADS / NUM_SHARDS > 0 ? MODKIT_THREADS / NUM_SHARDS : 1 ))
+    START_TIME=$(date +%s)
+    printf "Starting sharded modkit pileup (%d shards) for %s at %s\n" "${NUM_SHARDS}" "${BAM_BASENAME}" "$(date)" >> "${PILEUP_LOG}"
+
+    WORKER_PIDS=()
+    SHARD_OUTPUTS=()
+    for SHARD_IDX in $(seq 1 "${NUM_SHARDS}"); do
+        SHARD_BED="${SHARD_DIR}/shard_${SHARD_IDX}.bed"
+        SHARD_OUTPUT="${SHARD_DIR}/shard_${SHARD_IDX}.pileup.bed"
+        modkit pileup "${INPUT_BAM}" "${SHARD_OUTPUT}" --include-bed "${SHARD_BED}" --threads "${THREADS_PER_SHARD}" \
+          --log-filepath "${SHARD_DIR}/shard_${SHARD_IDX}.log" ${FLAGS} --with-header &
+        WORKER_PIDS+=($!)
+        SHARD_OUTPUTS+=("${SHARD_OUTPUT}")
+    done
+
+    FAILED_SHARDS=0
+    for PID in "${WORKER_PIDS[@]}"; do
+        wait "${PID}" || FAILED_SHARDS=$((FAILED_SHARDS + 1))
+    done
+    if [ "${FAILED_SHARDS}" -gt 0 ]; then
+        echo "Error: ${FAILED_SHARDS} modkit pileup shard(s) failed. See the logs in ${SHARD_DIR}. Exiting."
+        exit 1
+    fi
+
+    python3 "${SCRIPTS_DIR}/pileup_shards.py" merge "${SHARD_DIR}/contig_order.txt" "${OUTPUT_BED}" "${SHARD_OUTPUTS[@]}"
+    cat "${SHARD_DIR}"/shard_*.log >> "${PILEUP_LOG}"
+    rm -rf "${SHARD_DIR}"
+
+    END_TIME=$(date +%s)
+    RUNTIME=$((END_TIME - START_TIME))
+    printf "modkit pileup runtime for %s (%d shards): %d seconds\n" "${BAM_BASENAME}" "${NUM_SHARDS}" "${RUNTIME}" >> "${RUNTIME_LOG}"
+fi
+
+# Add a new pileup to the cache; a failure to cache does not fail the job
+if [ -n "${PILEUP_CACHE_KEY}" ] && [ "${PILEUP_CACHE_HIT}" != "true" ]; then
+    python3 "${SCRIPTS_DIR}/pileup_cache.py" store "${PILEUP_CACHE_DIR}" "${PILEUP_CACHE_KEY}" "${OUTPUT_BED}" \
+        --max_size_gb "${PILEUP_CACHE_GB:-200}" --description "${GROUP}_${SAMPLE} ${FLAGS}" \
+        || echo "Warning: Unable to add the pileup to the cache '${PILEUP_CACHE_DIR}'."
+fi
 
 # ----------------------- Step 7: Filter the Output BED File -----------------------
-awk -v cov_thresh="${VALID_COVERAGE_THRESHOLD}" -v mod_thresh="${PERCENT_MODIFIED_THRESHOLD}" \
-    '$10 >= cov_thresh && $11 >= mod_thresh' "${OUTPUT_BED}" > "${FILTERED_BED}"
+if [ "${MODKIT_FILTER_MODE}" = "indexed" ]; then
+    # One bgzip-compressed, tabix-indexed BED file per modification code
+    python3 "${SCRIPTS_DIR}/filter_bedmethyl.py" "${OUTPUT_BED}" "${FILTERED_BED_PATTERN}" \
+        --min_coverage "${VALID_COVERAGE_THRESHOLD}" --min_percent_modified "${PERCENT_MODIFIED_THRESHOLD}"
 
-# Validate that FILTERED_BED was created and is not empty
-if [[ -s "${FILTERED_BED}" ]]; then
-    echo "Filtering successful. Output BED file: ${FILTERED_BED}"
+    # Validate that at least one non-empty filtered file was created
+    shopt -s nullglob
+    FILTERED_OUTPUTS=( ${FILTERED_BED_PATTERN/\{mod\}/*} )
+    shopt -u nullglob
+    if [ "${#FILTERED_OUTPUTS[@]}" -gt 0 ]; then
+        echo "Filtering successful. Output BED files: ${FILTERED_OUTPUTS[*]}"
+    else
+        echo "Warning: No filtered BED file matching '${FILTERED_BED_PATTERN}' was created."
+    fi
 else
-    echo "Warning: Filtered BED file '${FILTERED_BED}' is empty or was not created."
+    awk -v cov_thresh="${VALID_COVERAGE_THRESHOLD}" -v mod_thresh="${PERCENT_MODIFIED_THRESHOLD}" \
+        '$10 >= cov_thresh && $11 >= mod_thresh' "${OUTPUT_BED}" > "${FILTERED_BED}"
+
+    # Validate that FILTERED_BED was created and is not empty
+    if [[ -s "${FILTERED_BED}" ]]; then
+        echo "Filtering successful. Output BED file: ${FILTERED_BED}"
+    else
+        echo "Warning: Filtered BED file '${FILTERED_BED}' is empty or was not created."
+    fi
 fi
 
 # Inform the user of completion
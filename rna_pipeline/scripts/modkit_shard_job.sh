@@ -0,0 +1,86 @@
+#!/bin/bash -l
+
+# =============================================================================
+#                             modkit_shard_job.sh
+# =============================================================================
+# Description:
+#   This script runs `modkit pileup` on one region shard of the final primary BAM
+#   file as a task of an array job. It is submitted by `modkit_job.sh` when
+#   `MODKIT_SHARD_MODE=array`, after `pileup_shards.py plan` has split the
+#   reference into shards of roughly equal mapped read count.
+#
+#     1. **Shard Selection:**
+#        - Selects the shard BED file `shard_${SGE_TASK_ID}.bed` in the shard directory.
+#
+#     2. **modkit pileup Execution:**
+#        - Runs `modkit pileup` restricted to the shard's regions with `--include-bed`,
+#          using the same thresholds as the unsharded run.
+#        - Writes the output under a temporary name and renames it on success, so that
+#          the merge step only sees complete outputs.
+#
+#   **Job Dependencies:**
+#     - The merge and filter job (`modkit_job.sh` in `merge` mode) holds on this array job
+#       and concatenates the shard outputs in genome order.
+#
+# Arguments:
+#   1. INPUT_BAM        - Coordinate-sorted, indexed primary BAM file.
+#   2. SHARD_DIR        - Directory holding `shard_<i>.bed`; outputs are written as `shard_<i>.pileup.bed`.
+#   3. MODKIT_THREADS   - Number of threads for modkit.
+#   4. FLAGS            - modkit pileup threshold flags built by `modkit_job.sh`, as a single string.
+#
+# Usage:
+#   qsub -t 1-<NUM_SHARDS> modkit_shard_job.sh INPUT_BAM SHARD_DIR MODKIT_THREADS "FLAGS"
+#
+# =============================================================================
+
+# Enable strict error handling
+set -euo pipefail
+
+# ----------------------- Step 0: Parse Input Arguments -----------------------
+if [ "$#" -ne 4 ]; then
+    echo "Usage: $0 INPUT_BAM SHARD_DIR MODKIT_THREADS FLAGS"
+    exit 1
+fi
+
+INPUT_BAM="${1}"
+SHARD_DIR="${2}"
+MODKIT_THREADS="${3}"
+FLAGS="${4}"
+
+# ----------------------- Step 1: Job Information -----------------------
+echo "=========================================================="
+echo "Start date : $(date)"
+echo "Job name : $JOB_NAME"
+echo "Job ID : $JOB_ID"
+# Only echo SGE_TASK_ID if it's set
+if [[ -n "${SGE_TASK_ID-}" ]]; then
+    echo "Task ID : $SGE_TASK_ID"
+fi
+echo "=========================================================="
+
+# ----------------------- Step 2: Select the Shard -----------------------
+SHARD_BED="${SHARD_DIR}/shard_${SGE_TASK_ID}.bed"
+SHARD_OUTPUT="${SHARD_DIR}/shard_${SGE_TASK_ID}.pileup.bed"
+
+if [ ! -f "${SHARD_BED}" ]; then
+    echo "Error: Shard regions '${SHARD_BED}' do not exist. Exiting."
+    exit 1
+fi
+
+# ----------------------- Step 3: Run modkit pileup on the Shard -----------------------
+START_TIME=$(date +%s)
+
+modkit pileup "${INPUT_BAM}" "${SHARD_OUTPUT}.partial" --include-bed "${SHARD_BED}" --threads "${MODKIT_THREADS}" \
+  --log-filepath "${SHARD_DIR}/shard_${SGE_TASK_ID}.log" ${FLAGS} --with-header
+
+mv "${SHARD_OUTPUT}.partial" "${SHARD_OUTPUT}"
+
+END_TIME=$(date +%s)
+RUNTIME=$((END_TIME - START_TIME))
+
+printf "modkit pileup runtime for shard %s: %d seconds\n" "${SGE_TASK_ID}" "${RUNTIME}" >> "${SHARD_DIR}/pileup_runtimes.log"
+
+echo "modkit pileup completed for shard ${SGE_TASK_ID}: ${SHARD_OUTPUT}"
+echo "=========================================================="
+echo "End date : $(date)"
+echo "=========================================================="
@@ -3,76 +3,141 @@ Description:
     This script generates a `partitions.json` file by scanning a specified source directory for `.pod5` files. It ensures that each `.pod5` filename is unique and partitions the files into groups where the total size of each partition does not exceed a user-defined limit in gigabytes. The resulting JSON file organizes the partitions with clear labels (e.g., `partition_1`, `partition_2`), facilitating organized processing for downstream tasks.
 
 Key Features:
-    - **File Discovery:** Recursively searches the source directory for `.pod5` files, ensuring no duplicate filenames exist.
+    - **File Discovery:** Recursively searches the source directory for `.pod5` files in parallel. An optional persistent scan cache limits re-scans to directories that changed.
+    - **Duplicate Detection:** Byte-identical files (e.g. re-copied acquisitions) are found by size, then partial and full content hashes with an optional persistent hash cache, and only one copy is partitioned; the skipped copies are listed in `duplicate_pod5_files.tsv`. Files that only share a name are all kept. `--duplicates name` restores the former check that aborts on repeated filenames.
     - **Partitioning Logic:** Groups files into partitions based on a specified size limit, preventing any partition from exceeding the defined threshold.
-    - **Output Generation:** Saves the partitioned file groups into a structured `partitions.json` file with sequentially labeled partitions.
-    - **Error Handling:** Alerts and exits if duplicate filenames are found or if any single file exceeds the partition size limit.
+    - **Balanced Packing:** Optionally spreads files over a fixed number of partitions with a longest-processing-time-first (LPT) heuristic so that the largest partition, which sets the Dorado wall-clock time, is as small as possible.
+    - **Imbalance Report:** Reports the ratio between the largest and the mean partition size for every run.
+    - **Cost Model:** Optionally weighs files by their signal sample count read from pod5 metadata instead of their on-disk size, records per-file and per-partition estimated costs in `partitions.json`, and suggests a `DORADO_JOB_RUNTIME` from a samples/second rate calibrated on past `dorado_job.sh` runs.
+    - **Output Generation:** Saves the partitioned file groups into a structured `partitions.json` file with sequentially labeled partitions, and lists the partitions that still need basecalling in `pending_partitions.txt`.
+    - **Incremental Mode:** For runs that are still being acquired, keeps the partitions of an existing `partitions.json` unchanged, packs only newly seen files into new partitions, and marks as pending only the partitions without a `basecalling.done` marker from `dorado_job.sh`.
+    - **Telemetry:** Optionally appends the wall time, CPU time, peak memory and I/O of the run, with the number of files and bytes scanned, to the pipeline's telemetry log (see `telemetry.py`).
+    - **Error Handling:** Alerts and exits if any single file exceeds the partition size limit, or on duplicate filenames with `--duplicates name`.
 
 Usage:
-    python partitions_creator.py <source_dir> <size_limit_gb> [--output_dir <output_directory>]
+    python partition_pod5_files.py <source_dir> <size_limit_gb> [--output_dir <output_directory>]
+                                   [--strategy {sequential,balanced}] [--num_workers <N>]
+                                   [--cost_model {size,samples}] [--samples_per_second <rate> | --calibrate <log> ...]
+                                   [--scan_cache <cache_file>] [--scan_threads <N>]
+                                   [--duplicates {content,name}] [--hash_cache <cache_file>]
+                                   [--incremental --basecalled_dir <unaligned_bam_dir>] [--telemetry_log <telemetry.jsonl>]
 
 Arguments:
     source_dir      : Path to the directory containing `.pod5` files.
     size_limit_gb   : Maximum size per partition in gigabytes.
     --output_dir    : (Optional) Directory to save the `partitions.json` file. Defaults to the current working directory.
+    --strategy      : (Optional) `sequential` fills one partition at a time (default); `balanced` packs all partitions at once to minimize the largest one.
+    --num_workers   : (Optional) Number of GPU workers for the `balanced` strategy. The partition count is rounded up to a multiple of this value.
+    --cost_model    : (Optional) `size` weighs files by bytes (default); `samples` weighs files by signal samples from pod5 metadata (requires the `pod5` package).
+    --samples_per_second : (Optional) Dorado throughput used to convert samples into estimated seconds.
+    --calibrate     : (Optional) One or more `dorado_runtimes.log` files from past runs used to calibrate the throughput.
+    --scan_cache    : (Optional) Persistent JSON cache of the directory scan. Re-scans only list directories that changed.
+    --scan_threads  : (Optional) Number of threads listing directories concurrently. Defaults to 16.
+    --duplicates    : (Optional) `content` skips byte-identical copies (default); `name` exits on repeated filenames.
+    --hash_cache    : (Optional) Persistent JSON cache of file hashes, keyed by path, size and modification time.
+    --incremental   : (Optional) Extend the existing `partitions.json` in the output directory instead of rebuilding it.
+    --basecalled_dir: (Optional) Directory holding the per-partition Dorado outputs (`UNALIGNED_BAM_DIR`). Partitions with a `basecalling.done` marker there are not listed as pending.
+    --telemetry_log : (Optional) JSON-lines telemetry log the run is recorded in (stage `partition_pod5`).
+
+Output Format:
+    With the default `size` cost model, each partition maps file paths to sizes in bytes. With the `samples` cost model, each partition is an object with a `files` mapping (per-file `size_bytes`, `num_reads`, `num_samples` and, when a throughput is known, `estimated_seconds`) plus the same totals for the partition.
 """
 
 import os
 import argparse
 import sys
 import json
+import re
+import heapq
+import math
+import time
 
-def get_all_pod5_files(source_dir):
+from pod5_cost import collect_pod5_stats, calibrate_samples_per_second, estimate_seconds, format_duration
+from pod5_scanner import scan_files
+from pod5_dedup import find_duplicates
+from telemetry import record_process
+
+# Marker written by dorado_job.sh into a partition's output directory once its basecalling has completed
+BASECALL_DONE_MARKER = "basecalling.done"
+
+def get_all_pod5_files(source_dir, cache_file=None, max_workers=16, duplicates="content", hash_cache=None, preferred=None):
     """
     Recursively gather all .pod5 files within the source directory and its subdirectories.
-    Ensures that each filename is unique across all directories.
+
+    Directories are listed in parallel by `pod5_scanner.scan_files`, which reuses the stat result of each directory
+    entry and, when a cache file is given, only lists directories that changed since the previous scan.
+
+    With `duplicates="content"`, files with byte-identical content are detected by `pod5_dedup.find_duplicates` and
+    only one copy is returned; files that share a name but differ in content are all returned. With
+    `duplicates="name"`, repeated filenames abort the run.
 
     Args:
         source_dir (str): Path to the source directory.
+        cache_file (str, optional): Path to a persistent scan cache.
+        max_workers (int): Number of threads listing directories concurrently.
+        duplicates (str): `content` skips identical copies; `name` exits on repeated filenames.
+        hash_cache (str, optional): Path to a persistent hash cache for duplicate detection.
+        preferred (set, optional): Paths kept in preference to other copies of the same content.
 
     Returns:
-        dict: Dictionary mapping unique file paths to their sizes in bytes.
+        tuple: (dictionary mapping file paths to their sizes in bytes, dictionary mapping skipped duplicate paths to
+        the path kept instead).
 
     Raises:
-        SystemExit: If duplicate filenames are found.
+        SystemExit: If duplicate filenames are found with `duplicates="name"`.
     """
+    scanned = scan_files(source_dir, suffix=".pod5", max_workers=max_workers, cache_file=cache_file)
+
+    if duplicates == "content":
+        kept, skipped = find_duplicates(scanned, hash_cache, max_workers, preferred)
+        return {path: scanned[path].size for path in kept}, skipped
+
     pod5_files = {}
     seen_filenames = set()
 
-    for dirpath, dirnames, filenames in os.walk(source_dir, followlinks=False):
-        for f in filenames:
-            if f.endswith(".pod5"):
-                file_path = os.path.join(dirpath, f)
-                try:
-                    # Resolve the absolute path
-                    abs_file_path = os.path.abspath(file_path)
-                    
-                    # Check for duplicate filenames
-                    if f in seen_filenames:
-                        print(f"[ERROR] Duplicate filename detected: '{f}' in '{abs_file_path}'")
-                        sys.exit(1)
-                    
-                    # Add filename to the seen set
-                    seen_filenames.add(f)
-                    
-                    # Get file size
-                    file_size = os.path.getsize(abs_file_path)
-                    
-                    # Add to the dictionary
-                    pod5_files[abs_file_path] = file_size
-
-                except OSError as e:
-                    print(f"[WARNING] Unable to access '{file_path}': {e}")
-
-    return pod5_files
-
-def partition_files(file_dict, size_limit_bytes):
+    for abs_file_path in sorted(scanned):
+        f = os.path.basename(abs_file_path)
+
+        # Check for duplicate filenames
+        if f in seen_filenames:
+            print(f"[ERROR] Duplicate filename detected: '{f}' in '{abs_file_path}'")
+            sys.exit(1)
+
+        # Add filename to the seen set
+        seen_filenames.add(f)
+
+        # Add to the dictionary
+        pod5_files[abs_file_path] = scanned[abs_file_path].size
+
+    return pod5_files, {}
+
+def save_duplicates(duplicates, duplicates_file):
+    """
+    Write the skipped duplicate files and the copies kept instead to a tab-separated file.
+
+    Args:
+        duplicates (dict): Dictionary mapping skipped paths to the kept paths.
+        duplicates_file (str): Output path. Removed if there are no duplicates.
+    """
+    if not duplicates:
+        if os.path.isfile(duplicates_file):
+            os.remove(duplicates_file)
+        return
+    with open(duplicates_file, "w") as f:
+        f.write("skipped\tkept\n")
+        for path in sorted(duplicates):
+            f.write(f"{path}\t{duplicates[path]}\n")
+    print(f"[INFO] Skipped {len(duplicates)} duplicate file(s); see '{duplicates_file}'.")
+
+def partition_files(file_dict, size_limit_bytes, format_weight=None, start_index=1):
     """
     Partition the dictionary of files into sub-dictionaries where the total size of each sub-dictionary does not exceed the size limit.
 
     Args:
-        file_dict (dict): Dictionary mapping unique file paths to their sizes in bytes.
-        size_limit_bytes (int): Maximum allowed size per partition in bytes.
+        file_dict (dict): Dictionary mapping unique file paths to their sizes in bytes (or to another cost weight).
+        size_limit_bytes (int): Maximum allowed size per partition in bytes (in the same unit as the weights).
+        format_weight (callable, optional): Formats a weight for log messages. Defaults to gigabytes.
+        start_index (int): Number of the first partition in log messages.
 
     Returns:
         list of dict: List of partitioned dictionaries.
@@ -85,9 +150,7 @@ def partition_files(file_dict, size_limit_bytes):
     sorted_files = sorted(file_dict.items(), key=lambda x: x[1], reverse=True)
 
     for file_path, file_size in sorted_files:
-        if file_size > size_limit_bytes:
-            print(f"[ERROR] File '{file_path}' exceeds the size limit of {convert_bytes_to_gb(size_limit_bytes):.2f} GB.")
-            sys.exit(1)
+        check_file_within_limit(file_path, file_size, size_limit_bytes, format_weight)
 
         if current_size + file_size > size_limit_bytes:
             partitions.append(current_partition)
@@ -100,16 +163,127 @@ def partition_files(file_dict, size_limit_bytes):
     if current_partition:
         partitions.append(current_partition)
 
-    print(f"[INFO] Total partitions created: {len(partitions)}")
+    print_partition_summary(partitions, format_weight, start_index)
+
+    return partitions
+
+def balance_partitions(file_dict, size_limit_bytes, num_workers=None, format_weight=None, start_index=1):
+    """
+    Partition the files so that the largest partition is as small as possible.
+
+    Files are assigned largest-first to the currently lightest partition (LPT
+    scheduling). The number of partitions starts at the minimum implied by the
+    size limit (rounded up to a multiple of `num_workers` when given) and is
+    increased until no partition exceeds the size limit.
+
+    Args:
+        file_dict (dict): Dictionary mapping unique file paths to their sizes in bytes (or to another cost weight).
+        size_limit_bytes (int): Maximum allowed size per partition in bytes (in the same unit as the weights).
+        num_workers (int, optional): Number of GPU workers that will process the partitions.
+        format_weight (callable, optional): Formats a weight for log messages. Defaults to gigabytes.
+        start_index (int): Number of the first partition in log messages.
+
+    Returns:
+        list of dict: List of partitioned dictionaries.
+    """
+    sorted_files = sorted(file_dict.items(), key=lambda x: x[1], reverse=True)
+
+    for file_path, file_size in sorted_files:
+        check_file_within_limit(file_path, file_size, size_limit_bytes, format_weight)
+
+    step = num_workers if num_workers else 1
+    total_size = sum(file_dict.values())
+    num_partitions = max(1, math.ceil(total_size / size_limit_bytes))
+    num_partitions = math.ceil(num_partitions / step) * step
+
+    while True:
+        partitions = pack_longest_first(sorted_files, num_partitions)
+        if max(sum(p.values()) for p in partitions) <= size_limit_bytes:
+            break
+        num_partitions += step
 
-    # Print the size of each partition in GB
-    for idx, partition in enumerate(partitions, start=1):
-        partition_size_bytes = sum(partition.values())
-        partition_size_gb = convert_bytes_to_gb(partition_size_bytes)
-        print(f"[INFO] Size of partition_{idx}: {partition_size_gb:.2f} GB")
+    # Drop partitions left empty when there are fewer files than partitions
+    partitions = [p for p in partitions if p]
+
+    print_partition_summary(partitions, format_weight, start_index)
 
     return partitions
 
+def pack_longest_first(sorted_files, num_partitions):
+    """
+    Assign files, already sorted by size in descending order, to a fixed number of partitions by always filling the lightest partition.
+
+    Args:
+        sorted_files (list of tuple): (file_path, file_size) pairs sorted by size, largest first.
+        num_partitions (int): Number of partitions to fill.
+
+    Returns:
+        list of dict: List of partitioned dictionaries, in creation order.
+    """
+    partitions = [{} for _ in range(num_partitions)]
+    heap = [(0, idx) for idx in range(num_partitions)]
+
+    for file_path, file_size in sorted_files:
+        load, idx = heapq.heappop(heap)
+        partitions[idx][file_path] = file_size
+        heapq.heappush(heap, (load + file_size, idx))
+
+    return partitions
+
+def check_file_within_limit(file_path, file_size, size_limit_bytes, format_weight=None):
+    """
+    Abort if a single file cannot fit in any partition.
+
+    Args:
+        file_path (str): Path to the file.
+        file_size (int): Size of the file in bytes (or its cost weight).
+        size_limit_bytes (int): Maximum allowed size per partition in bytes (in the same unit as the weights).
+        format_weight (callable, optional): Formats a weight for log messages. Defaults to gigabytes.
+
+    Raises:
+        SystemExit: If the file exceeds the size limit.
+    """
+    format_weight = format_weight or format_gb
+    if file_size > size_limit_bytes:
+        print(f"[ERROR] File '{file_path}' exceeds the size limit of {format_weight(size_limit_bytes)}.")
+        sys.exit(1)
+
+def compute_imbalance_ratio(partitions):
+    """
+    Compute the ratio between the largest and the mean partition size.
+
+    A value of 1.0 means perfectly even partitions; the excess over 1.0 is the
+    share of wall-clock time spent waiting on the slowest partition.
+
+    Args:
+        partitions (list of dict): List of partitioned dictionaries.
+
+    Returns:
+        float: Imbalance ratio (max / mean), or 1.0 for empty input.
+    """
+    sizes = [sum(p.values()) for p in partitions]
+    if not sizes or sum(sizes) == 0:
+        return 1.0
+    return max(sizes) / (sum(sizes) / len(sizes))
+
+def print_partition_summary(partitions, format_weight=None, start_index=1):
+    """
+    Print the number of partitions, the size of each partition and the imbalance ratio.
+
+    Args:
+        partitions (list of dict): List of partitioned dictionaries.
+        format_weight (callable, optional): Formats a partition weight. Defaults to gigabytes.
+        start_index (int): Number of the first partition.
+    """
+    format_weight = format_weight or format_gb
+    print(f"[INFO] Total partitions created: {len(partitions)}")
+
+    # Print the size of each partition
+    for idx, partition in enumerate(partitions, start=start_index):
+        print(f"[INFO] Size of partition_{idx}: {format_weight(sum(partition.values()))}")
+
+    print(f"[INFO] Partition imbalance ratio (max / mean): {compute_imbalance_ratio(partitions):.3f}")
+
 def convert_bytes_to_gb(size_bytes):
     """
     Convert bytes to gigabytes.
@@ -122,18 +296,169 @@ def convert_bytes_to_gb(size_bytes):
     """
     return size_bytes / (1024 ** 3)
 
-def save_partitions(partitions, output_file):
+def format_gb(size_bytes):
+    """
+    Format a size in bytes as gigabytes for log messages.
+
+    Args:
+        size_bytes (int): Size in bytes.
+
+    Returns:
+        str: Size formatted in GB.
+    """
+    return f"{convert_bytes_to_gb(size_bytes):.2f} GB"
+
+def format_samples(num_samples):
+    """
+    Format a signal sample count for log messages.
+
+    Args:
+        num_samples (int): Number of signal samples.
+
+    Returns:
+        str: Sample count formatted in giga-samples.
+    """
+    return f"{num_samples / 1e9:.2f} G samples"
+
+def describe_partition_costs(partition, file_stats, samples_per_second=None, overhead_seconds=0.0):
+    """
+    Build the cost-model entry of one partition for `partitions.json`.
+
+    Args:
+        partition (dict): Dictionary mapping file paths to their cost weights.
+        file_stats (dict): Dictionary mapping file paths to `size_bytes`, `num_reads` and `num_samples`.
+        samples_per_second (float, optional): Calibrated Dorado throughput.
+        overhead_seconds (float): Fixed per-partition overhead in seconds.
+
+    Returns:
+        dict: Partition entry with a `files` mapping and per-partition totals.
+    """
+    files = {}
+    for file_path in partition:
+        entry = dict(file_stats[file_path])
+        if samples_per_second:
+            entry["estimated_seconds"] = round(estimate_seconds(entry["num_samples"], samples_per_second), 1)
+        files[file_path] = entry
+
+    description = {
+        "files": files,
+        "size_bytes": sum(f["size_bytes"] for f in files.values()),
+        "num_reads": sum(f["num_reads"] for f in files.values()),
+        "num_samples": sum(f["num_samples"] for f in files.values()),
+    }
+    if samples_per_second:
+        description["estimated_seconds"] = round(estimate_seconds(description["num_samples"], samples_per_second, overhead_seconds), 1)
+    return description
+
+def load_partitions(partitions_file):
+    """
+    Load an existing `partitions.json` file.
+
+    Args:
+        partitions_file (str): Path to the JSON file.
+
+    Returns:
+        dict: Dictionary mapping partition names to their entries, in either partitions.json format.
+
+    Raises:
+        SystemExit: If the file cannot be read.
+    """
+    try:
+        with open(partitions_file) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Failed to load partitions from '{partitions_file}': {e}")
+        sys.exit(1)
+
+def partition_file_paths(partition_entry):
+    """
+    Return the file mapping of a partition entry in either partitions.json format.
+
+    Args:
+        partition_entry (dict): Entry of one partition in `partitions.json`.
+
+    Returns:
+        dict: Dictionary whose keys are the POD5 file paths of the partition.
+    """
+    return partition_entry["files"] if "files" in partition_entry else partition_entry
+
+def next_partition_index(partition_names):
+    """
+    Return the first unused partition number.
+
+    Args:
+        partition_names (iterable of str): Existing partition names such as 'partition_3'.
+
+    Returns:
+        int: One more than the highest existing partition number, or 1 if there are none.
+    """
+    numbers = [int(m.group(1)) for m in (re.fullmatch(r"partition_(\d+)", name) for name in partition_names) if m]
+    return max(numbers, default=0) + 1
+
+def find_pending_partitions(partition_names, basecalled_dir=None):
+    """
+    Select the partitions that still need basecalling.
+
+    Args:
+        partition_names (iterable of str): Partition names to check.
+        basecalled_dir (str, optional): Directory holding the per-partition Dorado outputs. If not given, every partition is pending.
+
+    Returns:
+        list of str: Pending partition names, in numerical order.
+    """
+    def _number(name):
+        m = re.fullmatch(r"partition_(\d+)", name)
+        return (int(m.group(1)) if m else float("inf"), name)
+
+    pending = []
+    for name in sorted(partition_names, key=_number):
+        if basecalled_dir and os.path.isfile(os.path.join(basecalled_dir, name, BASECALL_DONE_MARKER)):
+            continue
+        pending.append(name)
+    return pending
+
+def save_pending_partitions(pending, pending_file):
+    """
+    Save the names of the partitions that still need basecalling, one per line.
+
+    Args:
+        pending (list of str): Pending partition names.
+        pending_file (str): Path to the output text file.
+    """
+    try:
+        with open(pending_file, 'w') as f:
+            for name in pending:
+                f.write(f"{name}\n")
+        print(f"[INFO] Saved {len(pending)} pending partition(s) to '{pending_file}'")
+    except Exception as e:
+        print(f"[ERROR] Failed to save pending partitions to '{pending_file}': {e}")
+
+def save_partitions(partitions, output_file, file_stats=None, samples_per_second=None, overhead_seconds=0.0, existing_partitions=None):
     """
     Save all partitions into a single JSON file with keys like 'partition_1', 'partition_2', etc.
 
     Args:
         partitions (list of dict): List of partitioned dictionaries of files.
         output_file (str): Path to the output JSON file.
+        file_stats (dict, optional): Per-file pod5 statistics. When given, partitions are written in the cost-model format.
+        samples_per_second (float, optional): Calibrated Dorado throughput used for the estimated seconds.
+        overhead_seconds (float): Fixed per-partition overhead in seconds.
+        existing_partitions (dict, optional): Partitions loaded from a previous `partitions.json`. They are written
+            unchanged and the new partitions are numbered after them.
+
+    Returns:
+        list of str: Names of the newly added partitions.
     """
-    aggregated_partitions = {}
-    for idx, partition in enumerate(partitions, start=1):
+    aggregated_partitions = dict(existing_partitions or {})
+    start_index = next_partition_index(aggregated_partitions)
+    new_names = []
+    for idx, partition in enumerate(partitions, start=start_index):
         partition_key = f"partition_{idx}"
-        aggregated_partitions[partition_key] = partition
+        if file_stats is None:
+            aggregated_partitions[partition_key] = partition
+        else:
+            aggregated_partitions[partition_key] = describe_partition_costs(partition, file_stats, samples_per_second, overhead_seconds)
+        new_names.append(partition_key)
 
     try:
         with open(output_file, 'w') as f:
@@ -142,46 +467,154 @@ def save_partitions(partitions, output_file):
     except Exception as e:
         print(f"[ERROR] Failed to save partitions to '{output_file}': {e}")
 
+    return new_names
+
 def main():
     parser = argparse.ArgumentParser(description="List and partition .pod5 files based on size limit.")
     parser.add_argument("source_dir", type=str, help="Source directory containing .pod5 files.")
     parser.add_argument("size_limit_gb", type=float, help="Size limit for each partition in GB.")
     parser.add_argument("--output_dir", type=str, default=None, help="Directory to save the partition JSON file. If not specified, defaults to the current working directory from which the script is executed.")
+    parser.add_argument("--strategy", type=str, choices=["sequential", "balanced"], default="sequential", help="Packing strategy. 'sequential' fills one partition at a time; 'balanced' minimizes the largest partition.")
+    parser.add_argument("--num_workers", type=int, default=None, help="Number of GPU workers for the 'balanced' strategy. The partition count is rounded up to a multiple of this value.")
+    parser.add_argument("--cost_model", type=str, choices=["size", "samples"], default="size", help="Weigh files by on-disk size or by signal samples read from pod5 metadata.")
+    throughput = parser.add_mutually_exclusive_group()
+    throughput.add_argument("--samples_per_second", type=float, default=None, help="Dorado throughput used to estimate basecalling seconds (samples cost model only).")
+    throughput.add_argument("--calibrate", type=str, nargs="+", default=None, help="dorado_runtimes.log files from past runs used to calibrate the throughput (samples cost model only).")
+    parser.add_argument("--scan_cache", type=str, default=None, help="Persistent JSON cache of the directory scan, shared with distribute_files_by_size.py.")
+    parser.add_argument("--scan_threads", type=int, default=16, help="Number of threads listing directories concurrently.")
+    parser.add_argument("--duplicates", type=str, choices=["content", "name"], default="content", help="'content' skips byte-identical copies of a file; 'name' exits on repeated filenames.")
+    parser.add_argument("--hash_cache", type=str, default=None, help="Persistent JSON cache of file hashes used for duplicate detection.")
+    parser.add_argument("--incremental", action="store_true", help="Extend the existing partitions.json instead of rebuilding it; only newly seen files are packed into new partitions.")
+    parser.add_argument("--basecalled_dir", type=str, default=None, help="Directory holding per-partition Dorado outputs (UNALIGNED_BAM_DIR); partitions with a basecalling.done marker are not pending.")
+    parser.add_argument("--telemetry_log", type=str, default=None, help="JSON-lines telemetry log the run is recorded in.")
 
     args = parser.parse_args()
+    start_time, start_monotonic = time.time(), time.monotonic()
+
+    if args.num_workers is not None and args.num_workers < 1:
+        parser.error("--num_workers must be a positive integer.")
+    if args.cost_model != "samples" and (args.samples_per_second or args.calibrate):
+        parser.error("--samples_per_second and --calibrate require --cost_model samples.")
 
     source_dir = os.path.abspath(args.source_dir)
     size_limit_gb = args.size_limit_gb
     size_limit_bytes = size_limit_gb * (1024 ** 3)
     output_dir = os.path.abspath(args.output_dir) if args.output_dir else os.getcwd()
 
-    # Define the output JSON file path
+    # Define the output JSON file path and the list of partitions that still need basecalling
     output_file = os.path.join(output_dir, "partitions.json")
+    pending_file = os.path.join(output_dir, "pending_partitions.txt")
+    basecalled_dir = os.path.abspath(args.basecalled_dir) if args.basecalled_dir else None
+
+    # Record the run in the telemetry log before each successful exit
+    telemetry_metrics = {}
+    def record_telemetry():
+        if args.telemetry_log:
+            record_process(os.path.abspath(args.telemetry_log), "partition_pod5", start_time, start_monotonic, telemetry_metrics)
 
     print("=============================================")
     print("Starting File Listing and Partitioning")
     print(f"Source Directory: {source_dir}")
     print(f"Size Limit per Partition: {size_limit_gb} GB")
+    print(f"Packing Strategy: {args.strategy}")
+    print(f"Cost Model: {args.cost_model}")
+    if args.num_workers:
+        print(f"Number of Workers: {args.num_workers}")
+    if args.incremental:
+        print(f"Incremental Mode: extending '{output_file}'")
     print("=============================================")
 
-    # Gather all .pod5 files with uniqueness checks
-    pod5_files = get_all_pod5_files(source_dir)
+    # In incremental mode, existing partitions are kept frozen and their copy of a duplicated file is preferred
+    existing_partitions = {}
+    known_files = {}
+    if args.incremental and os.path.isfile(output_file):
+        existing_partitions = load_partitions(output_file)
+        for name, entry in existing_partitions.items():
+            for file_path in partition_file_paths(entry):
+                known_files[file_path] = name
+
+    # Gather all .pod5 files, skipping byte-identical copies
+    scan_cache = os.path.abspath(args.scan_cache) if args.scan_cache else None
+    hash_cache = os.path.abspath(args.hash_cache) if args.hash_cache else None
+    pod5_files, duplicates = get_all_pod5_files(source_dir, scan_cache, args.scan_threads, args.duplicates, hash_cache, set(known_files))
+    save_duplicates(duplicates, os.path.join(output_dir, "duplicate_pod5_files.tsv"))
     total_files = len(pod5_files)
     total_size = sum(pod5_files.values())
     total_size_gb = convert_bytes_to_gb(total_size)
+    telemetry_metrics.update({"files": total_files, "input_bytes": total_size})
 
     print(f"[INFO] Total .pod5 files found: {total_files}")
     print(f"[INFO] Total size of .pod5 files: {total_size_gb:.2f} GB")
 
+    # Only pack files that are not in any of the existing partitions
+    if args.incremental and os.path.isfile(output_file):
+        missing = [file_path for file_path in known_files if file_path not in pod5_files and file_path not in duplicates]
+        for file_path in missing:
+            print(f"[WARNING] File '{file_path}' from {known_files[file_path]} is no longer present in the source directory.")
+
+        pod5_files = {file_path: size for file_path, size in pod5_files.items() if file_path not in known_files}
+        total_files = len(pod5_files)
+        total_size = sum(pod5_files.values())
+        print(f"[INFO] Existing partitions kept unchanged: {len(existing_partitions)}")
+        print(f"[INFO] Newly seen .pod5 files: {total_files} ({convert_bytes_to_gb(total_size):.2f} GB)")
+
+        if total_files == 0:
+            print("[INFO] No new .pod5 files to partition. Keeping the existing partitions.")
+            save_pending_partitions(find_pending_partitions(existing_partitions, basecalled_dir), pending_file)
+            record_telemetry()
+            sys.exit(0)
+    elif args.incremental:
+        print(f"[INFO] No existing partitions found at '{output_file}'. Creating a new manifest.")
+
     if total_files == 0:
         print("[WARNING] No .pod5 files found. Exiting.")
+        record_telemetry()
         sys.exit(0)
 
-    # Partition files
-    partitions = partition_files(pod5_files, size_limit_bytes)
+    # Choose the weight used for packing
+    file_stats = None
+    samples_per_second = args.samples_per_second
+    overhead_seconds = 0.0
+    if args.cost_model == "samples":
+        file_stats = collect_pod5_stats(pod5_files)
+        weights = {path: stats["num_samples"] for path, stats in file_stats.items()}
+        total_samples = sum(weights.values())
+        telemetry_metrics.update({"reads": sum(stats["num_reads"] for stats in file_stats.values()), "samples": total_samples})
+        print(f"[INFO] Total reads: {sum(stats['num_reads'] for stats in file_stats.values())}")
+        print(f"[INFO] Total signal samples: {format_samples(total_samples)}")
+
+        # Express the size limit as the equivalent number of samples for this run
+        limit = size_limit_bytes * total_samples / total_size if total_size else size_limit_bytes
+        format_weight = format_samples
+
+        if args.calibrate:
+            samples_per_second, overhead_seconds, used = calibrate_samples_per_second([os.path.abspath(f) for f in args.calibrate])
+            print(f"[INFO] Calibrated throughput from {used} partition(s): {samples_per_second:.1f} samples/s, {overhead_seconds:.1f} s overhead per partition")
+    else:
+        weights = pod5_files
+        limit = size_limit_bytes
+        format_weight = format_gb
+
+    # Partition files, numbering new partitions after any existing ones
+    first_index = next_partition_index(existing_partitions)
+    if args.strategy == "balanced":
+        partitions = balance_partitions(weights, limit, args.num_workers, format_weight, first_index)
+    else:
+        partitions = partition_files(weights, limit, format_weight, first_index)
+
+    # Report the estimated basecalling time to help size DORADO_JOB_RUNTIME
+    if samples_per_second:
+        seconds = [estimate_seconds(sum(p.values()), samples_per_second, overhead_seconds) for p in partitions]
+        print(f"[INFO] Estimated basecalling time of the longest partition: {format_duration(max(seconds))}")
+        print(f"[INFO] Estimated basecalling time of all partitions in sequence: {format_duration(sum(seconds))}")
 
     # Save all partitions into a single JSON file
-    save_partitions(partitions, output_file)
+    new_names = save_partitions(partitions, output_file, file_stats, samples_per_second, overhead_seconds, existing_partitions)
+
+    # List the partitions that still need basecalling: unfinished existing ones and all new ones
+    pending = find_pending_partitions(existing_partitions, basecalled_dir) + new_names
+    save_pending_partitions(pending, pending_file)
+    record_telemetry()
 
     print("=============================================")
     print("File Listing and Partitioning Completed Successfully.")
@@ -0,0 +1,348 @@
+"""
+Description:
+    Content-addressed cache of raw `modkit pileup` outputs for `modkit_job.sh`. Only the coverage and percent
+    modified thresholds (`VALID_COVERAGE_THRESHOLD`, `PERCENT_MODIFIED_THRESHOLD`) are applied after the pileup, so
+    a sweep over them can reuse one pileup per input BAM and only re-run the filter step.
+
+Key Features:
+    - **Content-Addressed Keys:** The key is a hash of the input BAM (size and the hash of its first and last MiB),
+      the full content of its index (`.bai` or `.csi`, which changes with every change to the alignments), the
+      pileup flags and the modkit version. Paths and modification times are not part of the key, so a copied or
+      re-merged but identical BAM still hits the cache. The flags are normalized first, so the order in which
+      `modkit_job.sh` builds them does not matter; flags that do not change the output (`--threads`,
+      `--log-filepath`) are ignored, and a sharded pileup yields the same key as an unsharded one.
+    - **Size-Bounded LRU Eviction:** Every use of an entry refreshes its last-use time. After an entry is stored,
+      the least recently used entries are removed until the cache fits in `--max_size_gb`. The space of an evicted
+      entry that is still linked from fetched outputs is freed once those outputs are removed.
+    - **Private Entries, Linked Fetches:** `store` copies the pileup into the cache, so the entry shares no inode
+      with the output it came from, and makes the copy read-only. `fetch` hard-links the entry to the output when
+      the cache and the output directory share a filesystem, and copies it otherwise. A fetched file is therefore
+      the cache entry itself: it must not be modified, only read or removed. `modkit_job.sh` removes its output
+      before a new pileup so that it never writes through a link into the cache.
+    - **Concurrent Jobs:** Entries are written under a temporary name and renamed into place, and storing and
+      eviction hold an exclusive lock on the cache directory. A fetch that races with an eviction is a miss.
+
+Usage:
+    python pileup_cache.py key <input_bam> --flags "<pileup flags>" [--tool_version <version>]
+    python pileup_cache.py fetch <cache_dir> <key> <output_bed>
+    python pileup_cache.py store <cache_dir> <key> <pileup_bed> [--max_size_gb <N>] [--description <text>]
+    python pileup_cache.py info <cache_dir>
+
+Arguments:
+    key     : Print the cache key of a pileup of `input_bam` with the given flags. Exits with 1 if the BAM or
+              its index is missing.
+    fetch   : Place the cached pileup of `key` at `output_bed` (a read-only hard link into the cache where possible;
+              do not modify it). Exits with 0 on a hit and 1 on a miss.
+    store   : Copy `pileup_bed` into the cache under `key`, then evict the least recently used entries.
+              `pileup_bed` itself is left as it is.
+    info    : List the entries of the cache, most recently used first, with the number of fetched outputs still
+              linked to each.
+    --max_size_gb    : (Optional) Size limit of the cache in GB. Defaults to 200.
+    --description    : (Optional) Text stored with the entry and shown by `info` (e.g. the input BAM).
+    --tool_version   : (Optional) modkit version; entries of other versions are not reused.
+
+Requirements:
+    - Python 3 standard library; `pod5_dedup.py` from the same directory.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+
+from pod5_dedup import partial_hash, full_hash
+
+CACHE_VERSION = 1
+
+# Files of a cache entry
+PILEUP_FILE = "pileup.bed"
+ENTRY_FILE = "entry.json"
+LAST_USED_FILE = "last_used"
+
+# Pileup options that do not change the output; the value following each is dropped too
+IGNORED_OPTIONS = {"--threads", "-t", "--log-filepath"}
+
+def find_index(bam_path):
+    """
+    Find the index of a BAM file.
+
+    Args:
+        bam_path (str): Path to the BAM file.
+
+    Returns:
+        str or None: Path to the `.bai` or `.csi` index, or None if there is none.
+    """
+    stem = bam_path[:-4] if bam_path.endswith(".bam") else bam_path
+    for candidate in (f"{bam_path}.bai", f"{bam_path}.csi", f"{stem}.bai", f"{stem}.csi"):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def normalize_flags(flags):
+    """
+    Normalize pileup flags into a canonical, order-independent string.
+
+    Args:
+        flags (str): Flags as passed to `modkit pileup`.
+
+    Returns:
+        str: Sorted options, each with its value, without the options in `IGNORED_OPTIONS`.
+    """
+    tokens = flags.split()
+    options = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        has_value = i + 1 < len(tokens) and not tokens[i + 1].startswith("--")
+        value = tokens[i + 1] if has_value else None
+        if token not in IGNORED_OPTIONS:
+            options.append(f"{token} {value}" if value is not None else token)
+        i += 2 if has_value else 1
+    return " ".join(sorted(options))
+
+def cache_key(bam_path, flags, tool_version=""):
+    """
+    Compute the cache key of a pileup.
+
+    Args:
+        bam_path (str): Path to the input BAM file.
+        flags (str): Pileup flags.
+        tool_version (str): modkit version.
+
+    Returns:
+        str: Hexadecimal key.
+
+    Raises:
+        FileNotFoundError: If the BAM file or its index is missing.
+    """
+    index_path = find_index(bam_path)
+    if index_path is None:
+        raise FileNotFoundError(f"No .bai or .csi index found for '{bam_path}'")
+    size = os.path.getsize(bam_path)
+    fingerprint = {
+        "version": CACHE_VERSION,
+        "bam_size": size,
+        "bam_partial_hash": partial_hash(bam_path, size),
+        "index_hash": full_hash(index_path),
+        "flags": normalize_flags(flags),
+        "tool_version": tool_version.strip(),
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+def entry_dir(cache_dir, key):
+    """
+    Return the directory of a cache entry.
+
+    Args:
+        cache_dir (str): Cache directory.
+        key (str): Cache key.
+
+    Returns:
+        str: Entry directory.
+    """
+    return os.path.join(cache_dir, key[:2], key)
+
+def place_file(source, target):
+    """
+    Hard-link a file to a new path, copying it if the paths are on different filesystems.
+
+    Args:
+        source (str): Existing file.
+        target (str): New path; replaced if it exists.
+    """
+    # rename() does nothing when both paths are links to the same file, which would leave the temporary link behind
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+    tmp_target = f"{target}.tmp.{os.getpid()}"
+    try:
+        try:
+            os.link(source, tmp_target)
+        except OSError:
+            shutil.copyfile(source, tmp_target)
+        os.replace(tmp_target, target)
+    finally:
+        if os.path.lexists(tmp_target):
+            os.remove(tmp_target)
+
+def fetch(cache_dir, key, output_bed):
+    """
+    Place a cached pileup at the output path and refresh its last-use time.
+
+    The output is a hard link to the read-only cache entry where possible, so it must not be modified in place.
+
+    Args:
+        cache_dir (str): Cache directory.
+        key (str): Cache key.
+        output_bed (str): Output path.
+
+    Returns:
+        bool: True on a hit, False on a miss.
+    """
+    entry = entry_dir(cache_dir, key)
+    try:
+        place_file(os.path.join(entry, PILEUP_FILE), output_bed)
+        with open(os.path.join(entry, LAST_USED_FILE), "w") as f:
+            f.write(time.strftime("%Y-%m-%dT%H:%M:%S\n"))
+    except OSError:
+        return False
+    return True
+
+def list_entries(cache_dir):
+    """
+    List the complete entries of a cache.
+
+    Args:
+        cache_dir (str): Cache directory.
+
+    Returns:
+        list of dict: Entries with `key`, `path`, `size` (bytes), `links` (fetched outputs still linked to the
+        entry), `last_used` (seconds since the epoch) and `description`, most recently used first.
+    """
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for prefix in os.listdir(cache_dir):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+            continue
+        for key in os.listdir(prefix_dir):
+            path = os.path.join(prefix_dir, key)
+            try:
+                pileup_stat = os.stat(os.path.join(path, PILEUP_FILE))
+                last_used = os.path.getmtime(os.path.join(path, LAST_USED_FILE))
+                with open(os.path.join(path, ENTRY_FILE)) as f:
+                    description = json.load(f).get("description", "")
+            except (OSError, ValueError):
+                # Entry being written or removed
+                continue
+            entries.append({"key": key, "path": path, "size": pileup_stat.st_size, "links": pileup_stat.st_nlink - 1,
+                            "last_used": last_used, "description": description})
+    entries.sort(key=lambda e: e["last_used"], reverse=True)
+    return entries
+
+def evict(cache_dir, max_size_bytes):
+    """
+    Remove the least recently used entries until the cache fits in the size limit.
+
+    Args:
+        cache_dir (str): Cache directory.
+        max_size_bytes (int): Size limit in bytes.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    entries = list_entries(cache_dir)
+    total = sum(e["size"] for e in entries)
+    removed = 0
+    while entries and total > max_size_bytes:
+        oldest = entries.pop()
+        shutil.rmtree(oldest["path"], ignore_errors=True)
+        total -= oldest["size"]
+        removed += 1
+        print(f"[INFO] Evicted pileup cache entry {oldest['key'][:12]} ({oldest['size'] / 1024 ** 3:.2f} GB, {oldest['description']}).")
+        if oldest["links"]:
+            print(f"[WARNING] The evicted entry is still linked from {oldest['links']} fetched output(s); "
+                  f"its space is freed when they are removed.")
+    return removed
+
+def store(cache_dir, key, pileup_bed, max_size_bytes, description=""):
+    """
+    Copy a pileup into the cache and evict the least recently used entries.
+
+    The entry is a private, read-only copy, so the pileup output stays writable and later changes to it do not
+    reach the cache.
+
+    Args:
+        cache_dir (str): Cache directory.
+        key (str): Cache key.
+        pileup_bed (str): Pileup output to cache.
+        max_size_bytes (int): Size limit of the cache in bytes.
+        description (str): Text stored with the entry.
+
+    Returns:
+        bool: True if the pileup is in the cache afterwards.
+    """
+    size = os.path.getsize(pileup_bed)
+    if size > max_size_bytes:
+        print(f"[WARNING] The pileup ({size / 1024 ** 3:.2f} GB) is larger than the cache limit; not caching it.")
+        return False
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        entry = entry_dir(cache_dir, key)
+        if os.path.isfile(os.path.join(entry, PILEUP_FILE)):
+            return True
+
+        partial = f"{entry}.partial.{os.getpid()}"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        shutil.copyfile(pileup_bed, os.path.join(partial, PILEUP_FILE))
+        os.chmod(os.path.join(partial, PILEUP_FILE), 0o444)
+        with open(os.path.join(partial, ENTRY_FILE), "w") as f:
+            json.dump({"key": key, "description": description, "size": size,
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=4)
+        with open(os.path.join(partial, LAST_USED_FILE), "w") as f:
+            f.write(time.strftime("%Y-%m-%dT%H:%M:%S\n"))
+        os.replace(partial, entry)
+
+        evict(cache_dir, max_size_bytes)
+    return True
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Content-addressed cache of modkit pileup outputs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    key_parser = subparsers.add_parser("key", help="Print the cache key of a pileup.")
+    key_parser.add_argument("input_bam", type=str, help="Input BAM file of the pileup.")
+    key_parser.add_argument("--flags", type=str, required=True, help="Pileup flags.")
+    key_parser.add_argument("--tool_version", type=str, default="", help="modkit version.")
+
+    fetch_parser = subparsers.add_parser("fetch", help="Place a cached pileup at the output path (read-only; do not modify it).")
+    fetch_parser.add_argument("cache_dir", type=str, help="Cache directory.")
+    fetch_parser.add_argument("key", type=str, help="Cache key.")
+    fetch_parser.add_argument("output_bed", type=str, help="Output path.")
+
+    store_parser = subparsers.add_parser("store", help="Copy a pileup into the cache.")
+    store_parser.add_argument("cache_dir", type=str, help="Cache directory.")
+    store_parser.add_argument("key", type=str, help="Cache key.")
+    store_parser.add_argument("pileup_bed", type=str, help="Pileup output to cache.")
+    store_parser.add_argument("--max_size_gb", type=float, default=200, help="Size limit of the cache in GB.")
+    store_parser.add_argument("--description", type=str, default="", help="Text stored with the entry.")
+
+    info_parser = subparsers.add_parser("info", help="List the entries of the cache.")
+    info_parser.add_argument("cache_dir", type=str, help="Cache directory.")
+
+    args = parser.parse_args()
+
+    if args.command == "key":
+        try:
+            print(cache_key(args.input_bam, args.flags, args.tool_version))
+        except OSError as e:
+            print(f"[ERROR] Unable to fingerprint '{args.input_bam}': {e}", file=sys.stderr)
+            sys.exit(1)
+    elif args.command == "fetch":
+        if not fetch(args.cache_dir, args.key, args.output_bed):
+            sys.exit(1)
+        print(f"[INFO] Reused cached pileup {args.key[:12]} for '{args.output_bed}'.")
+    elif args.command == "store":
+        if not os.path.isfile(args.pileup_bed):
+            print(f"[ERROR] Pileup output '{args.pileup_bed}' does not exist.")
+            sys.exit(1)
+        if store(args.cache_dir, args.key, args.pileup_bed, args.max_size_gb * (1024 ** 3), args.description.strip()):
+            print(f"[INFO] Cached pileup {args.key[:12]} in '{args.cache_dir}'.")
+    else:
+        entries = list_entries(args.cache_dir)
+        total = sum(e["size"] for e in entries)
+        print(f"[INFO] {len(entries)} cached pileup(s), {total / 1024 ** 3:.2f} GB in '{args.cache_dir}'.")
+        for e in entries:
+            print(f"{e['key'][:12]}\t{time.strftime('%Y-%m-%d %H:%M', time.localtime(e['last_used']))}\t"
+                  f"{e['size'] / 1024 ** 3:.2f} GB\t{e['links']} linked\t{e['description']}")
+
+if __name__ == "__main__":
+    main()
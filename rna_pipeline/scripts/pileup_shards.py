@@ -0,0 +1,324 @@
+"""
+Description:
+    Helpers for running `modkit pileup` on region shards of an indexed BAM file and reassembling the results. The
+    `plan` command splits the reference into shards of roughly equal mapped read count, and the `merge` command
+    concatenates the per-shard bedMethyl files back into a single file in genome order, so that the result matches a
+    single `modkit pileup` run over the whole BAM.
+
+Key Features:
+    - **Read-Balanced Planning:** Mapped read counts per contig are taken from the BAM index. Contigs holding more
+      than a fraction of one shard's share of the reads are split into equal-length regions, and all regions are assigned to
+      shards longest-processing-time-first, so that every pileup task has a similar amount of work.
+    - **Disjoint Regions:** Shards never overlap, so every reference position is reported by exactly one shard.
+    - **Ordered Merge:** Shard outputs are combined with a streaming k-way merge keyed by (contig order in the BAM
+      header, start position). A shard output that is not in genome order is sorted in memory with a warning.
+
+Usage:
+    python pileup_shards.py plan <input_bam> <shard_dir> --num_shards <N>
+    python pileup_shards.py merge <contig_order_file> <output_bed> <shard_bed> [<shard_bed> ...]
+
+Arguments:
+    plan:
+        input_bam         : Coordinate-sorted, indexed BAM file.
+        shard_dir         : Directory in which `shard_<i>.bed` (numbered from 1) and `contig_order.txt` are written.
+        --num_shards      : Number of shards.
+    merge:
+        contig_order_file : `contig_order.txt` written by `plan`.
+        output_bed        : Path to the merged bedMethyl file.
+        shard_bed         : Per-shard bedMethyl files written by `modkit pileup`.
+
+Requirements:
+    - The `pysam` Python package, or `samtools` on the PATH, to read the BAM index statistics.
+"""
+
+import os
+import sys
+import math
+import heapq
+import argparse
+import subprocess
+
+# File written by `plan` listing the contigs in BAM header order
+CONTIG_ORDER_FILE = "contig_order.txt"
+
+# Heavy contigs are cut into regions of 1 / (num_shards * REGIONS_PER_SHARD) of the reads, which leaves the
+# longest-processing-time-first assignment enough small pieces to even out the shards
+REGIONS_PER_SHARD = 4
+
+class ShardOrderError(Exception):
+    """Raised when a shard output is not in genome order."""
+
+def read_contig_stats(bam_path):
+    """
+    Read the length and the number of mapped reads of every contig from the BAM index.
+
+    Args:
+        bam_path (str): Path to the indexed BAM file.
+
+    Returns:
+        list of tuple: (contig, length, mapped_reads) in BAM header order.
+
+    Raises:
+        SystemExit: If neither `pysam` nor `samtools` can read the index.
+    """
+    try:
+        import pysam
+    except ImportError:
+        pysam = None
+
+    if pysam is not None:
+        with pysam.AlignmentFile(bam_path, "rb") as bam:
+            mapped = {stat.contig: stat.mapped for stat in bam.get_index_statistics()}
+            return [(contig, length, mapped.get(contig, 0)) for contig, length in zip(bam.references, bam.lengths)]
+
+    try:
+        output = subprocess.run(["samtools", "idxstats", bam_path], check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"[ERROR] Unable to read index statistics of '{bam_path}': {e}")
+        sys.exit(1)
+
+    stats = []
+    for line in output.splitlines():
+        contig, length, mapped, _ = line.split("\t")
+        if contig != "*":
+            stats.append((contig, int(length), int(mapped)))
+    return stats
+
+def split_into_regions(contig_stats, num_shards):
+    """
+    Split contigs into regions of at most a fraction (1 / REGIONS_PER_SHARD) of one shard's share of the mapped reads.
+
+    Reads are assumed to be spread evenly along a contig, so a heavy contig is cut into equal-length regions.
+
+    Args:
+        contig_stats (list of tuple): (contig, length, mapped_reads) in BAM header order.
+        num_shards (int): Number of shards.
+
+    Returns:
+        list of tuple: (contig, start, end, estimated_reads) for every contig with mapped reads, in genome order.
+    """
+    total_reads = sum(mapped for _, _, mapped in contig_stats)
+    target = max(1, math.ceil(total_reads / (num_shards * REGIONS_PER_SHARD)))
+
+    regions = []
+    for contig, length, mapped in contig_stats:
+        if mapped == 0:
+            continue
+        pieces = min(length, math.ceil(mapped / target))
+        for piece in range(pieces):
+            start = length * piece // pieces
+            end = length * (piece + 1) // pieces
+            regions.append((contig, start, end, mapped / pieces))
+    return regions
+
+def assign_regions(regions, num_shards):
+    """
+    Assign regions to shards, heaviest first, always to the shard with the fewest reads.
+
+    Args:
+        regions (list of tuple): (contig, start, end, estimated_reads).
+        num_shards (int): Number of shards.
+
+    Returns:
+        list of list: Regions of every non-empty shard, each list in genome order.
+    """
+    order = {region[:3]: idx for idx, region in enumerate(regions)}
+    shards = [[] for _ in range(num_shards)]
+    heap = [(0.0, idx) for idx in range(num_shards)]
+
+    for region in sorted(regions, key=lambda r: r[3], reverse=True):
+        load, idx = heapq.heappop(heap)
+        shards[idx].append(region)
+        heapq.heappush(heap, (load + region[3], idx))
+
+    return [sorted(shard, key=lambda r: order[r[:3]]) for shard in shards if shard]
+
+def plan_shards(bam_path, shard_dir, num_shards):
+    """
+    Write one BED file of regions per shard and the contig order used by `merge`.
+
+    Args:
+        bam_path (str): Path to the indexed BAM file.
+        shard_dir (str): Output directory.
+        num_shards (int): Number of shards.
+
+    Returns:
+        list of list: Regions of every shard.
+    """
+    contig_stats = read_contig_stats(bam_path)
+    shards = assign_regions(split_into_regions(contig_stats, num_shards), num_shards)
+
+    os.makedirs(shard_dir, exist_ok=True)
+    with open(os.path.join(shard_dir, CONTIG_ORDER_FILE), "w") as f:
+        for contig, _, _ in contig_stats:
+            f.write(f"{contig}\n")
+
+    for shard_idx, shard in enumerate(shards, start=1):
+        with open(os.path.join(shard_dir, f"shard_{shard_idx}.bed"), "w") as f:
+            for contig, start, end, _ in shard:
+                f.write(f"{contig}\t{start}\t{end}\n")
+
+    loads = [sum(region[3] for region in shard) for shard in shards]
+    for shard_idx, (shard, load) in enumerate(zip(shards, loads), start=1):
+        print(f"[INFO] shard_{shard_idx}: {len(shard)} region(s), ~{int(round(load))} mapped reads")
+    if loads:
+        mean_load = sum(loads) / len(loads)
+        print(f"[INFO] Shard imbalance ratio (max / mean): {max(loads) / mean_load if mean_load else 1.0:.3f}")
+    if len(shards) < num_shards:
+        print(f"[WARNING] Only {len(shards)} of {num_shards} shard(s) received regions with mapped reads.")
+
+    return shards
+
+def _is_header(line):
+    """
+    Check whether a bedMethyl line is a header line.
+
+    Args:
+        line (str): Line of a bedMethyl file.
+
+    Returns:
+        bool: True for comment lines and for a column header without a numeric start position.
+    """
+    fields = line.split("\t", 2)
+    return line.startswith("#") or len(fields) < 2 or not fields[1].isdigit()
+
+def _record_key(line, rank):
+    """
+    Return the genome-order sort key of a bedMethyl record.
+
+    Args:
+        line (str): bedMethyl record.
+        rank (dict): Dictionary mapping contigs to their position in the BAM header.
+
+    Returns:
+        tuple: (contig rank, start, end).
+    """
+    contig, start, end, _ = line.split("\t", 3)
+    return rank.get(contig, len(rank)), int(start), int(end)
+
+def read_shard_header(path):
+    """
+    Read the leading header lines of a shard output.
+
+    Args:
+        path (str): Path to a per-shard bedMethyl file.
+
+    Returns:
+        list of str: Header lines.
+    """
+    header = []
+    with open(path) as f:
+        for line in f:
+            if not _is_header(line):
+                break
+            header.append(line)
+    return header
+
+def iter_shard_records(path, rank):
+    """
+    Yield the records of a shard output with their sort keys, checking that they are in genome order.
+
+    Args:
+        path (str): Path to a per-shard bedMethyl file.
+        rank (dict): Dictionary mapping contigs to their position in the BAM header.
+
+    Yields:
+        tuple: (key, line).
+
+    Raises:
+        ShardOrderError: If a record sorts before the previous one.
+    """
+    previous = None
+    with open(path) as f:
+        for line in f:
+            if _is_header(line):
+                continue
+            key = _record_key(line, rank)
+            if previous is not None and key < previous:
+                raise ShardOrderError(path)
+            previous = key
+            yield key, line
+
+def merge_shards(contig_order_file, output_bed, shard_beds):
+    """
+    Concatenate per-shard bedMethyl files in genome order.
+
+    The header of the first shard is written once. Shards are merged with a streaming k-way merge; if a shard turns
+    out not to be in genome order, all records are sorted in memory instead.
+
+    Args:
+        contig_order_file (str): File listing the contigs in BAM header order.
+        output_bed (str): Path to the merged bedMethyl file.
+        shard_beds (list of str): Per-shard bedMethyl files.
+
+    Returns:
+        int: Number of records written.
+    """
+    with open(contig_order_file) as f:
+        rank = {line.strip(): idx for idx, line in enumerate(f) if line.strip()}
+
+    header = read_shard_header(shard_beds[0])
+    tmp_bed = f"{output_bed}.partial"
+    written = 0
+
+    with open(tmp_bed, "w") as out:
+        out.writelines(header)
+        try:
+            streams = [iter_shard_records(path, rank) for path in shard_beds]
+            for _, line in heapq.merge(*streams, key=lambda item: item[0]):
+                out.write(line)
+                written += 1
+        except ShardOrderError as e:
+            print(f"[WARNING] '{e}' is not in genome order. Sorting all shard outputs in memory.")
+            records = []
+            for path in shard_beds:
+                with open(path) as f:
+                    records.extend((_record_key(line, rank), line) for line in f if not _is_header(line))
+            records.sort(key=lambda item: item[0])
+
+            out.seek(0)
+            out.truncate()
+            out.writelines(header)
+            out.writelines(line for _, line in records)
+            written = len(records)
+
+    os.replace(tmp_bed, output_bed)
+
+    print(f"[INFO] Merged {len(shard_beds)} shard output(s) into '{output_bed}' ({written} records).")
+    return written
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Plan and merge region-sharded modkit pileup runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="Split an indexed BAM into read-balanced region shards.")
+    plan_parser.add_argument("input_bam", type=str, help="Coordinate-sorted, indexed BAM file.")
+    plan_parser.add_argument("shard_dir", type=str, help="Directory for the shard BED files and the contig order.")
+    plan_parser.add_argument("--num_shards", type=int, required=True, help="Number of shards.")
+
+    merge_parser = subparsers.add_parser("merge", help="Concatenate per-shard bedMethyl files in genome order.")
+    merge_parser.add_argument("contig_order_file", type=str, help="contig_order.txt written by 'plan'.")
+    merge_parser.add_argument("output_bed", type=str, help="Path to the merged bedMethyl file.")
+    merge_parser.add_argument("shard_beds", type=str, nargs="+", help="Per-shard bedMethyl files.")
+
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        if args.num_shards < 1:
+            print(f"[ERROR] The number of shards must be at least 1 (got {args.num_shards}).")
+            sys.exit(1)
+        if not os.path.isfile(args.input_bam):
+            print(f"[ERROR] Input BAM '{args.input_bam}' does not exist.")
+            sys.exit(1)
+        plan_shards(os.path.abspath(args.input_bam), os.path.abspath(args.shard_dir), args.num_shards)
+    else:
+        missing = [path for path in args.shard_beds if not os.path.isfile(path)]
+        if missing:
+            for path in missing:
+                print(f"[ERROR] Shard output '{path}' does not exist.")
+            sys.exit(1)
+        merge_shards(args.contig_order_file, args.output_bed, args.shard_beds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,660 @@
+"""
+Description:
+    Runs the RNA pipeline as a DAG of stages with completion markers, so that a re-run only executes the stages that
+    are not done yet. The stages run the same job scripts as the `qsub` chain started by `main_job.sh`:
+
+        dorado_<partition>  ->  align_<partition>  ->  merge  ->  modkit
+
+    Every partition is basecalled by `dorado_job.sh` (one partition per run) and aligned by `align_array_job.sh` in
+    its task-list mode as soon as it is basecalled; `merge_job.sh` waits for every alignment and `modkit_job.sh` for
+    the merge. Two backends execute the DAG:
+
+        - `local`: a process pool on one workstation. A stage is started once its dependencies are done and its CPUs,
+          memory and GPUs fit in what is still free of the budgets (`--cpus`, `--memory_gb`, `--gpus`). GPU stages
+          get their own devices through `CUDA_VISIBLE_DEVICES`.
+        - `sge`: every stage that needs to run is submitted with `qsub`, held with `-hold_jid` on the jobs of its
+          dependencies, with the same resource requests as the `qsub` chain.
+
+Key Features:
+    - **Completion Markers with Fingerprints:** After a stage succeeds, a marker holding its fingerprint is written to
+      `<state_dir>/markers`. The fingerprint covers the stage's parameters (model, thresholds, modes), the size and
+      modification time of its external inputs (the partition's pod5 files, the reference and the annotation), and
+      the fingerprints of the stages it depends on. A stage is skipped when its marker matches and its outputs exist,
+      or when its outputs were consumed by dependents that are themselves done (e.g. the per-partition aligned BAMs,
+      which the merge removes). Changing a parameter or an input re-runs the affected stages and everything
+      downstream of them, and nothing else.
+    - **Safe Re-runs:** The outputs of a stage are removed before it runs again, so the scripts' checks for empty
+      output directories do not stop a resume. A partition basecalled with other parameters is basecalled again from
+      scratch, while a partition basecalled by an earlier run of the `qsub` chain (with a `basecalling.done` marker)
+      is adopted by `dorado_job.sh` without being basecalled again.
+    - **Failure Isolation:** When a stage fails, the stages that depend on it are not started, but independent stages
+      (other partitions) still run. Every stage also checks the markers of its dependencies before it starts.
+
+Usage:
+    python pipeline_dag.py run <state_dir> [--backend local|sge] [--cpus <N>] [--memory_gb <GB>] [--gpus <N>]
+                                           [--dry_run]
+    python pipeline_dag.py run_stage <state_dir> <stage>
+
+    The configuration is read from the environment variables exported by `run_pipeline.sh`
+    (`PIPELINE_EXECUTOR=local` or `sge` calls this script after partitioning).
+
+Arguments:
+    run:
+        state_dir   : Directory holding the plan, the completion markers and (local backend) the stage logs.
+        --backend   : (Optional) `local` (default) or `sge`.
+        --cpus      : (Optional) Local CPU budget. Defaults to the number of CPUs of the machine.
+        --memory_gb : (Optional) Local memory budget in GB. Defaults to the physical memory of the machine.
+        --gpus      : (Optional) Local GPU budget. Defaults to the devices in CUDA_VISIBLE_DEVICES, or those listed
+                      by nvidia-smi.
+        --dry_run   : (Optional) Print which stages would run and which are done, without running anything.
+    run_stage:
+        state_dir   : Directory holding the plan written by `run`.
+        stage       : Name of the stage to run (used by the jobs of the `sge` backend).
+
+Requirements:
+    - The tools used by the job scripts (`dorado`, `samtools`, `minimap2`, `modkit`, `jq`) and, with the `sge`
+      backend, `qsub`.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PLAN_FILE = "plan.json"
+MARKER_DIR = "markers"
+LOG_DIR = "logs"
+PARTITION_LIST_DIR = "partitions"
+
+# Marker written by dorado_job.sh into a partition's output directory
+DORADO_DONE_MARKER = "basecalling.done"
+
+# Environment variables every plan needs, as exported by run_pipeline.sh
+REQUIRED_ENV = [
+    "GROUP", "SAMPLE", "MODIFIED_BASES", "ALL_MODS", "SCRIPTS_DIR", "BASH_SOURCE_DIR", "ANNOTATION_FILE",
+    "REFERENCE_FILE", "UNALIGNED_BAM_DIR", "ALIGNED_BAM_DIR", "MODKIT_OUTPUT_DIR", "MODEL_NAME", "MIN_QSCORE",
+    "TOTAL_CPUS_DORADO", "TOTAL_GPUS_DORADO", "DORADO_JOB_RUNTIME", "DORADO_JOB_MEMORY", "DORADO_GPU_TYPE",
+    "TOTAL_CPUS_ALIGN", "ALIGN_THREADS", "ALIGN_JOB_RUNTIME", "ALIGN_JOB_MEMORY",
+    "TOTAL_CPUS_MERGE", "MERGE_THREADS", "MERGE_JOB_RUNTIME", "MERGE_JOB_MEMORY",
+    "TOTAL_CPUS_MODKIT", "MODKIT_THREADS", "MODKIT_JOB_RUNTIME", "MODKIT_JOB_MEMORY",
+    "FILTER_THRESHOLD_ALL", "FILTER_THRESHOLD_A", "FILTER_THRESHOLD_C", "FILTER_THRESHOLD_T",
+    "MOD_THRESHOLD_M6A", "MOD_THRESHOLD_PSEU", "MOD_THRESHOLD_INOSINE", "MOD_THRESHOLD_M5C",
+    "VALID_COVERAGE_THRESHOLD", "PERCENT_MODIFIED_THRESHOLD",
+]
+
+def load_config():
+    """
+    Read the pipeline configuration from the environment.
+
+    Returns:
+        dict: Dictionary mapping variable names to values.
+
+    Raises:
+        SystemExit: If a required variable is not set.
+    """
+    missing = [name for name in REQUIRED_ENV if name not in os.environ]
+    if missing:
+        print(f"[ERROR] Missing environment variables: {', '.join(missing)}. Run this script through run_pipeline.sh.")
+        sys.exit(1)
+    config = {name: os.environ[name] for name in REQUIRED_ENV}
+    for name, default in [("ALIGN_MODE", "classic"), ("KEEP_FULL_BAM", "false"), ("MODKIT_SHARDS", "1"),
+                          ("MODKIT_FILTER_MODE", "plain"), ("QSUB_PROJECT", ""), ("QSUB_EMAIL", "ea"),
+                          ("QSUB_JOINT_STDERR", "y")]:
+        config[name] = os.environ.get(name, default)
+    return config
+
+def parse_memory_gb(memory):
+    """
+    Convert a scheduler memory request (e.g. `64G`, `512M`) to gigabytes.
+
+    Args:
+        memory (str): Memory request.
+
+    Returns:
+        float: Memory in GB.
+    """
+    units = {"K": 1 / 1024 ** 2, "M": 1 / 1024, "G": 1, "T": 1024}
+    memory = memory.strip().upper()
+    if memory and memory[-1] in units:
+        return float(memory[:-1]) * units[memory[-1]]
+    return float(memory) / 1024 ** 3
+
+def file_fingerprints(paths):
+    """
+    Describe files by their size and modification time.
+
+    Args:
+        paths (list of str): File paths.
+
+    Returns:
+        list: [path, size, mtime_ns] per file; size and mtime_ns are None for missing files.
+    """
+    entries = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            entries.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            entries.append([path, None, None])
+    return entries
+
+def compute_fingerprint(params, inputs, dependency_fingerprints):
+    """
+    Hash the parameters, external inputs and dependency fingerprints of a stage.
+
+    Args:
+        params (dict): Parameters that change the stage's outputs.
+        inputs (list of str): External input files.
+        dependency_fingerprints (list of str): Fingerprints of the stages it depends on.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    payload = json.dumps([params, file_fingerprints(inputs), dependency_fingerprints], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def load_partitions(partitions_json):
+    """
+    Load the pod5 files of every partition from partitions.json (either format).
+
+    Args:
+        partitions_json (str): Path to partitions.json.
+
+    Returns:
+        dict: Dictionary mapping partition names, in sorted order, to lists of pod5 file paths.
+    """
+    with open(partitions_json) as f:
+        partitions = json.load(f)
+    return {name: sorted(entry["files"] if "files" in entry else entry) for name, entry in sorted(partitions.items())}
+
+def build_plan(config, state_dir):
+    """
+    Build the stages of the pipeline DAG.
+
+    Args:
+        config (dict): Pipeline configuration from `load_config`.
+        state_dir (str): Directory holding the plan and the per-partition lists.
+
+    Returns:
+        dict: Dictionary mapping stage names, in topological order, to stage descriptions.
+    """
+    scripts_dir = config["SCRIPTS_DIR"]
+    partitions_json = os.path.join(config["BASH_SOURCE_DIR"], "partitions.json")
+    partitions = load_partitions(partitions_json)
+    model_type = config["MODEL_NAME"].split("@")[0]
+    aligned_dir = config["ALIGNED_BAM_DIR"]
+    stages = {}
+
+    def add_stage(name, command, deps, cpus, memory, runtime, params, inputs=(), outputs=(), clean=(),
+                  clean_if_stale=(), env=None, gpus=0):
+        stages[name] = {
+            "command": command, "deps": deps, "cpus": int(cpus), "memory": memory,
+            "memory_gb": parse_memory_gb(memory), "gpus": int(gpus), "runtime": runtime,
+            "fingerprint": compute_fingerprint(params, list(inputs), [stages[dep]["fingerprint"] for dep in deps]),
+            "outputs": list(outputs), "clean": list(clean), "clean_if_stale": list(clean_if_stale), "env": env or {},
+        }
+
+    list_dir = os.path.join(state_dir, PARTITION_LIST_DIR)
+    os.makedirs(list_dir, exist_ok=True)
+    align_params = {"align_mode": config["ALIGN_MODE"], "keep_full_bam": config["KEEP_FULL_BAM"]}
+    align_stages = []
+
+    for partition, pod5_files in partitions.items():
+        partition_dir = os.path.join(config["UNALIGNED_BAM_DIR"], partition)
+        unaligned_bam = os.path.join(partition_dir, f"{model_type}_calls.bam")
+
+        # dorado_job.sh basecalls the partitions listed in its pending list, one after another
+        pending_list = os.path.join(list_dir, f"{partition}.txt")
+        with open(pending_list, "w") as f:
+            f.write(f"{partition}\n")
+        add_stage(
+            f"dorado_{partition}",
+            ["bash", "-l", os.path.join(scripts_dir, "dorado_job.sh"), config["MODIFIED_BASES"],
+             config["UNALIGNED_BAM_DIR"], config["MODEL_NAME"], config["MIN_QSCORE"], partitions_json, pending_list],
+            [], config["TOTAL_CPUS_DORADO"], config["DORADO_JOB_MEMORY"], config["DORADO_JOB_RUNTIME"],
+            {"model": config["MODEL_NAME"], "modified_bases": config["MODIFIED_BASES"],
+             "min_qscore": config["MIN_QSCORE"]},
+            inputs=pod5_files, outputs=[unaligned_bam, os.path.join(partition_dir, DORADO_DONE_MARKER)],
+            clean_if_stale=[partition_dir], env={"DORADO_EXECUTION_MODE": "sequential"},
+            gpus=config["TOTAL_GPUS_DORADO"],
+        )
+
+        # align_array_job.sh aligns the BAM named on line SGE_TASK_ID of its task list
+        task_list = os.path.join(list_dir, f"{partition}_align.tsv")
+        with open(task_list, "w") as f:
+            f.write(f"{unaligned_bam}\t{partition}_calls\n")
+        aligned_bam = os.path.join(aligned_dir, f"{partition}_calls_aligned.bam")
+        add_stage(
+            f"align_{partition}",
+            ["bash", "-l", os.path.join(scripts_dir, "align_array_job.sh"), task_list, aligned_dir,
+             config["ANNOTATION_FILE"], config["REFERENCE_FILE"], config["ALIGN_THREADS"], config["ALIGN_MODE"],
+             config["KEEP_FULL_BAM"]],
+            [f"dorado_{partition}"], config["TOTAL_CPUS_ALIGN"], config["ALIGN_JOB_MEMORY"],
+            config["ALIGN_JOB_RUNTIME"], align_params,
+            inputs=[config["ANNOTATION_FILE"], config["REFERENCE_FILE"]], outputs=[aligned_bam], clean=[aligned_bam],
+            env={"SGE_TASK_ID": "1"},
+        )
+        align_stages.append(f"align_{partition}")
+
+    # Streaming alignment writes coordinate-sorted BAMs, which the merge job combines with a single k-way merge
+    merge_mode = "sorted" if config["ALIGN_MODE"] == "streaming" else "classic"
+    sorted_bam = os.path.join(aligned_dir, f"{config['GROUP']}_{config['SAMPLE']}.bam")
+    primary_bam = os.path.join(aligned_dir, f"{config['GROUP']}_{config['SAMPLE']}_primary.bam")
+    add_stage(
+        "merge",
+        ["bash", "-l", os.path.join(scripts_dir, "merge_job.sh"), aligned_dir, config["SAMPLE"], config["GROUP"],
+         config["MERGE_THREADS"], merge_mode, config["KEEP_FULL_BAM"]],
+        align_stages, config["TOTAL_CPUS_MERGE"], config["MERGE_JOB_MEMORY"], config["MERGE_JOB_RUNTIME"],
+        {"merge_mode": merge_mode, "keep_full_bam": config["KEEP_FULL_BAM"]},
+        outputs=[primary_bam],
+        clean=[os.path.join(aligned_dir, "final_merged.bam"), sorted_bam, f"{sorted_bam}.bai", primary_bam,
+               f"{primary_bam}.bai"],
+    )
+
+    # modkit_job.sh runs its shards as local worker processes; its array mode would escape the DAG
+    modkit_dir = config["MODKIT_OUTPUT_DIR"]
+    bam_basename = os.path.basename(primary_bam)[:-len(".bam")]
+    modkit_params = {name: config[name] for name in REQUIRED_ENV if name.startswith(("FILTER_", "MOD_THRESHOLD_"))}
+    modkit_params.update({name: config[name] for name in ["MODIFIED_BASES", "VALID_COVERAGE_THRESHOLD",
+                                                          "PERCENT_MODIFIED_THRESHOLD", "MODKIT_SHARDS",
+                                                          "MODKIT_FILTER_MODE"]})
+    add_stage(
+        "modkit",
+        ["bash", "-l", os.path.join(scripts_dir, "modkit_job.sh"), config["GROUP"], config["SAMPLE"],
+         config["MODIFIED_BASES"], config["ALL_MODS"], aligned_dir, modkit_dir,
+         config["FILTER_THRESHOLD_ALL"], config["FILTER_THRESHOLD_A"], config["FILTER_THRESHOLD_C"],
+         config["FILTER_THRESHOLD_T"], config["MOD_THRESHOLD_M6A"], config["MOD_THRESHOLD_PSEU"],
+         config["MOD_THRESHOLD_INOSINE"], config["MOD_THRESHOLD_M5C"], config["VALID_COVERAGE_THRESHOLD"],
+         config["PERCENT_MODIFIED_THRESHOLD"], config["MODKIT_THREADS"], config["MODKIT_SHARDS"], "local"],
+        ["merge"], config["TOTAL_CPUS_MODKIT"], config["MODKIT_JOB_MEMORY"], config["MODKIT_JOB_RUNTIME"],
+        modkit_params,
+        outputs=[os.path.join(modkit_dir, f"{bam_basename}.bed")],
+        clean=[os.path.join(modkit_dir, f"{bam_basename}.bed"), os.path.join(modkit_dir, f"{bam_basename}_pileup_shards")],
+    )
+    return stages
+
+def save_plan(plan, state_dir):
+    """
+    Atomically write the plan to the state directory.
+
+    Args:
+        plan (dict): Result of `build_plan`.
+        state_dir (str): Directory holding the plan.
+    """
+    plan_path = os.path.join(state_dir, PLAN_FILE)
+    with open(f"{plan_path}.tmp", "w") as f:
+        json.dump({"version": 1, "stages": plan}, f, indent=4)
+    os.replace(f"{plan_path}.tmp", plan_path)
+
+def load_plan(state_dir):
+    """
+    Load the plan written by `save_plan`.
+
+    Args:
+        state_dir (str): Directory holding the plan.
+
+    Returns:
+        dict: Dictionary mapping stage names to stage descriptions.
+
+    Raises:
+        SystemExit: If there is no plan.
+    """
+    plan_path = os.path.join(state_dir, PLAN_FILE)
+    if not os.path.isfile(plan_path):
+        print(f"[ERROR] No plan found at '{plan_path}'.")
+        sys.exit(1)
+    with open(plan_path) as f:
+        return json.load(f)["stages"]
+
+def marker_path(state_dir, name):
+    """
+    Return the path of the completion marker of a stage.
+
+    Args:
+        state_dir (str): State directory.
+        name (str): Stage name.
+
+    Returns:
+        str: Marker path.
+    """
+    return os.path.join(state_dir, MARKER_DIR, f"{name}.done")
+
+def read_marker(state_dir, name):
+    """
+    Read the completion marker of a stage.
+
+    Args:
+        state_dir (str): State directory.
+        name (str): Stage name.
+
+    Returns:
+        dict or None: The marker, or None if the stage has none.
+    """
+    try:
+        with open(marker_path(state_dir, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def marker_matches(plan, state_dir, name):
+    """
+    Check whether a stage has a completion marker for its current fingerprint.
+
+    Args:
+        plan (dict): Stages of the plan.
+        state_dir (str): State directory.
+        name (str): Stage name.
+
+    Returns:
+        bool: True if the marker exists and matches.
+    """
+    marker = read_marker(state_dir, name)
+    return marker is not None and marker.get("fingerprint") == plan[name]["fingerprint"]
+
+def stages_to_run(plan, state_dir):
+    """
+    Decide which stages need to run.
+
+    A stage is done when its marker matches its fingerprint and either its outputs exist or every stage that depends
+    on it is done (its outputs were consumed). A stage runs when it is not done or when one of its dependencies runs.
+
+    Args:
+        plan (dict): Stages in topological order.
+        state_dir (str): State directory.
+
+    Returns:
+        list of str: Names of the stages to run, in topological order.
+    """
+    dependents = {name: [] for name in plan}
+    for name, stage in plan.items():
+        for dep in stage["deps"]:
+            dependents[dep].append(name)
+
+    done = {}
+    for name in reversed(list(plan)):
+        outputs_exist = all(os.path.exists(path) for path in plan[name]["outputs"])
+        consumed = bool(dependents[name]) and all(done[dependent] for dependent in dependents[name])
+        done[name] = marker_matches(plan, state_dir, name) and (outputs_exist or consumed)
+
+    to_run = []
+    for name, stage in plan.items():
+        if not done[name] or any(dep in to_run for dep in stage["deps"]):
+            to_run.append(name)
+    return to_run
+
+def remove_path(path):
+    """
+    Remove a file, symbolic link or directory tree if it exists.
+
+    Args:
+        path (str): Path to remove.
+    """
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+def execute_stage(plan, state_dir, name, log_file=None, extra_env=None):
+    """
+    Run one stage and write its completion marker on success.
+
+    Args:
+        plan (dict): Stages of the plan.
+        state_dir (str): State directory.
+        name (str): Stage name.
+        log_file (str, optional): File receiving the stage's output. Defaults to the current stdout.
+        extra_env (dict, optional): Additional environment variables (e.g. CUDA_VISIBLE_DEVICES).
+
+    Returns:
+        int: Exit code of the stage (1 if a dependency is not done or an output is missing).
+    """
+    stage = plan[name]
+    for dep in stage["deps"]:
+        if not marker_matches(plan, state_dir, dep):
+            print(f"[ERROR] Stage '{name}' cannot run: dependency '{dep}' is not done.")
+            return 1
+
+    # A failed or interrupted run must never leave a matching marker behind
+    stale = read_marker(state_dir, name) is not None
+    if stale:
+        os.remove(marker_path(state_dir, name))
+    for path in stage["clean"] + (stage["clean_if_stale"] if stale else []):
+        remove_path(path)
+
+    env = dict(os.environ)
+    env.setdefault("JOB_NAME", name)
+    env.setdefault("JOB_ID", "local")
+    env.update(stage["env"])
+    env.update(extra_env or {})
+
+    start_time = time.time()
+    if log_file:
+        with open(log_file, "a") as log:
+            returncode = subprocess.run(stage["command"], env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    else:
+        returncode = subprocess.run(stage["command"], env=env).returncode
+    runtime = time.time() - start_time
+
+    if returncode != 0:
+        print(f"[ERROR] Stage '{name}' failed with exit code {returncode} after {runtime:.0f} seconds.")
+        return returncode
+    missing = [path for path in stage["outputs"] if not os.path.exists(path)]
+    if missing:
+        print(f"[ERROR] Stage '{name}' finished but did not write: {', '.join(missing)}")
+        return 1
+
+    os.makedirs(os.path.join(state_dir, MARKER_DIR), exist_ok=True)
+    with open(f"{marker_path(state_dir, name)}.tmp", "w") as f:
+        json.dump({"fingerprint": stage["fingerprint"], "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "runtime_seconds": round(runtime, 1)}, f)
+    os.replace(f"{marker_path(state_dir, name)}.tmp", marker_path(state_dir, name))
+    print(f"[INFO] Stage '{name}' completed in {runtime:.0f} seconds.")
+    return 0
+
+def detect_gpus():
+    """
+    List the GPU devices available to local stages.
+
+    Returns:
+        list of str: Device indices from CUDA_VISIBLE_DEVICES, or from nvidia-smi; empty if there are none.
+    """
+    if os.environ.get("CUDA_VISIBLE_DEVICES"):
+        return [device for device in os.environ["CUDA_VISIBLE_DEVICES"].split(",") if device]
+    try:
+        result = subprocess.run(["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+                                capture_output=True, text=True, check=True)
+        return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    except (OSError, subprocess.CalledProcessError):
+        return []
+
+def run_local(plan, state_dir, to_run, cpus, memory_gb, gpu_devices):
+    """
+    Run the stages in a local process pool within CPU, memory and GPU budgets.
+
+    Requests larger than a budget are reduced to the budget, so that such a stage runs on its own.
+
+    Args:
+        plan (dict): Stages of the plan.
+        state_dir (str): State directory.
+        to_run (list of str): Stages to run, in topological order.
+        cpus (int): CPU budget.
+        memory_gb (float): Memory budget in GB.
+        gpu_devices (list of str): GPU devices available to the stages.
+
+    Returns:
+        list of str: Stages that failed or were not run because a dependency failed.
+    """
+    log_dir = os.path.join(state_dir, LOG_DIR)
+    os.makedirs(log_dir, exist_ok=True)
+
+    requests = {}
+    for name in to_run:
+        stage = plan[name]
+        request = (min(stage["cpus"], cpus), min(stage["memory_gb"], memory_gb), min(stage["gpus"], len(gpu_devices)))
+        if request != (stage["cpus"], stage["memory_gb"], stage["gpus"]):
+            print(f"[WARNING] Stage '{name}' requests {stage['cpus']} CPUs, {stage['memory_gb']:.0f} GB and "
+                  f"{stage['gpus']} GPUs; running it with {request[0]} CPUs, {request[1]:.0f} GB and {request[2]} GPUs.")
+        requests[name] = request
+
+    free_cpus, free_memory, free_gpus = cpus, memory_gb, list(gpu_devices)
+    pending = list(to_run)
+    finished, failed = set(), []
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(len(to_run), 1)) as executor:
+        while pending or running:
+            for name in list(pending):
+                deps = [dep for dep in plan[name]["deps"] if dep in to_run]
+                if any(dep in failed for dep in deps):
+                    print(f"[WARNING] Not running '{name}': a dependency failed.")
+                    pending.remove(name)
+                    failed.append(name)
+                    continue
+                if not all(dep in finished for dep in deps):
+                    continue
+                stage_cpus, stage_memory, stage_gpus = requests[name]
+                if stage_cpus > free_cpus or stage_memory > free_memory or stage_gpus > len(free_gpus):
+                    continue
+
+                devices = free_gpus[:stage_gpus]
+                free_gpus = free_gpus[stage_gpus:]
+                free_cpus -= stage_cpus
+                free_memory -= stage_memory
+                extra_env = {"CUDA_VISIBLE_DEVICES": ",".join(devices)} if devices else None
+                log_file = os.path.join(log_dir, f"{name}.log")
+                print(f"[INFO] Starting '{name}' ({stage_cpus} CPUs, {stage_memory:.0f} GB"
+                      f"{', GPU(s) ' + ','.join(devices) if devices else ''}); log: {log_file}")
+                future = executor.submit(execute_stage, plan, state_dir, name, log_file, extra_env)
+                running[future] = (name, devices)
+                pending.remove(name)
+
+            if not running:
+                break
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                name, devices = running.pop(future)
+                stage_cpus, stage_memory, _ = requests[name]
+                free_cpus += stage_cpus
+                free_memory += stage_memory
+                free_gpus += devices
+                if future.result() == 0:
+                    finished.add(name)
+                    print(f"[INFO] Finished '{name}' ({len(finished)}/{len(to_run)}).")
+                else:
+                    failed.append(name)
+                    print(f"[ERROR] '{name}' failed; see {os.path.join(log_dir, name + '.log')}")
+    return failed
+
+def run_sge(plan, state_dir, to_run, config):
+    """
+    Submit the stages as SGE jobs, each held on the jobs of its dependencies.
+
+    Args:
+        plan (dict): Stages of the plan.
+        state_dir (str): State directory.
+        to_run (list of str): Stages to run, in topological order.
+        config (dict): Pipeline configuration.
+
+    Returns:
+        dict: Dictionary mapping stage names to job IDs.
+
+    Raises:
+        SystemExit: If a submission fails.
+    """
+    log_dir = os.path.join(state_dir, LOG_DIR)
+    os.makedirs(log_dir, exist_ok=True)
+    job_ids = {}
+    for name in to_run:
+        stage = plan[name]
+        command = ["qsub", "-terse", "-V", "-N", f"{name}_{config['GROUP']}_{config['SAMPLE']}",
+                   "-l", f"h_rt={stage['runtime']}", "-l", f"mem_free={stage['memory']}", "-pe", "omp", str(stage["cpus"])]
+        if config["QSUB_PROJECT"]:
+            command += ["-P", config["QSUB_PROJECT"]]
+        if stage["gpus"]:
+            command += ["-l", f"gpus={stage['gpus']}", "-l", f"gpu_type={config['DORADO_GPU_TYPE']}"]
+        command += ["-m", config["QSUB_EMAIL"], "-j", config["QSUB_JOINT_STDERR"], "-o", os.path.join(log_dir, f"{name}.log")]
+        holds = [job_ids[dep] for dep in stage["deps"] if dep in job_ids]
+        if holds:
+            command += ["-hold_jid", ",".join(holds)]
+        command += ["-b", "y", "python3", os.path.abspath(__file__), "run_stage", state_dir, name]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"[ERROR] Failed to submit '{name}': {e}")
+            sys.exit(1)
+        job_ids[name] = result.stdout.strip().split(".")[0]
+        print(f"[INFO] Submitted '{name}' as job {job_ids[name]}" + (f" (held on {', '.join(holds)})" if holds else ""))
+    return job_ids
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Run the RNA pipeline as a DAG of resumable stages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Plan the DAG and run the stages that are not done.")
+    run_parser.add_argument("state_dir", type=str, help="Directory for the plan, markers and logs.")
+    run_parser.add_argument("--backend", choices=["local", "sge"], default="local", help="Local process pool or SGE jobs.")
+    run_parser.add_argument("--cpus", type=int, default=os.cpu_count(), help="Local CPU budget.")
+    run_parser.add_argument("--memory_gb", type=float, default=None, help="Local memory budget in GB.")
+    run_parser.add_argument("--gpus", type=int, default=None, help="Local GPU budget.")
+    run_parser.add_argument("--dry_run", action="store_true", help="Only print which stages would run.")
+
+    stage_parser = subparsers.add_parser("run_stage", help="Run one stage of a plan (used by SGE jobs).")
+    stage_parser.add_argument("state_dir", type=str, help="Directory holding the plan.")
+    stage_parser.add_argument("stage", type=str, help="Stage name.")
+
+    args = parser.parse_args()
+    state_dir = os.path.abspath(args.state_dir)
+
+    if args.command == "run_stage":
+        plan = load_plan(state_dir)
+        if args.stage not in plan:
+            print(f"[ERROR] Unknown stage '{args.stage}'.")
+            sys.exit(1)
+        sys.exit(execute_stage(plan, state_dir, args.stage))
+
+    config = load_config()
+    os.makedirs(state_dir, exist_ok=True)
+    plan = build_plan(config, state_dir)
+    save_plan(plan, state_dir)
+    to_run = stages_to_run(plan, state_dir)
+
+    print("=============================================")
+    print(f"Pipeline DAG for {config['GROUP']}_{config['SAMPLE']} ({args.backend} backend)")
+    print(f"State Directory: {state_dir}")
+    print(f"Stages: {len(plan)} ({len(plan) - len(to_run)} done, {len(to_run)} to run)")
+    print("=============================================")
+    for name in plan:
+        print(f"  {'run ' if name in to_run else 'done'}  {name}")
+
+    if args.dry_run or not to_run:
+        if not to_run:
+            print("[INFO] All stages are done.")
+        return
+
+    if args.backend == "sge":
+        run_sge(plan, state_dir, to_run, config)
+        print("[INFO] All stages submitted.")
+        return
+
+    memory_gb = args.memory_gb
+    if memory_gb is None:
+        memory_gb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    gpu_devices = detect_gpus()
+    if args.gpus is not None:
+        gpu_devices = gpu_devices[:args.gpus] if len(gpu_devices) >= args.gpus else [str(idx) for idx in range(args.gpus)]
+    print(f"[INFO] Local budget: {args.cpus} CPUs, {memory_gb:.0f} GB, {len(gpu_devices)} GPU(s)")
+
+    failed = run_local(plan, state_dir, to_run, args.cpus, memory_gb, gpu_devices)
+    if failed:
+        print(f"[ERROR] {len(failed)} stage(s) did not complete: {', '.join(failed)}. Re-run to resume.")
+        sys.exit(1)
+    print("[INFO] All stages completed successfully.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Description:
+    Helpers for estimating the GPU basecalling cost of `.pod5` files. Dorado's runtime scales with the number of
+    signal samples it has to process rather than with the on-disk size of a file, because compression ratios differ
+    between runs. This module reads per-file read counts and signal sample counts from pod5 metadata, converts them
+    into estimated basecalling seconds, and calibrates the samples/second rate from the runtimes logged by
+    `dorado_job.sh`.
+
+Key Features:
+    - **Metadata Extraction:** Reads `num_reads` and the total `num_samples` of each file from the pod5 read table,
+      without touching the signal data.
+    - **Parallel Collection:** Collects metadata for many files concurrently using a thread pool.
+    - **Calibration:** Fits `seconds = overhead + num_samples / samples_per_second` to the per-partition runtimes
+      recorded in one or more `dorado_runtimes.log` files.
+
+Requirements:
+    - The `pod5` Python package (only needed for metadata extraction, not for calibration).
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Leading column names of the tab-separated runtime log written by dorado_job.sh (later columns describe staging)
+RUNTIME_LOG_COLUMNS = ["partition", "runtime_seconds", "num_samples", "num_reads", "size_bytes"]
+
+def read_pod5_stats(file_path):
+    """
+    Read the number of reads and the total number of signal samples of a single .pod5 file.
+
+    Args:
+        file_path (str): Path to the .pod5 file.
+
+    Returns:
+        dict: Dictionary with the keys `num_reads` and `num_samples`.
+    """
+    import pod5
+
+    num_reads = 0
+    num_samples = 0
+    with pod5.Reader(file_path) as reader:
+        read_table = reader.read_table
+        for batch_idx in range(read_table.num_record_batches):
+            batch = read_table.get_batch(batch_idx)
+            num_reads += batch.num_rows
+            num_samples += int(batch.column("num_samples").to_numpy().sum())
+
+    return {"num_reads": num_reads, "num_samples": num_samples}
+
+def collect_pod5_stats(file_dict, max_workers=8):
+    """
+    Collect read and sample counts for every file in parallel.
+
+    Files whose metadata cannot be read are estimated from their size using the mean samples/byte ratio of the
+    files that could be read, so that a single damaged file does not abort the partitioning.
+
+    Args:
+        file_dict (dict): Dictionary mapping file paths to their sizes in bytes.
+        max_workers (int): Number of threads used to read metadata.
+
+    Returns:
+        dict: Dictionary mapping file paths to dictionaries with `size_bytes`, `num_reads` and `num_samples`.
+
+    Raises:
+        SystemExit: If the `pod5` package is not installed.
+    """
+    try:
+        import pod5  # noqa: F401
+    except ImportError:
+        print("[ERROR] The 'pod5' package is required for the samples cost model. Install it with 'pip install pod5'.")
+        sys.exit(1)
+
+    stats = {}
+    failed = []
+
+    def _read(file_path):
+        try:
+            return file_path, read_pod5_stats(file_path)
+        except Exception as e:
+            print(f"[WARNING] Unable to read pod5 metadata from '{file_path}': {e}")
+            return file_path, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_path, file_stats in executor.map(_read, file_dict):
+            if file_stats is None:
+                failed.append(file_path)
+            else:
+                file_stats["size_bytes"] = file_dict[file_path]
+                stats[file_path] = file_stats
+
+    if failed:
+        read_bytes = sum(s["size_bytes"] for s in stats.values())
+        read_samples = sum(s["num_samples"] for s in stats.values())
+        read_reads = sum(s["num_reads"] for s in stats.values())
+        samples_per_byte = read_samples / read_bytes if read_bytes else 0.0
+        reads_per_byte = read_reads / read_bytes if read_bytes else 0.0
+        print(f"[WARNING] Estimating sample counts of {len(failed)} file(s) from their size ({samples_per_byte:.3f} samples/byte).")
+        for file_path in failed:
+            size_bytes = file_dict[file_path]
+            stats[file_path] = {
+                "size_bytes": size_bytes,
+                "num_reads": int(round(size_bytes * reads_per_byte)),
+                "num_samples": int(round(size_bytes * samples_per_byte)),
+            }
+
+    return stats
+
+def estimate_seconds(num_samples, samples_per_second, overhead_seconds=0.0):
+    """
+    Estimate the Dorado runtime for a given number of signal samples.
+
+    Args:
+        num_samples (int): Number of signal samples.
+        samples_per_second (float): Calibrated basecalling throughput.
+        overhead_seconds (float): Fixed per-partition overhead (model loading, staging).
+
+    Returns:
+        float: Estimated runtime in seconds.
+    """
+    return overhead_seconds + num_samples / samples_per_second
+
+def read_runtime_log(log_file):
+    """
+    Read the per-partition runtimes recorded by dorado_job.sh.
+
+    Args:
+        log_file (str): Path to a `dorado_runtimes.log` file.
+
+    Returns:
+        list of dict: One record per partition with the columns listed in RUNTIME_LOG_COLUMNS.
+    """
+    records = []
+    with open(log_file) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if not line.strip() or fields[0] == RUNTIME_LOG_COLUMNS[0]:
+                continue
+            if len(fields) < len(RUNTIME_LOG_COLUMNS):
+                print(f"[WARNING] Skipping malformed line in '{log_file}': {line.strip()}")
+                continue
+            record = {"partition": fields[0]}
+            try:
+                for key, value in zip(RUNTIME_LOG_COLUMNS[1:], fields[1:]):
+                    record[key] = float(value) if value else None
+            except ValueError:
+                print(f"[WARNING] Skipping malformed line in '{log_file}': {line.strip()}")
+                continue
+            records.append(record)
+    return records
+
+def calibrate_samples_per_second(log_files):
+    """
+    Calibrate the basecalling throughput from past Dorado runtimes.
+
+    Fits `seconds = overhead + num_samples / samples_per_second` by least squares over all partitions that have a
+    sample count. With fewer than two distinct sample counts, or if the fitted overhead is negative, the overhead is
+    fixed at zero and the rate is the ratio of total samples to total seconds.
+
+    Args:
+        log_files (list of str): Paths to `dorado_runtimes.log` files.
+
+    Returns:
+        tuple: (samples_per_second, overhead_seconds, number_of_partitions_used).
+
+    Raises:
+        SystemExit: If no usable runtime records are found.
+    """
+    points = []
+    for log_file in log_files:
+        for record in read_runtime_log(log_file):
+            if record["num_samples"] and record["runtime_seconds"]:
+                points.append((record["num_samples"], record["runtime_seconds"]))
+
+    if not points:
+        print("[ERROR] No runtime records with sample counts were found for calibration.")
+        sys.exit(1)
+
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+
+    if n >= 2 and var_x > 0:
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        overhead = mean_y - slope * mean_x
+        if slope > 0 and overhead >= 0:
+            return 1.0 / slope, overhead, n
+
+    return sum(x for x, _ in points) / sum(y for _, y in points), 0.0, n
+
+def format_duration(seconds):
+    """
+    Format a duration in seconds as an SGE `h_rt` string (H:MM:SS).
+
+    Args:
+        seconds (float): Duration in seconds.
+
+    Returns:
+        str: Duration formatted as H:MM:SS.
+    """
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibrate Dorado samples/second from dorado_runtimes.log files.")
+    parser.add_argument("log_files", type=str, nargs="+", help="One or more dorado_runtimes.log files.")
+    args = parser.parse_args()
+
+    rate, overhead, used = calibrate_samples_per_second([os.path.abspath(f) for f in args.log_files])
+    print(f"[INFO] Partitions used for calibration: {used}")
+    print(f"[INFO] Samples per second: {rate:.1f}")
+    print(f"[INFO] Per-partition overhead: {overhead:.1f} seconds")
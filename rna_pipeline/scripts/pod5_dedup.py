@@ -0,0 +1,197 @@
+"""
+Description:
+    Content-based duplicate detection for the files found by `pod5_scanner.scan_files`. Re-copied acquisitions often
+    hold byte-identical `.pod5` files under other names or directories, and basecalling them twice wastes GPU time,
+    while files that merely share a name with another file are distinct data and must be kept.
+
+Key Features:
+    - **Size First:** Only files whose size matches another file's are hashed at all.
+    - **Partial, then Full Hash:** Files of equal size are compared by a BLAKE2b hash of their first and last MiB,
+      and only files whose partial hashes also match are hashed in full. Hashes are computed in a thread pool.
+    - **Persistent Hash Cache:** An optional JSON cache stores the hashes of every file keyed by path, size and
+      modification time, so unchanged files are never read again.
+    - **Stable Choice:** Of each group of identical files, a preferred file (e.g. one already partitioned) is kept,
+      otherwise the first path in sorted order.
+
+Usage:
+    from pod5_dedup import find_duplicates
+    kept, duplicates = find_duplicates(files, cache_file="pod5_hash_cache.json")
+    # files maps paths to FileInfo(size, mtime_ns); duplicates maps each skipped path to the path that was kept
+"""
+
+import os
+import json
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_VERSION = 1
+
+# Bytes hashed at the start and at the end of a file for the partial hash
+PARTIAL_HASH_BYTES = 1024 * 1024
+
+# Block size for full hashes
+HASH_BLOCK_BYTES = 8 * 1024 * 1024
+
+def load_hash_cache(cache_file):
+    """
+    Load a hash cache written by `save_hash_cache`.
+
+    Args:
+        cache_file (str): Path to the JSON cache file.
+
+    Returns:
+        dict: Dictionary mapping file paths to cached entries. Empty if the cache is missing or unreadable.
+    """
+    if not cache_file or not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Ignoring unreadable hash cache '{cache_file}': {e}")
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("files", {})
+
+def save_hash_cache(cache_file, entries):
+    """
+    Atomically write the hash cache.
+
+    Args:
+        cache_file (str): Path to the JSON cache file.
+        entries (dict): Dictionary mapping file paths to entries.
+    """
+    tmp_file = f"{cache_file}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump({"version": CACHE_VERSION, "files": entries}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"[WARNING] Unable to save hash cache '{cache_file}': {e}")
+
+def partial_hash(file_path, size):
+    """
+    Hash the size and the first and last `PARTIAL_HASH_BYTES` of a file.
+
+    Args:
+        file_path (str): Path to the file.
+        size (int): Size of the file in bytes.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, "rb") as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            f.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+def full_hash(file_path):
+    """
+    Hash the whole content of a file.
+
+    Args:
+        file_path (str): Path to the file.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _group_by_hash(paths, files, cache, kind, hash_function, executor):
+    """
+    Group files by a hash, reading cached hashes where the file is unchanged.
+
+    Args:
+        paths (list of str): Files to hash.
+        files (dict): Dictionary mapping paths to FileInfo(size, mtime_ns).
+        cache (dict): Hash cache entries; updated in place.
+        kind (str): `partial` or `full`.
+        hash_function (callable): Function computing the hash of one path.
+        executor (ThreadPoolExecutor): Thread pool.
+
+    Returns:
+        tuple: (list of lists of paths sharing a hash, number of files read).
+    """
+    groups = defaultdict(list)
+    to_hash = []
+    for path in paths:
+        entry = cache.get(path)
+        if entry and entry["size"] == files[path].size and entry["mtime_ns"] == files[path].mtime_ns and entry.get(kind):
+            groups[entry[kind]].append(path)
+        else:
+            to_hash.append(path)
+
+    def _hash(path):
+        try:
+            return path, hash_function(path)
+        except OSError as e:
+            print(f"[WARNING] Unable to read '{path}' for duplicate detection: {e}")
+            return path, None
+
+    for path, value in executor.map(_hash, to_hash):
+        if value is None:
+            continue
+        entry = cache.get(path)
+        if not entry or entry["size"] != files[path].size or entry["mtime_ns"] != files[path].mtime_ns:
+            entry = cache[path] = {"size": files[path].size, "mtime_ns": files[path].mtime_ns}
+        entry[kind] = value
+        groups[value].append(path)
+
+    return [group for group in groups.values() if len(group) > 1], len(to_hash)
+
+def find_duplicates(files, cache_file=None, max_workers=8, preferred=None):
+    """
+    Find files with identical content.
+
+    Args:
+        files (dict): Dictionary mapping paths to FileInfo(size, mtime_ns), as returned by `scan_files`.
+        cache_file (str, optional): Path to a persistent JSON hash cache. Created if missing.
+        max_workers (int): Number of threads hashing files concurrently.
+        preferred (set, optional): Paths kept in preference to other copies of the same content.
+
+    Returns:
+        tuple: (list of kept paths in sorted order, dictionary mapping every duplicate path to the path kept instead).
+    """
+    preferred = preferred or set()
+    cache = load_hash_cache(cache_file)
+
+    # Empty files (e.g. just created by MinKNOW) carry no data and are never reported as duplicates
+    by_size = defaultdict(list)
+    for path, info in files.items():
+        if info.size > 0:
+            by_size[info.size].append(path)
+    candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+
+    duplicates = {}
+    hashed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        same_partial, read_partial = _group_by_hash(candidates, files, cache, "partial",
+                                                    lambda path: partial_hash(path, files[path].size), executor)
+        hashed += read_partial
+
+        same_content, read_full = _group_by_hash([path for group in same_partial for path in group], files, cache,
+                                                 "full", full_hash, executor)
+        hashed += read_full
+
+    for group in same_content:
+        kept = min(group, key=lambda path: (path not in preferred, path))
+        for path in group:
+            if path != kept:
+                duplicates[path] = kept
+
+    if cache_file and hashed:
+        # Keep the entries of files that were not part of this scan so one cache can serve several directories
+        save_hash_cache(cache_file, cache)
+
+    print(f"[INFO] Duplicate detection: {len(candidates)} file(s) share a size with another file, {hashed} hash(es) "
+          f"computed, {len(duplicates)} duplicate(s) found.")
+    return sorted(path for path in files if path not in duplicates), duplicates
@@ -0,0 +1,356 @@
+"""
+Description:
+    Persistent read-ID index for `.pod5` files. The index maps every read ID to the file, record batch and row that
+    hold the read, so that the reads of a list of read IDs (e.g. for Remora training, Bonito evaluation or targeted
+    re-basecalling) can be copied into new pod5 files without reading any file that does not contain one of them.
+
+Key Features:
+    - **SQLite Store:** Read IDs are stored as 16-byte keys of a `WITHOUT ROWID` table, next to a table of indexed
+      files with their size and modification time. Lookups are B-tree searches; no server is needed.
+    - **Parallel Scan:** Files are found with the parallel scanner of `pod5_scanner.py` (optionally with its scan
+      cache), and read tables are read by a process pool. Only the read table is read, not the signal.
+    - **Incremental Updates:** A file is indexed again only if its size or modification time changed; files that
+      disappeared from the scanned directories are removed from the index. Each file is committed in its own
+      transaction, so an interrupted build keeps the files indexed so far. Files that cannot be read (e.g. still
+      being written by MinKNOW) are skipped with a warning and picked up by the next build.
+    - **Subset Extraction:** `extract` groups the requested read IDs by file and reads only the record batches that
+      contain them, then writes the reads to a new pod5 file (or several, with `--max_reads_per_file`).
+
+Usage:
+    python pod5_index.py build <index_db> <source_dir> [<source_dir> ...] [--workers <N>] [--scan_cache <cache.json>]
+    python pod5_index.py lookup <index_db> <read_ids_file>
+    python pod5_index.py extract <index_db> <read_ids_file> <output_pod5> [--max_reads_per_file <N>]
+
+Arguments:
+    index_db             : SQLite index file; created by `build` if missing.
+    source_dir           : Directories searched recursively for `.pod5` files.
+    read_ids_file        : Text file with one read ID per line (further tab-separated columns and a `read_id`
+                           header line are ignored).
+    output_pod5          : Output pod5 file. With `--max_reads_per_file`, outputs are numbered `<name>_<i>.pod5`.
+    --workers            : (Optional) Number of processes reading pod5 files. Defaults to 8.
+    --scan_cache         : (Optional) Persistent scan cache of `pod5_scanner.py`.
+    --max_reads_per_file : (Optional) Maximum number of reads per output file.
+
+Requirements:
+    - The `pod5` Python package for `build` and `extract`.
+"""
+
+import os
+import sys
+import uuid
+import sqlite3
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from pod5_scanner import scan_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    num_reads INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reads (
+    read_id BLOB NOT NULL,
+    file_id INTEGER NOT NULL,
+    batch INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (read_id, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS reads_by_file ON reads (file_id);
+"""
+
+# Number of read IDs looked up per query
+LOOKUP_BATCH = 500
+
+def open_index(index_db):
+    """
+    Open (and if needed create) an index database.
+
+    Args:
+        index_db (str): Path to the SQLite file.
+
+    Returns:
+        sqlite3.Connection: Open connection.
+    """
+    connection = sqlite3.connect(index_db)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+def read_file_index(file_path):
+    """
+    Read the read ID, record batch and row of every read of a pod5 file. Runs in a worker process.
+
+    Args:
+        file_path (str): Path to the pod5 file.
+
+    Returns:
+        tuple: (file_path, list of (read_id bytes, batch, row)), or (file_path, None) if the file cannot be read.
+    """
+    import pod5
+
+    try:
+        entries = []
+        with pod5.Reader(file_path) as reader:
+            read_table = reader.read_table
+            for batch_idx in range(read_table.num_record_batches):
+                column = read_table.get_batch(batch_idx).column("read_id")
+                read_ids = getattr(column, "storage", column).to_pylist()
+                entries.extend((read_id, batch_idx, row) for row, read_id in enumerate(read_ids))
+        return file_path, entries
+    except Exception as e:
+        print(f"[WARNING] Unable to index '{file_path}': {e}")
+        return file_path, None
+
+def build_index(index_db, source_dirs, workers=8, scan_cache=None):
+    """
+    Add new and changed pod5 files below the source directories to the index, and remove vanished ones.
+
+    Args:
+        index_db (str): Path to the SQLite file.
+        source_dirs (list of str): Directories searched recursively for `.pod5` files.
+        workers (int): Number of processes reading pod5 files.
+        scan_cache (str or None): Persistent scan cache of `pod5_scanner.py`.
+
+    Returns:
+        dict: Counts of `indexed`, `unchanged`, `removed` and `failed` files.
+
+    Raises:
+        SystemExit: If the `pod5` package is not installed.
+    """
+    try:
+        import pod5  # noqa: F401
+    except ImportError:
+        print("[ERROR] The 'pod5' package is required to index pod5 files. Install it with 'pip install pod5'.")
+        sys.exit(1)
+
+    found = {}
+    for source_dir in source_dirs:
+        found.update(scan_files(source_dir, suffix=".pod5", cache_file=scan_cache))
+
+    connection = open_index(index_db)
+    known = {path: (file_id, size, mtime_ns)
+             for file_id, path, size, mtime_ns in connection.execute("SELECT file_id, path, size, mtime_ns FROM files")}
+    roots = [os.path.abspath(d).rstrip(os.sep) + os.sep for d in source_dirs]
+
+    counts = {"indexed": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    to_index = []
+    for path, info in found.items():
+        entry = known.get(path)
+        if entry is not None and entry[1:] == (info.size, info.mtime_ns):
+            counts["unchanged"] += 1
+        else:
+            to_index.append(path)
+
+    # Files below a scanned directory that no longer exist
+    for path, (file_id, _, _) in known.items():
+        if path not in found and any(path.startswith(root) for root in roots):
+            with connection:
+                connection.execute("DELETE FROM reads WHERE file_id = ?", (file_id,))
+                connection.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+            counts["removed"] += 1
+
+    print(f"[INFO] {len(found)} pod5 file(s) found; indexing {len(to_index)} new or changed file(s).")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, entries in executor.map(read_file_index, to_index):
+            if entries is None:
+                counts["failed"] += 1
+                continue
+            info = found[path]
+            with connection:
+                if path in known:
+                    connection.execute("DELETE FROM reads WHERE file_id = ?", (known[path][0],))
+                    connection.execute("DELETE FROM files WHERE file_id = ?", (known[path][0],))
+                file_id = connection.execute(
+                    "INSERT INTO files (path, size, mtime_ns, num_reads) VALUES (?, ?, ?, ?)",
+                    (path, info.size, info.mtime_ns, len(entries)),
+                ).lastrowid
+                connection.executemany("INSERT OR IGNORE INTO reads (read_id, file_id, batch, row) VALUES (?, ?, ?, ?)",
+                                       ((read_id, file_id, batch, row) for read_id, batch, row in entries))
+            counts["indexed"] += 1
+
+    total_files, total_reads = connection.execute("SELECT COUNT(*), COALESCE(SUM(num_reads), 0) FROM files").fetchone()
+    connection.close()
+    print(f"[INFO] Indexed {counts['indexed']}, unchanged {counts['unchanged']}, removed {counts['removed']}, "
+          f"failed {counts['failed']} file(s). The index holds {total_reads} reads in {total_files} file(s).")
+    return counts
+
+def load_read_ids(read_ids_file):
+    """
+    Load read IDs from a text file.
+
+    Args:
+        read_ids_file (str): File with one read ID per line in its first tab-separated column.
+
+    Returns:
+        list of bytes: Unique read IDs as 16-byte values, in file order.
+
+    Raises:
+        SystemExit: If a line does not start with a valid read ID.
+    """
+    read_ids = {}
+    with open(read_ids_file) as f:
+        for line_number, line in enumerate(f, 1):
+            field = line.split("\t", 1)[0].strip()
+            if not field or field == "read_id":
+                continue
+            try:
+                read_ids[uuid.UUID(field).bytes] = None
+            except ValueError:
+                print(f"[ERROR] Line {line_number} of '{read_ids_file}' is not a read ID: '{field}'.")
+                sys.exit(1)
+    return list(read_ids)
+
+def lookup_reads(index_db, read_ids):
+    """
+    Look up the location of read IDs.
+
+    Args:
+        index_db (str): Path to the SQLite file.
+        read_ids (list of bytes): Read IDs as 16-byte values.
+
+    Returns:
+        tuple: (dictionary mapping file paths to lists of (batch, row, read_id), list of read IDs not found).
+    """
+    connection = open_index(index_db)
+    paths = dict(connection.execute("SELECT file_id, path FROM files"))
+    locations = defaultdict(list)
+    found = set()
+
+    for start in range(0, len(read_ids), LOOKUP_BATCH):
+        chunk = read_ids[start:start + LOOKUP_BATCH]
+        placeholders = ",".join("?" * len(chunk))
+        query = f"SELECT read_id, file_id, batch, row FROM reads WHERE read_id IN ({placeholders})"
+        for read_id, file_id, batch, row in connection.execute(query, chunk):
+            # A read present in several files (copies) is taken from the first file only
+            if read_id in found:
+                continue
+            found.add(read_id)
+            locations[paths[file_id]].append((batch, row, read_id))
+    connection.close()
+
+    missing = [read_id for read_id in read_ids if read_id not in found]
+    return locations, missing
+
+def extract_reads(locations, output_pod5, max_reads_per_file=None):
+    """
+    Copy reads into new pod5 files, reading only the record batches that hold them.
+
+    Args:
+        locations (dict): Dictionary returned by `lookup_reads`.
+        output_pod5 (str): Output path.
+        max_reads_per_file (int or None): Maximum number of reads per output file.
+
+    Returns:
+        list of str: Paths of the written files.
+    """
+    import pod5
+
+    stem = output_pod5[:-len(".pod5")] if output_pod5.endswith(".pod5") else output_pod5
+    outputs = []
+    writer, written = None, 0
+
+    def open_writer():
+        path = f"{stem}_{len(outputs) + 1}.pod5" if max_reads_per_file else f"{stem}.pod5"
+        outputs.append(path)
+        partial = f"{path[:-len('.pod5')]}.partial.pod5"
+        if os.path.exists(partial):
+            os.remove(partial)
+        return pod5.Writer(partial)
+
+    def close_writer(current):
+        current.close()
+        path = outputs[-1]
+        os.replace(f"{path[:-len('.pod5')]}.partial.pod5", path)
+
+    try:
+        for file_path in sorted(locations):
+            by_batch = defaultdict(list)
+            for batch_idx, row, _ in locations[file_path]:
+                by_batch[batch_idx].append(row)
+            with pod5.Reader(file_path) as reader:
+                for batch_idx in sorted(by_batch):
+                    batch = reader.get_batch(batch_idx)
+                    for row in sorted(by_batch[batch_idx]):
+                        if writer is None or (max_reads_per_file and written >= max_reads_per_file):
+                            if writer is not None:
+                                close_writer(writer)
+                            writer, written = open_writer(), 0
+                        writer.add_read(batch.get_read(row).to_read())
+                        written += 1
+    finally:
+        if writer is not None:
+            close_writer(writer)
+    return outputs
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Build and query a read-ID index of pod5 files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Add new and changed pod5 files to the index.")
+    build_parser.add_argument("index_db", type=str, help="SQLite index file.")
+    build_parser.add_argument("source_dirs", type=str, nargs="+", help="Directories searched for .pod5 files.")
+    build_parser.add_argument("--workers", type=int, default=8, help="Number of processes reading pod5 files.")
+    build_parser.add_argument("--scan_cache", type=str, default=None, help="Persistent scan cache of pod5_scanner.py.")
+
+    lookup_parser = subparsers.add_parser("lookup", help="Print the file, batch and row of read IDs.")
+    lookup_parser.add_argument("index_db", type=str, help="SQLite index file.")
+    lookup_parser.add_argument("read_ids_file", type=str, help="File with one read ID per line.")
+
+    extract_parser = subparsers.add_parser("extract", help="Copy the reads of read IDs into new pod5 files.")
+    extract_parser.add_argument("index_db", type=str, help="SQLite index file.")
+    extract_parser.add_argument("read_ids_file", type=str, help="File with one read ID per line.")
+    extract_parser.add_argument("output_pod5", type=str, help="Output pod5 file.")
+    extract_parser.add_argument("--max_reads_per_file", type=int, default=None, help="Maximum number of reads per output file.")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for source_dir in args.source_dirs:
+            if not os.path.isdir(source_dir):
+                print(f"[ERROR] Source directory '{source_dir}' does not exist.")
+                sys.exit(1)
+        if args.workers < 1:
+            print(f"[ERROR] The number of workers must be at least 1 (got {args.workers}).")
+            sys.exit(1)
+        build_index(args.index_db, args.source_dirs, args.workers, args.scan_cache)
+        return
+
+    if not os.path.isfile(args.index_db):
+        print(f"[ERROR] Index '{args.index_db}' does not exist. Create it with 'pod5_index.py build'.")
+        sys.exit(1)
+    if not os.path.isfile(args.read_ids_file):
+        print(f"[ERROR] Read ID file '{args.read_ids_file}' does not exist.")
+        sys.exit(1)
+
+    read_ids = load_read_ids(args.read_ids_file)
+    locations, missing = lookup_reads(args.index_db, read_ids)
+    if missing:
+        print(f"[WARNING] {len(missing)} of {len(read_ids)} read ID(s) are not in the index.", file=sys.stderr)
+
+    if args.command == "lookup":
+        print("read_id\tfile\tbatch\trow")
+        for file_path, entries in locations.items():
+            for batch_idx, row, read_id in entries:
+                print(f"{uuid.UUID(bytes=read_id)}\t{file_path}\t{batch_idx}\t{row}")
+    else:
+        if args.max_reads_per_file is not None and args.max_reads_per_file < 1:
+            print(f"[ERROR] --max_reads_per_file must be at least 1 (got {args.max_reads_per_file}).")
+            sys.exit(1)
+        if not locations:
+            print("[ERROR] None of the read IDs are in the index.")
+            sys.exit(1)
+        if os.path.dirname(args.output_pod5):
+            os.makedirs(os.path.dirname(args.output_pod5), exist_ok=True)
+        outputs = extract_reads(locations, args.output_pod5, args.max_reads_per_file)
+        print(f"[INFO] Extracted {len(read_ids) - len(missing)} read(s) from {len(locations)} file(s) into "
+              f"{len(outputs)} pod5 file(s): {', '.join(outputs)}")
+
+if __name__ == "__main__":
+    main()
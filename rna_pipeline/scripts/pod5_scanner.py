@@ -0,0 +1,204 @@
+"""
+Description:
+    Parallel, cached filesystem scanner shared by `partition_pod5_files.py` and `distribute_files_by_size.py`.
+    Directories are listed with `os.scandir` across a thread pool, and the size and modification time of every file
+    come from the stat result of its directory entry, so each file is stat-ed at most once per scan. On networked
+    filesystems the per-call latency dominates, and overlapping many directory listings hides most of it.
+
+Key Features:
+    - **Parallel Traversal:** Each directory is listed by a worker thread; subdirectories are queued as soon as they
+      are discovered.
+    - **Single Stat per File:** Sizes and modification times are taken from `os.DirEntry.stat()`.
+    - **Persistent Manifest Cache:** An optional JSON cache stores, per directory, its modification time and the
+      (size, mtime) of every file it contains. On a re-scan, a directory whose modification time is unchanged is
+      served from the cache with a single `stat` call, so only directories that changed are listed again.
+    - **Growing Files:** Adding or removing a file updates its directory's modification time, but a file that grows
+      in place does not. Directories that contained files modified shortly before they were cached (e.g. pod5 files
+      still being written by MinKNOW) are therefore always listed again.
+
+Usage:
+    from pod5_scanner import scan_files
+    files = scan_files(source_dir, suffix=".pod5", cache_file="pod5_scan_cache.json")
+    # files maps absolute paths to FileInfo(size, mtime_ns)
+"""
+
+import os
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Size in bytes and modification time in nanoseconds of a scanned file
+FileInfo = namedtuple("FileInfo", ["size", "mtime_ns"])
+
+CACHE_VERSION = 1
+
+# Directories holding files modified less than this long before they were cached are always listed again
+RECENT_WRITE_GRACE_NS = 120 * 10 ** 9
+
+def load_scan_cache(cache_file):
+    """
+    Load a scan cache written by `save_scan_cache`.
+
+    Args:
+        cache_file (str): Path to the JSON cache file.
+
+    Returns:
+        dict: Dictionary mapping directory paths to cached directory entries. Empty if the cache is missing or unreadable.
+    """
+    if not cache_file or not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Ignoring unreadable scan cache '{cache_file}': {e}")
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("dirs", {})
+
+def save_scan_cache(cache_file, dirs):
+    """
+    Atomically write the scan cache.
+
+    Args:
+        cache_file (str): Path to the JSON cache file.
+        dirs (dict): Dictionary mapping directory paths to directory entries.
+    """
+    tmp_file = f"{cache_file}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump({"version": CACHE_VERSION, "dirs": dirs}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"[WARNING] Unable to save scan cache '{cache_file}': {e}")
+
+def _cache_entry_is_valid(entry, dir_mtime_ns):
+    """
+    Check whether a cached directory entry can be reused.
+
+    Args:
+        entry (dict): Cached directory entry.
+        dir_mtime_ns (int): Current modification time of the directory.
+
+    Returns:
+        bool: True if the directory is unchanged and none of its files were being written when it was cached.
+    """
+    if entry is None or entry["mtime_ns"] != dir_mtime_ns:
+        return False
+    recent = entry["scanned_at_ns"] - RECENT_WRITE_GRACE_NS
+    return all(mtime_ns < recent for _, mtime_ns, _ in entry["files"].values())
+
+def _scan_directory(dir_path, cached_entry):
+    """
+    List a single directory, reusing its cached entry when it is still valid.
+
+    Args:
+        dir_path (str): Absolute path to the directory.
+        cached_entry (dict or None): Cached entry for this directory.
+
+    Returns:
+        tuple: (dir_path, entry, from_cache) where entry holds `mtime_ns`, `scanned_at_ns`, `files` and `subdirs`.
+    """
+    try:
+        dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+    except OSError as e:
+        print(f"[WARNING] Unable to access '{dir_path}': {e}")
+        return dir_path, None, False
+
+    if _cache_entry_is_valid(cached_entry, dir_mtime_ns):
+        return dir_path, cached_entry, True
+
+    entry = {"mtime_ns": dir_mtime_ns, "scanned_at_ns": time.time_ns(), "files": {}, "subdirs": []}
+    try:
+        with os.scandir(dir_path) as it:
+            for dir_entry in it:
+                try:
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        entry["subdirs"].append(dir_entry.name)
+                    elif dir_entry.is_file():
+                        st = dir_entry.stat()
+                        entry["files"][dir_entry.name] = [st.st_size, st.st_mtime_ns, dir_entry.is_symlink()]
+                except OSError as e:
+                    print(f"[WARNING] Unable to access '{dir_entry.path}': {e}")
+    except OSError as e:
+        print(f"[WARNING] Unable to list '{dir_path}': {e}")
+        return dir_path, None, False
+
+    return dir_path, entry, False
+
+def scan_files(root_dir, suffix=None, max_workers=16, cache_file=None, skip_symlinks=False):
+    """
+    Recursively list files below a directory in parallel.
+
+    Symbolic links to directories are not followed. Symbolic links to files are reported with the size of their
+    target unless `skip_symlinks` is set.
+
+    Args:
+        root_dir (str): Directory to scan.
+        suffix (str, optional): Only report files whose name ends with this suffix (e.g. ".pod5").
+        max_workers (int): Number of threads listing directories concurrently.
+        cache_file (str, optional): Path to a persistent JSON scan cache. Created if missing.
+        skip_symlinks (bool): Do not report symbolic links to files.
+
+    Returns:
+        dict: Dictionary mapping absolute file paths to FileInfo(size, mtime_ns).
+    """
+    root_dir = os.path.abspath(root_dir)
+    root_prefix = root_dir.rstrip(os.sep) + os.sep
+    cache = load_scan_cache(cache_file)
+    scanned_dirs = {}
+    files = {}
+    listed = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_scan_directory, root_dir, cache.get(root_dir))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_path, entry, from_cache = future.result()
+                if entry is None:
+                    continue
+                scanned_dirs[dir_path] = entry
+                listed += 0 if from_cache else 1
+
+                dir_prefix = dir_path.rstrip(os.sep) + os.sep
+                for name, (size, mtime_ns, is_link) in entry["files"].items():
+                    if suffix and not name.endswith(suffix):
+                        continue
+                    if skip_symlinks and is_link:
+                        continue
+                    files[dir_prefix + name] = FileInfo(size, mtime_ns)
+
+                for name in entry["subdirs"]:
+                    sub_path = dir_prefix + name
+                    pending.add(executor.submit(_scan_directory, sub_path, cache.get(sub_path)))
+
+    # Rewrite the cache only if a directory was listed again or disappeared
+    cached_under_root = {path for path in cache if path == root_dir or path.startswith(root_prefix)}
+    if cache_file and (listed or set(scanned_dirs) != cached_under_root):
+        # Keep cached entries of unrelated trees so one cache can serve several scripts
+        merged = {path: entry for path, entry in cache.items()
+                  if path != root_dir and not path.startswith(root_prefix)}
+        merged.update(scanned_dirs)
+        save_scan_cache(cache_file, merged)
+
+    if cache_file:
+        print(f"[INFO] Scanned {len(scanned_dirs)} director(ies); {listed} listed, {len(scanned_dirs) - listed} served from cache.")
+
+    return files
+
+def sum_sizes_under(files, dir_path):
+    """
+    Sum the sizes of scanned files located below a directory.
+
+    Args:
+        files (dict): Dictionary returned by `scan_files`.
+        dir_path (str): Directory whose files are summed.
+
+    Returns:
+        int: Total size in bytes.
+    """
+    prefix = os.path.abspath(dir_path).rstrip(os.sep) + os.sep
+    return sum(info.size for path, info in files.items() if path.startswith(prefix))
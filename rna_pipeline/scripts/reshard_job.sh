@@ -0,0 +1,89 @@
+#!/bin/bash -l
+
+# =============================================================================
+#                             reshard_job.sh
+# =============================================================================
+# Description:
+#   This script redistributes the reads of all unaligned BAM files of a sample into
+#   shards of equal read or base count (`RESHARD_UNALIGNED=true`), as a job of its own
+#   between the Dorado job and the alignment array job. It performs the following steps:
+#
+#     1. **Collect the Unaligned BAM Files:**
+#        - Finds the per-partition BAM files written by `dorado_job.sh` in `UNALIGNED_BAM_DIR`.
+#
+#     2. **Reshard the Reads:**
+#        - Streams every read into the currently lightest of `NUM_SHARDS` shards with
+#          `reshard_unaligned_bams.py`. The BGZF compression threads of the reader and
+#          the shard writers are sized to the slots of this job (`NSLOTS`).
+#
+#     3. **Mark the Shards as Complete:**
+#        - Writes `reshard.done`, holding the shard count, into `OUTPUT_DIR`. Alignment tasks
+#          whose shard received no reads (fewer reads than shards) then exit without error,
+#          and the last task to finish removes `OUTPUT_DIR`.
+#
+#   **Job Dependencies:**
+#     - Submitted by `alignment_modkit_job.sh`, which holds the alignment array job on it.
+#       Rewriting every read of a sample takes far longer than the coordinating job may run,
+#       so its runtime, memory and slots are set with `RESHARD_JOB_RUNTIME`,
+#       `RESHARD_JOB_MEMORY` and `TOTAL_CPUS_RESHARD`.
+#
+# Arguments:
+#   1. OUTPUT_DIR         - Directory in which the shards (`calls_<i>.bam`) are written.
+#   2. UNALIGNED_BAM_DIR  - Directory holding the unaligned BAM files of the sample.
+#   3. NUM_SHARDS         - Number of shards, i.e. the size of the alignment array job.
+#   4. BALANCE_BY         - (Optional) `reads` (default) or `bases`.
+#
+# Usage:
+#   This script is intended to be submitted via `qsub` by `alignment_modkit_job.sh`.
+#
+# =============================================================================
+
+# Enable strict error handling
+set -euo pipefail
+
+# Re-run this script under the telemetry wrapper when a telemetry log is configured (see telemetry.py)
+if [ -n "${TELEMETRY_LOG-}" ] && [ ! -f "${TELEMETRY_METRICS-}" ] && [ -f "${SCRIPTS_DIR-}/telemetry.py" ]; then
+    exec python3 "${SCRIPTS_DIR}/telemetry.py" run --log "${TELEMETRY_LOG}" --stage reshard -- bash -l "$0" "$@"
+fi
+
+# ----------------------- Step 1: Parse Input Arguments -----------------------
+if [ "$#" -lt 3 ]; then
+    echo "Usage: $0 OUTPUT_DIR UNALIGNED_BAM_DIR NUM_SHARDS [BALANCE_BY]"
+    exit 1
+fi
+
+OUTPUT_DIR="${1}"
+UNALIGNED_BAM_DIR="${2}"
+NUM_SHARDS="${3}"
+BALANCE_BY="${4:-reads}"
+
+# ----------------------- Step 2: Job Information -----------------------
+echo "=========================================================="
+echo "Start date : $(date)"
+echo "Job name : ${JOB_NAME-}"
+echo "Job ID : ${JOB_ID-}"
+echo "Slots : ${NSLOTS:-1}"
+echo "=========================================================="
+
+# ----------------------- Step 3: Collect the Unaligned BAM Files -----------------------
+UNALIGNED_BAMS=()
+while IFS= read -r BAM_FILE; do
+    UNALIGNED_BAMS+=("${BAM_FILE}")
+done < <(find "${UNALIGNED_BAM_DIR}" -mindepth 1 -maxdepth 2 -name "*.bam" | sort)
+
+if [ "${#UNALIGNED_BAMS[@]}" -eq 0 ]; then
+    echo "Error: No BAM file found in ${UNALIGNED_BAM_DIR}. Exiting."
+    exit 1
+fi
+
+# ----------------------- Step 4: Reshard the Reads -----------------------
+mkdir -p "${OUTPUT_DIR}"
+rm -f "${OUTPUT_DIR}/reshard.done"
+
+echo "Resharding ${#UNALIGNED_BAMS[@]} unaligned BAM file(s) into ${NUM_SHARDS} shard(s) by ${BALANCE_BY}..."
+python3 "${SCRIPTS_DIR}/reshard_unaligned_bams.py" "${OUTPUT_DIR}" "${UNALIGNED_BAMS[@]}" \
+    --num_shards "${NUM_SHARDS}" --balance_by "${BALANCE_BY}" --slots "${NSLOTS:-1}"
+
+# ----------------------- Step 5: Mark the Shards as Complete -----------------------
+printf "%s\n" "${NUM_SHARDS}" > "${OUTPUT_DIR}/reshard.done"
+echo "Resharding completed at $(date)."
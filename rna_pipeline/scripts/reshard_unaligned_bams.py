@@ -0,0 +1,234 @@
+"""
+Description:
+    This script redistributes the reads of the unaligned BAM files written by `dorado_job.sh` into a chosen number of
+    shards of roughly equal read or base count. The alignment array job then runs one task per shard, so its size is
+    set by the available CPUs rather than by how the pod5 files were grouped into basecalling partitions, and uneven
+    partitions no longer leave most tasks idle while one straggler runs.
+
+Key Features:
+    - **Streaming Redistribution:** Reads every input BAM record by record and writes each record directly to the
+      currently lightest shard (min-heap), so the shards are balanced in a single pass without copying whole files.
+    - **Balancing Criterion:** Shards are balanced by read count or by base count (sum of read lengths).
+    - **Shard Count from the CPU Budget:** The number of shards is either given directly or derived from the total
+      number of CPUs available to the alignment array and the CPUs requested per task.
+    - **Threads Sized to the Job:** With `--slots`, the BGZF threads of the reader and of every shard writer are
+      sized so that together they use the slots of the job (at least one per file), instead of a fixed number per
+      file that would oversubscribe a small job writing many shards.
+    - **Header Merging:** Read groups (`@RG`) and program records (`@PG`) of all inputs are carried into every shard,
+      so the modification and run metadata written by Dorado is preserved.
+    - **Error Handling:** Alerts and exits if no input BAM files are found or if the shard count is invalid.
+
+Usage:
+    python reshard_unaligned_bams.py <output_dir> <input_bam> [<input_bam> ...]
+                                     (--num_shards <N> | --cpu_budget <CPUs> --cpus_per_task <CPUs>)
+                                     [--balance_by {reads,bases}] [--threads <N> | --slots <CPUs>]
+
+Arguments:
+    output_dir      : Directory in which the shards (`calls_<i>.bam`) are written.
+    input_bam       : One or more unaligned BAM files.
+    --num_shards    : Number of shards to write.
+    --cpu_budget    : Total number of CPUs the alignment array may use at the same time.
+    --cpus_per_task : CPUs requested by each alignment task. The shard count is `cpu_budget // cpus_per_task`.
+    --balance_by    : (Optional) `reads` (default) or `bases`.
+    --threads       : (Optional) BGZF compression and decompression threads per file. Defaults to 2.
+    --slots         : (Optional) CPUs of the job. Sets the threads per file to `slots // (shards + 1)`, at least 1.
+
+Requirements:
+    - The `pysam` Python package.
+"""
+
+import os
+import sys
+import heapq
+import argparse
+
+def merge_headers(header_dicts):
+    """
+    Merge the headers of several unaligned BAM files.
+
+    The first header is kept as is; read groups and program records of the other headers are appended when their
+    IDs are not present yet.
+
+    Args:
+        header_dicts (list of dict): Headers as returned by `pysam.AlignmentHeader.to_dict()`.
+
+    Returns:
+        dict: Merged header.
+    """
+    merged = {key: list(value) if isinstance(value, list) else value for key, value in header_dicts[0].items()}
+    for record_type in ("RG", "PG"):
+        records = merged.setdefault(record_type, [])
+        seen_ids = {record.get("ID") for record in records}
+        for header in header_dicts[1:]:
+            for record in header.get(record_type, []):
+                if record.get("ID") not in seen_ids:
+                    records.append(record)
+                    seen_ids.add(record.get("ID"))
+        if not records:
+            del merged[record_type]
+    return merged
+
+def choose_num_shards(num_shards=None, cpu_budget=None, cpus_per_task=None):
+    """
+    Determine the number of shards.
+
+    Args:
+        num_shards (int, optional): Explicit number of shards.
+        cpu_budget (int, optional): Total CPUs available to the alignment array.
+        cpus_per_task (int, optional): CPUs requested per alignment task.
+
+    Returns:
+        int: Number of shards.
+
+    Raises:
+        SystemExit: If the resulting number of shards is smaller than one.
+    """
+    if num_shards is None:
+        num_shards = cpu_budget // cpus_per_task
+    if num_shards < 1:
+        print(f"[ERROR] The number of shards must be at least 1 (got {num_shards}).")
+        sys.exit(1)
+    return num_shards
+
+def threads_per_file(slots, num_shards):
+    """
+    Size the BGZF threads of each file so that the reader and all shard writers share the slots of the job.
+
+    Args:
+        slots (int): CPUs of the job.
+        num_shards (int): Number of shard writers.
+
+    Returns:
+        int: Threads per file, at least 1.
+    """
+    return max(1, slots // (num_shards + 1))
+
+def reshard_bams(input_bams, output_dir, num_shards, balance_by="reads", threads=2):
+    """
+    Stream the records of the input BAM files into balanced shards.
+
+    Each record is written to the shard with the smallest load so far, where the load is the number of reads or the
+    number of bases already assigned to it.
+
+    Args:
+        input_bams (list of str): Paths to the unaligned BAM files.
+        output_dir (str): Directory in which the shards are written.
+        num_shards (int): Number of shards.
+        balance_by (str): `reads` or `bases`.
+        threads (int): BGZF threads per file.
+
+    Returns:
+        list of dict: Per-shard dictionaries with `path`, `reads` and `bases`, for the shards that received reads.
+
+    Raises:
+        SystemExit: If the `pysam` package is not installed.
+    """
+    try:
+        import pysam
+    except ImportError:
+        print("[ERROR] The 'pysam' package is required for resharding. Install it with 'pip install pysam'.")
+        sys.exit(1)
+
+    headers = []
+    for bam_path in input_bams:
+        with pysam.AlignmentFile(bam_path, "rb", check_sq=False) as bam:
+            headers.append(bam.header.to_dict())
+    header = pysam.AlignmentHeader.from_dict(merge_headers(headers))
+
+    os.makedirs(output_dir, exist_ok=True)
+    shards = [{"path": os.path.join(output_dir, f"calls_{idx}.bam"), "reads": 0, "bases": 0} for idx in range(num_shards)]
+    writers = [pysam.AlignmentFile(shard["path"] + ".partial", "wb", header=header, threads=threads) for shard in shards]
+
+    # Heap of (load, shard index); the lightest shard is always at the top
+    heap = [(0, idx) for idx in range(num_shards)]
+    try:
+        for bam_path in input_bams:
+            print(f"[INFO] Resharding '{bam_path}'...")
+            with pysam.AlignmentFile(bam_path, "rb", check_sq=False, threads=threads) as bam:
+                for record in bam.fetch(until_eof=True):
+                    length = record.query_length
+                    load, idx = heap[0]
+                    writers[idx].write(record)
+                    shards[idx]["reads"] += 1
+                    shards[idx]["bases"] += length
+                    heapq.heapreplace(heap, (load + (length if balance_by == "bases" else 1), idx))
+    finally:
+        for writer in writers:
+            writer.close()
+
+    # Shards that received no reads (fewer reads than shards) are not worth an alignment task
+    kept = []
+    for shard in shards:
+        if shard["reads"] == 0:
+            os.remove(shard["path"] + ".partial")
+            continue
+        os.replace(shard["path"] + ".partial", shard["path"])
+        kept.append(shard)
+    if len(kept) < num_shards:
+        print(f"[WARNING] Only {len(kept)} of {num_shards} shard(s) received reads.")
+
+    return kept
+
+def print_shard_summary(shards, balance_by="reads"):
+    """
+    Print the size of each shard and the imbalance ratio.
+
+    Args:
+        shards (list of dict): Per-shard dictionaries returned by `reshard_bams`.
+        balance_by (str): `reads` or `bases`; used for the imbalance ratio.
+    """
+    for shard in shards:
+        print(f"[INFO] {os.path.basename(shard['path'])}: {shard['reads']} reads, {shard['bases']} bases")
+
+    loads = [shard[balance_by] for shard in shards]
+    mean_load = sum(loads) / len(loads) if loads else 0
+    ratio = max(loads) / mean_load if mean_load else 1.0
+    print(f"[INFO] Shard imbalance ratio by {balance_by} (max / mean): {ratio:.3f}")
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Reshard unaligned BAM files into shards of equal read or base count.")
+    parser.add_argument("output_dir", type=str, help="Directory in which the shards are written.")
+    parser.add_argument("input_bams", type=str, nargs="+", help="Unaligned BAM files.")
+    parser.add_argument("--num_shards", type=int, default=None, help="Number of shards to write.")
+    parser.add_argument("--cpu_budget", type=int, default=None, help="Total CPUs the alignment array may use at the same time.")
+    parser.add_argument("--cpus_per_task", type=int, default=None, help="CPUs requested by each alignment task.")
+    parser.add_argument("--balance_by", type=str, choices=["reads", "bases"], default="reads", help="Balance shards by read count or base count.")
+    threads_group = parser.add_mutually_exclusive_group()
+    threads_group.add_argument("--threads", type=int, default=None, help="BGZF threads per file. Defaults to 2.")
+    threads_group.add_argument("--slots", type=int, default=None, help="CPUs of the job; sizes the threads per file to them.")
+    args = parser.parse_args()
+
+    if args.num_shards is None and (args.cpu_budget is None or args.cpus_per_task is None):
+        parser.error("either --num_shards or both --cpu_budget and --cpus_per_task are required")
+
+    input_bams = [os.path.abspath(path) for path in args.input_bams]
+    missing = [path for path in input_bams if not os.path.isfile(path)]
+    if missing:
+        for path in missing:
+            print(f"[ERROR] Input BAM '{path}' does not exist.")
+        sys.exit(1)
+
+    num_shards = choose_num_shards(args.num_shards, args.cpu_budget, args.cpus_per_task)
+    if args.slots is not None:
+        threads = threads_per_file(args.slots, num_shards)
+    else:
+        threads = args.threads if args.threads is not None else 2
+
+    print("=============================================")
+    print(f"Input BAM files: {len(input_bams)}")
+    print(f"Output Directory: {os.path.abspath(args.output_dir)}")
+    print(f"Number of Shards: {num_shards}")
+    print(f"Balance By: {args.balance_by}")
+    print(f"Threads per File: {threads}")
+    print("=============================================")
+
+    shards = reshard_bams(input_bams, os.path.abspath(args.output_dir), num_shards, args.balance_by, threads)
+    print_shard_summary(shards, args.balance_by)
+
+    print("=============================================")
+    print("Resharding Completed Successfully.")
+    print("=============================================")
+
+if __name__ == "__main__":
+    main()
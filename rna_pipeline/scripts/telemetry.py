@@ -0,0 +1,633 @@
+"""
+Description:
+    Per-stage performance telemetry for the RNA pipeline. Every stage appends one JSON-lines record to a shared log
+    (`TELEMETRY_LOG`), and the `report` command aggregates the records of one or more runs to flag stragglers and to
+    suggest `*_JOB_RUNTIME` and `*_JOB_MEMORY` values.
+
+    Records are collected by one wrapper: `telemetry.py run -- <command>` runs the command, samples the memory and
+    I/O of its process tree from `/proc` while it runs, and takes CPU time from the resource usage of the finished
+    tree. The job scripts (`dorado_job.sh` per partition, `align_array_job.sh`,
+    `merge_job.sh`, `modkit_job.sh`) re-run themselves under the wrapper when `TELEMETRY_LOG` is set, and the
+    partitioner records its own run with `--telemetry_log`.
+
+Key Features:
+    - **Measured per Stage:** Wall time, user and system CPU time, CPU efficiency (CPU time / (wall time x NSLOTS)),
+      peak memory and bytes read and written:
+        - `peak_rss_mb` is the peak of the summed RSS of every process in the tree, sampled every
+          `--sample_interval` seconds, so concurrent processes (e.g. `samtools fastq | minimap2 | samtools sort`, or
+          local modkit shard workers) are added up. Pages shared between processes are counted once per process, which
+          errs on the side of a larger memory request. `max_process_rss_mb` is the peak of the largest single process
+          (`ru_maxrss`). Without `/proc`, only the latter is measured and `peak_rss_scope` is `process`.
+        - `read_bytes` and `write_bytes` are the `rchar` and `wchar` counters of `/proc/<pid>/io` summed over the
+          tree. They count every byte passed through read and write calls, so they work on NFS and Lustre, where
+          block I/O counters stay near zero, but they also include page cache hits and data piped between the
+          processes of a stage. Bytes of a process that exits between two samples are counted up to the last sample.
+    - **Work Done and Throughput:** Input reads, bases, signal samples and bytes, and the derived reads/s, bases/s
+      and samples/s. They are given on the command line (`--reads`, `--samples`, ...) or reported by the wrapped
+      script as `key=value` lines appended to the file named by `TELEMETRY_METRICS`. A `count_bam=<path>` line
+      counts the reads (from the index when there is one) and bases of a BAM file after the command (requires
+      `pysam`; skipped otherwise). A `stage=<name>` line records the run under another stage name, and a
+      `mode=<name>` line the mode of a whole-sample stage (the merge mode, or the number of modkit shards). The
+      wrapper writes its own messages to stderr, as the stdout of the command may be redirected to a BAM file.
+    - **Report:** Per-stage summaries across partitions and samples, stragglers (records whose wall time exceeds
+      `--straggler_factor` times the stage median), and suggested runtime and memory requests: the longest job and
+      the largest peak RSS times `--headroom`, rounded up to 15 minutes and 1 GB. Memory is only suggested for stages
+      whose records all measured the whole process tree. The records of a job that ran
+      several partitions (sequential or multi-GPU Dorado) are combined into the span of that job.
+    - **Concurrent Writers:** Records are appended under an exclusive lock, so array tasks and GPU workers can share
+      one log.
+
+Usage:
+    python telemetry.py run --log <telemetry.jsonl> --stage <name> [--partition <name>] [--reads <N>] [--bases <N>]
+                            [--samples <N>] [--input_bytes <N>] [--sample_interval <seconds>] -- <command> [<args> ...]
+    python telemetry.py report <telemetry.jsonl> [...] [--straggler_factor <F>] [--headroom <F>] [--output <json>]
+
+Arguments:
+    run:
+        --log               : JSON-lines log the record is appended to.
+        --stage             : Stage name (e.g. dorado, align, merge, modkit).
+        --partition         : (Optional) Partition or shard the stage worked on.
+        --reads, --bases, --samples, --input_bytes : (Optional) Work done by the stage.
+        --sample_interval   : (Optional) Seconds between two samples of the process tree. Defaults to 1.
+        command             : Command to run; its exit code is returned.
+    report:
+        logs                : One or more telemetry logs (e.g. of several samples).
+        --straggler_factor  : (Optional) Wall time over the stage median that flags a straggler. Defaults to 1.5.
+        --headroom          : (Optional) Factor applied to the largest observed runtime and memory. Defaults to 1.25.
+        --output            : (Optional) Write the summaries, stragglers and suggestions to a JSON file.
+
+Requirements:
+    - Python 3 standard library; `pysam` for `count_bam`.
+    - Linux `/proc` for the process tree memory and the I/O counters.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import fcntl
+import socket
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+from datetime import datetime
+
+from pod5_cost import format_duration
+
+# Environment variable naming the file a wrapped script appends key=value metrics to
+METRICS_ENV = "TELEMETRY_METRICS"
+
+# Seconds between two samples of the memory and I/O of a process tree
+SAMPLE_INTERVAL = 1.0
+
+PAGE_BYTES = os.sysconf("SC_PAGE_SIZE")
+
+# Pipeline variables sized from each stage's records
+STAGE_VARIABLES = {
+    "dorado": "DORADO_JOB",
+    "reshard": "RESHARD_JOB",
+    "align": "ALIGN_JOB",
+    "merge": "MERGE_JOB",
+    "modkit": "MODKIT_JOB",
+}
+
+# Work counters turned into throughputs
+WORK_FIELDS = ["reads", "bases", "samples"]
+
+# Metrics kept as text even when they look like numbers
+TEXT_FIELDS = {"stage", "partition", "sample", "mode"}
+
+def append_record(log_file, record):
+    """
+    Append one record to a telemetry log under an exclusive lock.
+
+    Args:
+        log_file (str): Path to the JSON-lines log.
+        record (dict): Record to append.
+    """
+    directory = os.path.dirname(os.path.abspath(log_file))
+    os.makedirs(directory, exist_ok=True)
+    with open(log_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+        f.flush()
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+def list_process_tree(root_pid):
+    """
+    List a process and all of its descendants from the parent IDs in `/proc`.
+
+    Args:
+        root_pid (int): Process ID of the root of the tree.
+
+    Returns:
+        list of int: Process IDs of the tree, starting with the root.
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name in parentheses may contain spaces; the state and the parent ID follow it
+        children.setdefault(int(stat[stat.rindex(")") + 2:].split()[1]), []).append(int(entry))
+
+    pids, queue = [], [root_pid]
+    while queue:
+        pid = queue.pop()
+        pids.append(pid)
+        queue.extend(children.get(pid, []))
+    return pids
+
+def read_process_io(pid):
+    """
+    Read the bytes a process has passed through read and write calls.
+
+    Args:
+        pid (int or str): Process ID, or "self".
+
+    Returns:
+        tuple: (rchar, wchar), or None if the counters cannot be read.
+    """
+    counters = {}
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                counters[key] = int(value)
+        return counters["rchar"], counters["wchar"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+class ProcessTreeSampler(threading.Thread):
+    """
+    Sample the summed RSS and the I/O counters of a process tree from `/proc` until stopped.
+
+    Attributes:
+        available (bool): Whether the tree could be sampled (Linux `/proc`).
+        peak_rss_bytes (int): Largest summed RSS of the tree seen so far.
+        io (dict): Dictionary mapping process IDs to their last (rchar, wchar).
+    """
+
+    def __init__(self, root_pid, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.available = os.path.isfile(f"/proc/{root_pid}/statm")
+        self.peak_rss_bytes = 0
+        self.io = {}
+        self.stopped = threading.Event()
+
+    def sample(self):
+        """
+        Add one sample of the tree.
+        """
+        rss_bytes = 0
+        for pid in list_process_tree(self.root_pid):
+            try:
+                with open(f"/proc/{pid}/statm") as f:
+                    rss_bytes += int(f.read().split()[1]) * PAGE_BYTES
+            except (OSError, IndexError, ValueError):
+                # The process exited since the tree was listed
+                continue
+            io = read_process_io(pid)
+            if io:
+                self.io[pid] = io
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss_bytes)
+
+    def run(self):
+        while self.available:
+            self.sample()
+            if self.stopped.wait(self.interval):
+                break
+
+    def stop(self):
+        """
+        Stop sampling and wait for the sampling thread.
+        """
+        self.stopped.set()
+        self.join()
+
+    def totals(self):
+        """
+        Return the measurements of the tree.
+
+        Returns:
+            dict: `peak_rss_bytes`, `read_bytes` and `write_bytes`, or None if the tree could not be sampled.
+        """
+        if not self.available or not self.peak_rss_bytes:
+            return None
+        return {
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "read_bytes": sum(rchar for rchar, _ in self.io.values()),
+            "write_bytes": sum(wchar for _, wchar in self.io.values()),
+        }
+
+def count_bam(bam_path):
+    """
+    Count the reads and bases of a BAM file.
+
+    Reads are taken from the index when there is one (bases are then not counted); otherwise the file is read once.
+
+    Args:
+        bam_path (str): Path to the BAM file.
+
+    Returns:
+        dict: `reads` and, when the file was read, `bases`. Empty if pysam is missing or the file cannot be read.
+    """
+    try:
+        import pysam
+    except ImportError:
+        print("[WARNING] pysam is not installed; reads and bases are not counted.", file=sys.stderr)
+        return {}
+    try:
+        with pysam.AlignmentFile(bam_path, "rb", check_sq=False) as bam:
+            if bam.has_index():
+                statistics_per_contig = bam.get_index_statistics()
+                return {"reads": sum(s.total for s in statistics_per_contig) + bam.unmapped}
+            reads = bases = 0
+            for record in bam.fetch(until_eof=True):
+                if record.is_secondary or record.is_supplementary:
+                    continue
+                reads += 1
+                bases += record.query_length
+            return {"reads": reads, "bases": bases}
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Unable to count reads in '{bam_path}': {e}", file=sys.stderr)
+        return {}
+
+def read_metrics(metrics_file):
+    """
+    Read the key=value metrics reported by a wrapped script.
+
+    Numeric values (other than names) are converted to numbers, `count_bam` lines are replaced by the counts of that BAM file, and later
+    lines override earlier ones.
+
+    Args:
+        metrics_file (str): Path to the metrics file.
+
+    Returns:
+        dict: Dictionary of metrics.
+    """
+    metrics = {}
+    if not os.path.isfile(metrics_file):
+        return metrics
+    with open(metrics_file) as f:
+        for line in f:
+            key, sep, value = line.strip().partition("=")
+            if not sep:
+                continue
+            if key == "count_bam":
+                metrics.update(count_bam(value))
+                continue
+            if key in TEXT_FIELDS:
+                metrics[key] = value
+                continue
+            try:
+                metrics[key] = int(value)
+            except ValueError:
+                try:
+                    metrics[key] = float(value)
+                except ValueError:
+                    metrics[key] = value
+    return metrics
+
+def build_record(stage, start_time, wall_seconds, usage, metrics, exit_code, tree=None, io=None):
+    """
+    Build a telemetry record from resource usage and work metrics.
+
+    Args:
+        stage (str): Stage name.
+        start_time (float): Start time (seconds since the epoch).
+        wall_seconds (float): Wall time in seconds.
+        usage (resource.struct_rusage or dict): Resource usage of the measured processes.
+        metrics (dict): Work metrics (partition, reads, bases, samples, input_bytes, ...).
+        exit_code (int): Exit code of the stage.
+        tree (dict, optional): Result of `ProcessTreeSampler.totals`. Without it, the peak RSS is that of the
+            largest process.
+        io (tuple, optional): (rchar, wchar) of a single measured process, used when `tree` is not given.
+
+    Returns:
+        dict: Telemetry record.
+    """
+    if not isinstance(usage, dict):
+        usage = {name: getattr(usage, name) for name in ["ru_utime", "ru_stime", "ru_maxrss"]}
+    slots = int(os.environ.get("NSLOTS", "1") or 1)
+    cpu_seconds = usage["ru_utime"] + usage["ru_stime"]
+
+    record = {
+        "stage": stage,
+        "sample": "_".join(filter(None, [os.environ.get("GROUP"), os.environ.get("SAMPLE")])) or None,
+        "host": socket.gethostname(),
+        "job_id": os.environ.get("JOB_ID"),
+        "job_name": os.environ.get("JOB_NAME"),
+        "task_id": os.environ.get("SGE_TASK_ID") if os.environ.get("SGE_TASK_ID") not in (None, "undefined") else None,
+        "slots": slots,
+        "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(start_time)),
+        "wall_seconds": round(wall_seconds, 3),
+        "user_cpu_seconds": round(usage["ru_utime"], 3),
+        "system_cpu_seconds": round(usage["ru_stime"], 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_efficiency": round(cpu_seconds / (wall_seconds * slots), 3) if wall_seconds > 0 else None,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(tree["peak_rss_bytes"] / 1024 ** 2, 1) if tree else round(usage["ru_maxrss"] / 1024, 1),
+        "peak_rss_scope": "tree" if tree else "process",
+        "max_process_rss_mb": round(usage["ru_maxrss"] / 1024, 1),
+        "read_bytes": tree["read_bytes"] if tree else (io[0] if io else None),
+        "write_bytes": tree["write_bytes"] if tree else (io[1] if io else None),
+        "exit_code": exit_code,
+    }
+    record.update(metrics)
+    for field in WORK_FIELDS:
+        if record.get(field) and wall_seconds > 0:
+            record[f"{field}_per_second"] = round(record[field] / wall_seconds, 1)
+    return record
+
+def run_command(log_file, stage, command, metrics, sample_interval=SAMPLE_INTERVAL):
+    """
+    Run a command, measure it and append its record to the log.
+
+    Args:
+        log_file (str): Path to the JSON-lines log.
+        stage (str): Stage name.
+        command (list of str): Command and arguments.
+        metrics (dict): Work metrics known before the command runs.
+        sample_interval (float): Seconds between two samples of the memory and I/O of the process tree.
+
+    Returns:
+        int: Exit code of the command.
+    """
+    fd, metrics_file = tempfile.mkstemp(prefix="telemetry_", suffix=".txt")
+    os.close(fd)
+    env = dict(os.environ)
+    env[METRICS_ENV] = metrics_file
+
+    start_time = time.time()
+    start = time.monotonic()
+    try:
+        process = subprocess.Popen(command, env=env)
+    except OSError as e:
+        print(f"[ERROR] Unable to run {command[0]}: {e}", file=sys.stderr)
+        os.remove(metrics_file)
+        return 127
+    sampler = ProcessTreeSampler(process.pid, sample_interval)
+    sampler.start()
+
+    # wait4 returns the resource usage of the child and of all descendants it waited for
+    while True:
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        except KeyboardInterrupt:
+            process.terminate()
+    wall_seconds = time.monotonic() - start
+    sampler.stop()
+    exit_code = os.waitstatus_to_exitcode(status)
+    process.returncode = exit_code
+
+    metrics = dict(metrics)
+    metrics.update(read_metrics(metrics_file))
+    os.remove(metrics_file)
+
+    record = build_record(stage, start_time, wall_seconds, usage, metrics, exit_code, tree=sampler.totals())
+    try:
+        append_record(log_file, record)
+    except OSError as e:
+        print(f"[WARNING] Unable to write telemetry to '{log_file}': {e}", file=sys.stderr)
+    return exit_code if exit_code >= 0 else 128 - exit_code
+
+def record_process(log_file, stage, start_time, start_monotonic, metrics):
+    """
+    Append a record for the current Python process and the children it has waited for.
+
+    The peak RSS is that of the largest process, which is the memory of the stage for a single Python process.
+
+    Args:
+        log_file (str): Path to the JSON-lines log.
+        stage (str): Stage name.
+        start_time (float): Start time (seconds since the epoch).
+        start_monotonic (float): `time.monotonic()` at the start.
+        metrics (dict): Work metrics.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    usage = {
+        "ru_utime": own.ru_utime + children.ru_utime,
+        "ru_stime": own.ru_stime + children.ru_stime,
+        "ru_maxrss": max(own.ru_maxrss, children.ru_maxrss),
+    }
+    record = build_record(stage, start_time, time.monotonic() - start_monotonic, usage, metrics, 0,
+                          io=read_process_io("self"))
+    try:
+        append_record(log_file, record)
+    except OSError as e:
+        print(f"[WARNING] Unable to write telemetry to '{log_file}': {e}", file=sys.stderr)
+
+def load_records(log_files):
+    """
+    Load the records of one or more telemetry logs, skipping unreadable lines.
+
+    Args:
+        log_files (list of str): Paths to JSON-lines logs.
+
+    Returns:
+        list of dict: Records.
+    """
+    records = []
+    for log_file in log_files:
+        with open(log_file) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"[WARNING] Skipping malformed line {line_number} of '{log_file}'.")
+    return records
+
+def job_wall_seconds(stage_records):
+    """
+    Compute the wall time of every job from the records of one stage.
+
+    A sequential Dorado job basecalls many partitions and a multi-GPU job several at once, so the runtime a job
+    needs is the span from the start of its first record to the end of its last one. A job is identified by its
+    host, job ID, job name and task ID: the local DAG executor gives every stage the job ID `local` and its stage
+    name as the job name. Records without a job ID are jobs of their own.
+
+    Args:
+        stage_records (list of dict): Records of one stage.
+
+    Returns:
+        list of float: Wall time of each job in seconds.
+    """
+    spans = {}
+    for index, r in enumerate(stage_records):
+        key = (r.get("host"), r.get("job_id"), r.get("job_name"), r.get("task_id")) if r.get("job_id") else index
+        start = datetime.fromisoformat(r["start"]).timestamp()
+        first, last = spans.get(key, (start, start))
+        spans[key] = (min(first, start), max(last, start + r["wall_seconds"]))
+    return [last - first for first, last in spans.values()]
+
+def summarize(records, straggler_factor=1.5, headroom=1.25):
+    """
+    Aggregate records per stage, flag stragglers and suggest resource requests.
+
+    Args:
+        records (list of dict): Telemetry records.
+        straggler_factor (float): Wall time over the stage median that flags a straggler.
+        headroom (float): Factor applied to the longest job and the largest peak RSS.
+
+    Returns:
+        tuple: (dictionary of per-stage summaries, list of stragglers, dictionary of suggested variables).
+    """
+    by_stage = {}
+    for record in records:
+        if record.get("exit_code", 0) == 0:
+            by_stage.setdefault(record["stage"], []).append(record)
+
+    summaries, stragglers, suggestions = {}, [], {}
+    for stage, stage_records in sorted(by_stage.items()):
+        walls = [r["wall_seconds"] for r in stage_records]
+        rss = [r["peak_rss_mb"] for r in stage_records]
+        efficiencies = [r["cpu_efficiency"] for r in stage_records if r.get("cpu_efficiency") is not None]
+        median_wall = statistics.median(walls)
+        summary = {
+            "records": len(stage_records),
+            "samples": len({r.get("sample") for r in stage_records}),
+            "median_wall_seconds": round(median_wall, 1),
+            "max_wall_seconds": round(max(walls), 1),
+            "max_job_wall_seconds": round(max(job_wall_seconds(stage_records)), 1),
+            "total_cpu_seconds": round(sum(r["cpu_seconds"] for r in stage_records), 1),
+            "median_cpu_efficiency": round(statistics.median(efficiencies), 3) if efficiencies else None,
+            "max_peak_rss_mb": max(rss),
+            "peak_rss_scope": "tree" if all(r.get("peak_rss_scope") == "tree" for r in stage_records) else "process",
+            "read_bytes": sum(r.get("read_bytes") or 0 for r in stage_records),
+            "write_bytes": sum(r.get("write_bytes") or 0 for r in stage_records),
+        }
+        for field in WORK_FIELDS:
+            rates = [r[f"{field}_per_second"] for r in stage_records if r.get(f"{field}_per_second")]
+            if rates:
+                summary[f"median_{field}_per_second"] = round(statistics.median(rates), 1)
+        summaries[stage] = summary
+
+        if len(stage_records) > 1:
+            for r in stage_records:
+                if r["wall_seconds"] > straggler_factor * median_wall:
+                    stragglers.append({
+                        "stage": stage, "sample": r.get("sample"), "partition": r.get("partition"),
+                        "mode": r.get("mode"), "host": r.get("host"), "wall_seconds": r["wall_seconds"],
+                        "times_median": round(r["wall_seconds"] / median_wall, 2) if median_wall else None,
+                    })
+
+        if stage in STAGE_VARIABLES:
+            prefix = STAGE_VARIABLES[stage]
+            runtime = math.ceil(summary["max_job_wall_seconds"] * headroom / 900) * 900
+            suggestions[f"{prefix}_RUNTIME"] = format_duration(max(runtime, 900))
+            # The largest single process understates the memory of stages that run several processes at once
+            if summary["peak_rss_scope"] == "tree":
+                memory_gb = math.ceil(max(rss) * headroom / 1024)
+                suggestions[f"{prefix}_MEMORY"] = f"{max(memory_gb, 1)}G"
+    return summaries, stragglers, suggestions
+
+def print_report(summaries, stragglers, suggestions, straggler_factor):
+    """
+    Print the per-stage summaries, stragglers and suggested resource requests.
+
+    Args:
+        summaries (dict): Per-stage summaries.
+        stragglers (list of dict): Stragglers.
+        suggestions (dict): Suggested pipeline variables.
+        straggler_factor (float): Factor used to flag stragglers.
+    """
+    print("=============================================")
+    print("Per-Stage Telemetry")
+    print("=============================================")
+    for stage, summary in summaries.items():
+        rates = ", ".join(f"{summary[key]:,.0f} {key[len('median_'):-len('_per_second')]}/s"
+                          for key in summary if key.endswith("_per_second"))
+        efficiency = summary["median_cpu_efficiency"]
+        print(f"{stage}: {summary['records']} record(s) from {summary['samples']} sample(s); "
+              f"wall median {format_duration(summary['median_wall_seconds'])}, max {format_duration(summary['max_wall_seconds'])}, "
+              f"longest job {format_duration(summary['max_job_wall_seconds'])}; "
+              f"peak RSS {summary['max_peak_rss_mb'] / 1024:.1f} GB "
+              f"({'process tree' if summary['peak_rss_scope'] == 'tree' else 'largest process'}); "
+              f"CPU efficiency {efficiency if efficiency is not None else 'n/a'}" + (f"; {rates}" if rates else ""))
+
+    print("=============================================")
+    print(f"Stragglers (wall time > {straggler_factor} x stage median)")
+    print("=============================================")
+    if not stragglers:
+        print("None.")
+    for s in sorted(stragglers, key=lambda s: -s["wall_seconds"]):
+        print(f"{s['stage']} {s.get('sample') or ''} {s.get('partition') or s.get('mode') or ''} on {s.get('host')}: "
+              f"{format_duration(s['wall_seconds'])} ({s['times_median']}x median)")
+
+    print("=============================================")
+    print("Suggested run_pipeline.sh Settings")
+    print("=============================================")
+    for name, value in suggestions.items():
+        print(f'{name}="{value}"')
+    for stage, summary in summaries.items():
+        if stage in STAGE_VARIABLES and summary["peak_rss_scope"] != "tree":
+            print(f"[INFO] No {STAGE_VARIABLES[stage]}_MEMORY suggestion: the memory of the whole process tree of "
+                  f"'{stage}' was not measured in every record.")
+
+def main():
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Record and report per-stage performance telemetry.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a command and append its telemetry record.")
+    run_parser.add_argument("--log", type=str, required=True, help="JSON-lines telemetry log.")
+    run_parser.add_argument("--stage", type=str, required=True, help="Stage name.")
+    run_parser.add_argument("--partition", type=str, default=None, help="Partition or shard the stage worked on.")
+    for field in WORK_FIELDS + ["input_bytes"]:
+        run_parser.add_argument(f"--{field}", type=int, default=None, help=f"Number of {field.replace('_', ' ')} processed.")
+    run_parser.add_argument("--sample_interval", type=float, default=SAMPLE_INTERVAL, help="Seconds between two samples of the process tree.")
+    run_parser.add_argument("cmd", nargs=argparse.REMAINDER, help="Command to run, after --.")
+
+    report_parser = subparsers.add_parser("report", help="Aggregate telemetry logs.")
+    report_parser.add_argument("logs", nargs="+", help="Telemetry logs.")
+    report_parser.add_argument("--straggler_factor", type=float, default=1.5, help="Wall time over the stage median that flags a straggler.")
+    report_parser.add_argument("--headroom", type=float, default=1.25, help="Factor applied to the largest runtime and memory.")
+    report_parser.add_argument("--output", type=str, default=None, help="Write the report to a JSON file.")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        command = args.cmd[1:] if args.cmd and args.cmd[0] == "--" else args.cmd
+        if not command:
+            print("[ERROR] No command given. Usage: telemetry.py run --log LOG --stage STAGE -- COMMAND [ARGS ...]", file=sys.stderr)
+            sys.exit(1)
+        metrics = {field: getattr(args, field) for field in WORK_FIELDS + ["input_bytes", "partition"]
+                   if getattr(args, field) is not None}
+        sys.exit(run_command(args.log, args.stage, command, metrics, args.sample_interval))
+
+    for log_file in args.logs:
+        if not os.path.isfile(log_file):
+            print(f"[ERROR] Telemetry log '{log_file}' does not exist.")
+            sys.exit(1)
+    records = load_records(args.logs)
+    if not records:
+        print("[ERROR] No telemetry records found.")
+        sys.exit(1)
+    failed = sum(1 for r in records if r.get("exit_code", 0) != 0)
+    if failed:
+        print(f"[INFO] Ignoring {failed} record(s) of failed runs.")
+
+    summaries, stragglers, suggestions = summarize(records, args.straggler_factor, args.headroom)
+    print_report(summaries, stragglers, suggestions, args.straggler_factor)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"stages": summaries, "stragglers": stragglers, "suggestions": suggestions}, f, indent=4)
+        print(f"[INFO] Report written to '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
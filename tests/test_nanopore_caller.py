@@ -0,0 +1,172 @@
+"""
+Description:
+    Tests of the ctc-data tooling of the Nanopore Caller, on small synthetic datasets:
+        - `ctc_data.py`: the per-chunk sidecar pairs every row with its BAM record when the rows are saved in
+          random order and atypical chunks are dropped, as `bonito basecaller --save-ctc` does.
+        - `ctc_shards.py`: packing a dataset into shards and unpacking it restores the arrays and the sidecar
+          (exactly, or within the quantization step), and the block-shuffling loader yields every row once.
+
+Usage:
+    python -m pytest -q tests
+
+Requirements:
+    - The `pytest`, `numpy` and `pysam` Python packages.
+"""
+
+import os
+import sys
+import random
+
+import numpy as np
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "nanopore_caller", "scripts", "bonito"))
+
+import ctc_data
+import ctc_shards
+
+CHUNK_LENGTH = 32
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+def write_reference(path, rng, contigs):
+    """
+    Write a random reference FASTA and return its sequences.
+    """
+    sequences = {name: "".join(rng.choice("ACGT") for _ in range(length)) for name, length in contigs}
+    with open(path, "w") as f:
+        for name, sequence in sequences.items():
+            f.write(f">{name}\n{sequence}\n")
+    return sequences
+
+def basecalling_run(tmp_path, rng, sequences, spans):
+    """
+    Write the BAM file and ctc-data arrays of a basecalling run over the given reference spans.
+
+    Like Bonito's CTC writer, a record is written for every chunk, and the chunks are then saved in random order
+    without the one with an atypical reference length (the last span).
+
+    Returns:
+        list: (read ID, qscore, accuracy) of the saved row, for every row.
+    """
+    pysam = pytest.importorskip("pysam")
+    header = {"HD": {"VN": "1.6"}, "SQ": [{"SN": name, "LN": len(seq)} for name, seq in sequences.items()]}
+    names = list(sequences)
+    records, targets = [], []
+    with pysam.AlignmentFile(str(tmp_path / "basecalls.bam"), "wb", header=header) as bam:
+        for idx, (contig, start, end, reverse) in enumerate(spans):
+            record = pysam.AlignedSegment(bam.header)
+            record.query_name = f"read_{idx}"
+            record.reference_id = names.index(contig)
+            record.reference_start = start
+            record.cigartuples = [(0, end - start)]
+            record.is_reverse = reverse
+            record.query_sequence = sequences[contig][start:end]
+            record.query_qualities = pysam.qualitystring_to_array("I" * (end - start))
+            record.set_tag("qs", rng.randint(5, 40))
+            record.set_tag("NM", rng.randint(0, 3))
+            bam.write(record)
+            refseq = sequences[contig][start:end]
+            if reverse:
+                refseq = refseq.translate(COMPLEMENT)[::-1]
+            targets.append([int(base) for base in refseq.translate({65: "1", 67: "2", 71: "3", 84: "4"})])
+            records.append((f"read_{idx}", record.get_tag("qs"), (end - start - record.get_tag("NM")) / (end - start)))
+
+    saved = np.random.default_rng(1).permutation(len(spans) - 1)
+    width = max(len(target) for target in targets)
+    references = np.zeros((len(saved), width), dtype=np.uint8)
+    for row, idx in enumerate(saved):
+        references[row, :len(targets[idx])] = targets[idx]
+    np.save(tmp_path / ctc_data.CHUNKS_FILE, np.zeros((len(saved), CHUNK_LENGTH), dtype=np.float16))
+    np.save(tmp_path / ctc_data.REFERENCES_FILE, references)
+    np.save(tmp_path / ctc_data.LENGTHS_FILE, np.array([len(targets[idx]) for idx in saved], dtype=np.uint16))
+    return [records[idx] for idx in saved]
+
+def test_summary_pairs_shuffled_rows_with_their_records(tmp_path):
+    rng = random.Random(4)
+    sequences = write_reference(str(tmp_path / "reference.fasta"), rng, [("chr1", 2000), ("chr2", 1500)])
+    spans = []
+    for _ in range(40):
+        contig = rng.choice(list(sequences))
+        start = rng.randrange(0, len(sequences[contig]) - 60)
+        spans.append((contig, start, start + rng.randint(20, 40), rng.random() < 0.5))
+    # Two reads over the same span on the same strand cannot be told apart
+    spans += [("chr1", 100, 130, False), ("chr1", 100, 130, False)]
+    spans.append(("chr2", 0, 60, False))
+    expected = basecalling_run(tmp_path, rng, sequences, spans)
+
+    summary = ctc_data.summarize_dataset(str(tmp_path), str(tmp_path / "basecalls.bam"),
+                                         str(tmp_path / "reference.fasta"))
+
+    assert len(summary) == len(expected)
+    for row, (read_id, qscore, accuracy) in enumerate(expected):
+        if read_id in ("read_40", "read_41"):
+            assert np.isnan(summary["qscore"][row]) and np.isnan(summary["accuracy"][row])
+            continue
+        assert summary["read_id"][row].decode() == read_id
+        assert summary["qscore"][row] == pytest.approx(qscore)
+        assert summary["accuracy"][row] == pytest.approx(accuracy)
+
+    # Unpaired rows are never selected
+    kept, total = ctc_data.filter_dataset(str(tmp_path), str(tmp_path / "view"), view=True)
+    assert (kept, total) == (len(expected) - 2, len(expected))
+
+def synthetic_dataset(path, num_chunks, width=24):
+    """
+    Write a ctc-data dataset with a sidecar; the first sample of every chunk holds its row number.
+    """
+    rng = np.random.default_rng(7)
+    chunks = rng.normal(0, 1, (num_chunks, CHUNK_LENGTH)).astype(np.float16)
+    chunks[:, 0] = np.arange(num_chunks)
+    lengths = rng.integers(1, width + 1, num_chunks).astype(np.uint16)
+    references = rng.integers(1, 5, (num_chunks, width)).astype(np.uint8)
+    references[np.arange(width)[None, :] >= lengths[:, None]] = 0
+    summary = np.zeros(num_chunks, dtype=ctc_data.summary_dtype(8))
+    summary["read_id"] = [f"read_{i}".encode() for i in range(num_chunks)]
+    summary["qscore"] = rng.uniform(5, 40, num_chunks)
+    summary["accuracy"] = rng.uniform(0.8, 1, num_chunks)
+
+    os.makedirs(path)
+    for name, array in [(ctc_data.CHUNKS_FILE, chunks), (ctc_data.REFERENCES_FILE, references),
+                        (ctc_data.LENGTHS_FILE, lengths), (ctc_data.SUMMARY_FILE, summary)]:
+        np.save(os.path.join(path, name), array)
+    return chunks, references, lengths, summary
+
+@pytest.mark.parametrize("quantize_signal", [False, True])
+def test_shard_round_trip_restores_dataset(tmp_path, quantize_signal):
+    chunks, references, lengths, summary = synthetic_dataset(str(tmp_path / "dataset"), 30)
+
+    index = ctc_shards.pack_dataset(str(tmp_path / "dataset"), str(tmp_path / "shards"), shard_size=7,
+                                    quantize_signal=quantize_signal)
+    assert [shard["num_chunks"] for shard in index["shards"]] == [7, 7, 7, 7, 2]
+    assert ctc_shards.unpack_shards(str(tmp_path / "shards"), str(tmp_path / "unpacked")) == 30
+
+    unpacked = ctc_data.load_dataset(str(tmp_path / "unpacked"))
+    assert unpacked["chunks"].dtype == chunks.dtype and unpacked["lengths"].dtype == lengths.dtype
+    assert np.array_equal(unpacked["references"], references)
+    assert np.array_equal(unpacked["lengths"], lengths)
+    assert np.array_equal(unpacked["summary"], summary)
+    if quantize_signal:
+        # Half a quantization step, then the rounding back to float16
+        signal = chunks.astype(np.float32)
+        step = (signal.max(axis=1) - signal.min(axis=1)) / (2 * ctc_shards.QUANT_LEVELS)
+        tolerance = step[:, None] / 2 + np.spacing(np.abs(chunks)).astype(np.float32)
+        assert np.all(np.abs(unpacked["chunks"].astype(np.float32) - signal) <= tolerance)
+    else:
+        assert np.array_equal(unpacked["chunks"], chunks)
+
+def test_shard_loader_yields_every_row_once(tmp_path):
+    chunks, references, lengths, _ = synthetic_dataset(str(tmp_path / "dataset"), 30)
+    ctc_shards.pack_dataset(str(tmp_path / "dataset"), str(tmp_path / "shards"), shard_size=7, quantize_signal=False)
+
+    seen = []
+    for data, targets, target_lengths in ctc_shards.iter_batches(str(tmp_path / "shards"), batch_size=4,
+                                                                 buffer_shards=2, seed=3, drop_last=False):
+        for sample, target, length in zip(data, targets, target_lengths):
+            row = int(sample[0, 0])
+            assert np.array_equal(sample[0], chunks[row].astype(np.float32))
+            assert length == lengths[row]
+            assert np.array_equal(target[:length], references[row, :length])
+            seen.append(row)
+    assert sorted(seen) == list(range(30))
+    assert seen != sorted(seen)
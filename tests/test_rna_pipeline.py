@@ -0,0 +1,469 @@
+"""
+Description:
+    Tests of the pure Python building blocks of the RNA pipeline, on small synthetic inputs:
+        - `build_mod_matrix.py`: a store built in several `add` calls exports the same matrices as an outer join of
+          the input bedMethyl files, and an unsorted input leaves the store unchanged.
+        - `pileup_shards.py`: shard regions are disjoint, and merging the per-shard outputs reproduces a single
+          sorted pileup, also when a shard output is out of order.
+        - `partition_pod5_files.py`: balanced (LPT) packing keeps every partition within the size limit.
+        - `pipeline_dag.py`: a resumed run only runs the stages that are not done, outputs consumed by finished
+          dependents do not re-run their stage, and a changed input re-runs its partition and everything downstream.
+        - `pod5_dedup.py`: identical files are found under any name, while files of equal size that differ only
+          beyond their first and last bytes, or share a name, are kept; unchanged files are not read again.
+        - `pod5_index.py`: an incremental build indexes new and changed files, drops vanished ones and keeps files it
+          cannot read out of the index, and lookups return the file, batch and row of every read. The read table of
+          a pod5 file is replaced by a text file of read IDs, so the `pod5` package is not needed.
+        - `telemetry.py`: the stages the local DAG executor runs one after another are separate jobs, while the
+          partitions a sequential Dorado job basecalls add up to one job.
+
+Usage:
+    python -m pytest -q tests
+
+Requirements:
+    - The `pytest`, `numpy` and `pandas` Python packages.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "rna_pipeline", "scripts"))
+
+import build_mod_matrix
+import pileup_shards
+import pipeline_dag
+import pod5_dedup
+import pod5_index
+from pod5_scanner import FileInfo
+import telemetry
+from partition_pod5_files import balance_partitions
+
+CONTIGS = ["chr1", "chr2", "chrM"]
+SITE_COLUMNS = ["contig", "start", "strand", "mod"]
+PILEUP_HEADER = "chrom\tstart\tend\tmod\tscore\tstrand\tstart\tend\tcolor\tn_valid\tpercent_modified\n"
+
+def bedmethyl_line(contig, start, mod, strand, coverage, percent):
+    """
+    Format a bedMethyl record in the column layout of `modkit pileup`.
+    """
+    fields = [contig, start, start + 1, mod, coverage, strand, start, start + 1, "255,0,0", coverage,
+              f"{percent:.2f}", 0, 0, 0, 0, 0, 0, 0]
+    return "\t".join(str(field) for field in fields) + "\n"
+
+def random_sample_sites(rng, num_sites):
+    """
+    Draw distinct (contig, start, strand, mod) sites with a coverage and percent modified, in genome order.
+    """
+    sites = {}
+    while len(sites) < num_sites:
+        site = (rng.choice(CONTIGS), rng.randrange(0, 300), rng.choice("+-"), rng.choice(["a", "m", "17802"]))
+        sites[site] = (rng.randint(1, 200), round(rng.uniform(0, 100), 2))
+    return sorted(sites.items(), key=lambda item: (CONTIGS.index(item[0][0]), item[0][1]))
+
+def write_bed(path, records):
+    """
+    Write (site, (coverage, percent)) records as a bedMethyl file.
+    """
+    with open(path, "w") as f:
+        for (contig, start, strand, mod), (coverage, percent) in records:
+            f.write(bedmethyl_line(contig, start, mod, strand, coverage, percent))
+
+def expected_matrix(samples, value):
+    """
+    Outer-join the sites of every sample on (contig, start, strand, mod).
+    """
+    frames = []
+    for name, records in samples.items():
+        rows = [dict(zip(SITE_COLUMNS, site), **{name: values[value]}) for site, values in records]
+        frames.append(pd.DataFrame(rows).set_index(SITE_COLUMNS))
+    return pd.concat(frames, axis=1, join="outer")
+
+def read_exported(path):
+    """
+    Read an exported matrix indexed by site.
+    """
+    frame = pd.read_csv(path, sep="\t", dtype={"mod": str}, na_values="NA")
+    return frame.drop(columns="end").set_index(SITE_COLUMNS)
+
+def test_mod_matrix_matches_outer_join(tmp_path, monkeypatch):
+    # Small write buffers exercise the flushes of the k-way merge
+    monkeypatch.setattr(build_mod_matrix, "WRITE_BUFFER", 16)
+    rng = random.Random(12)
+    samples = {f"sample_{i}": random_sample_sites(rng, 150) for i in range(4)}
+    store_dir = str(tmp_path / "store")
+
+    # The first two samples create the store; the others are appended, one of them split over two files
+    batches = [["sample_0", "sample_1"], ["sample_2"], ["sample_3"]]
+    for batch in batches:
+        sheet = {}
+        for name in batch:
+            records = samples[name]
+            if name == "sample_3":
+                paths = [str(tmp_path / f"{name}_a.bed"), str(tmp_path / f"{name}_m.bed")]
+                write_bed(paths[0], [r for r in records if r[0][3] != "m"])
+                write_bed(paths[1], [r for r in records if r[0][3] == "m"])
+            else:
+                paths = [str(tmp_path / f"{name}.bed")]
+                write_bed(paths[0], records)
+            sheet[name] = {"group": "AD" if name in ("sample_0", "sample_2") else "Control", "beds": paths}
+        build_mod_matrix.add_samples(store_dir, sheet, CONTIGS)
+
+    prefix = str(tmp_path / "matrix")
+    build_mod_matrix.export_matrix(store_dir, prefix, chunk_size=97)
+    percent = read_exported(f"{prefix}.percent.tsv")
+    coverage = read_exported(f"{prefix}.coverage.tsv")
+
+    expected_percent = expected_matrix(samples, 1).reindex(percent.index)
+    expected_coverage = expected_matrix(samples, 0).reindex(coverage.index).fillna(0).astype(int)
+    assert len(percent) == len(expected_matrix(samples, 1))
+    assert list(percent.columns) == list(samples)
+    pd.testing.assert_frame_equal(percent, expected_percent, check_dtype=False, atol=0.005)
+    pd.testing.assert_frame_equal(coverage, expected_coverage, check_dtype=False)
+
+    # Rows are exported in genome order
+    ranks = [(CONTIGS.index(contig), start) for contig, start, _, _ in percent.index]
+    assert ranks == sorted(ranks)
+
+    groups = pd.read_csv(f"{prefix}.samples.tsv", sep="\t")
+    assert groups["group"].tolist() == ["AD", "Control", "AD", "Control"]
+
+def test_mod_matrix_unsorted_input_leaves_store_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_mod_matrix, "WRITE_BUFFER", 16)
+    rng = random.Random(3)
+    store_dir = str(tmp_path / "store")
+    sites_path = os.path.join(store_dir, build_mod_matrix.SITES_FILE)
+    first = random_sample_sites(rng, 100)
+    write_bed(str(tmp_path / "first.bed"), first)
+    build_mod_matrix.add_samples(store_dir, {"first": {"group": "AD", "beds": [str(tmp_path / "first.bed")]}}, CONTIGS)
+    sites_size = os.path.getsize(sites_path)
+
+    # The unsorted record comes last, so new sites have already been flushed when it is reached
+    unsorted = random_sample_sites(rng, 100)
+    unsorted.append(unsorted[0])
+    write_bed(str(tmp_path / "unsorted.bed"), unsorted)
+    with pytest.raises(build_mod_matrix.SiteOrderError):
+        build_mod_matrix.add_samples(store_dir, {"bad": {"group": "AD", "beds": [str(tmp_path / "unsorted.bed")]}},
+                                     CONTIGS)
+    assert os.path.getsize(sites_path) > sites_size
+    store = build_mod_matrix.load_store(store_dir)
+    assert [sample["name"] for sample in store["samples"]] == ["first"]
+    assert os.listdir(os.path.join(store_dir, build_mod_matrix.COLUMNS_DIR)) == ["column_0.bin"]
+
+    # The next addition truncates the sites appended by the failed one
+    second = random_sample_sites(rng, 100)
+    write_bed(str(tmp_path / "second.bed"), second)
+    build_mod_matrix.add_samples(store_dir, {"second": {"group": "Control", "beds": [str(tmp_path / "second.bed")]}},
+                                 CONTIGS)
+    samples = {"first": first, "second": second}
+    store = build_mod_matrix.load_store(store_dir)
+    assert store["num_sites"] == len(expected_matrix(samples, 1))
+    assert os.path.getsize(sites_path) == store["num_sites"] * build_mod_matrix.SITE_DTYPE.itemsize
+
+    prefix = str(tmp_path / "matrix")
+    build_mod_matrix.export_matrix(store_dir, prefix)
+    percent = read_exported(f"{prefix}.percent.tsv")
+    assert len(percent) == store["num_sites"]
+    pd.testing.assert_frame_equal(percent, expected_matrix(samples, 1).reindex(percent.index), check_dtype=False,
+                                  atol=0.005)
+
+def synthetic_pileup(rng, contig_stats):
+    """
+    Build the records of a single sorted pileup over the contigs with mapped reads.
+    """
+    lines = []
+    for contig, length, mapped in contig_stats:
+        if mapped == 0:
+            continue
+        for start in sorted(rng.sample(range(length), min(length, 60))):
+            for mod, strand in sorted(rng.sample([("a", "+"), ("m", "+"), ("a", "-")], rng.randint(1, 3))):
+                lines.append(bedmethyl_line(contig, start, mod, strand, rng.randint(1, 50), rng.uniform(0, 100)))
+    return lines
+
+def write_shard_outputs(tmp_path, shards, lines, reverse_shard=None):
+    """
+    Split pileup records by shard region, as one `modkit pileup --include-bed` run per shard would, optionally
+    reporting the regions of one shard in reverse order.
+    """
+    paths = []
+    for idx, shard in enumerate(shards, start=1):
+        # A shard whose regions are reported in reverse order is out of genome order
+        regions = reversed(shard) if idx == reverse_shard else shard
+        records = [line for contig, start, end, _ in regions for line in lines
+                   if line.split("\t")[0] == contig and start <= int(line.split("\t")[1]) < end]
+        path = str(tmp_path / f"shard_{idx}.bed")
+        with open(path, "w") as f:
+            f.write(PILEUP_HEADER)
+            f.writelines(records)
+        paths.append(path)
+    return paths
+
+@pytest.mark.parametrize("reverse_shard", [None, 2])
+def test_sharded_pileup_merge_matches_single_pileup(tmp_path, reverse_shard):
+    rng = random.Random(7)
+    contig_stats = [("chr1", 5000, 9000), ("chr2", 3000, 1000), ("chr3", 800, 0), ("chrM", 400, 20000)]
+    num_shards = 4
+
+    regions = pileup_shards.split_into_regions(contig_stats, num_shards)
+    shards = pileup_shards.assign_regions(regions, num_shards)
+    assert len(shards) == num_shards
+
+    # Regions are disjoint and cover every contig with mapped reads
+    for contig, length, mapped in contig_stats:
+        spans = sorted((start, end) for shard in shards for c, start, end, _ in shard if c == contig)
+        if mapped == 0:
+            assert spans == []
+            continue
+        assert spans[0][0] == 0 and spans[-1][1] == length
+        assert all(previous[1] == current[0] for previous, current in zip(spans, spans[1:]))
+
+    lines = synthetic_pileup(rng, contig_stats)
+    shard_paths = write_shard_outputs(tmp_path, shards, lines, reverse_shard)
+    contig_order = tmp_path / pileup_shards.CONTIG_ORDER_FILE
+    contig_order.write_text("".join(f"{contig}\n" for contig, _, _ in contig_stats))
+
+    output_bed = tmp_path / "merged.bed"
+    written = pileup_shards.merge_shards(str(contig_order), str(output_bed), shard_paths)
+    assert written == len(lines)
+    assert output_bed.read_text() == PILEUP_HEADER + "".join(lines)
+
+@pytest.mark.parametrize("num_workers", [None, 4])
+def test_balanced_partitions_stay_within_limit(num_workers):
+    rng = random.Random(5)
+    size_limit = 50 * 1024 ** 3
+    file_dict = {f"/data/run_{i // 100}/chunk_{i}.pod5": int(rng.uniform(0.05, 1.2) * 1024 ** 3) for i in range(900)}
+    file_dict["/data/run_big/chunk_0.pod5"] = size_limit
+
+    partitions = balance_partitions(file_dict, size_limit, num_workers)
+
+    assert all(sum(partition.values()) <= size_limit for partition in partitions)
+    packed = [path for partition in partitions for path in partition]
+    assert sorted(packed) == sorted(file_dict)
+    assert all(partition[path] == file_dict[path] for partition in partitions for path in partition)
+
+    minimum = math.ceil(sum(file_dict.values()) / size_limit)
+    assert minimum <= len(partitions) <= minimum + (num_workers or 1)
+    if num_workers:
+        assert len(partitions) % num_workers == 0
+
+def test_balanced_partitions_reject_oversized_file():
+    with pytest.raises(SystemExit):
+        balance_partitions({"/data/a.pod5": 10, "/data/b.pod5": 11}, 10)
+
+def telemetry_record(stage, job_id, job_name, task_id, start_minute, wall_seconds):
+    """
+    Build a minimal successful telemetry record on one host.
+    """
+    return {
+        "stage": stage, "sample": "g_s", "host": "node1", "job_id": job_id, "job_name": job_name,
+        "task_id": task_id, "start": f"2026-01-01T10:{start_minute:02d}:00", "wall_seconds": wall_seconds,
+        "cpu_seconds": wall_seconds, "cpu_efficiency": 1.0, "peak_rss_mb": 1024.0, "peak_rss_scope": "tree",
+        "exit_code": 0,
+    }
+
+def test_telemetry_separates_local_stages_and_joins_sequential_jobs():
+    # The local DAG executor runs the align stages one after another, all with JOB_ID=local and SGE_TASK_ID=1
+    records = [telemetry_record("align", "local", f"align_partition_{i}", "1", 10 * i, 600) for i in range(4)]
+    # A sequential Dorado job basecalls two partitions one after another
+    records += [telemetry_record("dorado", "4242", "dorado_job_g_s", None, 10 * i, 600) for i in range(2)]
+
+    summaries, _, suggestions = telemetry.summarize(records)
+
+    assert summaries["align"]["max_job_wall_seconds"] == 600
+    assert suggestions["ALIGN_JOB_RUNTIME"] == "0:15:00"
+    assert summaries["dorado"]["max_job_wall_seconds"] == 1200
+    assert suggestions["DORADO_JOB_RUNTIME"] == "0:30:00"
+    assert suggestions["ALIGN_JOB_MEMORY"] == "2G"
+
+def dag_config(tmp_path):
+    """
+    Build a pipeline configuration of two partitions with small pod5 stand-ins under `tmp_path`.
+    """
+    config = {name: "1" for name in pipeline_dag.REQUIRED_ENV}
+    config.update({name: "1G" for name in pipeline_dag.REQUIRED_ENV if name.endswith("_MEMORY")})
+    config.update({"GROUP": "g", "SAMPLE": "s", "MODEL_NAME": "rna004_130bps_sup@v5.1.0", "ALIGN_MODE": "classic",
+                   "KEEP_FULL_BAM": "false", "MODKIT_SHARDS": "1", "MODKIT_FILTER_MODE": "plain"})
+    for name in ["SCRIPTS_DIR", "BASH_SOURCE_DIR", "UNALIGNED_BAM_DIR", "ALIGNED_BAM_DIR", "MODKIT_OUTPUT_DIR"]:
+        config[name] = str(tmp_path / name.lower())
+        os.makedirs(config[name])
+    for name in ["REFERENCE_FILE", "ANNOTATION_FILE"]:
+        config[name] = str(tmp_path / name.lower())
+        open(config[name], "w").close()
+
+    partitions = {}
+    for partition in ["partition_0", "partition_1"]:
+        partitions[partition] = [str(tmp_path / f"{partition}_{i}.pod5") for i in range(2)]
+        for path in partitions[partition]:
+            open(path, "w").close()
+    with open(os.path.join(config["BASH_SOURCE_DIR"], "partitions.json"), "w") as f:
+        json.dump(partitions, f)
+    return config, partitions
+
+def run_dag_stages(plan, state_dir, names):
+    """
+    Run stages whose commands only create their outputs, writing their completion markers.
+    """
+    for name in names:
+        for path in plan[name]["outputs"]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        plan[name]["command"] = ["touch"] + plan[name]["outputs"]
+        assert pipeline_dag.execute_stage(plan, state_dir, name) == 0
+
+def test_dag_resume_runs_only_stages_not_done(tmp_path):
+    config, partitions = dag_config(tmp_path)
+    state_dir = str(tmp_path / "state")
+    all_stages = ["dorado_partition_0", "align_partition_0", "dorado_partition_1", "align_partition_1", "merge",
+                  "modkit"]
+
+    plan = pipeline_dag.build_plan(config, state_dir)
+    assert pipeline_dag.stages_to_run(plan, state_dir) == all_stages
+
+    # An interrupted run: the second partition was not aligned
+    run_dag_stages(plan, state_dir, ["dorado_partition_0", "align_partition_0", "dorado_partition_1"])
+    assert pipeline_dag.stages_to_run(plan, state_dir) == ["align_partition_1", "merge", "modkit"]
+
+    run_dag_stages(plan, state_dir, ["align_partition_1", "merge", "modkit"])
+    assert pipeline_dag.stages_to_run(plan, state_dir) == []
+
+    # The merge consumes the per-partition aligned BAMs; their stages stay done while the merge is done
+    for name in ["align_partition_0", "align_partition_1"]:
+        os.remove(plan[name]["outputs"][0])
+    assert pipeline_dag.stages_to_run(plan, state_dir) == []
+
+    # A missing modkit output re-runs modkit only, while the merged BAM exists
+    os.remove(plan["modkit"]["outputs"][0])
+    assert pipeline_dag.stages_to_run(plan, state_dir) == ["modkit"]
+
+    # Without the merged BAM, the merge needs its consumed inputs again
+    os.remove(plan["merge"]["outputs"][0])
+    assert pipeline_dag.stages_to_run(plan, state_dir) == ["align_partition_0", "align_partition_1", "merge",
+                                                            "modkit"]
+    run_dag_stages(plan, state_dir, ["align_partition_0", "align_partition_1", "merge", "modkit"])
+
+    # A changed pod5 file re-runs its partition and everything downstream, and nothing else
+    stat = os.stat(partitions["partition_1"][0])
+    os.utime(partitions["partition_1"][0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    plan = pipeline_dag.build_plan(config, state_dir)
+    assert pipeline_dag.stages_to_run(plan, state_dir) == ["dorado_partition_1", "align_partition_1", "merge",
+                                                            "modkit"]
+
+def write_files(contents):
+    """
+    Write files with the given contents and describe them as `scan_files` does.
+    """
+    files = {}
+    for path, content in contents.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        stat = os.stat(path)
+        files[path] = FileInfo(stat.st_size, stat.st_mtime_ns)
+    return files
+
+def test_duplicates_are_found_by_content(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(pod5_dedup, "PARTIAL_HASH_BYTES", 16)
+    rng = random.Random(9)
+    content = bytes(rng.randrange(256) for _ in range(200))
+    middle_differs = content[:100] + bytes([content[100] ^ 1]) + content[101:]
+    run_a, run_b = str(tmp_path / "run_a"), str(tmp_path / "run_b")
+    files = write_files({
+        f"{run_a}/chunk_0.pod5": content,
+        f"{run_b}/copy_of_chunk_0.pod5": content,
+        f"{run_b}/sub/chunk_0_again.pod5": content,
+        f"{run_a}/chunk_1.pod5": middle_differs,
+        f"{run_b}/chunk_1.pod5": content[:150],
+        f"{run_a}/empty_0.pod5": b"",
+        f"{run_b}/empty_1.pod5": b"",
+    })
+    cache_file = str(tmp_path / "hash_cache.json")
+
+    kept, duplicates = pod5_dedup.find_duplicates(files, cache_file=cache_file, max_workers=2,
+                                                  preferred={f"{run_b}/copy_of_chunk_0.pod5"})
+    assert duplicates == {f"{run_a}/chunk_0.pod5": f"{run_b}/copy_of_chunk_0.pod5",
+                          f"{run_b}/sub/chunk_0_again.pod5": f"{run_b}/copy_of_chunk_0.pod5"}
+    assert kept == sorted(path for path in files if path not in duplicates)
+
+    # The cache answers for unchanged files; without a preference the first path is kept
+    capsys.readouterr()
+    _, duplicates = pod5_dedup.find_duplicates(files, cache_file=cache_file)
+    assert "0 hash(es) computed" in capsys.readouterr().out
+    assert set(duplicates.values()) == {f"{run_a}/chunk_0.pod5"}
+
+    # A changed file is hashed again (partial and full hash), and only that file
+    files.update(write_files({f"{run_b}/sub/chunk_0_again.pod5": middle_differs}))
+    _, duplicates = pod5_dedup.find_duplicates(files, cache_file=cache_file)
+    assert "2 hash(es) computed" in capsys.readouterr().out
+    assert duplicates == {f"{run_b}/copy_of_chunk_0.pod5": f"{run_a}/chunk_0.pod5",
+                          f"{run_b}/sub/chunk_0_again.pod5": f"{run_a}/chunk_1.pod5"}
+
+# Reads per record batch of the text stand-ins for pod5 files
+READS_PER_BATCH = 2
+
+def read_text_index(file_path):
+    """
+    Read the read IDs of a text stand-in for a pod5 file, one per line, like `pod5_index.read_file_index`.
+    """
+    with open(file_path) as f:
+        read_ids = [uuid.UUID(line.strip()).bytes for line in f if line.strip()]
+    if not read_ids:
+        return file_path, None
+    return file_path, [(read_id, row // READS_PER_BATCH, row % READS_PER_BATCH) for row, read_id in enumerate(read_ids)]
+
+def write_read_ids(path, read_ids):
+    """
+    Write read IDs one per line, with a new modification time.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("".join(f"{read_id}\n" for read_id in read_ids))
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+
+def test_pod5_index_build_and_lookup(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pod5", types.ModuleType("pod5"))
+    monkeypatch.setattr(pod5_index, "read_file_index", read_text_index)
+    monkeypatch.setattr(pod5_index, "ProcessPoolExecutor", ThreadPoolExecutor)
+    rng = random.Random(11)
+    reads = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(8)]
+    source = str(tmp_path / "pod5")
+    index_db = str(tmp_path / "index.sqlite")
+    write_read_ids(f"{source}/run_a/chunk_0.pod5", reads[0:3])
+    write_read_ids(f"{source}/run_a/chunk_1.pod5", reads[3:5])
+    write_read_ids(f"{source}/run_b/copy_of_chunk_0.pod5", reads[0:3])
+    write_read_ids(f"{source}/run_b/being_written.pod5", [])
+
+    counts = pod5_index.build_index(index_db, [source], workers=2)
+    assert counts == {"indexed": 3, "unchanged": 0, "removed": 0, "failed": 1}
+
+    read_ids_file = tmp_path / "read_ids.tsv"
+    read_ids_file.write_text(f"read_id\tlength\n{reads[2]}\t100\n{reads[4]}\t50\n{reads[2]}\t100\n{reads[7]}\n")
+    read_ids = pod5_index.load_read_ids(str(read_ids_file))
+    assert read_ids == [uuid.UUID(read_id).bytes for read_id in (reads[2], reads[4], reads[7])]
+
+    locations, missing = pod5_index.lookup_reads(index_db, read_ids)
+    assert missing == [uuid.UUID(reads[7]).bytes]
+    assert locations[f"{source}/run_a/chunk_1.pod5"] == [(0, 1, uuid.UUID(reads[4]).bytes)]
+    # A read held by two copies is located in one of them only
+    copies = [path for path in locations if path.endswith(("chunk_0.pod5", "copy_of_chunk_0.pod5"))]
+    assert len(copies) == 1 and locations[copies[0]] == [(1, 0, uuid.UUID(reads[2]).bytes)]
+
+    # Only changed files are read again, vanished ones are removed, and unreadable ones are retried
+    write_read_ids(f"{source}/run_a/chunk_1.pod5", reads[5:8])
+    os.remove(f"{source}/run_b/copy_of_chunk_0.pod5")
+    counts = pod5_index.build_index(index_db, [source], workers=2)
+    assert counts == {"indexed": 1, "unchanged": 1, "removed": 1, "failed": 1}
+
+    locations, missing = pod5_index.lookup_reads(index_db, [uuid.UUID(read_id).bytes for read_id in reads])
+    assert missing == [uuid.UUID(read_id).bytes for read_id in reads[3:5]]
+    assert sorted(locations) == [f"{source}/run_a/chunk_0.pod5", f"{source}/run_a/chunk_1.pod5"]
+    assert sorted(locations[f"{source}/run_a/chunk_1.pod5"]) == [(0, 0, uuid.UUID(reads[5]).bytes),
+                                                         (0, 1, uuid.UUID(reads[6]).bytes),
+                                                         (1, 0, uuid.UUID(reads[7]).bytes)]